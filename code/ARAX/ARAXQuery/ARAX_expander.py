@@ -1,6 +1,7 @@
 #!/bin/env python3
 import sys
 import os
+import concurrent.futures
 
 from response import Response
 import Expand.expand_utilities as eu
@@ -13,6 +14,7 @@ def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 
 class ARAXExpander:
+    MAX_CONCURRENT_EXPANSIONS = 4  # Number of qedges that may be expanded at the same time
 
     def __init__(self):
         self.response = None
@@ -105,21 +107,45 @@ team KG1 and KG2 Neo4j instances as well as BioThings Explorer to fulfill QG's,
 
             # Expand the query graph edge by edge (much faster for neo4j queries, and allows easy integration with BTE)
             ordered_qedges_to_expand = self._get_order_to_expand_edges_in(query_sub_graph)
+            independent_qedge_ids = self._get_independent_qedge_ids(ordered_qedges_to_expand, self.message.query_graph, dict_kg)
             node_usages_by_edges_map = dict()
 
-            for qedge in ordered_qedges_to_expand:
-                answer_kg, edge_node_usage_map = self._expand_edge(qedge, kp_to_use, dict_kg, continue_if_no_results, self.message.query_graph)
-                if response.status != 'OK':
-                    return response
-                node_usages_by_edges_map[qedge.id] = edge_node_usage_map
-
-                self._process_and_merge_answer(answer_kg, dict_kg)
-                if response.status != 'OK':
-                    return response
-
-                self._prune_dead_end_paths(dict_kg, query_sub_graph, node_usages_by_edges_map)
-                if response.status != 'OK':
-                    return response
+            # Qedges that don't use results of the qedges before them are expanded concurrently (each logging to its own
+            # response), but all answers are merged in order, so the outcome is the same as expanding them one by one
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_EXPANSIONS)
+
+            def start_expanding_edge(qedge_to_expand):
+                edge_query_graph, qnodes_using_curies_from_prior_step = self._get_query_graph_for_edge(qedge_to_expand, self.message.query_graph, dict_kg)
+                edge_response = Response()
+                edge_response.data['parameters'] = parameters
+                return edge_response, executor.submit(self._answer_edge_query, qedge_to_expand, edge_query_graph,
+                                                      qnodes_using_curies_from_prior_step, kp_to_use,
+                                                      continue_if_no_results, edge_response)
+
+            expansions = dict()
+            try:
+                for qedge in ordered_qedges_to_expand:
+                    if qedge.id in independent_qedge_ids:
+                        expansions[qedge.id] = start_expanding_edge(qedge)
+                for qedge in ordered_qedges_to_expand:
+                    edge_response, expansion = expansions.pop(qedge.id) if qedge.id in expansions else start_expanding_edge(qedge)
+                    answer_kg, edge_node_usage_map = expansion.result()
+                    response.merge(edge_response)
+                    if response.status != 'OK':
+                        return response
+                    node_usages_by_edges_map[qedge.id] = edge_node_usage_map
+
+                    self._process_and_merge_answer(answer_kg, dict_kg)
+                    if response.status != 'OK':
+                        return response
+
+                    self._prune_dead_end_paths(dict_kg, query_sub_graph, node_usages_by_edges_map)
+                    if response.status != 'OK':
+                        return response
+            finally:
+                for edge_response, expansion in expansions.values():
+                    expansion.cancel()
+                executor.shutdown(wait=False)
 
         # Expand any specified nodes
         if input_node_ids:
@@ -201,42 +227,42 @@ team KG1 and KG2 Neo4j instances as well as BioThings Explorer to fulfill QG's,
 
         return edge_query_graph, qnodes_using_curies_from_prior_step
 
-    def _expand_edge(self, qedge, kp_to_use, dict_kg, continue_if_no_results, query_graph):
-        # This function answers a single-edge (one-hop) query using the specified knowledge provider
-        self.response.info(f"Expanding edge {qedge.id} using {kp_to_use}")
+    @staticmethod
+    def _answer_edge_query(qedge, edge_query_graph, qnodes_using_curies_from_prior_step, kp_to_use, continue_if_no_results, response):
+        # This function answers the query graph of a single edge, logging to the given response (may run in a worker thread)
+        response.info(f"Expanding edge {qedge.id} using {kp_to_use}")
 
-        edge_query_graph, qnodes_using_curies_from_prior_step = self._get_query_graph_for_edge(qedge, query_graph, dict_kg)
         if not any(qnode for qnode in edge_query_graph.nodes if qnode.curie):
-            self.response.error(f"Cannot expand an edge for which neither end has any curies. (Could not find curies to"
-                                f" use from a prior expand step, and neither qnode has a curie specified.)",
-                                error_code="InvalidQueryGraph")
+            response.error(f"Cannot expand an edge for which neither end has any curies. (Could not find curies to"
+                           f" use from a prior expand step, and neither qnode has a curie specified.)",
+                           error_code="InvalidQueryGraph")
             return None, None
 
         valid_kps = ["ARAX/KG1", "ARAX/KG2", "BTE"]
         if kp_to_use not in valid_kps:
-            self.response.error(f"Invalid knowledge provider: {kp_to_use}. Valid options are {', '.join(valid_kps)}",
-                                error_code="UnknownValue")
+            response.error(f"Invalid knowledge provider: {kp_to_use}. Valid options are {', '.join(valid_kps)}",
+                           error_code="UnknownValue")
             return None, None
         else:
             if kp_to_use == 'BTE':
                 from Expand.bte_querier import BTEQuerier
-                kp_querier = BTEQuerier(self.response)
+                kp_querier = BTEQuerier(response)
             else:
                 from Expand.kg_querier import KGQuerier
-                kp_querier = KGQuerier(self.response, kp_to_use)
+                kp_querier = KGQuerier(response, kp_to_use)
 
             answer_kg, edge_node_usage_map = kp_querier.answer_one_hop_query(edge_query_graph, qnodes_using_curies_from_prior_step)
 
             # Make sure all of the QG IDs in our query have been fulfilled (unless we're continuing if no results)
-            if self.response.status == 'OK' and not continue_if_no_results:
+            if response.status == 'OK' and not continue_if_no_results:
                 for qnode in edge_query_graph.nodes:
                     if qnode.id not in answer_kg['nodes'] or not answer_kg['nodes'][qnode.id]:
-                        self.response.error(f"Returned answer KG does not contain any results for QNode {qnode.id}",
-                                            error_code="UnfulfilledQGID")
+                        response.error(f"Returned answer KG does not contain any results for QNode {qnode.id}",
+                                       error_code="UnfulfilledQGID")
                 for qedge in edge_query_graph.edges:
                     if qedge.id not in answer_kg['edges'] or not answer_kg['edges'][qedge.id]:
-                        self.response.error(f"Returned answer KG does not contain any results for QEdge {qedge.id}",
-                                            error_code="UnfulfilledQGID")
+                        response.error(f"Returned answer KG does not contain any results for QEdge {qedge.id}",
+                                       error_code="UnfulfilledQGID")
 
             return answer_kg, edge_node_usage_map
 
@@ -368,6 +394,21 @@ team KG1 and KG2 Neo4j instances as well as BioThings Explorer to fulfill QG's,
                         edges_remaining.pop(edges_remaining.index(edge_connected_to_left_end))
         return ordered_edges
 
+    @staticmethod
+    def _get_independent_qedge_ids(ordered_qedges, query_graph, dict_kg):
+        # This function determines which qedges can be expanded without waiting for the qedges before them. A qedge's
+        # query only depends on prior expansions if its curie-less qnodes are fed the curies found by an earlier qedge;
+        # such a qedge depends on all earlier ones (pruning after any of them can remove curies it would be fed)
+        independent_qedge_ids = set()
+        qnode_ids_used_by_earlier_qedges = set()
+        for qedge in ordered_qedges:
+            curieless_qnode_ids = {qnode_id for qnode_id in (qedge.source_id, qedge.target_id)
+                                   if not eu.get_query_node(query_graph, qnode_id).curie}
+            if qedge.id in dict_kg['edges'] or not curieless_qnode_ids.intersection(qnode_ids_used_by_earlier_qedges):
+                independent_qedge_ids.add(qedge.id)
+            qnode_ids_used_by_earlier_qedges.update({qedge.source_id, qedge.target_id})
+        return independent_qedge_ids
+
     @staticmethod
     def _get_orphan_query_node_ids(query_graph):
         node_ids_used_by_edges = set()
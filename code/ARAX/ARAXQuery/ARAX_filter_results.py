@@ -18,6 +18,7 @@ class ARAXFilterResults:
         self.response = None
         self.message = None
         self.parameters = None
+        self.top_k = None
         self.allowable_actions = {
             'sort_by_edge_attribute',
             'sort_by_node_attribute',
@@ -83,13 +84,40 @@ class ARAXFilterResults:
                         f"Supplied value {item} is not permitted. In action {allowable_parameters['action']}, allowable values to {key} are: {list(allowable_parameters[key])}",
                         error_code="UnknownValue")
 
+    @staticmethod
+    def get_chained_max_results(following_actions):
+        """
+        The number of results that the limit_number_of_results actions right after a filter_results action will keep
+        (None if there are none), so that a sort followed by a limit can be done in one pass
+        :param following_actions: the parsed actions (with 'command' and 'parameters') after the current one
+        :return: int or None
+        """
+        max_results = None
+        for action in following_actions:
+            if action['command'] != 'filter_results' or action['parameters'].get('action') != 'limit_number_of_results':
+                break
+            try:
+                n = int(action['parameters']['max_results'])
+            except (KeyError, ValueError, TypeError):
+                break
+            if n < 0:
+                break
+            max_results = n if max_results is None else min(max_results, n)
+        return max_results
+
     #### Top level decision maker for applying filters
-    def apply(self, input_message, input_parameters):
+    def apply(self, input_message, input_parameters, top_k=None):
+        """
+        Apply a filter_results action to the message
+        :param top_k: (optional) the number of results that will be kept after this action anyway (see get_chained_max_results),
+        so that a sort only has to select the top ones
+        """
 
         #### Define a default response
         response = Response()
         self.response = response
         self.message = input_message
+        self.top_k = top_k
 
         #### Basic checks on arguments
         if not isinstance(input_parameters, dict):
@@ -219,7 +247,7 @@ Also, you have the option of limiting the number of results returned (e.g. via `
 
         # now do the call out to NGD
         from Filter_Results.sort_results import SortResults
-        SR = SortResults(self.response, self.message, edge_params)
+        SR = SortResults(self.response, self.message, edge_params, top_k=self.top_k)
         response = SR.sort_by_edge_attribute()
         return response
 
@@ -314,7 +342,7 @@ Also, you have the option of limiting the number of results returned (e.g. via `
 
         # now do the call out to NGD
         from Filter_Results.sort_results import SortResults
-        SR = SortResults(self.response, self.message, node_params)
+        SR = SortResults(self.response, self.message, node_params, top_k=self.top_k)
         response = SR.sort_by_node_attribute()
         return response
 
@@ -463,7 +491,7 @@ Also, you have the option of limiting the number of results returned (e.g. via `
 
         # now do the call out to NGD
         from Filter_Results.sort_results import SortResults
-        SR = SortResults(self.response, self.message, edge_params)
+        SR = SortResults(self.response, self.message, edge_params, top_k=self.top_k)
         response = SR.sort_by_edge_count()
         return response
 
@@ -542,7 +570,7 @@ Also, you have the option of limiting the number of results returned (e.g. via `
 
         # now do the call out to NGD
         from Filter_Results.sort_results import SortResults
-        SR = SortResults(self.response, self.message, node_params)
+        SR = SortResults(self.response, self.message, node_params, top_k=self.top_k)
         response = SR.sort_by_node_count()
         return response
 
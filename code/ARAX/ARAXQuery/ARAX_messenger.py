@@ -12,6 +12,7 @@ import numpy as np
 from response import Response
 from query_graph_info import QueryGraphInfo
 from knowledge_graph_info import KnowledgeGraphInfo
+from result_ranker import ResultRanker
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
 from RTXConfiguration import RTXConfiguration
@@ -587,7 +588,7 @@ class ARAXMessenger:
 
 
     #### Early experimental code to re-rank results
-    def rank_results(self, message, response=None):
+    def rank_results(self, message, response=None, ranker=None):
 
         #### Define a default response
         if response is None:
@@ -607,79 +608,15 @@ class ARAXMessenger:
         #    print(response.show(level=Response.DEBUG))
         #    return response
 
-        #### Create an index of edges in the knowledge_graph and collect some min,max stats
-        kg_edges = {}
-        score_stats = {}
-        for edge in message.knowledge_graph.edges:
-            kg_edges[edge.id] = edge
-            if edge.edge_attributes is not None:
-                for edge_attribute in edge.edge_attributes:
-                    for attribute_name in [ 'probability', 'normalized_google_distance', 'jaccard_index', 'probability_drug_treats' ]:
-                        if edge_attribute.name == attribute_name:
-                            if attribute_name not in score_stats:
-                                score_stats[attribute_name] = { 'minimum': -9999, 'maximum': -9999 }
-                            value = float(edge_attribute.value)
-                            if np.isinf(value): value = 9999
-                            if score_stats[attribute_name]['minimum'] == -9999 or value < score_stats[attribute_name]['minimum']:
-                                score_stats[attribute_name]['minimum'] = value
-                            if score_stats[attribute_name]['maximum'] == -9999 or value > score_stats[attribute_name]['maximum']:
-                                score_stats[attribute_name]['maximum'] = value
-        response.info(f"Summary of available edge metrics: {score_stats}")
-
-        # Iterate through the results
-        i_result = 0
-        for result in message.results:
-            #response.debug(f"Metrics for result {i_result}  {result.essence}: ")
-            score = 1.0
-            best_probability = 0.0
-            for edge in result.edge_bindings:
-                kg_edge_id = edge.kg_id
-                buf = ''
-                if kg_edges[kg_edge_id].confidence is not None:
-                    buf += f" confidence={kg_edges[kg_edge_id].confidence}"
-                    score *= float(kg_edges[kg_edge_id].confidence)
-                if kg_edges[kg_edge_id].edge_attributes is not None:
-                    for edge_attribute in kg_edges[kg_edge_id].edge_attributes:
-                        if edge_attribute.name == 'probability':
-                            value = float(edge_attribute.value)
-                            buf += f" probability={edge_attribute.value}"
-                            if value > best_probability:
-                                best_probability = value
-                        #if edge_attribute.name == 'probability_drug_treats':               # this is already put in confidence
-                        #    buf += f" probability_drug_treats={edge_attribute.value}"
-                        #    score *= value
-                        if edge_attribute.name == 'normalized_google_distance':
-                            ngd = float(edge_attribute.value)
-                            if np.isinf(ngd): ngd = 10.0
-                            buf += f" ngd={ngd}"
-                            factor = 1 - ( ngd - 0.3) * 0.6
-                            if factor < 0.01: factor = 0.01
-                            if factor > 1: factor = 1.0
-                            buf += f" ngd_factor={factor}"
-                            score *= factor
-                        if edge_attribute.name == 'jaccard_index':
-                            jaccard = float(edge_attribute.value)
-                            if np.isinf(jaccard): jaccard = 0.01
-                            factor = jaccard / score_stats['jaccard_index']['maximum'] * 0.9
-                            buf += f" jaccard={jaccard}, factor={factor}"
-                            score *= factor
-                #response.debug(f"  - {kg_edge_id}  {buf}")
-
-            # #### If there was a best_probability recorded, then multiply times the running score
-            if best_probability > 0.0:
-                score *= best_probability
-
-            # #### Make all scores at least 0.01. This is all way low anyway, but let's not have anything that rounds to zero
-            if score < 0.01:
-                score += 0.01
-
-            #### Keep only 3 digits after the decimal 
-            score = int(score * 1000 + 0.5) / 1000.0
-
-            #response.debug(f"  ---> final score={score}")
+        #### Score all the results at once
+        if ranker is None:
+            ranker = ResultRanker()
+        scores = ranker.score_results(message, response=response)
+
+        for result, score in zip(message.results, scores):
+            score = float(score)
             result.confidence = score
             result.row_data = [ score, result.essence, result.essence_type ]
-            i_result += 1
 
         #### Add table columns name
         message.table_column_names = [ 'confidence', 'essence', 'essence_type' ]
@@ -11,6 +11,7 @@ from response import Response
 from collections import Counter
 import traceback
 import itertools
+from Filter_KG.attribute_columns import invalidate_attribute_columns
 
 class ARAXOverlay:
 
@@ -140,6 +141,8 @@ class ARAXOverlay:
 
         # convert the action string to a function call (so I don't need a ton of if statements
         getattr(self, '_' + self.__class__.__name__ + '__' + parameters['action'])()  # thank you https://stackoverflow.com/questions/11649848/call-methods-by-string
+        # the overlays add attributes to the KG in place, so filter_kg has to rebuild its view of them
+        invalidate_attribute_columns(self.message)
 
         response.debug(f"Applying Overlay to Message with parameters {parameters}")  # TODO: re-write this to be more specific about the actual action
 
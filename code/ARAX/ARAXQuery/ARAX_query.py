@@ -9,6 +9,7 @@ import re
 import time
 from datetime import datetime
 import subprocess
+import hashlib
 import traceback
 from collections import Counter
 import numpy as np
@@ -22,6 +23,7 @@ from ARAX_filter import ARAXFilter
 from ARAX_resultify import ARAXResultify
 from ARAX_query_graph_interpreter import ARAXQueryGraphInterpreter
 from ARAX_messenger import ARAXMessenger
+from processing_plan_cache import ProcessingPlanCache
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from swagger_server.models.message import Message
@@ -50,12 +52,103 @@ from RTXFeedback import RTXFeedback
 
 class ARAXQuery:
 
+    #### Settings of the cache of the states reached by processing plans. It is off unless PLAN_CACHE_FILE is set (e.g. to
+    #### os.path.dirname(os.path.abspath(__file__)) + '/processing_plan_cache.sqlite'). The states are keyed by the code
+    #### version and the KG1/KG2 databases, but not by the contents of those: clear the cache when a KG is reloaded in place
+    PLAN_CACHE_FILE = None
+    PLAN_CACHE_TTL_SEC = 7 * 24 * 60 * 60
+    PLAN_CACHE_MAX_ENTRIES = 10000
+    PLAN_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    #### The actions whose resulting states can be cached (they only depend on the Message, their parameters and the local KGs)
+    CACHEABLE_COMMANDS = [ 'create_message', 'add_qnode', 'add_qedge', 'expand', 'filter', 'resultify', 'overlay', 'filter_kg', 'filter_results' ]
+    #### Unless they call live services (BTE, NGD, COHD, PubMed), whose answers can change at any time
+    CACHEABLE_EXPAND_KPS = [ 'ARAX/KG1', 'ARAX/KG2' ]
+    LIVE_SERVICE_OVERLAY_ACTIONS = [ 'compute_ngd', 'overlay_clinical_info', 'add_node_pmids' ]
+    _plan_cache_lock = threading.Lock()
+    _plan_cache = None
+    _plan_cache_checked = False
+    _code_version = None
+    _code_version_checked = False
+
     #### Constructor
     def __init__(self):
         self.response = None
         self.message = None
 
 
+    #### The processing plan cache (opened the first time it is needed), or None if caching is turned off
+    @staticmethod
+    def get_plan_cache():
+        with ARAXQuery._plan_cache_lock:
+            if not ARAXQuery._plan_cache_checked:
+                ARAXQuery._plan_cache_checked = True
+                if ARAXQuery.PLAN_CACHE_FILE is not None:
+                    ARAXQuery._plan_cache = ProcessingPlanCache(ARAXQuery.PLAN_CACHE_FILE, ARAXQuery.PLAN_CACHE_TTL_SEC,
+                        max_entries=ARAXQuery.PLAN_CACHE_MAX_ENTRIES, max_bytes=ARAXQuery.PLAN_CACHE_MAX_BYTES)
+            return ARAXQuery._plan_cache
+
+
+    #### Use the given ProcessingPlanCache (or None, to turn caching off)
+    @staticmethod
+    def set_plan_cache(plan_cache):
+        with ARAXQuery._plan_cache_lock:
+            ARAXQuery._plan_cache = plan_cache
+            ARAXQuery._plan_cache_checked = True
+
+
+    #### The version of the code: the git commit, and a hash of the uncommitted changes to it (None if it is not a git checkout)
+    @staticmethod
+    def get_code_version():
+        with ARAXQuery._plan_cache_lock:
+            if not ARAXQuery._code_version_checked:
+                ARAXQuery._code_version_checked = True
+                code_dir = os.path.dirname(os.path.abspath(__file__))
+                try:
+                    commit = subprocess.run([ 'git', 'rev-parse', 'HEAD' ], cwd=code_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=60).stdout
+                    changes = subprocess.run([ 'git', 'diff', 'HEAD' ], cwd=code_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=60).stdout
+                    ARAXQuery._code_version = commit.decode('utf-8').strip() + '+' + hashlib.sha256(changes).hexdigest()
+                except (OSError, subprocess.SubprocessError):
+                    ARAXQuery._code_version = None
+            return ARAXQuery._code_version
+
+
+    #### The versions of the system and of the knowledge graphs, which cached processing plan states are only valid for
+    @staticmethod
+    def get_knowledge_source_versions():
+        rtxConfig = RTXConfiguration()
+        versions = { 'ARAX': rtxConfig.version, 'code': ARAXQuery.get_code_version(), 'KG1': rtxConfig.neo4j_database }
+        rtxConfig.live = "KG2"
+        versions['KG2'] = rtxConfig.neo4j_database
+        return versions
+
+
+    #### Whether the result of an action comes from a live service (rather than from the Message and the local KGs)
+    @staticmethod
+    def calls_live_service(action):
+        if action['command'] == 'expand':
+            return action['parameters'].get('kp', 'ARAX/KG1') not in ARAXQuery.CACHEABLE_EXPAND_KPS
+        if action['command'] == 'overlay':
+            return action['parameters'].get('action') in ARAXQuery.LIVE_SERVICE_OVERLAY_ACTIONS
+        return False
+
+
+    #### The cache keys of the states after each of the actions, up to the first one whose result cannot be cached
+    def get_plan_step_keys(self, message, actions, versions):
+        step_keys = []
+        key = ProcessingPlanCache.make_base_key(message, versions)
+        for action_index, action in enumerate(actions):
+            if action['command'] not in self.CACHEABLE_COMMANDS or self.calls_live_service(action):
+                break
+            action_content = { 'command': action['command'], 'parameters': action['parameters'] }
+            #### The result of filter_results also depends on the number of results that the following actions keep
+            if action['command'] == 'filter_results':
+                from ARAX_filter_results import ARAXFilterResults
+                action_content['top_k'] = ARAXFilterResults.get_chained_max_results(actions[action_index + 1:])
+            key = ProcessingPlanCache.make_step_key(key, action_content)
+            step_keys.append(key)
+        return step_keys
+
+
     def query_return_stream(self,query):
 
         main_query_thread = threading.Thread(target=self.asynchronous_query, args=(query,))
@@ -437,7 +530,7 @@ class ARAXQuery:
         #### Examine the options that were provided and act accordingly
         optionsDict = {}
         if envelope.options:
-            response.debug(f"Processing options were provided, but these are not implemented at the moment and will be ignored")
+            response.debug(f"Processing options were provided, but apart from bypass_cache these are not implemented at the moment and will be ignored")
             for option in envelope.options:
                 response.debug(f"   option="+option)
                 optionsDict[option] = 1
@@ -469,7 +562,36 @@ class ARAXQuery:
             #### Process each action in order
             action_stats = { }
             actions = result.data['actions']
-            for action in actions:
+
+            #### If the states after the first actions are in the processing plan cache, resume from the last one of them
+            plan_cache = ARAXQuery.get_plan_cache()
+            step_keys = []
+            n_cached_actions = 0
+            n_log_entries_before_actions = len(response.messages)
+            if plan_cache is not None:
+                versions = ARAXQuery.get_knowledge_source_versions()
+                if versions['code'] is None:
+                    response.debug(f"Not using the processing plan cache: the version of the code is unknown")
+                else:
+                    step_keys = self.get_plan_step_keys(message, actions, versions)
+                if step_keys and 'bypass_cache' not in optionsDict:
+                    for action_index in range(len(step_keys) - 1, -1, -1):
+                        cached_state = plan_cache.get(step_keys[action_index])
+                        if cached_state is not None:
+                            message, log_entries = cached_state
+                            self.message = message
+                            for log_entry in log_entries:
+                                response.messages.append(log_entry)
+                                response.n_messages += 1
+                                if log_entry['level'] == Response.WARNING:
+                                    response.n_warnings += 1
+                            n_cached_actions = action_index + 1
+                            response.info(f"Resumed from the cached result of the first {n_cached_actions} actions")
+                            break
+
+            for action_index, action in enumerate(actions):
+                if action_index < n_cached_actions:
+                    continue
                 response.info(f"Processing action '{action['command']}' with parameters {action['parameters']}")
                 nonstandard_result = False
                 skip_merge = False
@@ -505,7 +627,9 @@ class ARAXQuery:
                         result = filter_kg.apply(message, action['parameters'])
 
                     elif action['command'] == 'filter_results':  # recognize the filter_kg command
-                        result = filter_results.apply(message, action['parameters'])
+                        # a sort followed by limit_number_of_results actions only has to select the results that are kept
+                        top_k = ARAXFilterResults.get_chained_max_results(actions[action_index + 1:])
+                        result = filter_results.apply(message, action['parameters'], top_k=top_k)
 
                     elif action['command'] == 'query_graph_reasoner':
                         response.info(f"Sending current query_graph to the QueryGraphReasoner")
@@ -547,6 +671,13 @@ class ARAXQuery:
                         response.error(f"An uncaught error occurred: {error}: {repr(traceback.format_exception(exception_type, exception_value, exception_traceback))}", error_code="UncaughtARAXiError")
                         return response
 
+                #### Cache the state after each cacheable action, so that plans starting with the same actions can resume from it
+                if action_index < len(step_keys):
+                    try:
+                        plan_cache.set(step_keys[action_index], message, response.messages[n_log_entries_before_actions:])
+                    except Exception as error:
+                        response.warning(f"Unable to store the result of action '{action['command']}' in the processing plan cache: {error}")
+
             #### At the end, process the explicit return() action, or implicitly perform one
             return_action = { 'command': 'return', 'parameters': { 'message': 'true', 'store': 'true' } }
             if action is not None and action['command'] == 'return':
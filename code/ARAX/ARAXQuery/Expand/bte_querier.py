@@ -3,6 +3,7 @@ import sys
 import os
 import traceback
 import asyncio
+import concurrent.futures
 
 from biothings_explorer.user_query_dispatcher import SingleEdgeQueryDispatcher
 
@@ -14,9 +15,13 @@ import Expand.expand_utilities as eu
 
 
 class BTEQuerier:
+    MAX_CONCURRENT_QUERIES = 8  # Number of input curies that are queried at the same time
+    QUERY_TIMEOUT_SEC = 120  # Time allowed for the query of a single input curie
 
     def __init__(self, response_object):
         self.response = response_object
+        self.max_concurrent_queries = self.MAX_CONCURRENT_QUERIES
+        self.query_timeout = self.QUERY_TIMEOUT_SEC
         self.use_synonyms = response_object.data['parameters'].get('use_synonyms')
         self.synonym_handling = response_object.data['parameters'].get('synonym_handling')
         self.enforce_directionality = response_object.data['parameters'].get('enforce_directionality')
@@ -138,31 +143,90 @@ class BTEQuerier:
 
     def _answer_query_using_bte(self, input_qnode, output_qnode, qedge, answer_kg, valid_bte_inputs_dict):
         accepted_curies = set()
-        # Send this single-edge query to BTE, once per input curie (adding findings to our answer KG as we go)
+        curies_to_query = []
         for curie in input_qnode.curie:
-            if eu.get_curie_prefix(curie) in valid_bte_inputs_dict['curie_prefixes']:
+            if eu.get_curie_prefix(curie) in valid_bte_inputs_dict['curie_prefixes'] and curie not in accepted_curies:
                 accepted_curies.add(curie)
+                curies_to_query.append(curie)
+        if not curies_to_query:
+            return answer_kg, accepted_curies
+
+        # Send this single-edge query to BTE for all input curies at once (adding findings to our answer KG as we go)
+        loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_queries)
+        try:
+            answer_kg, failed_curies = loop.run_until_complete(self._answer_query_using_bte_async(
+                curies_to_query, input_qnode, output_qnode, qedge, answer_kg, loop, executor))
+        finally:
+            executor.shutdown(wait=False)  # Queries that timed out may still be running; don't wait for them
+            loop.close()
+
+        if failed_curies and len(failed_curies) == len(curies_to_query):
+            problem, error_code = failed_curies[curies_to_query[0]]
+            self.response.error(f"Encountered a problem while using BioThings Explorer. {problem}", error_code=error_code)
+        elif failed_curies:
+            self.response.warning(f"BTE queries failed for {len(failed_curies)} of {len(curies_to_query)} input curies "
+                                  f"({', '.join(failed_curies)}); returning results for the rest")
+        return answer_kg, accepted_curies
+
+    async def _answer_query_using_bte_async(self, curies, input_qnode, output_qnode, qedge, answer_kg, loop, executor):
+        semaphore = asyncio.Semaphore(self.max_concurrent_queries)
+
+        async def query_bte(curie):
+            async with semaphore:
+                self.response.debug(f"Sending query to BTE: {curie}-{qedge.type if qedge.type else ''}->{output_qnode.type}")
+                started = asyncio.Event()
+
+                def run_query():
+                    loop.call_soon_threadsafe(started.set)
+                    return self._query_bte(curie, input_qnode.type, output_qnode.type, qedge.type)
+
+                future = loop.run_in_executor(executor, run_query)
+                # A query's time only starts once a worker thread picks it up: queries that timed out keep their
+                # threads until BTE answers them, and the queries waiting for a thread shouldn't time out because of it
                 try:
-                    loop = asyncio.new_event_loop()
-                    seqd = SingleEdgeQueryDispatcher(input_cls=input_qnode.type,
-                                                     output_cls=output_qnode.type,
-                                                     pred=qedge.type,
-                                                     input_id=eu.get_curie_prefix(curie),
-                                                     values=eu.get_curie_local_id(curie),
-                                                     loop=loop)
-                    self.response.debug(f"Sending query to BTE: {curie}-{qedge.type if qedge.type else ''}->{output_qnode.type}")
-                    seqd.query()
-                    reasoner_std_response = seqd.to_reasoner_std()
-                except Exception:
-                    trace_back = traceback.format_exc()
-                    error_type, error, _ = sys.exc_info()
-                    self.response.error(f"Encountered a problem while using BioThings Explorer. {trace_back}",
-                                        error_code=error_type.__name__)
-                    return answer_kg, accepted_curies
-                else:
-                    answer_kg = self._add_answers_to_kg(answer_kg, reasoner_std_response, input_qnode.id, output_qnode.id, qedge.id)
+                    await started.wait()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                return await asyncio.wait_for(future, timeout=self.query_timeout)
+
+        # Submit all queries at once, then merge their answers (in curie order) as they come in
+        tasks = [loop.create_task(query_bte(curie)) for curie in curies]
+        failed_curies = dict()
+        for curie, task in zip(curies, tasks):
+            try:
+                reasoner_std_response = await task
+            except asyncio.TimeoutError:
+                failed_curies[curie] = (f"Query for {curie} timed out after {self.query_timeout} seconds", "TimeoutError")
+            except Exception:
+                error_type, error, _ = sys.exc_info()
+                failed_curies[curie] = (traceback.format_exc(), error_type.__name__)
+            else:
+                answer_kg = self._add_answers_to_kg(answer_kg, reasoner_std_response, input_qnode.id, output_qnode.id, qedge.id)
+                if self.response.status != 'OK':
+                    for remaining_task in tasks:
+                        remaining_task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    break
+        return answer_kg, failed_curies
 
-        return answer_kg, accepted_curies
+    @staticmethod
+    def _query_bte(curie, input_type, output_type, predicate):
+        # BTE runs its (asynchronous) calls to the underlying APIs to completion on the loop it's given, so each query
+        # gets a loop of its own, in its own worker thread
+        loop = asyncio.new_event_loop()
+        try:
+            seqd = SingleEdgeQueryDispatcher(input_cls=input_type,
+                                             output_cls=output_type,
+                                             pred=predicate,
+                                             input_id=eu.get_curie_prefix(curie),
+                                             values=eu.get_curie_local_id(curie),
+                                             loop=loop)
+            seqd.query()
+            return seqd.to_reasoner_std()
+        finally:
+            loop.close()
 
     def _add_answers_to_kg(self, answer_kg, reasoner_std_response, input_qnode_id, output_qnode_id, qedge_id):
         kg_to_qg_ids_dict = self._build_kg_to_qg_id_dict(reasoner_std_response['results'])
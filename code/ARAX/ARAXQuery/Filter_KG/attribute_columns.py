@@ -0,0 +1,188 @@
+# This class keeps a columnar view of the edge and node attributes of a message's knowledge graph, so that filter_kg
+# actions can pick the edges/nodes to remove with vectorized (numpy) operations instead of looping over the KG
+#!/bin/env python3
+import itertools
+import weakref
+import numpy as np
+
+MISSING = object()  # value of a property that a node/edge does not have
+
+
+def object_array(values):
+    """
+    Make a 1-d numpy object array (np.array() would make a 2-d array of a list of equal length lists)
+    """
+    values = list(values)
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+def plain_value(value):
+    """
+    The value of a model's property, as it is in the model's to_dict() (without converting the whole model)
+    """
+    if isinstance(value, list):
+        return [x.to_dict() if hasattr(x, "to_dict") else x for x in value]
+    elif hasattr(value, "to_dict"):
+        return value.to_dict()
+    return value
+
+
+class AttributeColumns:
+
+    #### Constructor
+    def __init__(self, knowledge_graph):
+        self.edges = knowledge_graph.edges
+        self.nodes = knowledge_graph.nodes
+        self.num_edges = len(self.edges)
+        self.num_nodes = len(self.nodes)
+        self.fingerprint = self.get_fingerprint(knowledge_graph)
+        # the columns are built the first time they are asked for, and compacted along with the KG by remove()
+        self.edge_attributes = dict()  # name -> (float values of each occurrence of the attribute, index of its edge)
+        self.edge_properties = dict()  # name -> object array of values
+        self.node_properties = dict()  # name -> object array of values (MISSING if the node does not have it)
+
+    @staticmethod
+    def get_fingerprint(knowledge_graph):
+        """
+        The edges (with their lists of attributes and the lengths of those) and the nodes of the KG. The objects themselves
+        are kept (and compared by identity), so that their ids cannot be reused by new objects
+        """
+        edge_fingerprint = []
+        for edge in knowledge_graph.edges:
+            edge_attributes = getattr(edge, 'edge_attributes', None)
+            edge_fingerprint.append((edge, edge_attributes, len(edge_attributes) if edge_attributes else 0))
+        return edge_fingerprint, list(knowledge_graph.nodes)
+
+    def is_current(self, knowledge_graph):
+        """
+        Whether the KG still has the edges and nodes that the columns were built for (if they were replaced, added to, or
+        had edge attributes added, the columns have to be rebuilt; overlays that change the edges or nodes in other ways
+        call invalidate_attribute_columns())
+        """
+        edge_fingerprint, nodes = self.fingerprint
+        if len(knowledge_graph.edges) != len(edge_fingerprint) or len(knowledge_graph.nodes) != len(nodes):
+            return False
+        if any(node is not old_node for node, old_node in zip(knowledge_graph.nodes, nodes)):
+            return False
+        for edge, (old_edge, old_edge_attributes, num_edge_attributes) in zip(knowledge_graph.edges, edge_fingerprint):
+            edge_attributes = getattr(edge, 'edge_attributes', None)
+            if edge is not old_edge or edge_attributes is not old_edge_attributes or \
+                    (len(edge_attributes) if edge_attributes else 0) != num_edge_attributes:
+                return False
+        return True
+
+    def get_edge_attribute(self, name):
+        """
+        The values of an edge attribute, as floats. An edge can have the attribute more than once: each occurrence counts
+        (as in the per-edge loops that the filters replaced)
+        :param name: name of the edge attribute (eg. ngd)
+        :return: tuple (float array of the values, int array of the index of the edge of each value), in the order of the edges
+        """
+        if name not in self.edge_attributes:
+            values = []
+            edge_indexes = []
+            for index, edge in enumerate(self.edges):
+                if hasattr(edge, 'edge_attributes') and edge.edge_attributes:
+                    for attribute in edge.edge_attributes:
+                        if attribute.name == name:
+                            values.append(float(attribute.value))
+                            edge_indexes.append(index)
+            self.edge_attributes[name] = (np.array(values, dtype=float), np.array(edge_indexes, dtype=int))
+        return self.edge_attributes[name]
+
+    def get_edge_property(self, name):
+        """
+        The values of an edge property (eg. type, source_id)
+        :return: object array of the values
+        """
+        if name not in self.edge_properties:
+            for edge in self.edges:
+                if name not in edge.swagger_types:
+                    raise KeyError(name)
+            self.edge_properties[name] = object_array([plain_value(getattr(edge, name)) for edge in self.edges])
+        return self.edge_properties[name]
+
+    def get_node_property(self, name):
+        """
+        The values of a node property (eg. id, type)
+        :return: object array of the values (MISSING for nodes that do not have the property)
+        """
+        if name not in self.node_properties:
+            self.node_properties[name] = object_array([plain_value(getattr(node, name)) if name in node.swagger_types else MISSING
+                                                       for node in self.nodes])
+        return self.node_properties[name]
+
+    @staticmethod
+    def matches(values, value):
+        """
+        Which of the values are equal to value, or (for lists) contain it
+        :return: bool array
+        """
+        return np.fromiter((x == value or (isinstance(x, list) and value in x) for x in values), dtype=bool, count=len(values))
+
+    @staticmethod
+    def is_in(values, value_set):
+        return np.fromiter((x in value_set for x in values), dtype=bool, count=len(values))
+
+    def edges_connected_to(self, node_ids):
+        """
+        Which edges have their source or target in node_ids
+        :return: bool array
+        """
+        return self.is_in(self.get_edge_property('source_id'), node_ids) | self.is_in(self.get_edge_property('target_id'), node_ids)
+
+    def remove(self, knowledge_graph, edges_to_remove, nodes_to_remove):
+        """
+        Remove edges and nodes from the KG (and the columns) in a single compaction pass
+        :param knowledge_graph: the KG the columns were built for
+        :param edges_to_remove: bool array over the edges
+        :param nodes_to_remove: bool array over the nodes
+        """
+        edges_to_keep = ~edges_to_remove
+        nodes_to_keep = ~nodes_to_remove
+        self.edges = list(itertools.compress(self.edges, edges_to_keep))
+        self.nodes = list(itertools.compress(self.nodes, nodes_to_keep))
+        knowledge_graph.edges = self.edges
+        knowledge_graph.nodes = self.nodes
+        self.num_edges = len(self.edges)
+        self.num_nodes = len(self.nodes)
+        self.fingerprint = self.get_fingerprint(knowledge_graph)
+        # the new index of each kept edge
+        new_edge_indexes = np.cumsum(edges_to_keep) - 1
+        for name, (values, edge_indexes) in self.edge_attributes.items():
+            is_kept = edges_to_keep[edge_indexes]
+            self.edge_attributes[name] = (values[is_kept], new_edge_indexes[edge_indexes[is_kept]])
+        for name, values in self.edge_properties.items():
+            self.edge_properties[name] = values[edges_to_keep]
+        for name, values in self.node_properties.items():
+            self.node_properties[name] = values[nodes_to_keep]
+
+
+# the columns of each message's knowledge graph, by id (the models are unhashable), with a weak reference to tell
+# whether the knowledge graph is still the same one
+_columns_by_knowledge_graph_id = dict()
+
+
+def get_attribute_columns(message):
+    """
+    Get the (cached) columns of a message's knowledge graph, building them again if the KG changed
+    :return: AttributeColumns
+    """
+    knowledge_graph = message.knowledge_graph
+    knowledge_graph_ref, columns = _columns_by_knowledge_graph_id.get(id(knowledge_graph), (None, None))
+    if knowledge_graph_ref is None or knowledge_graph_ref() is not knowledge_graph or not columns.is_current(knowledge_graph):
+        columns = AttributeColumns(knowledge_graph)
+        key = id(knowledge_graph)
+        _columns_by_knowledge_graph_id[key] = (weakref.ref(knowledge_graph, lambda ref: _columns_by_knowledge_graph_id.pop(key, None)), columns)
+    return columns
+
+
+def invalidate_attribute_columns(message):
+    """
+    Drop the columns of a message's knowledge graph (call this after changing its edges or nodes in place)
+    """
+    if hasattr(message, 'knowledge_graph') and message.knowledge_graph is not None:
+        _columns_by_knowledge_graph_id.pop(id(message.knowledge_graph), None)
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../OpenAPI/python-f
 from swagger_server.models.edge_attribute import EdgeAttribute
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../reasoningtool/kg-construction/")
 from NormGoogleDistance import NormGoogleDistance as NGD
+from Filter_KG.attribute_columns import get_attribute_columns
 
 
 class RemoveEdges:
@@ -20,6 +21,32 @@ class RemoveEdges:
         self.message = message
         self.edge_parameters = edge_params
 
+    def __remove_edges(self, columns, edges_to_remove):
+        """
+        Remove the marked edges (and, if asked to, their connected nodes and the edges of those) from the knowledge graph
+        :param columns: AttributeColumns of the knowledge graph
+        :param edges_to_remove: bool array over the edges
+        """
+        edge_params = self.edge_parameters
+        nodes_to_remove = np.zeros(columns.num_nodes, dtype=bool)
+        if edge_params['remove_connected_nodes']:
+            self.response.debug(f"Removing Nodes")
+            self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
+            node_ids_to_remove = set(columns.get_edge_property('source_id')[edges_to_remove]) | set(columns.get_edge_property('target_id')[edges_to_remove])
+            node_ids = columns.get_node_property('id')
+            # find adjacent connected nodes
+            nodes_to_remove = columns.is_in(node_ids, node_ids_to_remove)
+            if 'qnode_id' in edge_params:
+                # only remove the connected nodes of the given query node (and keep the edges of the others)
+                in_qnode = np.fromiter((qnode_ids is not None and edge_params['qnode_id'] in qnode_ids for qnode_ids in columns.get_node_property('qnode_ids')),
+                                       dtype=bool, count=columns.num_nodes)
+                node_ids_to_remove -= set(node_ids[nodes_to_remove & ~in_qnode])
+                nodes_to_remove &= in_qnode
+            # find edges connected to the nodes
+            edges_to_remove = edges_to_remove | columns.edges_connected_to(node_ids_to_remove)
+        # remove edges and connected nodes
+        columns.remove(self.message.knowledge_graph, edges_to_remove, nodes_to_remove)
+
     def remove_edges_by_type(self):
         """
         Iterate over all the edges in the knowledge graph, remove any edges matching the discription provided.
@@ -29,46 +56,10 @@ class RemoveEdges:
         self.response.info(f"Removing edges from the knowledge graph matching the specified type")
         edge_params = self.edge_parameters
         try:
-            i = 0
-            edges_to_remove = set()
-            node_ids_to_remove = set()
-            # iterate over the edges find the edges to remove
-            for edge in self.message.knowledge_graph.edges:
-                if edge.type == edge_params['edge_type']:
-                    edges_to_remove.add(i)
-                    if edge_params['remove_connected_nodes']:
-                        node_ids_to_remove.add(edge.source_id)
-                        node_ids_to_remove.add(edge.target_id)
-                i += 1
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                i = 0
-                nodes_to_remove = set()
-                # iterate over nodes find adjacent connected nodes
-                for node in self.message.knowledge_graph.nodes:
-                    if node.id in node_ids_to_remove:
-                        if 'qnode_id' in edge_params:
-                            if node.qnode_ids is not None:
-                                if edge_params['qnode_id'] in node.qnode_ids:
-                                    nodes_to_remove.add(i)
-                                else:
-                                    node_ids_to_remove.remove(node.id)
-                            else:
-                                node_ids_to_remove.remove(node.id)
-                        else:
-                            nodes_to_remove.add(i)
-                    i += 1
-                # remove connected nodes
-                self.message.knowledge_graph.nodes = [val for idx,val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                i = 0
-                # iterate over edges find edges connected to the nodes
-                for edge in self.message.knowledge_graph.edges:
-                    if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                        edges_to_remove.add(i)
-                    i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+            columns = get_attribute_columns(self.message)
+            # find the edges to remove
+            edges_to_remove = columns.get_edge_property('type') == edge_params['edge_type']
+            self.__remove_edges(columns, edges_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -88,54 +79,10 @@ class RemoveEdges:
         self.response.info(f"Removing edges from the knowledge graph matching the specified property")
         edge_params = self.edge_parameters
         try:
-            i = 0
-            edges_to_remove = set()
-            node_ids_to_remove = set()
-            # iterate over the edges find the edges to remove
-            for edge in self.message.knowledge_graph.edges:
-                edge_dict = edge.to_dict()
-                if type(edge_dict[edge_params['edge_property']]) == list:
-                    if edge_params['property_value'] in edge_dict[edge_params['edge_property']]:
-                        edges_to_remove.add(i)
-                        if edge_params['remove_connected_nodes']:
-                            node_ids_to_remove.add(edge.source_id)
-                            node_ids_to_remove.add(edge.target_id)
-                else:
-                    if edge_dict[edge_params['edge_property']] == edge_params['property_value']:
-                        edges_to_remove.add(i)
-                        if edge_params['remove_connected_nodes']:
-                            node_ids_to_remove.add(edge.source_id)
-                            node_ids_to_remove.add(edge.target_id)
-                i += 1
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                i = 0
-                nodes_to_remove = set()
-                # iterate over nodes find adjacent connected nodes
-                for node in self.message.knowledge_graph.nodes:
-                    if node.id in node_ids_to_remove:
-                        if 'qnode_id' in edge_params:
-                            if node.qnode_ids is not None:
-                                if edge_params['qnode_id'] in node.qnode_ids:
-                                    nodes_to_remove.add(i)
-                                else:
-                                    node_ids_to_remove.remove(node.id)
-                            else:
-                                node_ids_to_remove.remove(node.id)
-                        else:
-                            nodes_to_remove.add(i)
-                    i += 1
-                # remove connected nodes
-                self.message.knowledge_graph.nodes = [val for idx,val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                i = 0
-                # iterate over edges find edges connected to the nodes
-                for edge in self.message.knowledge_graph.edges:
-                    if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                        edges_to_remove.add(i)
-                    i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+            columns = get_attribute_columns(self.message)
+            # find the edges to remove: the property is the value, or a list containing it
+            edges_to_remove = columns.matches(columns.get_edge_property(edge_params['edge_property']), edge_params['property_value'])
+            self.__remove_edges(columns, edges_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -155,60 +102,16 @@ class RemoveEdges:
         self.response.info(f"Removing edges from the knowledge graph with the specified attribute values")
         edge_params = self.edge_parameters
         try:
+            columns = get_attribute_columns(self.message)
+            values, edge_indexes = columns.get_edge_attribute(edge_params['edge_attribute'])
+            # find the edges with the attribute above/below the threshold
             if edge_params['direction'] == 'above':
-                def compare(x, y):
-                    return x > y
+                is_match = values > edge_params['threshold']
             elif edge_params['direction'] == 'below':
-                def compare(x, y):
-                    return x < y
-
-            i = 0
-            edges_to_remove = set()
-            node_ids_to_remove = set()
-            # iterate over the edges find the edges to remove
-            for edge in self.message.knowledge_graph.edges:  # iterate over the edges
-                if hasattr(edge, 'edge_attributes'):  # check if they have attributes
-                    if edge.edge_attributes:  # if there are any edge attributes
-                        for attribute in edge.edge_attributes:  # for each attribute
-                            if attribute.name == edge_params['edge_attribute']:  # check if it's the desired one
-                                if compare(float(attribute.value), edge_params['threshold']):  # check if it's above/below the threshold
-                                    edges_to_remove.add(i)  # mark it to be removed
-                                    if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
-                                        node_ids_to_remove.add(edge.source_id)
-                                        node_ids_to_remove.add(edge.target_id)
-                i += 1
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                i = 0
-                nodes_to_remove = set()
-                # iterate over nodes find adjacent connected nodes
-                for node in self.message.knowledge_graph.nodes:
-                    if node.id in node_ids_to_remove:
-                        if 'qnode_id' in edge_params:
-                            if node.qnode_ids is not None:
-                                if edge_params['qnode_id'] in node.qnode_ids:
-                                    nodes_to_remove.add(i)
-                                else:
-                                    node_ids_to_remove.remove(node.id)
-                            else:
-                                node_ids_to_remove.remove(node.id)
-                        else:
-                            nodes_to_remove.add(i)
-                    i += 1
-                # remove connected nodes
-                self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                i = 0
-                c = 0
-                # iterate over edges find edges connected to the nodes
-                for edge in self.message.knowledge_graph.edges:
-                    if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                        edges_to_remove.add(i)
-                    else:
-                        c += 1
-                    i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+                is_match = values < edge_params['threshold']
+            edges_to_remove = np.zeros(columns.num_edges, dtype=bool)
+            edges_to_remove[edge_indexes[is_match]] = True
+            self.__remove_edges(columns, edges_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -228,88 +131,29 @@ class RemoveEdges:
         self.response.info(f"Removing edges from the knowledge graph with the specified attribute values")
         edge_params = self.edge_parameters
         try:
-            i = 0
-            edges_to_remove = set()
-            node_ids_to_remove = set()
-            values = []
-            # iterate over the edges find the edges to remove
-            for edge in self.message.knowledge_graph.edges:  # iterate over the edges
-                if hasattr(edge, 'edge_attributes'):  # check if they have attributes
-                    if edge.edge_attributes:  # if there are any edge attributes
-                        for attribute in edge.edge_attributes:  # for each attribute
-                            if attribute.name == edge_params['edge_attribute']:  # check if it's the desired one
-                                values.append((i,float(attribute.value), edge.source_id, edge.target_id))
-                i += 1
+            columns = get_attribute_columns(self.message)
+            values, edge_indexes = columns.get_edge_attribute(edge_params['edge_attribute'])
+            edges_to_remove = np.zeros(columns.num_edges, dtype=bool)
             if len(values) > 0:
                 print(edge_params)
                 if edge_params['stat'] == 'n':
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
-                    values.sort(key=lambda x:x[1])
+                    # keep the top (or bottom) n values
+                    order = np.argsort(values, kind='stable')
                     if edge_params['top']:
-                        values.reverse()
-                    values = values[edge_params['threshold']:]
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
+                        order = order[::-1]
+                    edges_to_remove[edge_indexes[order[edge_params['threshold']:]]] = True
                 elif edge_params['stat'] == 'std':
-                    vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
-                    mean = np.mean(vals)
-                    std = np.std(vals)
-                    #print(mean)
-                    #print(std)
+                    mean = np.mean(values)
+                    std = np.std(values)
                     if edge_params['top']:
-                        i = 1
+                        val = mean + std
                     else:
-                        i = -1
-                    val = mean + i*std
-                    #print(val)
+                        val = mean - std
                     if edge_params['direction'] == 'above':
-                        values = [x for x in values if x[1]>val]
+                        edges_to_remove[edge_indexes[values > val]] = True
                     elif edge_params['direction'] == 'below':
-                        values = [x for x in values if x[1]<val]
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
-
-
-            for edge in values:
-                edges_to_remove.add(edge[0])  # mark it to be removed
-                if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
-                    node_ids_to_remove.add(edge[2])
-                    node_ids_to_remove.add(edge[3])
-
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                i = 0
-                nodes_to_remove = set()
-                # iterate over nodes find adjacent connected nodes
-                for node in self.message.knowledge_graph.nodes:
-                    if node.id in node_ids_to_remove:
-                        if 'qnode_id' in edge_params:
-                            if node.qnode_ids is not None:
-                                if edge_params['qnode_id'] in node.qnode_ids:
-                                    nodes_to_remove.add(i)
-                                else:
-                                    node_ids_to_remove.remove(node.id)
-                            else:
-                                node_ids_to_remove.remove(node.id)
-                        else:
-                            nodes_to_remove.add(i)
-                    i += 1
-                # remove connected nodes
-                self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                i = 0
-                c = 0
-                # iterate over edges find edges connected to the nodes
-                for edge in self.message.knowledge_graph.edges:
-                    if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                        edges_to_remove.add(i)
-                    else:
-                        c += 1
-                    i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+                        edges_to_remove[edge_indexes[values < val]] = True
+            self.__remove_edges(columns, edges_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -318,4 +162,4 @@ class RemoveEdges:
         else:
             self.response.info(f"Edges successfully removed")
 
-        return self.response
\ No newline at end of file
+        return self.response
@@ -4,6 +4,7 @@ import sys
 import os
 import traceback
 import numpy as np
+from Filter_KG.attribute_columns import get_attribute_columns
 
 
 class RemoveNodes:
@@ -14,6 +15,18 @@ class RemoveNodes:
         self.message = message
         self.node_parameters = params
 
+    def __remove_nodes(self, columns, nodes_to_remove):
+        """
+        Remove the marked nodes and the edges connected to them from the knowledge graph
+        :param columns: AttributeColumns of the knowledge graph
+        :param nodes_to_remove: bool array over the nodes
+        """
+        node_ids_to_remove = set(columns.get_node_property('id')[nodes_to_remove])
+        # find edges connected to the nodes
+        edges_to_remove = columns.edges_connected_to(node_ids_to_remove)
+        # remove the nodes and edges
+        columns.remove(self.message.knowledge_graph, edges_to_remove, nodes_to_remove)
+
     def remove_nodes_by_type(self):
         """
         Iterate over all the edges in the knowledge graph, remove any edges matching the discription provided.
@@ -23,25 +36,11 @@ class RemoveNodes:
         self.response.info(f"Removing nodes from the knowledge graph matching the specified type")
 
         try:
-            i = 0
-            nodes_to_remove = set()
-            node_ids_to_remove = set()
-            # iterate over the edges find the edges to remove
-            for node in self.message.knowledge_graph.nodes:
-                if self.node_parameters['node_type'] in node.type:
-                    nodes_to_remove.add(i)
-                    node_ids_to_remove.add(node.id)
-                i += 1
-            self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-            i = 0
-            edges_to_remove = set()
-            # iterate over edges find edges connected to the nodes
-            for edge in self.message.knowledge_graph.edges:
-                if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                    edges_to_remove.add(i)
-                i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx, val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+            columns = get_attribute_columns(self.message)
+            # find the nodes to remove
+            nodes_to_remove = np.fromiter((self.node_parameters['node_type'] in node_type for node_type in columns.get_node_property('type')),
+                                          dtype=bool, count=columns.num_nodes)
+            self.__remove_nodes(columns, nodes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -61,32 +60,10 @@ class RemoveNodes:
         self.response.info(f"Removing nodes from the knowledge graph matching the specified property")
         node_params = self.node_parameters
         try:
-            i = 0
-            nodes_to_remove = set()
-            node_ids_to_remove = set()
-            # iterate over the nodes find the nodes to remove
-            for node in self.message.knowledge_graph.nodes:
-                node_dict = node.to_dict()
-                if node_params['node_property'] in node_dict:
-                    if isinstance(node_dict[node_params['node_property']], list):
-                        if node_params['property_value'] in node_dict[node_params['node_property']]:
-                            nodes_to_remove.add(i)
-                        elif node_dict[node_params['node_property']] == node_params['property_value']:
-                            nodes_to_remove.add(i)
-                    else:
-                        if node_dict[node_params['node_property']] == node_params['property_value']:
-                            nodes_to_remove.add(i)
-                i += 1
-            self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-            i = 0
-            edges_to_remove = set()
-            # iterate over edges find edges connected to the nodes
-            for edge in self.message.knowledge_graph.edges:
-                if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
-                    edges_to_remove.add(i)
-                i += 1
-            # remove edges
-            self.message.knowledge_graph.edges = [val for idx, val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
+            columns = get_attribute_columns(self.message)
+            # find the nodes to remove: the property is the value, or a list containing it
+            nodes_to_remove = columns.matches(columns.get_node_property(node_params['node_property']), node_params['property_value'])
+            self.__remove_nodes(columns, nodes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -107,26 +84,17 @@ class RemoveNodes:
         node_parameters = self.node_parameters
 
         try:
-            # iterate over edges in KG to find all id's that connect the edges
-            connected_node_ids = set()
-            for edge in self.message.knowledge_graph.edges:
-                connected_node_ids.add(edge.source_id)
-                connected_node_ids.add(edge.target_id)
-
-            # iterate over all nodes in KG
-            node_indexes_to_remove = set()
-            i = 0  # counter to keep track of where this node is in the message.knowledge_graph.nodes list
-            for node in self.message.knowledge_graph.nodes:
-                if 'node_type' in node_parameters and node_parameters['node_type'] in node.type:
-                    if node.id not in connected_node_ids:
-                        node_indexes_to_remove.add(i)
-                else:
-                    if node.id not in connected_node_ids:
-                        node_indexes_to_remove.add(i)
-                i += 1
+            columns = get_attribute_columns(self.message)
+            # all id's that connect the edges
+            connected_node_ids = set(columns.get_edge_property('source_id')) | set(columns.get_edge_property('target_id'))
+            # the orphaned nodes (only those of the given type, if there is one)
+            node_indexes_to_remove = ~columns.is_in(columns.get_node_property('id'), connected_node_ids)
+            if 'node_type' in node_parameters:
+                node_indexes_to_remove &= np.fromiter((node_type is not None and node_parameters['node_type'] in node_type
+                                                       for node_type in columns.get_node_property('type')), dtype=bool, count=columns.num_nodes)
 
             # remove the orphaned nodes
-            self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in node_indexes_to_remove]
+            columns.remove(self.message.knowledge_graph, np.zeros(columns.num_edges, dtype=bool), node_indexes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
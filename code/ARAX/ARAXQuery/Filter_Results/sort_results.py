@@ -5,6 +5,7 @@ import os
 import traceback
 import numpy as np
 import math
+import heapq
 
 # relative imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../OpenAPI/python-flask-server/")
@@ -18,13 +19,37 @@ def sort_index(lst, desc):
     indexes = sorted(range(len(lst)), key=lst.__getitem__, reverse = desc)
     return indexes
 
+def top_k_index(lst, desc, k):
+    # the first k of sort_index(lst, desc), selected with a heap instead of sorting the whole list (ties keep their order too)
+    if k is None:
+        return sort_index(lst, desc)
+    if desc:
+        return heapq.nlargest(k, range(len(lst)), key=lst.__getitem__)
+    else:
+        return heapq.nsmallest(k, range(len(lst)), key=lst.__getitem__)
+
 class SortResults:
 
     #### Constructor
-    def __init__(self, response, message, params):
+    def __init__(self, response, message, params, top_k=None):
         self.response = response
         self.message = message
         self.parameters = params
+        # the number of results that will be kept anyway (by limit_number_of_results actions right after this one)
+        self.top_k = top_k
+
+    def __reorder_results(self, value_list):
+        """
+        Reorder the results by their values; if only the top results are kept (max_results, or top_k), only those are
+        selected instead of sorting all of them
+        """
+        params = self.parameters
+        limits = [n for n in (params.get('max_results'), self.top_k) if n is not None]
+        if limits and min(limits) < len(value_list):
+            idx = top_k_index(value_list, params['descending'], min(limits))
+        else:
+            idx = sort_index(value_list, params['descending'])
+        self.message.results = [self.message.results[i] for i in idx]
 
     def limit_number_of_results(self):
         """
@@ -81,8 +106,7 @@ class SortResults:
                                 # this will take the sum off all edges with the attribute if we want to change to max edit this line
                                 value_list[i] += edge_values[binding.kg_id]['value']
                 i+=1
-            idx = sort_index(value_list, params['descending'])
-            self.message.results = [self.message.results[i] for i in idx]
+            self.__reorder_results(value_list)
             if 'max_results' in params:
                 self.limit_number_of_results()
         except:
@@ -109,8 +133,7 @@ class SortResults:
             for result in self.message.results:
                 value_list[i] = len(result.edge_bindings)
                 i+=1
-            idx = sort_index(value_list, params['descending'])
-            self.message.results = [self.message.results[i] for i in idx]
+            self.__reorder_results(value_list)
             if 'max_results' in params:
                 self.limit_number_of_results()
         except:
@@ -160,8 +183,7 @@ class SortResults:
                                 # this will take the sum off all nodes with the attribute if we want to change to max edit this line
                                 value_list[i] += node_values[binding.kg_id]['value']
                 i+=1
-            idx = sort_index(value_list, params['descending'])
-            self.message.results = [self.message.results[i] for i in idx]
+            self.__reorder_results(value_list)
             if 'max_results' in params:
                 self.limit_number_of_results()
         except:
@@ -188,8 +210,7 @@ class SortResults:
             for result in self.message.results:
                 value_list[i] = len(result.node_bindings)
                 i+=1
-            idx = sort_index(value_list, params['descending'])
-            self.message.results = [self.message.results[i] for i in idx]
+            self.__reorder_results(value_list)
             if 'max_results' in params:
                 self.limit_number_of_results()
         except:
@@ -15,18 +15,69 @@ import requests
 import re
 import json
 import sys
+import os
+import copy
+import time
+import hashlib
+import sqlite3
+import threading
+import concurrent.futures
+from requests.adapters import HTTPAdapter
 #import unittest
 from collections import OrderedDict
 #from cache_control_helper import CacheControlHelper
-from deepdiff import DeepDiff  # For Deep Difference of 2 objects
 #from deepdiff import grep, DeepSearch  # For finding if item exists in an object
 #from deepdiff import DeepHash  # For hashing objects based on their contents   
 #import jsondiff 
 #from recursive_diff import recursive_eq    
 
+class ICEESResponseCache:
+    '''
+    A persistent (sqlite) cache of ICEES responses, keyed by the request. Responses older than the time-to-live are
+    ignored (and replaced when the request is sent again).
+    '''
+
+    def __init__(self, db_file, ttl_sec):
+        self.ttl_sec = ttl_sec
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, timestamp REAL, content TEXT)")
+
+    @staticmethod
+    def make_key(url, query):
+        return hashlib.sha256(json.dumps([url, query], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT timestamp, content FROM response WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_sec:
+            return None
+        return json.loads(row[1])
+
+    def set(self, key, response_json):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO response VALUES (?, ?, ?)",
+                                        (key, time.time(), json.dumps(response_json)))
+
+    def purge_expired(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM response WHERE timestamp < ?", (time.time() - self.ttl_sec,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
 #main class 
 class Query_ICEES:
     API_BASE_URL = 'https://icees.renci.org:16340/'
+    TIMEOUT_SEC = 120
+    CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icees_cache.sqlite')
+    CACHE_TTL_SEC = 24 * 60 * 60
+    MAX_WORKERS = 4  # number of queries sent to ICEES at the same time by the batch methods (and of connections kept open)
 
     HANDLER_MAP = {
         'get_feature_identifiers':               '{table}/{feature}/identifiers',
@@ -38,17 +89,86 @@ class Query_ICEES:
         'post_knowledge_graph_overlay':          'knowledge_graph_overlay',
         'query_ICEES_kg_schema':                 'knowledge_graph/schema',
     }
- 
-    
+    _lock = threading.Lock()
+    _session = None
+    _cache = None
+    _cache_checked = False
+    _in_flight = dict()  # cache key -> Future of the response of a request that is being sent
+
     @staticmethod
-    def __access_api(handler, url_suffix, query):
-        
+    def get_session():
+        '''The requests session (with a pool of connections to reuse) that all the queries are sent with'''
+        with Query_ICEES._lock:
+            if Query_ICEES._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=Query_ICEES.MAX_WORKERS, pool_maxsize=Query_ICEES.MAX_WORKERS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                Query_ICEES._session = session
+            return Query_ICEES._session
+
+    @staticmethod
+    def get_cache():
+        '''The response cache (opened the first time it is needed), or None if caching is turned off'''
+        with Query_ICEES._lock:
+            if not Query_ICEES._cache_checked:
+                Query_ICEES._cache_checked = True
+                if Query_ICEES.CACHE_FILE is not None:
+                    Query_ICEES._cache = ICEESResponseCache(Query_ICEES.CACHE_FILE, Query_ICEES.CACHE_TTL_SEC)
+            return Query_ICEES._cache
+
+    @staticmethod
+    def set_cache(cache):
+        '''Use the given ICEESResponseCache (or None, to turn caching off)'''
+        with Query_ICEES._lock:
+            Query_ICEES._cache = cache
+            Query_ICEES._cache_checked = True
+
+    @staticmethod
+    def __access_api(handler, url_suffix, query=None):
+        '''
+        Sends a query to ICEES, unless its response is in the cache. If the same query is already being sent (by
+        another thread), waits for that response instead of sending it again.
+        '''
+        url = Query_ICEES.API_BASE_URL + handler + url_suffix
+        cache = Query_ICEES.get_cache()
+        key = ICEESResponseCache.make_key(url, query)
+        if cache is not None:
+            response_json = cache.get(key)
+            if response_json is not None:
+                return response_json
+        with Query_ICEES._lock:
+            future = Query_ICEES._in_flight.get(key)
+            is_sender = future is None
+            if is_sender:
+                future = concurrent.futures.Future()
+                Query_ICEES._in_flight[key] = future
+        if not is_sender:
+            return copy.deepcopy(future.result())
         try:
-            #requests = CacheControlHelper()
-            url = Query_ICEES.API_BASE_URL + handler+ url_suffix
-            response_content = requests.post(url, json=query, headers={'accept': 'application/json'}, verify=False)
-            print(f"Executing query at {url}\nPlease wait...")
-            
+            # the response may have been cached by a sender that finished since the cache was looked at
+            response_json = cache.get(key) if cache is not None else None
+            if response_json is None:
+                response_json, is_ok = Query_ICEES.__post(url, query)
+                if is_ok and cache is not None:
+                    cache.set(key, response_json)
+            future.set_result(response_json)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with Query_ICEES._lock:
+                del Query_ICEES._in_flight[key]
+        return copy.deepcopy(response_json)
+
+    @staticmethod
+    def __post(url, query):
+        '''
+        :return: tuple (response JSON or None, whether the response is OK and can be cached)
+        '''
+        try:
+            response_content = Query_ICEES.get_session().post(url, json=query, headers={'accept': 'application/json'},
+                                                              verify=False, timeout=Query_ICEES.TIMEOUT_SEC)
             status_code = response_content.status_code
             if status_code != 200:
                 print("Error returned with status \n"+str(status_code))
@@ -62,7 +182,7 @@ class Query_ICEES:
             #print(json.dumps(OrderedDict(response_json)))
             #res = jsondiff.diff(json.dumps(OrderedDict(expected_json), indent=2, sort_keys=True), json.dumps(OrderedDict(response_json), indent=2, sort_keys=True))
             
-            return response_json    
+            return response_json, status_code == 200
 
         except requests.exceptions.HTTPError as httpErr: 
             print ("Http Error:",httpErr) 
@@ -72,6 +192,7 @@ class Query_ICEES:
             print ("Timeout Error:",timeOutErr) 
         except requests.exceptions.RequestException as reqErr: 
             print ("Something Else:",reqErr)
+        return None, False
         
     @staticmethod
     def get_feature_identifiers(table, feature):
@@ -186,6 +307,20 @@ class Query_ICEES:
         res_json = Query_ICEES.__access_api(handler, url_suffix, query)
         return res_json
 
+    @staticmethod
+    def post_knowledge_graph_overlay_batch(queries, max_workers=None):
+        '''
+        Sends many (independent) knowledge graph overlay queries, at most max_workers (default: MAX_WORKERS) at a time.
+        Each query goes through the response cache and the in-flight deduplication, like post_knowledge_graph_overlay.
+        :return: list of the responses, in the order of the queries
+        '''
+        queries = list(queries)
+        if not queries:
+            return []
+        max_workers = min(max_workers or Query_ICEES.MAX_WORKERS, len(queries))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(Query_ICEES.post_knowledge_graph_overlay, queries))
+
 # Class to test the query output 
 class test_query():
     
@@ -195,6 +330,7 @@ class test_query():
             query:          input JSON query 
             expected_json:  expected JSON result
         '''
+        from deepdiff import DeepDiff  # For Deep Difference of 2 objects
         #Compares the query outout and expected JSON printing the difference from the 
         ddiff = DeepDiff(expected_json, response_json, ignore_order=True, report_repetition=True, exclude_paths={"root['terms and conditions']"})
         print(ddiff)
@@ -8,6 +8,7 @@ import sys
 import os
 import traceback
 import numpy as np
+from scipy import sparse
 from datetime import datetime
 
 # relative imports
@@ -31,37 +32,45 @@ class ComputeJaccard:
         self.response.info(f"Computing Jaccard distance and adding this information as virtual edges")
 
         self.response.info("Getting all relevant nodes")
-        # TODO: should I check that they're connected to the start node, or just assume that they are?
-        # TODO: For now, assume that they are
         try:
-            intermediate_nodes = set()
-            end_node_to_intermediate_node_set = dict()  # keys will be end node curies, values will be tuples the (intermediate curie ids, edge_type)
+            # index the start, intermediate and end nodes (rows/columns of the incidence matrices)
+            start_node_ids = []
+            end_node_ids = []
+            intermediate_node_to_index = dict()
             for node in message.knowledge_graph.nodes:
                 if parameters['intermediate_node_id'] in node.qnode_ids:
-                    intermediate_nodes.add(node.id)  # add the intermediate node by it's identifier
-                # also look for the source node id
+                    intermediate_node_to_index.setdefault(node.id, len(intermediate_node_to_index))
                 if parameters['start_node_id'] in node.qnode_ids:
-                    source_node_id = node.id
+                    start_node_ids.append(node.id)
                 if parameters['end_node_id'] in node.qnode_ids:
-                    end_node_to_intermediate_node_set[node.id] = set()
+                    end_node_ids.append(node.id)
+            start_node_to_index = {node_id: index for index, node_id in enumerate(start_node_ids)}
+            end_node_to_index = {node_id: index for index, node_id in enumerate(end_node_ids)}
 
-            # now iterate over the edges to look for the ones we need to add  # TODO: Here, I won't care which direction the edges are pointing
+            # now iterate over the edges once to build the start x intermediate and end x intermediate incidence matrices
+            # TODO: Here, I won't care which direction the edges are pointing (nor about the edge types)
+            start_rows, start_cols, end_rows, end_cols = [], [], [], []
             for edge in message.knowledge_graph.edges:
-                if edge.source_id in intermediate_nodes:  # if source is intermediate
-                    if edge.target_id in end_node_to_intermediate_node_set:
-                        end_node_to_intermediate_node_set[edge.target_id].add((edge.source_id, edge.type))  # add source
-                elif edge.target_id in intermediate_nodes:  # if target is intermediate
-                    if edge.source_id in end_node_to_intermediate_node_set:
-                        end_node_to_intermediate_node_set[edge.source_id].add((edge.target_id, edge.type))  # add target
+                for node_id, other_id in ((edge.source_id, edge.target_id), (edge.target_id, edge.source_id)):
+                    intermediate_index = intermediate_node_to_index.get(node_id)
+                    if intermediate_index is None:
+                        continue
+                    if other_id in start_node_to_index:
+                        start_rows.append(start_node_to_index[other_id])
+                        start_cols.append(intermediate_index)
+                    if other_id in end_node_to_index:
+                        end_rows.append(end_node_to_index[other_id])
+                        end_cols.append(intermediate_index)
+            start_incidence = self.__incidence_matrix(start_rows, start_cols, len(start_node_ids), len(intermediate_node_to_index))
+            end_incidence = self.__incidence_matrix(end_rows, end_cols, len(end_node_ids), len(intermediate_node_to_index))
 
-            # now compute the actual jaccard indexes
-            denom = len(intermediate_nodes)
-            end_node_to_jaccard = dict()
-            for end_node_id in end_node_to_intermediate_node_set:
-                # TODO: add code here if you care about edge types
-                numerator = len(end_node_to_intermediate_node_set[end_node_id])
-                jacc = numerator / float(denom)
-                end_node_to_jaccard[end_node_id] = jacc
+            # now compute the actual jaccard indexes: the intersections of all the pairs with one sparse product, the
+            # unions from the numbers of intermediate nodes of each start and end node
+            intersections = (start_incidence @ end_incidence.T).toarray()
+            start_counts = np.asarray(start_incidence.sum(axis=1)).reshape(-1, 1)
+            end_counts = np.asarray(end_incidence.sum(axis=1)).reshape(1, -1)
+            unions = start_counts + end_counts - intersections
+            jaccard = np.divide(intersections, unions, out=np.zeros(intersections.shape), where=unions > 0)
 
             # now add them all as virtual edges
 
@@ -77,14 +86,9 @@ class ComputeJaccard:
             provided_by = "ARAX"
             confidence = None
             weight = None  # TODO: could make the jaccard index the weight
-            try:
-                source_id = source_node_id
-            except:
-                tb = traceback.format_exc()
-                error_type, error, _ = sys.exc_info()
+            if not start_node_ids:
                 self.response.warning(
                     f"Source node id: {parameters['start_node_id']} not found in the KG. Perhaps the KG is empty?")
-                #self.response.error(tb, error_code=error_type.__name__)
 
             # edge attribute properties
             description = f"Jaccard index based on intermediate query nodes {parameters['intermediate_node_id']}"
@@ -93,15 +97,17 @@ class ComputeJaccard:
             url = None
 
             # now actually add the virtual edges in
-            for end_node_id, value in end_node_to_jaccard.items():
-                edge_attribute = EdgeAttribute(type=attribute_type, name=name, value=value, url=url)
-                id = f"J{j_iter}"
-                j_iter += 1
-                target_id = end_node_id
-                edge = Edge(id=id, type=edge_type, relation=relation, source_id=source_id, target_id=target_id,
-                            is_defined_by=is_defined_by, defined_datetime=defined_datetime, provided_by=provided_by,
-                            confidence=confidence, weight=weight, edge_attributes=[edge_attribute], qedge_ids=qedge_ids)
-                message.knowledge_graph.edges.append(edge)
+            for start_index, source_id in enumerate(start_node_ids):
+                for end_index, target_id in enumerate(end_node_ids):
+                    if source_id == target_id:
+                        continue
+                    edge_attribute = EdgeAttribute(type=attribute_type, name=name, value=float(jaccard[start_index, end_index]), url=url)
+                    id = f"J{j_iter}"
+                    j_iter += 1
+                    edge = Edge(id=id, type=edge_type, relation=relation, source_id=source_id, target_id=target_id,
+                                is_defined_by=is_defined_by, defined_datetime=defined_datetime, provided_by=provided_by,
+                                confidence=confidence, weight=weight, edge_attributes=[edge_attribute], qedge_ids=qedge_ids)
+                    message.knowledge_graph.edges.append(edge)
 
             # Now add a q_edge the query_graph since I've added an extra edge to the KG
             q_edge = QEdge(id=relation, type=edge_type, relation=relation, source_id=parameters['start_node_id'], target_id=parameters['end_node_id'])  # TODO: ok to make the id and type the same thing?
@@ -113,3 +119,12 @@ class ComputeJaccard:
             error_type, error, _ = sys.exc_info()
             self.response.error(f"Something went wrong when computing the Jaccard index")
             self.response.error(tb, error_code=error_type.__name__)
+
+    @staticmethod
+    def __incidence_matrix(rows, cols, num_rows, num_cols):
+        """
+        Make a (0/1) sparse incidence matrix, counting a node pair only once however many edges connect it
+        """
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_rows, num_cols))
+        matrix.data[:] = 1.0  # csr_matrix sums duplicate entries
+        return matrix
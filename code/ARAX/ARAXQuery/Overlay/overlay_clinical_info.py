@@ -93,107 +93,98 @@ class OverlayClinicalInfo:
         :default: default value of the edge attribute
         :name: name of the KP functionality you want to apply
         """
+        curies_to_names = {source_curie: source_name, target_curie: target_name}
+        edge_attributes = self.make_edge_attributes_from_curie_pairs([(source_curie, target_curie)], curies_to_names,
+                                                                     default=default, name=name)
+        return edge_attributes[0] if edge_attributes else None
+
+    def make_edge_attributes_from_curie_pairs(self, curie_pairs, curies_to_names, default=0., name=""):
+        """
+        Make the edge attributes of many (source, target) pairs at once: the CURIEs are all mapped to OMOP identifiers
+        in one batch, and the statistic is computed for all the OMOP pairs of all the CURIE pairs in another one
+        :curie_pairs: list of (source CURIE, target CURIE) pairs
+        :curies_to_names: dictionary of CURIE -> text name of the node (in case the KP doesn't understand the CURIE)
+        :default: default value of the edge attributes
+        :name: name of the KP functionality you want to apply
+        :return: list of the edge attributes of the pairs (None for the pairs no KP knows about), or None if something went wrong
+        """
         try:
             # edge attributes
-            name = name
             type = "data:0951"
             url = "http://cohd.smart-api.info/"
-            value = default
 
+            # figure out which knowledge provider to use for each pair  # TODO: should handle this in a more structured fashion, does there exist a standardized KP API format?
             node_curie_to_type = self.node_curie_to_type
-            source_type = node_curie_to_type[source_curie]
-            target_type = node_curie_to_type[target_curie]
-            # figure out which knowledge provider to use  # TODO: should handle this in a more structured fashion, does there exist a standardized KP API format?
-            KP_to_use = None
-            for KP in self.who_knows_about_what:
-                # see which KP's can label both sources of information
-                if self.in_common(source_type, self.who_knows_about_what[KP]) and self.in_common(target_type, self.who_knows_about_what[KP]):
-                    KP_to_use = KP
-            if KP_to_use == 'COHD':
-                # convert CURIE to OMOP identifiers
-                source_OMOPs = [str(x['omop_standard_concept_id']) for x in COHD.get_xref_to_OMOP(source_curie, 1)]
-                target_OMOPs = [str(x['omop_standard_concept_id']) for x in COHD.get_xref_to_OMOP(target_curie, 1)]
+            pair_KPs = []
+            for source_curie, target_curie in curie_pairs:
+                source_type = node_curie_to_type[source_curie]
+                target_type = node_curie_to_type[target_curie]
+                KP_to_use = None
+                for KP in self.who_knows_about_what:
+                    # see which KP's can label both sources of information
+                    if self.in_common(source_type, self.who_knows_about_what[KP]) and self.in_common(target_type, self.who_knows_about_what[KP]):
+                        KP_to_use = KP
+                pair_KPs.append(KP_to_use)
+            COHD_pair_indexes = [index for index, KP in enumerate(pair_KPs) if KP == 'COHD']
+            edge_attributes = [None] * len(curie_pairs)
+            if not COHD_pair_indexes:
+                return edge_attributes
+
+            # convert CURIEs to OMOP identifiers
+            COHD_curies = {curie for index in COHD_pair_indexes for curie in curie_pairs[index]}
+            curie_to_OMOPs = {curie: [str(x['omop_standard_concept_id']) for x in xrefs]
+                              for curie, xrefs in COHD.get_xref_to_OMOP_batch(COHD_curies, 1).items()}
+            for curie in COHD_curies:
                 # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
-                if source_curie.split('.')[0] == 'CHEMBL':
-                    source_OMOPs = [str(x['concept_id']) for x in
-                                    COHD.find_concept_ids(source_name, domain="Drug", dataset_id=3)]
-                if target_curie.split('.')[0] == 'CHEMBL':
-                    target_OMOPs = [str(x['concept_id']) for x in
-                                    COHD.find_concept_ids(target_name, domain="Drug", dataset_id=3)]
+                if curie.split('.')[0] == 'CHEMBL':
+                    curie_to_OMOPs[curie] = [str(x['concept_id']) for x in
+                                             COHD.find_concept_ids(curies_to_names[curie], domain="Drug", dataset_id=3)]
                 # uniquify everything
-                source_OMOPs = list(set(source_OMOPs))
-                target_OMOPs = list(set(target_OMOPs))
+                curie_to_OMOPs[curie] = list(set(curie_to_OMOPs.get(curie, [])))
 
-                # Decide how to handle the response from the KP
-                if name == 'paired_concept_frequency':
-                    # sum up all frequencies  #TODO check with COHD people to see if this is kosher
-                    frequency = default
-                    for (omop1, omop2) in itertools.product(source_OMOPs, target_OMOPs):
-                        freq_data = COHD.get_paired_concept_freq(omop1, omop2, 3)  # use the hierarchical dataset
-                        if freq_data and 'concept_frequency' in freq_data:
-                            frequency += freq_data['concept_frequency']
-                    # decorate the edges
-                    value = frequency
-                elif name == 'observed_expected_ratio':
-                    # should probably take the largest obs/exp ratio  # TODO: check with COHD people to see if this is kosher
-                    # FIXME: the ln_ratio can be negative, so I should probably account for this, but the object model doesn't like -np.inf
-                    value = float("-inf")  # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
+            # gather the OMOP pairs of all the CURIE pairs, and compute the statistic of each (distinct) one at once
+            OMOP_pair_to_index = dict()
+            pair_groups = []  # for each OMOP pair of each CURIE pair: the position of the CURIE pair among the COHD pairs
+            pair_positions = []  # for each OMOP pair of each CURIE pair: the position of its statistic
+            for group, index in enumerate(COHD_pair_indexes):
+                source_curie, target_curie = curie_pairs[index]
+                for OMOP_pair in itertools.product(curie_to_OMOPs[source_curie], curie_to_OMOPs[target_curie]):
+                    pair_groups.append(group)
+                    pair_positions.append(OMOP_pair_to_index.setdefault(OMOP_pair, len(OMOP_pair_to_index)))
+            stat_name = {'paired_concept_frequency': 'concept_frequency', 'observed_expected_ratio': 'ln_ratio',
+                         'chi_square': 'p-value'}[name]
+            stats = COHD.get_paired_concept_stats_batch(list(OMOP_pair_to_index), stat_name, dataset_id=3)  # use the hierarchical dataset
+            pair_groups = np.array(pair_groups, dtype=int)
+            pair_values = stats[np.array(pair_positions, dtype=int)] if pair_positions else np.zeros(0)
+            has_value = ~np.isnan(pair_values)
+            pair_groups = pair_groups[has_value]
+            pair_values = pair_values[has_value]
 
-                    ###############################
-                    # The following code was an experiment to see if it would speed things up, leaving it out for now since it's difficult to quantify if it does speed things up given the cacheing
-                    #if len(source_OMOPs) < len(target_OMOPs):
-                    #    for omop1 in source_OMOPs:
-                    #        omop_to_ln_ratio = dict()
-                    #        response = COHD.get_obs_exp_ratio(omop1, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #        if response:
-                    #            for res in response:
-                    #                omop_to_ln_ratio[str(res['concept_id_2'])] = res['ln_ratio']
-                    #        for omop2 in target_OMOPs:
-                    #            if omop2 in omop_to_ln_ratio:
-                    #                temp_value = omop_to_ln_ratio[omop2]
-                    #                if temp_value > value:
-                    #                    value = temp_value
-                    #else:
-                    #    for omop1 in target_OMOPs:
-                    #        omop_to_ln_ratio = dict()
-                    #        response = COHD.get_obs_exp_ratio(omop1, domain="", dataset_id=3)  # use the hierarchical dataset
-                    #        if response:
-                    #            for res in response:
-                    #                omop_to_ln_ratio[str(res['concept_id_2'])] = res['ln_ratio']
-                    #        for omop2 in source_OMOPs:
-                    #            if omop2 in omop_to_ln_ratio:
-                    #                temp_value = omop_to_ln_ratio[omop2]
-                    #                if temp_value > value:
-                    #                    value = temp_value
-                    ###################################
+            # Decide how to handle the response from the KP
+            if name == 'paired_concept_frequency':
+                # sum up all frequencies  #TODO check with COHD people to see if this is kosher
+                values = np.full(len(COHD_pair_indexes), float(default))
+                np.add.at(values, pair_groups, pair_values)
+            elif name == 'observed_expected_ratio':
+                # should probably take the largest obs/exp ratio  # TODO: check with COHD people to see if this is kosher
+                # FIXME: the ln_ratio can be negative, so I should probably account for this, but the object model doesn't like -np.inf
+                values = np.full(len(COHD_pair_indexes), float("-inf"))  # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
+                np.maximum.at(values, pair_groups, pair_values)
+            else:  # chi_square
+                values = np.full(len(COHD_pair_indexes), float("inf"))
+                np.minimum.at(values, pair_groups, pair_values)  # looking at p=values, so lower is better
+            has_data = np.bincount(pair_groups, minlength=len(COHD_pair_indexes)) > 0
 
-                    for (omop1, omop2) in itertools.product(source_OMOPs, target_OMOPs):
-                        #print(f"{omop1},{omop2}")
-                        response = COHD.get_obs_exp_ratio(omop1, concept_id_2=omop2, domain="", dataset_id=3)  # use the hierarchical dataset
-                        # response is a list, since this function is overloaded and can omit concept_id_2, take the first element
-                        if response and 'ln_ratio' in response[0]:
-                            temp_val = response[0]['ln_ratio']
-                            if temp_val > value:
-                                value = temp_val
-                elif name == 'chi_square':
-                    value = float("inf")
-                    for (omop1, omop2) in itertools.product(source_OMOPs, target_OMOPs):
-                        response = COHD.get_chi_square(omop1, concept_id_2=omop2, domain="", dataset_id=3)  # use the hierarchical dataset
-                        # response is a list, since this function is overloaded and can omit concept_id_2, take the first element
-                        if response and 'p-value' in response[0]:
-                            temp_val = response[0]['p-value']
-                            if temp_val < value:  # looking at p=values, so lower is better
-                                value = temp_val
-                # create the edge attribute
-                edge_attribute = EdgeAttribute(type=type, name=name, value=str(value), url=url)  # populate the edge attribute # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
-                return edge_attribute
-            else:
-                return None
+            # create the edge attributes
+            for group, index in enumerate(COHD_pair_indexes):
+                value = float(values[group]) if has_data[group] or name != 'paired_concept_frequency' else default
+                edge_attributes[index] = EdgeAttribute(type=type, name=name, value=str(value), url=url)  # populate the edge attribute # FIXME: unclear in object model if attribute type dictates value type, or if value always needs to be a string
+            return edge_attributes
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
             self.response.error(tb, error_code=error_type.__name__)
-            self.response.error(f"Something went wrong when adding the edge attribute from {KP_to_use}.")
+            self.response.error(f"Something went wrong when adding the edge attributes from COHD.")
 
     def add_virtual_edge(self, name="", default=0.):
         """
@@ -217,13 +208,12 @@ class OverlayClinicalInfo:
                         node.id] = node.name  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
         added_flag = False  # check to see if any edges where added
         # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-        for (source_curie, target_curie) in itertools.product(source_curies_to_decorate, target_curies_to_decorate):
-            # create the edge attribute if it can be
-            edge_attribute = self.make_edge_attribute_from_curies(source_curie, target_curie,
-                                                                  source_name=curies_to_names[source_curie],
-                                                                  target_name=curies_to_names[target_curie],
-                                                                  default=default,
-                                                                  name=name)
+        curie_pairs = list(itertools.product(source_curies_to_decorate, target_curies_to_decorate))
+        # create the edge attributes if they can be (all at once)
+        edge_attributes = self.make_edge_attributes_from_curie_pairs(curie_pairs, curies_to_names, default=default, name=name)
+        if edge_attributes is None:
+            edge_attributes = [None] * len(curie_pairs)
+        for (source_curie, target_curie), edge_attribute in zip(curie_pairs, edge_attributes):
             if edge_attribute:
                 added_flag = True
                 # make the edge, add the attribute
@@ -265,16 +255,15 @@ class OverlayClinicalInfo:
         curies_to_names = dict()
         for node in self.message.knowledge_graph.nodes:
             curies_to_names[node.id] = node.name
-        for edge in self.message.knowledge_graph.edges:
+        edges = self.message.knowledge_graph.edges
+        curie_pairs = [(edge.source_id, edge.target_id) for edge in edges]
+        edge_attributes = self.make_edge_attributes_from_curie_pairs(curie_pairs, curies_to_names, default=default,
+                                                                     name=name)  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
+        if edge_attributes is None:
+            edge_attributes = [None] * len(edges)
+        for edge, edge_attribute in zip(edges, edge_attributes):
             if not edge.edge_attributes:  # populate if not already there
                 edge.edge_attributes = []
-            source_curie = edge.source_id
-            target_curie = edge.target_id
-            edge_attribute = self.make_edge_attribute_from_curies(source_curie, target_curie,
-                                                                  source_name=curies_to_names[source_curie],
-                                                                  target_name=curies_to_names[target_curie],
-                                                                  default=default,
-                                                                  name=name)  # FIXME: Super hacky way to get around the fact that COHD can't map CHEMBL drugs
             if edge_attribute:  # make sure an edge attribute was actually created
                 edge.edge_attributes.append(edge_attribute)
 
@@ -0,0 +1,99 @@
+#!/bin/env python3
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import json
+import time
+import zlib
+import pickle
+import hashlib
+import sqlite3
+import threading
+
+
+class ProcessingPlanCache:
+    '''
+    A persistent (sqlite) cache of the states (Message and log) that ARAXi processing plans reach after their
+    actions. A state is keyed by a hash chained over the actions that led to it, starting from a hash of the input
+    Message and of the versions of the code and of the knowledge sources, so a plan that starts like a cached one can
+    resume from the last matching cached state. States older than the time-to-live are ignored, and the least recently used ones are
+    evicted when the cache holds more than max_entries states or max_bytes of them.
+    '''
+
+    def __init__(self, db_file, ttl_sec, max_entries=None, max_bytes=None):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, timestamp REAL, last_access REAL, size INTEGER, content BLOB)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS state_last_access ON state (last_access)")
+
+    @staticmethod
+    def __hash(content):
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_base_key(message, versions):
+        '''The key of the input Message (its query graph, knowledge graph and results) given the knowledge source versions'''
+        if hasattr(message, 'to_dict'):
+            message_dict = message.to_dict()
+        else:
+            message_dict = message if message is not None else dict()
+        content = { name: message_dict.get(name) for name in [ 'query_graph', 'knowledge_graph', 'results' ] }
+        return ProcessingPlanCache.__hash([ versions, content ])
+
+    @staticmethod
+    def make_step_key(previous_key, action):
+        '''The key of the state after the given (parsed) action, from the key of the state before it'''
+        return ProcessingPlanCache.__hash([ previous_key, action ])
+
+    def get(self, key):
+        '''The (Message, log entries) state stored under the key, or None if there is none or it is expired'''
+        with self.lock:
+            row = self.connection.execute("SELECT timestamp, content FROM state WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[0] > self.ttl_sec:
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE state SET last_access = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(zlib.decompress(row[1]))
+
+    def set(self, key, message, log_entries):
+        content = zlib.compress(pickle.dumps((message, log_entries), protocol=pickle.HIGHEST_PROTOCOL))
+        if self.max_bytes is not None and len(content) > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?, ?)", (key, now, now, len(content), content))
+                self.__evict()
+
+    def __evict(self):
+        #### Remove the expired states, then the least recently used ones until the size limits are met
+        self.connection.execute("DELETE FROM state WHERE timestamp < ?", (time.time() - self.ttl_sec,))
+        n_entries, n_bytes = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM state").fetchone()
+        if (self.max_entries is None or n_entries <= self.max_entries) and (self.max_bytes is None or n_bytes <= self.max_bytes):
+            return
+        keys_to_delete = []
+        for key, size in self.connection.execute("SELECT key, size FROM state ORDER BY last_access").fetchall():
+            if (self.max_entries is None or n_entries <= self.max_entries) and (self.max_bytes is None or n_bytes <= self.max_bytes):
+                break
+            keys_to_delete.append((key,))
+            n_entries -= 1
+            n_bytes -= size
+        self.connection.executemany("DELETE FROM state WHERE key = ?", keys_to_delete)
+
+    def purge_expired(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM state WHERE timestamp < ?", (time.time() - self.ttl_sec,))
+
+    def clear(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM state")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,107 @@
+#!/bin/env python3
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import numpy as np
+
+
+#### Scoring functions: given the values of an edge attribute (one per occurrence) and the min,max stats of the
+#### attributes, return the factor that each occurrence multiplies the score of its edge by
+def score_normalized_google_distance(values, score_stats):
+    ngd = np.where(np.isinf(values), 10.0, values)
+    return np.clip(1 - (ngd - 0.3) * 0.6, 0.01, 1.0)
+
+
+def score_jaccard_index(values, score_stats):
+    jaccard = np.where(np.isinf(values), 0.01, values)
+    return jaccard / score_stats['jaccard_index']['maximum'] * 0.9
+
+
+class ResultRanker:
+
+    #### Constructor
+    def __init__(self):
+        #### Edge attributes for which min,max stats are collected
+        self.stats_attribute_names = [ 'probability', 'normalized_google_distance', 'jaccard_index', 'probability_drug_treats' ]
+        #### Scoring functions by edge attribute name (probability_drug_treats is already put in the edge confidence)
+        self.edge_attribute_scorers = {
+            'normalized_google_distance': score_normalized_google_distance,
+            'jaccard_index': score_jaccard_index,
+        }
+        #### Edge attributes of which only the best value among all the edges of a result multiplies its score
+        self.best_value_attribute_names = [ 'probability' ]
+
+
+    #### Collect the values of the edge attributes of interest, as (edge position, value) arrays by attribute name
+    def get_edge_attribute_values(self, edges):
+        attribute_names = set(self.stats_attribute_names) | set(self.edge_attribute_scorers) | set(self.best_value_attribute_names)
+        positions = { attribute_name: [] for attribute_name in attribute_names }
+        values = { attribute_name: [] for attribute_name in attribute_names }
+        for i_edge, edge in enumerate(edges):
+            if edge.edge_attributes is not None:
+                for edge_attribute in edge.edge_attributes:
+                    if edge_attribute.name in attribute_names:
+                        positions[edge_attribute.name].append(i_edge)
+                        values[edge_attribute.name].append(float(edge_attribute.value))
+        return { attribute_name: (np.array(positions[attribute_name], dtype=int), np.array(values[attribute_name], dtype=float)) for attribute_name in attribute_names }
+
+
+    #### Compute the min,max stats of the edge attributes (infinite values count as 9999)
+    def get_score_stats(self, attribute_values):
+        score_stats = {}
+        for attribute_name in self.stats_attribute_names:
+            positions, values = attribute_values[attribute_name]
+            if len(values) > 0:
+                values = np.where(np.isinf(values), 9999, values)
+                score_stats[attribute_name] = { 'minimum': float(np.min(values)), 'maximum': float(np.max(values)) }
+        return score_stats
+
+
+    #### Score every edge of the knowledge graph
+    def score_edges(self, edges, attribute_values, score_stats):
+        #### The score of an edge is the product of its confidence and the factors of its attributes
+        edge_scores = np.array([ float(edge.confidence) if edge.confidence is not None else 1.0 for edge in edges ], dtype=float)
+        for attribute_name, scorer in self.edge_attribute_scorers.items():
+            positions, values = attribute_values[attribute_name]
+            if len(values) > 0:
+                np.multiply.at(edge_scores, positions, scorer(values, score_stats))
+
+        #### The best value of each of the best_value attributes for each edge (0.0 if none)
+        best_values = np.zeros((len(edges), len(self.best_value_attribute_names)))
+        for i_attribute, attribute_name in enumerate(self.best_value_attribute_names):
+            positions, values = attribute_values[attribute_name]
+            if len(values) > 0:
+                np.maximum.at(best_values[:, i_attribute], positions, values)
+        return edge_scores, best_values
+
+
+    #### Compute the confidences of all the results in the message
+    def score_results(self, message, response=None):
+        edges = message.knowledge_graph.edges
+        attribute_values = self.get_edge_attribute_values(edges)
+        score_stats = self.get_score_stats(attribute_values)
+        if response is not None:
+            response.info(f"Summary of available edge metrics: {score_stats}")
+        edge_scores, best_values = self.score_edges(edges, attribute_values, score_stats)
+
+        #### Map each edge binding of each result to the position of its edge in the knowledge graph
+        edge_positions = { edge.id: i_edge for i_edge, edge in enumerate(edges) }
+        n_bindings = np.array([ len(result.edge_bindings) for result in message.results ], dtype=int)
+        binding_positions = np.array([ edge_positions[binding.kg_id] for result in message.results for binding in result.edge_bindings ], dtype=int)
+
+        #### The score of a result is the product of the scores of its edges, times the best values over its edges
+        scores = np.ones(len(message.results))
+        has_bindings = n_bindings > 0
+        if binding_positions.size > 0:
+            starts = (np.cumsum(n_bindings) - n_bindings)[has_bindings]
+            scores[has_bindings] = np.multiply.reduceat(edge_scores[binding_positions], starts)
+            result_best_values = np.maximum.reduceat(best_values[binding_positions], starts, axis=0)
+            for i_attribute in range(len(self.best_value_attribute_names)):
+                best_value = result_best_values[:, i_attribute]
+                scores[has_bindings] *= np.where(best_value > 0.0, best_value, 1.0)
+
+        #### Make all scores at least 0.01. This is all way low anyway, but let's not have anything that rounds to zero
+        scores = np.where(scores < 0.01, scores + 0.01, scores)
+
+        #### Keep only 3 digits after the decimal
+        return np.trunc(scores * 1000 + 0.5) / 1000.0
@@ -15,6 +15,8 @@ from typing import List, Union
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
 from ARAX_query import ARAXQuery
+from ARAX_filter_results import ARAXFilterResults
+from Filter_Results.sort_results import top_k_index
 from response import Response
 
 PACKAGE_PARENT = '../../UI/OpenAPI/python-flask-server'
@@ -58,5 +60,39 @@ def test_sort():
     # add something to test if the results are assending and the correct numbers
 
 
+@pytest.mark.parametrize('desc', [False, True])
+@pytest.mark.parametrize('k', [None, 0, 1, 3, 7, 10, 25])
+def test_top_k_index_matches_sorted(desc, k):
+    # ties (many repeated values) keep the order of the list, like in sorted()
+    values = [3, 1, 2, 3, 1, 5, 2, 3, 0, 5]
+    assert top_k_index(values, desc, k) == sorted(range(len(values)), key=values.__getitem__, reverse=desc)[:k]
+    assert top_k_index([], desc, k) == []
+
+
+def _limit(max_results):
+    return {'command': 'filter_results', 'parameters': {'action': 'limit_number_of_results', 'max_results': max_results}}
+
+
+def test_get_chained_max_results():
+    sort = {'command': 'filter_results', 'parameters': {'action': 'sort_by_edge_count', 'direction': 'd'}}
+    overlay = {'command': 'overlay', 'parameters': {'action': 'compute_jaccard'}}
+    assert ARAXFilterResults.get_chained_max_results([]) is None
+    assert ARAXFilterResults.get_chained_max_results([_limit('5')]) == 5
+    assert ARAXFilterResults.get_chained_max_results([_limit('5'), _limit('3')]) == 3
+    assert ARAXFilterResults.get_chained_max_results([_limit('3'), _limit('5')]) == 3
+    # the folding stops at another sort (which can reorder the kept results) or at any other action
+    assert ARAXFilterResults.get_chained_max_results([_limit('5'), sort, _limit('3')]) == 5
+    assert ARAXFilterResults.get_chained_max_results([sort, _limit('3')]) is None
+    assert ARAXFilterResults.get_chained_max_results([_limit('5'), overlay, _limit('3')]) == 5
+    assert ARAXFilterResults.get_chained_max_results([overlay, _limit('3')]) is None
+    # and at a limit whose max_results is invalid or missing
+    for max_results in ['abc', '2.5', '-1', None]:
+        assert ARAXFilterResults.get_chained_max_results([_limit(max_results), _limit('3')]) is None
+        assert ARAXFilterResults.get_chained_max_results([_limit('5'), _limit(max_results), _limit('3')]) == 5
+    missing = {'command': 'filter_results', 'parameters': {'action': 'limit_number_of_results'}}
+    assert ARAXFilterResults.get_chained_max_results([missing, _limit('3')]) is None
+    assert ARAXFilterResults.get_chained_max_results([_limit('0')]) == 0
+
+
 if __name__ == "__main__":
     pytest.main(['-v'])
\ No newline at end of file
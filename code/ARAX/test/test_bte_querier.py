@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Tests the BTE querier's concurrent querying of input curies, using mocked BTE responses (no calls to BTE)
+
+# Usage:
+# run all: pytest -v test_bte_querier.py
+
+import sys
+import os
+import time
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from response import Response
+import Expand.bte_querier as bte_querier
+from Expand.bte_querier import BTEQuerier
+from swagger_server.models.q_node import QNode
+from swagger_server.models.q_edge import QEdge
+
+
+class MockSingleEdgeQueryDispatcher:
+    delay_sec = 0.2
+    failing_ids = set()
+    slow_ids = set()
+    num_running = 0
+    max_num_running = 0
+    lock = threading.Lock()
+
+    def __init__(self, input_cls, output_cls, pred, input_id, values, loop):
+        self.curie = f"{input_id}:{values}"
+
+    def query(self):
+        cls = MockSingleEdgeQueryDispatcher
+        with cls.lock:
+            cls.num_running += 1
+            cls.max_num_running = max(cls.max_num_running, cls.num_running)
+        try:
+            time.sleep(cls.delay_sec * (10 if self.curie in cls.slow_ids else 1))
+            if self.curie in cls.failing_ids:
+                raise ConnectionError(f"API for {self.curie} is down")
+        finally:
+            with cls.lock:
+                cls.num_running -= 1
+
+    def to_reasoner_std(self):
+        # Each input curie is connected to one protein
+        protein_id = f"UNIPROTKB:P{self.curie.split(':')[-1]}"
+        edge_id = f"{self.curie}-{protein_id}"
+        return {'knowledge_graph': {'nodes': [{'id': self.curie, 'name': self.curie, 'type': 'Disease',
+                                               'equivalent_identifiers': {'DOID': [self.curie]}},
+                                              {'id': protein_id, 'name': protein_id, 'type': 'Protein',
+                                               'equivalent_identifiers': {'UNIPROTKB': [protein_id]}}],
+                                    'edges': [{'id': edge_id, 'type': 'related_to', 'source_id': self.curie,
+                                               'target_id': protein_id, 'edge_source': 'mock'}]},
+                'results': {'node_bindings': [{'kg_id': self.curie, 'qg_id': 'n0'}, {'kg_id': protein_id, 'qg_id': 'n1'}],
+                            'edge_bindings': [{'kg_id': edge_id, 'qg_id': 'e1'}]}}
+
+
+@pytest.fixture
+def mock_bte(monkeypatch):
+    MockSingleEdgeQueryDispatcher.failing_ids = set()
+    MockSingleEdgeQueryDispatcher.slow_ids = set()
+    MockSingleEdgeQueryDispatcher.max_num_running = 0
+    monkeypatch.setattr(bte_querier, 'SingleEdgeQueryDispatcher', MockSingleEdgeQueryDispatcher)
+    return MockSingleEdgeQueryDispatcher
+
+
+def _query_bte(curies, max_concurrent_queries=4, query_timeout=10):
+    response = Response()
+    response.data['parameters'] = {'continue_if_no_results': False}
+    querier = BTEQuerier(response)
+    querier.max_concurrent_queries = max_concurrent_queries
+    querier.query_timeout = query_timeout
+    input_qnode = QNode(id='n00', curie=curies, type='Disease')
+    output_qnode = QNode(id='n01', type='Protein')
+    qedge = QEdge(id='e00', source_id='n00', target_id='n01')
+    answer_kg = {'nodes': dict(), 'edges': dict()}
+    answer_kg, accepted_curies = querier._answer_query_using_bte(input_qnode, output_qnode, qedge, answer_kg,
+                                                                 querier._get_valid_bte_inputs_dict())
+    return response, answer_kg, accepted_curies
+
+
+def test_curies_are_queried_concurrently(mock_bte):
+    curies = [f"DOID:{i}" for i in range(8)]
+    start = time.time()
+    response, answer_kg, accepted_curies = _query_bte(curies + ['FAKE:1'], max_concurrent_queries=4)
+    elapsed = time.time() - start
+    assert response.status == 'OK'
+    assert accepted_curies == set(curies)
+    assert set(answer_kg['nodes']['n00']) == set(curies)
+    assert len(answer_kg['nodes']['n01']) == 8
+    assert len(answer_kg['edges']['e00']) == 8
+    assert mock_bte.max_num_running == 4
+    assert elapsed < 8 * mock_bte.delay_sec
+
+
+def test_partial_results_when_some_queries_fail(mock_bte):
+    mock_bte.failing_ids = {'DOID:1'}
+    mock_bte.slow_ids = {'DOID:2'}
+    response, answer_kg, accepted_curies = _query_bte(["DOID:0", "DOID:1", "DOID:2", "DOID:3"], query_timeout=1)
+    assert response.status == 'OK'
+    assert set(answer_kg['nodes']['n00']) == {"DOID:0", "DOID:3"}
+    assert any("2 of 4 input curies" in message['message'] for message in response.messages)
+
+
+def test_error_when_all_queries_fail(mock_bte):
+    mock_bte.failing_ids = {'DOID:0', 'DOID:1'}
+    response, answer_kg, accepted_curies = _query_bte(["DOID:0", "DOID:1"])
+    assert response.status == 'ERROR'
+    assert response.error_code == 'ConnectionError'
+    assert answer_kg == {'nodes': dict(), 'edges': dict()}
+
+
+def test_queued_queries_do_not_time_out_behind_timed_out_ones(mock_bte):
+    # The slow queries time out but keep their worker threads until BTE answers; the queries queued behind them only
+    # start their time once a worker picks them up
+    mock_bte.slow_ids = {'DOID:0', 'DOID:1'}
+    curies = [f"DOID:{i}" for i in range(6)]
+    response, answer_kg, accepted_curies = _query_bte(curies, max_concurrent_queries=2, query_timeout=4 * mock_bte.delay_sec)
+    assert response.status == 'OK'
+    assert set(answer_kg['nodes']['n00']) == set(curies[2:])
+    assert any("2 of 6 input curies (DOID:0, DOID:1)" in message['message'] for message in response.messages)
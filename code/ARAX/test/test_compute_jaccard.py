@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Tests the Jaccard index virtual edges of overlay(action=compute_jaccard) on a small synthetic KG (no calls to KPs),
+# against a set-based Jaccard index
+
+# Usage:
+# run all: pytest -v test_compute_jaccard.py
+
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from response import Response
+from Overlay.compute_jaccard import ComputeJaccard
+from swagger_server.models.node import Node
+from swagger_server.models.edge import Edge
+from swagger_server.models.q_node import QNode
+from swagger_server.models.q_edge import QEdge
+from swagger_server.models.query_graph import QueryGraph
+from swagger_server.models.knowledge_graph import KnowledgeGraph
+from swagger_server.models.message import Message
+
+PARAMETERS = {'start_node_id': 'n00', 'intermediate_node_id': 'n01', 'end_node_id': 'n02', 'virtual_relation_label': 'J1'}
+
+
+def make_message(end_qnode_ids_of_start_nodes=None):
+    # 2 start nodes, 3 intermediate nodes and 2 end nodes; the edges point either way, some are duplicated, and the
+    # edges that do not touch an intermediate node do not count
+    end_qnode_ids_of_start_nodes = end_qnode_ids_of_start_nodes or dict()
+    nodes = [Node(id='S1', type=['disease'], qnode_ids=['n00'] + end_qnode_ids_of_start_nodes.get('S1', [])),
+             Node(id='S2', type=['disease'], qnode_ids=['n00'] + end_qnode_ids_of_start_nodes.get('S2', []))]
+    nodes += [Node(id=f"I{i}", type=['protein'], qnode_ids=['n01']) for i in range(1, 4)]
+    nodes += [Node(id=f"E{i}", type=['chemical_substance'], qnode_ids=['n02']) for i in range(1, 3)]
+    node_pairs = [('S1', 'I1'), ('I2', 'S1'), ('S1', 'I2'), ('S2', 'I3'),
+                  ('I1', 'E1'), ('E1', 'I2'), ('I3', 'E1'), ('I1', 'E2'),
+                  ('S1', 'E2'), ('I1', 'I2')]
+    edges = [Edge(id=f"e{i}", type='related_to', source_id=source_id, target_id=target_id, qedge_ids=['e00'])
+             for i, (source_id, target_id) in enumerate(node_pairs)]
+    query_graph = QueryGraph(nodes=[QNode(id='n00', type='disease'), QNode(id='n01', type='protein'), QNode(id='n02', type='chemical_substance')],
+                             edges=[QEdge(id='e00', source_id='n00', target_id='n01'), QEdge(id='e01', source_id='n01', target_id='n02')])
+    return Message(query_graph=query_graph, knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges))
+
+
+def set_jaccard(message, source_id, target_id):
+    intermediate_node_ids = {node.id for node in message.knowledge_graph.nodes if PARAMETERS['intermediate_node_id'] in node.qnode_ids}
+    neighbors = {source_id: set(), target_id: set()}
+    for edge in message.knowledge_graph.edges:
+        for node_id, other_id in ((edge.source_id, edge.target_id), (edge.target_id, edge.source_id)):
+            if node_id in neighbors and other_id in intermediate_node_ids:
+                neighbors[node_id].add(other_id)
+    union = neighbors[source_id] | neighbors[target_id]
+    return len(neighbors[source_id] & neighbors[target_id]) / len(union) if union else 0.0
+
+
+def compute_jaccard(message):
+    response = Response()
+    ComputeJaccard(response, message, PARAMETERS).compute_jaccard()
+    assert response.status == 'OK', response.show(level=response.DEBUG)
+    return [edge for edge in message.knowledge_graph.edges if edge.qedge_ids == ['J1']]
+
+
+def test_virtual_edges_between_all_start_and_end_nodes():
+    message = make_message()
+    virtual_edges = compute_jaccard(message)
+    assert [(edge.id, edge.source_id, edge.target_id) for edge in virtual_edges] == [('J0', 'S1', 'E1'), ('J1', 'S1', 'E2'),
+                                                                                     ('J2', 'S2', 'E1'), ('J3', 'S2', 'E2')]
+    for edge in virtual_edges:
+        assert edge.type == 'has_jaccard_index_with' and edge.relation == 'J1' and edge.provided_by == 'ARAX'
+        assert [edge_attribute.name for edge_attribute in edge.edge_attributes] == ['jaccard_index']
+        assert edge.edge_attributes[0].value == pytest.approx(set_jaccard(message, edge.source_id, edge.target_id))
+    # S1 ~ {I1, I2}, S2 ~ {I3}, E1 ~ {I1, I2, I3}, E2 ~ {I1}
+    assert [edge.edge_attributes[0].value for edge in virtual_edges] == pytest.approx([2 / 3, 1 / 2, 1 / 3, 0.0])
+    assert [(qedge.id, qedge.source_id, qedge.target_id) for qedge in message.query_graph.edges][-1] == ('J1', 'n00', 'n02')
+
+
+def test_node_paired_with_itself_is_skipped():
+    # S2 is also an end node, but gets no Jaccard index with itself
+    message = make_message({'S2': ['n02']})
+    virtual_edges = compute_jaccard(message)
+    assert [(edge.source_id, edge.target_id) for edge in virtual_edges] == [('S1', 'S2'), ('S1', 'E1'), ('S1', 'E2'),
+                                                                            ('S2', 'E1'), ('S2', 'E2')]
+    for edge in virtual_edges:
+        assert edge.edge_attributes[0].value == pytest.approx(set_jaccard(message, edge.source_id, edge.target_id))
+
+
+def test_no_start_nodes():
+    message = make_message()
+    message.knowledge_graph.nodes = [node for node in message.knowledge_graph.nodes if not node.id.startswith('S')]
+    response = Response()
+    ComputeJaccard(response, message, PARAMETERS).compute_jaccard()
+    assert response.status == 'OK'
+    assert response.n_warnings == 1
+    assert all(edge.qedge_ids != ['J1'] for edge in message.knowledge_graph.edges)
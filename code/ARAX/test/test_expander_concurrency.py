@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Tests Expand's concurrent expansion of independent query edges, using a mocked KG querier (no calls to KPs)
+
+# Usage:
+# run all: pytest -v test_expander_concurrency.py
+
+import sys
+import os
+import time
+import threading
+import types
+import copy
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from ARAX_expander import ARAXExpander
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from swagger_server.models.node import Node
+from swagger_server.models.edge import Edge
+from swagger_server.models.q_node import QNode
+from swagger_server.models.q_edge import QEdge
+from swagger_server.models.query_graph import QueryGraph
+from swagger_server.models.knowledge_graph import KnowledgeGraph
+from swagger_server.models.message import Message
+
+
+class MockKGQuerier:
+    delay_sec = 0.3
+    delay_sec_by_qedge = dict()
+    queried_curies = dict()
+    num_running = 0
+    max_num_running = 0
+    lock = threading.Lock()
+
+    def __init__(self, response, kp_to_use):
+        self.response = response
+
+    def answer_one_hop_query(self, query_graph, qnodes_using_curies_from_prior_step):
+        cls = MockKGQuerier
+        with cls.lock:
+            cls.num_running += 1
+            cls.max_num_running = max(cls.max_num_running, cls.num_running)
+        time.sleep(cls.delay_sec_by_qedge.get(query_graph.edges[0].id, cls.delay_sec))
+        with cls.lock:
+            cls.num_running -= 1
+
+        # Each input curie is connected to the output qnode's curie, or else to two made-up output curies
+        qedge = query_graph.edges[0]
+        input_qnode, output_qnode = sorted(query_graph.nodes, key=lambda qnode: (qnode.id not in qnodes_using_curies_from_prior_step,
+                                                                                 not qnode.curie))
+        input_curies = input_qnode.curie if isinstance(input_qnode.curie, list) else [input_qnode.curie]
+        cls.queried_curies[qedge.id] = sorted(input_curies)
+        answer_kg = {'nodes': {input_qnode.id: dict(), output_qnode.id: dict()}, 'edges': {qedge.id: dict()}}
+        edge_node_usage_map = dict()
+        for input_curie in input_curies:
+            for output_curie in self.get_output_curies(qedge, input_curie, output_qnode):
+                edge_id = f"{input_curie}-{output_curie}"
+                answer_kg['nodes'][input_qnode.id][input_curie] = Node(id=input_curie)
+                answer_kg['nodes'][output_qnode.id][output_curie] = Node(id=output_curie)
+                answer_kg['edges'][qedge.id][edge_id] = Edge(id=edge_id, source_id=input_curie, target_id=output_curie)
+                edge_node_usage_map[edge_id] = {input_qnode.id: input_curie, output_qnode.id: output_curie}
+        return answer_kg, edge_node_usage_map
+
+    def get_output_curies(self, qedge, input_curie, output_qnode):
+        if output_qnode.curie:
+            return [output_qnode.curie]
+        return [f"{qedge.id.upper()}:{input_curie.split(':')[-1]}{number}" for number in range(2)]
+
+
+class OverlappingMockKGQuerier(MockKGQuerier):
+    # Input curies share some of their output curies, and only some of them connect to an output qnode's curie (so
+    # that expanding the next qedges leaves dead ends to prune)
+    def get_output_curies(self, qedge, input_curie, output_qnode):
+        number = int(input_curie.split(':')[-1])
+        if output_qnode.curie:
+            return [output_qnode.curie] if number % 2 == 0 else []
+        return [f"{output_qnode.id.upper()}:{(number * 3 + offset) % 7}" for offset in range(3)]
+
+
+@pytest.fixture
+def mock_kg_querier(monkeypatch):
+    MockKGQuerier.queried_curies = dict()
+    MockKGQuerier.max_num_running = 0
+    MockKGQuerier.delay_sec_by_qedge = dict()
+    kg_querier = types.ModuleType('Expand.kg_querier')
+    kg_querier.KGQuerier = MockKGQuerier
+    monkeypatch.setitem(sys.modules, 'Expand.kg_querier', kg_querier)
+    return MockKGQuerier
+
+
+def _expand(qnodes, qedges):
+    message = Message(query_graph=QueryGraph(nodes=qnodes, edges=qedges), knowledge_graph=KnowledgeGraph(nodes=[], edges=[]))
+    start = time.time()
+    response = ARAXExpander().apply(message, {'kp': 'ARAX/KG2', 'use_synonyms': 'false'})
+    return response, message, time.time() - start
+
+
+def test_independent_edges_are_expanded_concurrently(mock_kg_querier):
+    # n00 -e00- n01 -e01- n02 -e02- n03: e00 and e02 each start from a qnode with a curie, e01 needs the curies of n01
+    qnodes = [QNode(id='n00', curie='DOID:1'), QNode(id='n01'), QNode(id='n02', curie='DOID:2'), QNode(id='n03')]
+    qedges = [QEdge(id='e00', source_id='n00', target_id='n01'), QEdge(id='e01', source_id='n01', target_id='n02'),
+              QEdge(id='e02', source_id='n02', target_id='n03')]
+    response, message, elapsed = _expand(qnodes, qedges)
+    assert response.status == 'OK'
+    assert mock_kg_querier.max_num_running == 2
+    assert elapsed < 3 * mock_kg_querier.delay_sec
+    # The dependent edge was fed the curies found by the edge expanded before it
+    assert mock_kg_querier.queried_curies['e01'] == ['E00:10', 'E00:11']
+    assert {edge.id for edge in message.knowledge_graph.edges} == {'DOID:1-E00:10', 'DOID:1-E00:11', 'E00:10-DOID:2',
+                                                                   'E00:11-DOID:2', 'DOID:2-E02:20', 'DOID:2-E02:21'}
+
+
+def test_dependent_edges_are_expanded_in_order(mock_kg_querier):
+    qnodes = [QNode(id='n00', curie='DOID:1'), QNode(id='n01'), QNode(id='n02')]
+    qedges = [QEdge(id='e00', source_id='n00', target_id='n01'), QEdge(id='e01', source_id='n01', target_id='n02')]
+    response, message, elapsed = _expand(qnodes, qedges)
+    assert response.status == 'OK'
+    assert mock_kg_querier.max_num_running == 1
+    assert mock_kg_querier.queried_curies['e01'] == ['E00:10', 'E00:11']
+    assert len(message.knowledge_graph.edges) == 6
+
+
+def test_concurrent_expansion_gives_the_same_kg_as_sequential(mock_kg_querier, monkeypatch):
+    # n00 -e00- n01 -e01- n02 -e02- n03 -e03- n04, n03 -e04- n05, with the curie qnodes' edges finishing out of order
+    monkeypatch.setattr(sys.modules['Expand.kg_querier'], 'KGQuerier', OverlappingMockKGQuerier)
+    mock_kg_querier.delay_sec_by_qedge = {'e00': 0.3, 'e01': 0.05, 'e02': 0.2, 'e03': 0.05, 'e04': 0.1}
+    node_usages_by_edges_maps = []
+
+    def record_prune_dead_end_paths(self, dict_kg, full_query_graph, node_usages_by_edges_map):
+        # the map, in order, as it is after each qedge is merged (the ARAX_expander.py callers reuse the same dict)
+        node_usages_by_edges_maps[-1].append([(qedge_id, list(usages.items())) for qedge_id, usages in copy.deepcopy(node_usages_by_edges_map).items()])
+        return prune_dead_end_paths(self, dict_kg, full_query_graph, node_usages_by_edges_map)
+
+    prune_dead_end_paths = ARAXExpander._prune_dead_end_paths
+    monkeypatch.setattr(ARAXExpander, '_prune_dead_end_paths', record_prune_dead_end_paths)
+    kgs = []
+    for max_concurrent_expansions in [1, 4]:
+        monkeypatch.setattr(ARAXExpander, 'MAX_CONCURRENT_EXPANSIONS', max_concurrent_expansions)
+        node_usages_by_edges_maps.append([])
+        qnodes = [QNode(id='n00', curie='DOID:1'), QNode(id='n01'), QNode(id='n02', curie='DOID:2'), QNode(id='n03'),
+                  QNode(id='n04', curie='DOID:5'), QNode(id='n05')]
+        qedges = [QEdge(id='e00', source_id='n00', target_id='n01'), QEdge(id='e01', source_id='n01', target_id='n02'),
+                  QEdge(id='e02', source_id='n02', target_id='n03'), QEdge(id='e03', source_id='n03', target_id='n04'),
+                  QEdge(id='e04', source_id='n03', target_id='n05')]
+        response, message, elapsed = _expand(qnodes, qedges)
+        assert response.status == 'OK'
+        kgs.append(([(node.id, node.qnode_ids) for node in message.knowledge_graph.nodes],
+                    [(edge.id, edge.source_id, edge.target_id, edge.qedge_ids) for edge in message.knowledge_graph.edges]))
+    assert kgs[0] == kgs[1]
+    assert node_usages_by_edges_maps[0] == node_usages_by_edges_maps[1]
+    # the expansions did overlap, and the pruning did remove dead ends
+    assert mock_kg_querier.max_num_running > 1
+    assert len(node_usages_by_edges_maps[0]) == 5
+    assert len(kgs[0][1]) < sum(len(usages) for qedge_id, usages in node_usages_by_edges_maps[0][-1])
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# Tests that the columnar (vectorized) filter_kg actions remove the same edges and nodes as the per-edge loops
+# that they replaced, on random knowledge graphs (no calls to KPs)
+
+# Usage:
+# run all: pytest -v test_filter_kg_columns.py
+
+import sys
+import os
+import copy
+import random
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from response import Response
+from Filter_KG.attribute_columns import get_attribute_columns, MISSING
+from Filter_KG.remove_edges import RemoveEdges
+from Filter_KG.remove_nodes import RemoveNodes
+from swagger_server.models.node import Node
+from swagger_server.models.edge import Edge
+from swagger_server.models.edge_attribute import EdgeAttribute
+from swagger_server.models.knowledge_graph import KnowledgeGraph
+from swagger_server.models.message import Message
+
+NODE_TYPES = ['protein', 'disease', 'chemical_substance']
+EDGE_TYPES = ['physically_interacts_with', 'treats', 'causes']
+
+
+def make_message(seed, num_nodes=40, num_edges=120):
+    rng = random.Random(seed)
+    nodes = [Node(id=f"TEST:{i}", name=rng.choice(['a', 'b', None]), type=rng.sample(NODE_TYPES, rng.randint(1, 2)),
+                  qnode_ids=rng.choice([None, ['n00'], ['n01'], ['n00', 'n01']])) for i in range(num_nodes)]
+    edges = []
+    for i in range(num_edges):
+        # some edges have an attribute more than once
+        edge_attributes = [EdgeAttribute(name=name, value=str(rng.choice([rng.random(), 0.5])))
+                           for name in ['ngd', 'jaccard_index', 'ngd'] if rng.random() < 0.6]
+        # some edges point at nodes that are not in the KG (eg. left dangling by earlier actions)
+        edges.append(Edge(id=f"e{i}", type=rng.choice(EDGE_TYPES), source_id=f"TEST:{rng.randrange(num_nodes + 5)}",
+                          target_id=f"TEST:{rng.randrange(num_nodes + 5)}", provided_by=rng.choice(['ARAX/KG1', 'BTE']),
+                          publications=rng.sample(['PMID:1', 'PMID:2', 'PMID:3'], rng.randint(0, 2)),
+                          edge_attributes=edge_attributes or rng.choice([None, []])))
+    return Message(knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges))
+
+
+#### The per-edge loops of the filter_kg actions before they were vectorized
+
+def old_remove_edges(message, edge_params, edges_to_remove, node_ids_to_remove):
+    if edge_params['remove_connected_nodes']:
+        i = 0
+        nodes_to_remove = set()
+        for node in message.knowledge_graph.nodes:
+            if node.id in node_ids_to_remove:
+                if 'qnode_id' in edge_params:
+                    if node.qnode_ids is not None:
+                        if edge_params['qnode_id'] in node.qnode_ids:
+                            nodes_to_remove.add(i)
+                        else:
+                            node_ids_to_remove.remove(node.id)
+                    else:
+                        node_ids_to_remove.remove(node.id)
+                else:
+                    nodes_to_remove.add(i)
+            i += 1
+        message.knowledge_graph.nodes = [val for idx, val in enumerate(message.knowledge_graph.nodes) if idx not in nodes_to_remove]
+        i = 0
+        for edge in message.knowledge_graph.edges:
+            if edge.source_id in node_ids_to_remove or edge.target_id in node_ids_to_remove:
+                edges_to_remove.add(i)
+            i += 1
+    message.knowledge_graph.edges = [val for idx, val in enumerate(message.knowledge_graph.edges) if idx not in edges_to_remove]
+
+
+def old_mark_edges(message, edge_params, is_match):
+    edges_to_remove = set()
+    node_ids_to_remove = set()
+    for i, edge in enumerate(message.knowledge_graph.edges):
+        if is_match(edge):
+            edges_to_remove.add(i)
+            if edge_params['remove_connected_nodes']:
+                node_ids_to_remove.add(edge.source_id)
+                node_ids_to_remove.add(edge.target_id)
+    old_remove_edges(message, edge_params, edges_to_remove, node_ids_to_remove)
+
+
+def old_remove_edges_by_type(message, edge_params):
+    old_mark_edges(message, edge_params, lambda edge: edge.type == edge_params['edge_type'])
+
+
+def old_remove_edges_by_property(message, edge_params):
+    def is_match(edge):
+        value = edge.to_dict()[edge_params['edge_property']]
+        if type(value) == list:
+            return edge_params['property_value'] in value
+        return value == edge_params['property_value']
+    old_mark_edges(message, edge_params, is_match)
+
+
+def old_attribute_values(message, edge_params):
+    values = []
+    for i, edge in enumerate(message.knowledge_graph.edges):
+        if hasattr(edge, 'edge_attributes') and edge.edge_attributes:
+            for attribute in edge.edge_attributes:
+                if attribute.name == edge_params['edge_attribute']:
+                    values.append((i, float(attribute.value), edge.source_id, edge.target_id))
+    return values
+
+
+def old_remove_edges_by_attribute(message, edge_params):
+    if edge_params['direction'] == 'above':
+        def compare(x, y):
+            return x > y
+    else:
+        def compare(x, y):
+            return x < y
+    old_remove_edges_by_values(message, edge_params, [x for x in old_attribute_values(message, edge_params) if compare(x[1], edge_params['threshold'])])
+
+
+def old_remove_edges_by_stats(message, edge_params):
+    values = old_attribute_values(message, edge_params)
+    if len(values) > 0:
+        if edge_params['stat'] == 'n':
+            values.sort(key=lambda x: x[1])
+            if edge_params['top']:
+                values.reverse()
+            values = values[edge_params['threshold']:]
+        elif edge_params['stat'] == 'std':
+            vals = [x[1] for x in values]
+            val = np.mean(vals) + (1 if edge_params['top'] else -1) * np.std(vals)
+            if edge_params['direction'] == 'above':
+                values = [x for x in values if x[1] > val]
+            elif edge_params['direction'] == 'below':
+                values = [x for x in values if x[1] < val]
+    old_remove_edges_by_values(message, edge_params, values)
+
+
+def old_remove_edges_by_values(message, edge_params, values):
+    edges_to_remove = set()
+    node_ids_to_remove = set()
+    for edge in values:
+        edges_to_remove.add(edge[0])
+        if edge_params['remove_connected_nodes']:
+            node_ids_to_remove.add(edge[2])
+            node_ids_to_remove.add(edge[3])
+    old_remove_edges(message, edge_params, edges_to_remove, node_ids_to_remove)
+
+
+def old_remove_nodes(message, is_match):
+    node_ids_to_remove = {node.id for node in message.knowledge_graph.nodes if is_match(node)}
+    message.knowledge_graph.nodes = [node for node in message.knowledge_graph.nodes if not is_match(node)]
+    message.knowledge_graph.edges = [edge for edge in message.knowledge_graph.edges
+                                     if edge.source_id not in node_ids_to_remove and edge.target_id not in node_ids_to_remove]
+
+
+def old_remove_nodes_by_type(message, node_params):
+    old_remove_nodes(message, lambda node: node_params['node_type'] in node.type)
+
+
+def old_remove_nodes_by_property(message, node_params):
+    # (the old loop left the edges of the removed nodes dangling: they are now removed, as by remove_nodes_by_type)
+    def is_match(node):
+        node_dict = node.to_dict()
+        if node_params['node_property'] in node_dict:
+            if isinstance(node_dict[node_params['node_property']], list):
+                return node_params['property_value'] in node_dict[node_params['node_property']] or \
+                    node_dict[node_params['node_property']] == node_params['property_value']
+            return node_dict[node_params['node_property']] == node_params['property_value']
+        return False
+    old_remove_nodes(message, is_match)
+
+
+def old_remove_orphaned_nodes(message, node_params):
+    # (the old loop removed orphans of any type: a node_type now restricts it to the orphans of that type, as documented)
+    connected_node_ids = set()
+    for edge in message.knowledge_graph.edges:
+        connected_node_ids.add(edge.source_id)
+        connected_node_ids.add(edge.target_id)
+    message.knowledge_graph.nodes = [node for node in message.knowledge_graph.nodes if node.id in connected_node_ids or
+                                     ('node_type' in node_params and node_params['node_type'] not in node.type)]
+
+
+#### Tests
+
+def kg_ids(message):
+    return [node.id for node in message.knowledge_graph.nodes], [edge.id for edge in message.knowledge_graph.edges]
+
+
+EDGE_ACTIONS = [('remove_edges_by_type', old_remove_edges_by_type, {'edge_type': 'treats'}),
+                ('remove_edges_by_type', old_remove_edges_by_type, {'edge_type': 'causes', 'qnode_id': 'n01'}),
+                ('remove_edges_by_property', old_remove_edges_by_property, {'edge_property': 'provided_by', 'property_value': 'BTE'}),
+                ('remove_edges_by_property', old_remove_edges_by_property, {'edge_property': 'publications', 'property_value': 'PMID:2'}),
+                ('remove_edges_by_attribute', old_remove_edges_by_attribute, {'edge_attribute': 'ngd', 'direction': 'above', 'threshold': 0.5}),
+                ('remove_edges_by_attribute', old_remove_edges_by_attribute, {'edge_attribute': 'ngd', 'direction': 'below', 'threshold': 0.3, 'qnode_id': 'n00'}),
+                ('remove_edges_by_stats', old_remove_edges_by_stats, {'edge_attribute': 'jaccard_index', 'stat': 'n', 'threshold': 10, 'top': True}),
+                ('remove_edges_by_stats', old_remove_edges_by_stats, {'edge_attribute': 'jaccard_index', 'stat': 'n', 'threshold': 10, 'top': False}),
+                ('remove_edges_by_stats', old_remove_edges_by_stats, {'edge_attribute': 'ngd', 'stat': 'std', 'top': True, 'direction': 'above'}),
+                ('remove_edges_by_stats', old_remove_edges_by_stats, {'edge_attribute': 'ngd', 'stat': 'std', 'top': False, 'direction': 'below'}),
+                ('remove_edges_by_stats', old_remove_edges_by_stats, {'edge_attribute': 'missing', 'stat': 'n', 'threshold': 1, 'top': True})]
+
+NODE_ACTIONS = [('remove_nodes_by_type', old_remove_nodes_by_type, {'node_type': 'disease'}),
+                ('remove_nodes_by_property', old_remove_nodes_by_property, {'node_property': 'name', 'property_value': 'a'}),
+                ('remove_nodes_by_property', old_remove_nodes_by_property, {'node_property': 'qnode_ids', 'property_value': 'n01'}),
+                ('remove_orphaned_nodes', old_remove_orphaned_nodes, {}),
+                ('remove_orphaned_nodes', old_remove_orphaned_nodes, {'node_type': 'protein'})]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('remove_connected_nodes', [False, True])
+@pytest.mark.parametrize('action,old_action,params', EDGE_ACTIONS)
+def test_remove_edges_matches_loops(seed, remove_connected_nodes, action, old_action, params):
+    params = dict(params, remove_connected_nodes=remove_connected_nodes)
+    message = make_message(seed)
+    old_message = copy.deepcopy(message)
+    response = getattr(RemoveEdges(Response(), message, params), action)()
+    assert response.status == 'OK'
+    old_action(old_message, params)
+    assert kg_ids(message) == kg_ids(old_message)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('action,old_action,params', NODE_ACTIONS)
+def test_remove_nodes_matches_loops(seed, action, old_action, params):
+    message = make_message(seed)
+    old_message = copy.deepcopy(message)
+    response = getattr(RemoveNodes(Response(), message, params), action)()
+    assert response.status == 'OK'
+    old_action(old_message, params)
+    assert kg_ids(message) == kg_ids(old_message)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_chained_filters_match_loops(seed):
+    # the columns cached by the first action are compacted, and reused by the next ones
+    message = make_message(seed)
+    old_message = copy.deepcopy(message)
+    for action, old_action, params in [EDGE_ACTIONS[4], NODE_ACTIONS[0], EDGE_ACTIONS[6], NODE_ACTIONS[3]]:
+        params = dict(params, remove_connected_nodes=True)
+        remover = RemoveEdges if action.startswith('remove_edges') else RemoveNodes
+        assert getattr(remover(Response(), message, params), action)().status == 'OK'
+        old_action(old_message, params)
+        assert kg_ids(message) == kg_ids(old_message)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_columns_match_loops(seed):
+    message = make_message(seed)
+    columns = get_attribute_columns(message)
+    assert get_attribute_columns(message) is columns
+    for name in ['ngd', 'jaccard_index', 'missing']:
+        values, edge_indexes = columns.get_edge_attribute(name)
+        assert list(zip(edge_indexes, values)) == [(i, value) for i, value, _, _ in old_attribute_values(message, {'edge_attribute': name})]
+    for name in ['type', 'source_id', 'publications', 'provided_by']:
+        assert list(columns.get_edge_property(name)) == [edge.to_dict()[name] for edge in message.knowledge_graph.edges]
+    for name in ['id', 'type', 'qnode_ids', 'not_a_property']:
+        assert list(columns.get_node_property(name)) == [node.to_dict().get(name, MISSING) for node in message.knowledge_graph.nodes]
+    for value in ['PMID:1', 'PMID:3', 'BTE']:
+        for name in ['publications', 'provided_by']:
+            assert list(columns.matches(columns.get_edge_property(name), value)) == \
+                [value in x if isinstance(x, list) else x == value for x in columns.get_edge_property(name)]
+    # replacing the edges makes the columns stale
+    message.knowledge_graph.edges = message.knowledge_graph.edges[:10]
+    assert get_attribute_columns(message) is not columns
+    assert get_attribute_columns(message).num_edges == 10
+
+
+def test_columns_are_rebuilt_after_edges_change_in_place():
+    message = make_message(0)
+    params = {'edge_attribute': 'ngd', 'direction': 'above', 'threshold': 0.5, 'remove_connected_nodes': False}
+    assert RemoveEdges(Response(), message, dict(params, threshold=2.0)).remove_edges_by_attribute().status == 'OK'
+    columns = get_attribute_columns(message)
+    # an attribute is added to an edge, and another edge is swapped for a copy, without changing the number of edges
+    edges = message.knowledge_graph.edges
+    if edges[0].edge_attributes is None:
+        edges[0].edge_attributes = []
+    edges[0].edge_attributes.append(EdgeAttribute(name='ngd', value='0.9'))
+    edges[1] = copy.deepcopy(edges[1])
+    edges[1].edge_attributes = [EdgeAttribute(name='ngd', value='0.95')]
+    assert get_attribute_columns(message) is not columns
+    old_message = copy.deepcopy(message)
+    assert RemoveEdges(Response(), message, params).remove_edges_by_attribute().status == 'OK'
+    old_remove_edges_by_attribute(old_message, params)
+    assert kg_ids(message) == kg_ids(old_message)
+    assert 'e0' not in kg_ids(message)[1] and 'e1' not in kg_ids(message)[1]
+    # swapping a node also makes the columns stale
+    columns = get_attribute_columns(message)
+    message.knowledge_graph.nodes[0] = copy.deepcopy(message.knowledge_graph.nodes[0])
+    assert get_attribute_columns(message) is not columns
+
+
+@pytest.mark.parametrize('direction,threshold', [('above', 0.5), ('below', 0.5)])
+def test_every_occurrence_of_a_repeated_attribute_counts(direction, threshold):
+    # as in the per-edge loops, an edge is removed if any of its values of the attribute is above/below the threshold
+    message = make_message(0, num_edges=3)
+    for edge, values in zip(message.knowledge_graph.edges, [['0.9', '0.1'], ['0.1', '0.2'], ['0.8']]):
+        edge.edge_attributes = [EdgeAttribute(name='ngd', value=value) for value in values]
+    params = {'edge_attribute': 'ngd', 'direction': direction, 'threshold': threshold, 'remove_connected_nodes': False}
+    assert RemoveEdges(Response(), message, params).remove_edges_by_attribute().status == 'OK'
+    assert kg_ids(message)[1] == (['e1'] if direction == 'above' else ['e2'])
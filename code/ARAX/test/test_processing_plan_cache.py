@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# Tests the cache of the states that ARAXi processing plans reach (keys, expiration and eviction), and ARAXQuery resuming
+# plans from it, using a mocked KG querier (no calls to KPs)
+
+# Usage:
+# run all: pytest -v test_processing_plan_cache.py
+
+import sys
+import os
+import time
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from processing_plan_cache import ProcessingPlanCache
+from ARAX_query import ARAXQuery
+import ARAX_messenger
+from swagger_server.models.node import Node
+from swagger_server.models.edge import Edge
+from swagger_server.models.q_node import QNode
+from swagger_server.models.query_graph import QueryGraph
+from swagger_server.models.message import Message
+
+VERSIONS = {'ARAX': 'ARAX 0.6.0', 'code': '0123abcd+ef45', 'KG1': 'kg1.example.org', 'KG2': 'kg2.example.org'}
+
+
+def _make_message(*qnode_ids):
+    return Message(query_graph=QueryGraph(nodes=[QNode(id=qnode_id, type='protein') for qnode_id in qnode_ids], edges=[]))
+
+
+def _make_plan_keys(message, actions, versions=VERSIONS):
+    keys = []
+    key = ProcessingPlanCache.make_base_key(message, versions)
+    for action in actions:
+        key = ProcessingPlanCache.make_step_key(key, action)
+        keys.append(key)
+    return keys
+
+
+def test_keys_identify_the_input_versions_and_actions():
+    actions = [{'command': 'expand', 'parameters': {'edge_id': 'e00', 'kp': 'ARAX/KG2'}},
+               {'command': 'resultify', 'parameters': {'ignore_edge_direction': 'true'}}]
+    keys = _make_plan_keys(_make_message('n00'), actions)
+    assert _make_plan_keys(_make_message('n00'), actions) == keys
+    # a plan with the same first action shares the key of its first state
+    other_keys = _make_plan_keys(_make_message('n00'), actions[:1] + [{'command': 'resultify', 'parameters': {}}])
+    assert other_keys[0] == keys[0] and other_keys[1] != keys[1]
+    assert _make_plan_keys(_make_message('n01'), actions)[0] != keys[0]
+    assert _make_plan_keys(_make_message('n00'), actions, dict(VERSIONS, KG2='kg2-new.example.org'))[0] != keys[0]
+    # the order of the parameters does not matter
+    reordered_actions = [{'parameters': {'kp': 'ARAX/KG2', 'edge_id': 'e00'}, 'command': 'expand'}] + actions[1:]
+    assert _make_plan_keys(_make_message('n00'), reordered_actions) == keys
+
+
+def test_state_is_stored_and_loaded(tmp_path):
+    cache = ProcessingPlanCache(str(tmp_path / 'plan_cache.sqlite'), ttl_sec=3600)
+    message = _make_message('n00', 'n01')
+    log_entries = [{'level': 20, 'message': "Processing action 'expand'"}]
+    cache.set('key', message, log_entries)
+    message.query_graph.nodes.pop()
+    cached_message, cached_log_entries = cache.get('key')
+    assert [qnode.id for qnode in cached_message.query_graph.nodes] == ['n00', 'n01']
+    assert cached_log_entries == log_entries
+    assert cache.get('other_key') is None
+
+
+def test_expired_state_is_ignored(tmp_path):
+    cache = ProcessingPlanCache(str(tmp_path / 'plan_cache.sqlite'), ttl_sec=-1)
+    cache.set('key', _make_message('n00'), [])
+    assert cache.get('key') is None
+
+
+def test_least_recently_used_states_are_evicted(tmp_path):
+    cache = ProcessingPlanCache(str(tmp_path / 'plan_cache.sqlite'), ttl_sec=3600, max_entries=2)
+    cache.set('key0', _make_message('n00'), [])
+    time.sleep(0.01)
+    cache.set('key1', _make_message('n01'), [])
+    time.sleep(0.01)
+    assert cache.get('key0') is not None
+    time.sleep(0.01)
+    cache.set('key2', _make_message('n02'), [])
+    assert cache.get('key1') is None
+    assert cache.get('key0') is not None and cache.get('key2') is not None
+
+    # states bigger than the size limit are not stored
+    cache = ProcessingPlanCache(str(tmp_path / 'plan_cache_small.sqlite'), ttl_sec=3600, max_bytes=100)
+    cache.set('key', _make_message(*[f"n{i:02d}" for i in range(100)]), [])
+    assert cache.get('key') is None
+
+
+class MockKGQuerier:
+    num_queries = 0
+
+    def __init__(self, response, kp_to_use):
+        self.response = response
+
+    def answer_one_hop_query(self, query_graph, qnodes_using_curies_from_prior_step):
+        # The input curie is connected to two proteins
+        MockKGQuerier.num_queries += 1
+        qedge = query_graph.edges[0]
+        input_qnode = next(qnode for qnode in query_graph.nodes if qnode.curie)
+        output_qnode = next(qnode for qnode in query_graph.nodes if qnode.id != input_qnode.id)
+        answer_kg = {'nodes': {input_qnode.id: {input_qnode.curie: Node(id=input_qnode.curie, type=['disease'])},
+                               output_qnode.id: dict()},
+                     'edges': {qedge.id: dict()}}
+        edge_node_usage_map = dict()
+        for number in range(2):
+            output_curie = f"UniProtKB:P{number}"
+            edge_id = f"{input_qnode.curie}-{output_curie}"
+            answer_kg['nodes'][output_qnode.id][output_curie] = Node(id=output_curie, type=['protein'])
+            answer_kg['edges'][qedge.id][edge_id] = Edge(id=edge_id, type='related_to', source_id=input_qnode.curie,
+                                                         target_id=output_curie, confidence=0.5 + number / 4)
+            edge_node_usage_map[edge_id] = {input_qnode.id: input_qnode.curie, output_qnode.id: output_curie}
+        return answer_kg, edge_node_usage_map
+
+
+class MockKGNodeIndex:
+    def get_curies_and_types(self, curie, kg_name=None):
+        return [{'curie': curie, 'type': 'disease'}]
+
+
+@pytest.fixture
+def plan_cache(tmp_path, monkeypatch):
+    MockKGQuerier.num_queries = 0
+    kg_querier = types.ModuleType('Expand.kg_querier')
+    kg_querier.KGQuerier = MockKGQuerier
+    monkeypatch.setitem(sys.modules, 'Expand.kg_querier', kg_querier)
+    monkeypatch.setattr(ARAX_messenger, 'KGNodeIndex', MockKGNodeIndex)
+    monkeypatch.setattr(ARAXQuery, 'get_knowledge_source_versions', staticmethod(lambda: dict(VERSIONS)))
+    plan_cache = ProcessingPlanCache(str(tmp_path / 'plan_cache.sqlite'), ttl_sec=3600)
+    ARAXQuery.set_plan_cache(plan_cache)
+    yield plan_cache
+    ARAXQuery.set_plan_cache(None)
+    plan_cache.close()
+
+
+PLAN = ["create_message",
+        "add_qnode(curie=DOID:14330, id=n00)",
+        "add_qnode(type=protein, id=n01)",
+        "add_qedge(source_id=n00, target_id=n01, id=e00)",
+        "expand(edge_id=e00, kp=ARAX/KG2)",
+        "resultify(ignore_edge_direction=true)",
+        "return(message=true, store=false)"]
+
+
+def _run_plan(actions, options=None):
+    plan = {'processing_actions': actions}
+    if options is not None:
+        plan['options'] = options
+    araxq = ARAXQuery()
+    response = araxq.query({'previous_message_processing_plan': plan})
+    assert response.status == 'OK', response.show(level=response.DEBUG)
+    log_messages = [log_entry['message'] for log_entry in response.messages]
+    return araxq.message, log_messages
+
+
+def _index_of_action(log_messages, command):
+    return next(index for index, log_message in enumerate(log_messages) if log_message.startswith(f"Processing action '{command}'"))
+
+
+def _message_content(message):
+    message_dict = message.to_dict()
+    return {name: message_dict[name] for name in ['query_graph', 'knowledge_graph', 'results', 'table_column_names', 'n_results']}
+
+
+def test_the_cache_is_off_by_default():
+    assert ARAXQuery.PLAN_CACHE_FILE is None
+
+
+def test_plan_resumes_from_the_cache(plan_cache):
+    ARAXQuery.set_plan_cache(None)
+    uncached_message, uncached_log = _run_plan(PLAN)
+    ARAXQuery.set_plan_cache(plan_cache)
+    first_message, first_log = _run_plan(PLAN)
+    assert MockKGQuerier.num_queries == 2
+    assert not any(log_message.startswith("Resumed from the cached result") for log_message in first_log)
+
+    # the first 6 actions are skipped: their log is replayed, and only return() is processed
+    message, log = _run_plan(PLAN)
+    assert MockKGQuerier.num_queries == 2
+    resume_index = log.index("Resumed from the cached result of the first 6 actions")
+    first_actions_log = first_log[_index_of_action(first_log, 'create_message'):_index_of_action(first_log, 'return')]
+    assert log[resume_index - len(first_actions_log):resume_index] == first_actions_log
+    assert [log_message.split("'")[1] for log_message in log[resume_index + 1:] if log_message.startswith("Processing action")] == ['return']
+    assert _message_content(message) == _message_content(first_message) == _message_content(uncached_message)
+    assert len(message.results) == 2
+
+    # a plan that goes on from the cached actions resumes after them
+    message, log = _run_plan(PLAN[:-1] + ["filter_results(action=limit_number_of_results, max_results=1)", PLAN[-1]])
+    assert MockKGQuerier.num_queries == 2
+    assert "Resumed from the cached result of the first 6 actions" in log
+    assert len(message.results) == 1
+
+    # unless the cache is bypassed
+    message, log = _run_plan(PLAN, options=['bypass_cache'])
+    assert MockKGQuerier.num_queries == 3
+    assert _message_content(message) == _message_content(uncached_message)
+
+
+def test_plan_diverging_after_expand_resumes_after_expand(plan_cache):
+    _run_plan(PLAN)
+    assert MockKGQuerier.num_queries == 1
+
+    # a plan sharing the actions up to expand() with the cached one resumes after expand(), from its intermediate state
+    plan = PLAN[:5] + ["resultify(ignore_edge_direction=false)", PLAN[-1]]
+    message, log = _run_plan(plan)
+    assert MockKGQuerier.num_queries == 1
+    assert "Resumed from the cached result of the first 5 actions" in log
+    resume_index = log.index("Resumed from the cached result of the first 5 actions")
+    assert [log_message.split("'")[1] for log_message in log[resume_index + 1:] if log_message.startswith("Processing action")] == ['resultify', 'return']
+    ARAXQuery.set_plan_cache(None)
+    uncached_message, uncached_log = _run_plan(plan)
+    assert _message_content(message) == _message_content(uncached_message)
+
+
+def test_actions_calling_live_services_are_not_cached(plan_cache):
+    message = _make_message('n00', 'n01')
+    actions = [{'command': 'add_qedge', 'parameters': {'source_id': 'n00', 'target_id': 'n01', 'id': 'e00'}},
+               {'command': 'expand', 'parameters': {'edge_id': 'e00'}},
+               {'command': 'overlay', 'parameters': {'action': 'compute_jaccard'}},
+               {'command': 'overlay', 'parameters': {'action': 'compute_ngd'}},
+               {'command': 'resultify', 'parameters': {}}]
+    assert len(ARAXQuery().get_plan_step_keys(message, actions, VERSIONS)) == 3
+    actions[1]['parameters']['kp'] = 'BTE'
+    assert len(ARAXQuery().get_plan_step_keys(message, actions, VERSIONS)) == 1
+    # states of other versions of the code are not resumed from
+    keys = ARAXQuery().get_plan_step_keys(message, actions[:1], VERSIONS)
+    assert ARAXQuery().get_plan_step_keys(message, actions[:1], dict(VERSIONS, code='4567cdef+0123')) != keys
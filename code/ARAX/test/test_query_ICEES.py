@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# Tests the ICEES client (caching, in-flight deduplication, concurrency) against a local stub of the ICEES server
+
+# Usage:
+# run all: pytest -v test_query_ICEES.py
+
+import sys
+import os
+import math
+import pytest
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from Overlay.Query_ICEES import Query_ICEES, ICEESResponseCache
+
+
+class _StubICEESHandler(BaseHTTPRequestHandler):
+    requests_received = []
+    delay_sec = 0.2
+    lock = threading.Lock()
+    num_in_flight = 0
+    max_in_flight = 0
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.requests_received.append((self.path, query))
+            _StubICEESHandler.num_in_flight += 1
+            _StubICEESHandler.max_in_flight = max(_StubICEESHandler.max_in_flight, _StubICEESHandler.num_in_flight)
+        time.sleep(self.delay_sec)
+        with self.lock:
+            _StubICEESHandler.num_in_flight -= 1
+        body = json.dumps({'return value': {'echo': query}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_icees(tmp_path):
+    _StubICEESHandler.requests_received = []
+    _StubICEESHandler.num_in_flight = 0
+    _StubICEESHandler.max_in_flight = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubICEESHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api_base_url = Query_ICEES.API_BASE_URL
+    Query_ICEES.API_BASE_URL = f"http://127.0.0.1:{server.server_port}/"
+    Query_ICEES.set_cache(ICEESResponseCache(str(tmp_path / 'icees_cache.sqlite'), ttl_sec=3600))
+    yield _StubICEESHandler.requests_received
+    Query_ICEES.API_BASE_URL = api_base_url
+    Query_ICEES.set_cache(None)
+    server.shutdown()
+    server.server_close()
+
+
+def _make_query(curie):
+    return {"message": {"knowledge_graph": {"nodes": [{"node_id": "n00", "curie": curie, "type": "drug"}], "edges": []}}}
+
+
+def test_response_is_cached(stub_icees):
+    query = _make_query("PUBCHEM:2083")
+    result = Query_ICEES.post_knowledge_graph_overlay(query)
+    assert result == {'return value': {'echo': query}}
+    assert Query_ICEES.post_knowledge_graph_overlay(query) == result
+    assert stub_icees == [('/knowledge_graph_overlay', query)]
+
+
+def test_expired_response_is_sent_again(stub_icees, tmp_path):
+    Query_ICEES.set_cache(ICEESResponseCache(str(tmp_path / 'icees_cache_expired.sqlite'), ttl_sec=-1))
+    query = _make_query("PUBCHEM:2083")
+    Query_ICEES.post_knowledge_graph_overlay(query)
+    Query_ICEES.post_knowledge_graph_overlay(query)
+    assert len(stub_icees) == 2
+
+
+def _post_at_the_same_time(queries):
+    # all the threads send their query once they are all started, so that the requests overlap in time
+    barrier = threading.Barrier(len(queries))
+    results = [None] * len(queries)
+
+    def post(i):
+        barrier.wait()
+        results[i] = Query_ICEES.post_knowledge_graph_overlay(queries[i])
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_in_flight_query_is_sent_once(stub_icees, monkeypatch):
+    # without the cache, only the in-flight deduplication keeps the duplicates from being sent
+    Query_ICEES.set_cache(None)
+    monkeypatch.setattr(_StubICEESHandler, 'delay_sec', 1.0)
+    query = _make_query("PUBCHEM:2083")
+    start = time.time()
+    results = _post_at_the_same_time([query] * 6)
+    elapsed = time.time() - start
+    assert results == [{'return value': {'echo': query}}] * 6
+    assert stub_icees == [('/knowledge_graph_overlay', query)]
+    # the duplicates waited for the response of the query that was sent
+    assert elapsed < 2 * _StubICEESHandler.delay_sec
+    # the waiting threads get their own copies of the response
+    assert len({id(result) for result in results}) == 6
+
+
+def test_distinct_queries_from_threads_overlap(stub_icees):
+    Query_ICEES.set_cache(None)
+    queries = [_make_query(f"PUBCHEM:{i}") for i in range(4)]
+    start = time.time()
+    results = _post_at_the_same_time(queries)
+    elapsed = time.time() - start
+    assert [result['return value']['echo'] for result in results] == queries
+    assert len(stub_icees) == 4
+    assert elapsed < 4 * _StubICEESHandler.delay_sec
+
+
+@pytest.mark.parametrize('max_workers', [1, 3, 4])
+def test_batch_is_sent_with_bounded_parallelism(stub_icees, max_workers):
+    Query_ICEES.set_cache(None)
+    queries = [_make_query(f"PUBCHEM:{i}") for i in range(8)]
+    start = time.time()
+    results = Query_ICEES.post_knowledge_graph_overlay_batch(queries, max_workers=max_workers)
+    elapsed = time.time() - start
+    # the responses are in the order of the queries
+    assert [result['return value']['echo'] for result in results] == queries
+    assert len(stub_icees) == 8
+    assert _StubICEESHandler.max_in_flight == max_workers
+    # the queries are sent in ceil(N / max_workers) waves
+    num_waves = math.ceil(len(queries) / max_workers)
+    assert num_waves * _StubICEESHandler.delay_sec <= elapsed < (num_waves + 1) * _StubICEESHandler.delay_sec
+
+
+def test_batch_goes_through_the_cache_and_in_flight_deduplication(stub_icees):
+    queries = [_make_query(f"PUBCHEM:{i % 3}") for i in range(9)]
+    Query_ICEES.post_knowledge_graph_overlay(queries[0])
+    results = Query_ICEES.post_knowledge_graph_overlay_batch(queries, max_workers=len(queries))
+    assert [result['return value']['echo'] for result in results] == queries
+    # each distinct query reaches the server once: the first one was cached, and the duplicates of the others are in flight together
+    assert sorted(query['message']['knowledge_graph']['nodes'][0]['curie'] for path, query in stub_icees) == ['PUBCHEM:0', 'PUBCHEM:1', 'PUBCHEM:2']
+    assert Query_ICEES.post_knowledge_graph_overlay_batch([]) == []
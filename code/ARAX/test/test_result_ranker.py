@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Tests that the vectorized result ranker gives the results the same confidences as the per-result loop that it
+# replaced in ARAXMessenger.rank_results, on random messages (no calls to KPs)
+
+# Usage:
+# run all: pytest -v test_result_ranker.py
+
+import sys
+import os
+import copy
+import random
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from response import Response
+from ARAX_messenger import ARAXMessenger
+from result_ranker import ResultRanker
+from swagger_server.models.node import Node
+from swagger_server.models.edge import Edge
+from swagger_server.models.edge_attribute import EdgeAttribute
+from swagger_server.models.q_node import QNode
+from swagger_server.models.q_edge import QEdge
+from swagger_server.models.query_graph import QueryGraph
+from swagger_server.models.knowledge_graph import KnowledgeGraph
+from swagger_server.models.node_binding import NodeBinding
+from swagger_server.models.edge_binding import EdgeBinding
+from swagger_server.models.result import Result
+from swagger_server.models.message import Message
+
+#### Tolerance of the confidences: they are rounded to 3 digits, and multiplying the edge scores in a different
+#### order can move a score across a rounding boundary
+TOLERANCE = 0.001 + 1e-9
+
+
+def make_message(seed, num_edges=60, num_results=40):
+    rng = random.Random(seed)
+    query_graph = QueryGraph(nodes=[QNode(id='n00', curie='DOID:14330', type='disease'), QNode(id='n01', type='protein', is_set=True),
+                                    QNode(id='n02', type='chemical_substance')],
+                             edges=[QEdge(id='e00', source_id='n00', target_id='n01'), QEdge(id='e01', source_id='n01', target_id='n02')])
+    nodes = [Node(id=f"TEST:{i}", type=['protein']) for i in range(20)]
+    edges = []
+    for i in range(num_edges):
+        edge_attributes = []
+        for name in ['normalized_google_distance', 'jaccard_index', 'probability', 'probability_drug_treats', 'ngd']:
+            # an attribute can occur more than once on an edge, and some distances (and Jaccard indexes) are infinite
+            values = [rng.random(), rng.random() * 3] + ([float('inf')] if name in ['normalized_google_distance', 'jaccard_index', 'ngd'] else [])
+            for _ in range(rng.choice([0, 0, 1, 1, 1, 2])):
+                edge_attributes.append(EdgeAttribute(name=name, value=str(rng.choice(values))))
+        edges.append(Edge(id=f"e{i}", type='physically_interacts_with', source_id=rng.choice(nodes).id, target_id=rng.choice(nodes).id,
+                          confidence=rng.choice([None, rng.random(), 1.0]), edge_attributes=rng.choice([edge_attributes, edge_attributes, None])))
+    results = []
+    for i in range(num_results):
+        edge_bindings = [EdgeBinding(qg_id=rng.choice(['e00', 'e01']), kg_id=edge.id) for edge in rng.sample(edges, rng.choice([0, 1, 2, 3, 5]))]
+        results.append(Result(id=f"result{i}", essence=f"essence{i}", essence_type='protein', edge_bindings=edge_bindings,
+                              node_bindings=[NodeBinding(qg_id='n01', kg_id=rng.choice(nodes).id)]))
+    return Message(query_graph=query_graph, knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges), results=results)
+
+
+def old_rank_results(message):
+    """
+    The per-result loop of ARAXMessenger.rank_results before the scoring was vectorized
+    """
+    kg_edges = {}
+    score_stats = {}
+    for edge in message.knowledge_graph.edges:
+        kg_edges[edge.id] = edge
+        if edge.edge_attributes is not None:
+            for edge_attribute in edge.edge_attributes:
+                for attribute_name in [ 'probability', 'normalized_google_distance', 'jaccard_index', 'probability_drug_treats' ]:
+                    if edge_attribute.name == attribute_name:
+                        if attribute_name not in score_stats:
+                            score_stats[attribute_name] = { 'minimum': -9999, 'maximum': -9999 }
+                        value = float(edge_attribute.value)
+                        if np.isinf(value): value = 9999
+                        if score_stats[attribute_name]['minimum'] == -9999 or value < score_stats[attribute_name]['minimum']:
+                            score_stats[attribute_name]['minimum'] = value
+                        if score_stats[attribute_name]['maximum'] == -9999 or value > score_stats[attribute_name]['maximum']:
+                            score_stats[attribute_name]['maximum'] = value
+
+    for result in message.results:
+        score = 1.0
+        best_probability = 0.0
+        for edge in result.edge_bindings:
+            kg_edge_id = edge.kg_id
+            if kg_edges[kg_edge_id].confidence is not None:
+                score *= float(kg_edges[kg_edge_id].confidence)
+            if kg_edges[kg_edge_id].edge_attributes is not None:
+                for edge_attribute in kg_edges[kg_edge_id].edge_attributes:
+                    if edge_attribute.name == 'probability':
+                        value = float(edge_attribute.value)
+                        if value > best_probability:
+                            best_probability = value
+                    if edge_attribute.name == 'normalized_google_distance':
+                        ngd = float(edge_attribute.value)
+                        if np.isinf(ngd): ngd = 10.0
+                        factor = 1 - ( ngd - 0.3) * 0.6
+                        if factor < 0.01: factor = 0.01
+                        if factor > 1: factor = 1.0
+                        score *= factor
+                    if edge_attribute.name == 'jaccard_index':
+                        jaccard = float(edge_attribute.value)
+                        if np.isinf(jaccard): jaccard = 0.01
+                        factor = jaccard / score_stats['jaccard_index']['maximum'] * 0.9
+                        score *= factor
+        if best_probability > 0.0:
+            score *= best_probability
+        if score < 0.01:
+            score += 0.01
+        score = int(score * 1000 + 0.5) / 1000.0
+        result.confidence = score
+        result.row_data = [ score, result.essence, result.essence_type ]
+    message.table_column_names = [ 'confidence', 'essence', 'essence_type' ]
+    message.results.sort(key=lambda result: result.confidence, reverse=True)
+    return score_stats
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rank_results_matches_loop(seed):
+    message = make_message(seed)
+    old_message = copy.deepcopy(message)
+    ARAXMessenger().rank_results(message, response=Response())
+    old_score_stats = old_rank_results(old_message)
+    assert message.table_column_names == old_message.table_column_names
+    old_confidences = { result.id: result.confidence for result in old_message.results }
+    assert sorted(old_confidences) == sorted(result.id for result in message.results)
+    for result in message.results:
+        assert result.confidence == pytest.approx(old_confidences[result.id], abs=TOLERANCE)
+        assert result.row_data == [ result.confidence, result.essence, result.essence_type ]
+    #### The results are sorted by confidence, and the scores are summarized the same way
+    confidences = [ result.confidence for result in message.results ]
+    assert confidences == sorted(confidences, reverse=True)
+    ranker = ResultRanker()
+    assert ranker.get_score_stats(ranker.get_edge_attribute_values(message.knowledge_graph.edges)) == old_score_stats
+
+
+def test_rank_results_without_results_or_attributes():
+    message = make_message(0, num_results=0)
+    ARAXMessenger().rank_results(message, response=Response())
+    assert message.results == []
+    message = make_message(1)
+    for edge in message.knowledge_graph.edges:
+        edge.edge_attributes = None
+    old_message = copy.deepcopy(message)
+    ARAXMessenger().rank_results(message, response=Response())
+    old_rank_results(old_message)
+    assert [ (result.id, result.confidence) for result in message.results ] == [ (result.id, result.confidence) for result in old_message.results ]
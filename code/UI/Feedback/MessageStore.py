@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+# Content-addressed, compressed storage of Messages for RTXFeedback
+import os
+import json
+import zlib
+import hashlib
+
+from sqlalchemy import Column, Integer, String, LargeBinary
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+#### zstd is much faster than zlib at a similar ratio, but fall back to zlib if it is not installed
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+#### Number of KG nodes or edges stored together in one fragment blob
+FRAGMENT_SIZE = 500
+
+#### Number of keys to put in one IN () clause when probing the backend
+QUERY_BATCH_SIZE = 500
+
+BlobBase = declarative_base()
+
+#### Define the blob table. One row per distinct piece of content, keyed on the sha256 of its canonical JSON
+class Blob(BlobBase):
+  __tablename__ = 'blob09'
+  blob_hash = Column(String(64), primary_key=True)
+  codec = Column(String(16), nullable=False)
+  raw_size = Column(Integer, nullable=False)
+  stored_size = Column(Integer, nullable=False)
+  data = Column(LargeBinary(length=100500500), nullable=False)
+
+
+############################################ Canonical form and hashing ###############################################
+#### Turn a swagger model or a dict into plain JSON-compatible data
+def as_plain_data(obj):
+  if hasattr(obj, 'to_dict'):
+    return obj.to_dict()
+  return obj
+
+#### Serialize to a byte string that is identical for identical content, independent of dict ordering
+def canonicalize(obj):
+  return json.dumps(as_plain_data(obj), sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+#### Stable content hash of canonical bytes
+def content_hash(canonical_bytes):
+  return hashlib.sha256(canonical_bytes).hexdigest()
+
+#### A result's own id is assigned after it is stored, so it is not part of its content
+def canonicalize_result(result):
+  result = dict(as_plain_data(result))
+  result.pop('id', None)
+  return canonicalize(result)
+
+
+############################################ Compression ###############################################
+class Codec:
+
+  def __init__(self, level=3):
+    if zstandard is not None:
+      self.name = 'zstd'
+      self.compressor = zstandard.ZstdCompressor(level=level)
+    else:
+      self.name = 'zlib'
+      self.compressor = None
+    self.level = level
+
+  def compress(self, data):
+    if self.name == 'zstd':
+      return self.compressor.compress(data)
+    return zlib.compress(data, min(self.level*2, 9))
+
+  @staticmethod
+  def decompress(codec, data):
+    if codec == 'zstd':
+      if zstandard is None:
+        raise Exception("Blob is zstd compressed but the zstandard module is not installed")
+      return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+      return zlib.decompress(data)
+    if codec == 'none':
+      return data
+    raise Exception("Unknown blob codec '"+str(codec)+"'")
+
+
+############################################ Backends ###############################################
+#### A backend stores (codec, raw_size, data) tuples keyed by hash. Implement these three methods to add another one
+class BlobBackend:
+
+  #### Return the subset of hashes that are already stored
+  def existingHashes(self, hashes):
+    raise NotImplementedError
+
+  #### Store a dict of hash -> (codec, raw_size, data). The caller (MessageStore.flush) only passes hashes that
+  #### existingHashes did not find, so this does not check again. With commit=False, a transactional backend leaves the
+  #### blobs in the caller's transaction
+  def putBlobs(self, blobs, commit=True):
+    raise NotImplementedError
+
+  #### Return a dict of hash -> (codec, data) for the requested hashes that exist
+  def getBlobs(self, hashes):
+    raise NotImplementedError
+
+
+#### Blobs in a table accessed through SQLAlchemy, e.g. the RTXFeedback MySQL database or a local sqlite file.
+#### Pass the caller's session to write the blobs in the same transaction as the caller's own rows
+class SqlBlobBackend(BlobBackend):
+
+  def __init__(self, engine, session=None):
+    self.engine = engine
+    BlobBase.metadata.create_all(engine)
+    if session is None:
+      session = sessionmaker(bind=engine)()
+    self.session = session
+
+  def existingHashes(self, hashes):
+    hashes = list(hashes)
+    existing = set()
+    for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+      batch = hashes[start:start+QUERY_BATCH_SIZE]
+      for row in self.session.query(Blob.blob_hash).filter(Blob.blob_hash.in_(batch)):
+        existing.add(row.blob_hash)
+    return existing
+
+  def putBlobs(self, blobs, commit=True):
+    for blob_hash, (codec, raw_size, data) in blobs.items():
+      self.session.add(Blob(blob_hash=blob_hash, codec=codec, raw_size=raw_size, stored_size=len(data), data=data))
+    if commit:
+      self.session.commit()
+    else:
+      self.session.flush()
+
+  def getBlobs(self, hashes):
+    hashes = list(hashes)
+    blobs = {}
+    for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+      batch = hashes[start:start+QUERY_BATCH_SIZE]
+      for row in self.session.query(Blob).filter(Blob.blob_hash.in_(batch)):
+        blobs[row.blob_hash] = (row.codec, row.data)
+    return blobs
+
+
+#### Blobs as files in a directory tree, fanned out on the first two hex digits of the hash
+class DirectoryBlobBackend(BlobBackend):
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, blob_hash):
+    return os.path.join(self.directory, blob_hash[0:2], blob_hash)
+
+  def existingHashes(self, hashes):
+    return set([ blob_hash for blob_hash in hashes if os.path.exists(self._path(blob_hash)) ])
+
+  def putBlobs(self, blobs, commit=True):
+    for blob_hash, (codec, raw_size, data) in blobs.items():
+      path = self._path(blob_hash)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      #### Write to a temporary name and rename so a reader never sees a partial blob (a blob written by another
+      #### process in the meantime has the same content, so replacing it is harmless)
+      with open(path+".tmp", 'wb') as outfile:
+        outfile.write(codec.encode('ascii')+b'\n'+data)
+      os.replace(path+".tmp", path)
+
+  def getBlobs(self, hashes):
+    blobs = {}
+    for blob_hash in hashes:
+      path = self._path(blob_hash)
+      if os.path.exists(path):
+        with open(path, 'rb') as infile:
+          codec, data = infile.read().split(b'\n', 1)
+        blobs[blob_hash] = (codec.decode('ascii'), data)
+    return blobs
+
+
+############################################ The store ###############################################
+#### Stores Messages as a small manifest plus deduplicated result and knowledge graph fragment blobs
+class MessageStore:
+
+  #### Constructor
+  def __init__(self, backend, codec=None):
+    self.backend = backend
+    if codec is None:
+      codec = Codec()
+    self.codec = codec
+
+  #### Make a MessageStore on a local sqlite file, handy for testing
+  @staticmethod
+  def sqlite(filename):
+    from sqlalchemy import create_engine
+    return MessageStore(SqlBlobBackend(create_engine("sqlite:///"+filename)))
+
+
+  #### Add canonical bytes to a pending dict of blobs and return the hash
+  def _addBlob(self, pending, canonical_bytes):
+    blob_hash = content_hash(canonical_bytes)
+    if blob_hash not in pending:
+      pending[blob_hash] = canonical_bytes
+    return blob_hash
+
+  #### Compress and write pending blobs, skipping the ones the backend already has. With commit=False, the blobs are
+  #### left in the backend's current transaction for the caller to commit (or roll back) together with its own rows
+  def flush(self, pending, commit=True):
+    existing = self.backend.existingHashes(pending.keys())
+    blobs = {}
+    for blob_hash, canonical_bytes in pending.items():
+      if blob_hash not in existing:
+        blobs[blob_hash] = (self.codec.name, len(canonical_bytes), self.codec.compress(canonical_bytes))
+    if len(blobs) > 0:
+      self.backend.putBlobs(blobs, commit=commit)
+    return len(blobs)
+
+  #### Fetch and decode blobs
+  def _load(self, hashes):
+    blobs = self.backend.getBlobs(set(hashes))
+    missing = set(hashes) - set(blobs.keys())
+    if len(missing) > 0:
+      raise Exception("Message store is missing blobs: "+", ".join(sorted(missing)[0:5]))
+    decoded = {}
+    for blob_hash, (codec, data) in blobs.items():
+      decoded[blob_hash] = json.loads(Codec.decompress(codec, data))
+    return decoded
+
+
+  #### Add a single result to a pending dict of blobs (written by flush) and return its content hash
+  def addResult(self, pending, result):
+    return self._addBlob(pending, canonicalize_result(result))
+
+  #### Store a single result and return its content hash
+  def storeResult(self, result):
+    pending = {}
+    result_hash = self.addResult(pending, result)
+    self.flush(pending)
+    return result_hash
+
+  #### Load a single result by content hash, optionally restoring the id it was given
+  def loadResult(self, result_hash, result_id=None):
+    result = self._load([result_hash])[result_hash]
+    if result_id is not None:
+      result['id'] = result_id
+    return result
+
+
+  #### Add a whole message to a pending dict of blobs (written by flush) and return the hash of its manifest. The hashes
+  #### of its results may be passed if they were already added with addResult
+  def addMessage(self, pending, message, result_hashes=None):
+    message = dict(as_plain_data(message))
+
+    #### Each result is its own blob so identical results are shared across messages
+    results = message.pop('results', None)
+    if results is not None:
+      message['results'] = []
+      for i_result, result in enumerate(results):
+        result = as_plain_data(result)
+        if result_hashes is not None:
+          entry = { 'hash': result_hashes[i_result] }
+        else:
+          entry = { 'hash': self.addResult(pending, result) }
+        if 'id' in result:
+          entry['id'] = result['id']
+        message['results'].append(entry)
+
+    #### The knowledge graph is split into fixed-size runs of nodes and edges, kept in their original order
+    knowledge_graph = message.get('knowledge_graph')
+    if isinstance(knowledge_graph, dict):
+      knowledge_graph = dict(knowledge_graph)
+      for component in [ 'nodes', 'edges' ]:
+        items = knowledge_graph.get(component)
+        if items is None:
+          continue
+        knowledge_graph[component] = { 'n_items': len(items), 'fragment_size': FRAGMENT_SIZE, 'fragments': [ self._addBlob(pending, canonicalize(items[start:start+FRAGMENT_SIZE]))
+          for start in range(0, len(items), FRAGMENT_SIZE) ] }
+      message['knowledge_graph'] = knowledge_graph
+
+    return self._addBlob(pending, canonicalize({ 'manifest_version': 1, 'message': message }))
+
+  #### Store a whole message and return the hash of its manifest
+  def storeMessage(self, message):
+    pending = {}
+    manifest_hash = self.addMessage(pending, message)
+    self.flush(pending)
+    return manifest_hash
+
+
+  #### Load the manifest of a stored message
+  def loadManifest(self, manifest_hash):
+    return self._load([manifest_hash])[manifest_hash]['message']
+
+  #### Reassemble a whole message from its manifest
+  def loadMessage(self, manifest_hash):
+    message = self.loadManifest(manifest_hash)
+    needed = []
+    if message.get('results') is not None:
+      needed.extend([ entry['hash'] for entry in message['results'] ])
+    knowledge_graph = message.get('knowledge_graph')
+    if isinstance(knowledge_graph, dict):
+      for component in [ 'nodes', 'edges' ]:
+        if isinstance(knowledge_graph.get(component), dict):
+          needed.extend(knowledge_graph[component]['fragments'])
+    blobs = self._load(needed)
+
+    if message.get('results') is not None:
+      results = []
+      for entry in message['results']:
+        result = dict(blobs[entry['hash']])
+        if 'id' in entry:
+          result['id'] = entry['id']
+        results.append(result)
+      message['results'] = results
+    if isinstance(knowledge_graph, dict):
+      for component in [ 'nodes', 'edges' ]:
+        if isinstance(knowledge_graph.get(component), dict):
+          items = []
+          for fragment_hash in knowledge_graph[component]['fragments']:
+            items.extend(blobs[fragment_hash])
+          knowledge_graph[component] = items
+    return message
+
+
+  #### Load one page of a stored message's results without reading the rest of the message
+  def loadResultsPage(self, manifest_hash, offset=0, limit=None, manifest=None):
+    if manifest is None:
+      manifest = self.loadManifest(manifest_hash)
+    entries = manifest.get('results')
+    if entries is None:
+      return None
+    if limit is None:
+      entries = entries[offset:]
+    else:
+      entries = entries[offset:offset+limit]
+    blobs = self._load([ entry['hash'] for entry in entries ])
+    results = []
+    for entry in entries:
+      result = dict(blobs[entry['hash']])
+      if 'id' in entry:
+        result['id'] = entry['id']
+      results.append(result)
+    return results
+
+  #### Yield the nodes or edges of a stored knowledge graph one fragment at a time, optionally starting at an item offset
+  def iterateKnowledgeGraph(self, manifest_hash, component, offset=0, manifest=None):
+    if manifest is None:
+      manifest = self.loadManifest(manifest_hash)
+    knowledge_graph = manifest.get('knowledge_graph')
+    if not isinstance(knowledge_graph, dict) or not isinstance(knowledge_graph.get(component), dict):
+      return
+    fragment_size = knowledge_graph[component].get('fragment_size', FRAGMENT_SIZE)
+    first_fragment = offset // fragment_size
+    skip = offset - first_fragment * fragment_size
+    for fragment_hash in knowledge_graph[component]['fragments'][first_fragment:]:
+      for item in self._load([fragment_hash])[fragment_hash][skip:]:
+        yield item
+      skip = 0
+
+  #### Load one page of a stored knowledge graph's nodes or edges, reading only the fragments that overlap it
+  def loadKnowledgeGraphPage(self, manifest_hash, component, offset=0, limit=None, manifest=None):
+    items = []
+    for item in self.iterateKnowledgeGraph(manifest_hash, component, offset=offset, manifest=manifest):
+      if limit is not None and len(items) >= limit:
+        break
+      items.append(item)
+    return items
+
+  #### Load a message with only one page of results, and the knowledge graph only if asked for
+  def loadMessagePage(self, manifest_hash, offset=0, limit=None, include_knowledge_graph=False):
+    manifest = self.loadManifest(manifest_hash)
+    message = dict(manifest)
+    message['results'] = self.loadResultsPage(manifest_hash, offset=offset, limit=limit, manifest=manifest)
+    knowledge_graph = manifest.get('knowledge_graph')
+    if isinstance(knowledge_graph, dict):
+      knowledge_graph = dict(knowledge_graph)
+      for component in [ 'nodes', 'edges' ]:
+        if isinstance(knowledge_graph.get(component), dict):
+          if include_knowledge_graph:
+            knowledge_graph[component] = list(self.iterateKnowledgeGraph(manifest_hash, component, manifest=manifest))
+          else:
+            knowledge_graph[component] = None
+      message['knowledge_graph'] = knowledge_graph
+    return message
@@ -37,6 +37,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../ARAX/ARAXQuer
 from actions_parser import ActionsParser
 from ARAX_filter import ARAXFilter
 
+from MessageStore import MessageStore, SqlBlobBackend, canonicalize, content_hash
+
 Base = declarative_base()
 
 #### Define the database tables as classes
@@ -53,7 +55,11 @@ class Message(Base):
   n_results = Column(Integer, nullable=False)
   # PickleType uses BLOB on MySQL, which is only 65k. Could not seem to work around it. Resort to LargeBinary with explicit length and my own pickling.
   #message_object = Column(PickleType, nullable=False)
+  # Legacy pickled messages only. New messages leave this empty and live in the MessageStore under message_hash
   message_object = Column(LargeBinary(length=100500500), nullable=False)
+  message_hash = Column(String(64), nullable=True)
+  # Hash of the canonical query plus tool and KG versions, see calcQueryHash()
+  query_hash = Column(String(64), nullable=True, index=True)
 
 class Result(Base):
   __tablename__ = 'result09'
@@ -63,6 +69,7 @@ class Result(Base):
   n_nodes = Column(Integer, nullable=False)
   n_edges = Column(Integer, nullable=False)
   result_text = Column(Text, nullable=False)
+  # Legacy pickled results only. New results leave this empty and live in the MessageStore under result_hash
   result_object = Column(LargeBinary(length=16777200), nullable=False)
   result_hash = Column(String(255), nullable=False)
   message = relationship(Message)
@@ -178,6 +185,7 @@ class RTXFeedback:
     session = DBSession()
     self.session = session
     self.engine = engine
+    self.messageStore = MessageStore(SqlBlobBackend(engine, session=session))
 
   #### Create and store a database connection
   def disconnect(self):
@@ -278,25 +286,41 @@ class RTXFeedback:
       elif "query_graph" in query["message"]:
         termsString = stringifyDict(query["message"]["query_graph"])
 
+    queryHash = None
+    if query is not None:
+      queryHash = self.calcQueryHash(query)
+
     storedMessage = Message(message_datetime=datetime.now(),restated_question=message.restated_question,query_type=query_type_id,
-      terms=termsString,tool_version=rtxConfig.version,result_code=message.message_code,message=message.code_description,n_results=n_results,message_object=pickle.dumps(ast.literal_eval(repr(message))))
-    session.add(storedMessage)
-    session.flush()
-    message.id = "https://arax.rtx.ai/api/rtx/v1/message/"+str(storedMessage.message_id)
+      terms=termsString,tool_version=rtxConfig.version,result_code=message.message_code,message=message.code_description,n_results=n_results,message_object=b'',
+      query_hash=queryHash)
+    #### The rows and the MessageStore blobs are written in one transaction, so a failure leaves neither behind
+    pending = {}
+    try:
+      session.add(storedMessage)
+      session.flush()
+      message.id = "https://arax.rtx.ai/api/rtx/v1/message/"+str(storedMessage.message_id)
 
-    self.addNewResults(storedMessage.message_id,message)
+      result_hashes = self.addNewResults(storedMessage.message_id,message,pending=pending)
 
-    #### After updating all the ids, store an updated object
-    storedMessage.message_object=pickle.dumps(ast.literal_eval(repr(message)))
-    session.commit()
+      #### After updating all the ids, add the message content. The results added above are not hashed again
+      storedMessage.message_hash = self.messageStore.addMessage(pending,message,result_hashes=result_hashes)
+      self.messageStore.flush(pending,commit=False)
+      session.commit()
+    except Exception:
+      session.rollback()
+      raise
 
     return storedMessage.message_id
 
 
-  #### Store all the results from a message into the database
-  def addNewResults(self,message_id,message):
+  #### Store all the results from a message into the database and return their MessageStore hashes. If a pending dict
+  #### of blobs is passed, the result content is only added to it and nothing is committed (the caller does both)
+  def addNewResults(self,message_id,message,pending=None):
     session = self.session
-    result_hash = "xxxx"
+    commit = pending is None
+    if pending is None:
+      pending = {}
+    result_hashes = []
     if message.results is not None:
       for result in message.results:
         n_nodes = 0
@@ -307,14 +331,14 @@ class RTXFeedback:
         if result.confidence is None:
           result.confidence = 0
         if result.result_graph is not None:
-          #### Calculate a hash from the list of nodes and edges in the result
-          result_hash = self.calcResultHash(result)
           if result.result_graph.nodes is not None:
             n_nodes = len(result.result_graph.nodes)
           if result.result_graph.edges is not None:
             n_edges = len(result.result_graph.edges)
-        else:
-          result_hash = 'xxxx'
+
+        #### Add the result content. Identical results share one compressed blob in the MessageStore
+        result_hash = self.messageStore.addResult(pending,result)
+        result_hashes.append(result_hash)
 
         #### See if there is an existing result that matches this hash
         previousResult = None
@@ -333,7 +357,7 @@ class RTXFeedback:
           session.flush()
 
         else:
-          storedResult = Result(message_id=message_id,confidence=result.confidence,n_nodes=n_nodes,n_edges=n_edges,result_text=result.description,result_object=pickle.dumps(ast.literal_eval(repr(result))),result_hash=result_hash)
+          storedResult = Result(message_id=message_id,confidence=result.confidence,n_nodes=n_nodes,n_edges=n_edges,result_text=result.description,result_object=b'',result_hash=result_hash)
           session.add(storedResult)
           session.flush()
 
@@ -344,13 +368,14 @@ class RTXFeedback:
 
           result.id = "https://arax.rtx.ai/api/rtx/v1/result/"+str(storedResult.result_id)
           #eprint("Stored new result. Returned result_id is "+str(storedResult.result_id)+", n_nodes="+str(n_nodes)+", n_edges="+str(n_edges)+", hash="+result_hash)
-          storedResult.result_object=pickle.dumps(ast.literal_eval(repr(result)))
 
-    session.commit()
-    return
+    if commit:
+      self.messageStore.flush(pending,commit=False)
+      session.commit()
+    return result_hashes
 
 
-  #### Calculate a hash from the list of nodes and edges in a result
+  #### Calculate a hash from the list of nodes and edges in a result. Superseded by the MessageStore content hash
   def calcResultHash(self,result):
 
     #### Get a sorted list of node ids
@@ -378,22 +403,59 @@ class RTXFeedback:
     return result_hash_string
 
 
+  #### Calculate the cache key of a query: a hash of its canonical content plus the tool and KG versions that answered it
+  def calcQueryHash(self,query):
+    rtxConfig = RTXConfiguration()
+    key = { "tool_version": rtxConfig.version, "kg_version": rtxConfig.live, "neo4j_bolt": rtxConfig.neo4j_bolt }
+
+    #### The query may carry its content at the top level (as from processExternalPreviousMessageProcessingPlan) or in a message dict or object
+    message = query.get("message")
+    if message is None:
+      message = query
+    elif hasattr(message, "to_dict"):
+      message = message.to_dict()
+
+    query_type_id = query.get("query_type_id")
+    if query_type_id is None:
+      query_type_id = message.get("query_type_id")
+    if message.get("terms") is not None:
+      key["terms"] = message["terms"]
+    elif message.get("query_graph") is not None:
+      key["query_graph"] = message["query_graph"]
+    if "previous_message_processing_plan" in query and query["previous_message_processing_plan"] is not None:
+      key["processing_actions"] = query["previous_message_processing_plan"].get("processing_actions")
+    key["query_type_id"] = query_type_id
+
+    return content_hash(canonicalize(key))
+
+
   #### Get a previously stored message for this query from the database
   def getCachedMessage(self,query):
     if "bypass_cache" in query and query["bypass_cache"] == "true":
       return
     session = self.session
-    rtxConfig = RTXConfiguration()
-    tool_version = rtxConfig.version
-    termsString = stringifyDict(query["message"]["terms"])
 
-    #### Look for previous messages we could use
-    storedMessage = session.query(Message).filter(Message.query_type==query["message"]["query_type_id"]).filter(Message.tool_version==tool_version).filter(Message.terms==termsString).order_by(desc(Message.message_datetime)).first()
+    #### Look for previous messages we could use. query_hash is indexed, so this is a single index probe
+    storedMessage = session.query(Message).filter(Message.query_hash==self.calcQueryHash(query)).order_by(desc(Message.message_id)).first()
     if ( storedMessage is not None ):
-      return pickle.loads(storedMessage.message_object)
+      return self.loadStoredMessage(storedMessage)
     return
 
 
+  #### Turn a Message row into the message dict, from the MessageStore or from a legacy pickle
+  def loadStoredMessage(self,storedMessage):
+    if storedMessage.message_hash is not None:
+      return self.messageStore.loadMessage(storedMessage.message_hash)
+    return pickle.loads(storedMessage.message_object)
+
+
+  #### Turn a Result row into the result dict, from the MessageStore or from a legacy pickle
+  def loadStoredResult(self,storedResult):
+    if len(storedResult.result_object) == 0:
+      return self.messageStore.loadResult(storedResult.result_hash, "https://arax.rtx.ai/api/rtx/v1/result/"+str(storedResult.result_id))
+    return pickle.loads(storedResult.result_object)
+
+
   #### Get the list of ratings
   def getRatings(self):
     session = self.session
@@ -548,11 +610,55 @@ class RTXFeedback:
     #### Find the message
     storedMessage = session.query(Message).filter(Message.message_id==message_id).first()
     if storedMessage is not None:
-      return pickle.loads(storedMessage.message_object)
+      return self.loadStoredMessage(storedMessage)
     else:
       return( { "status": 404, "title": "Message not found", "detail": "There is no message corresponding to message_id="+str(message_id), "type": "about:blank" }, 404)
 
 
+  #### Fetch one page of results from a cached message. The knowledge graph is only included if asked for
+  def getMessagePage(self, message_id, offset=0, limit=100, includeKnowledgeGraph=False):
+    session = self.session
+
+    if message_id is None:
+      return( { "status": 450, "title": "message_id missing", "detail": "Required attribute message_id is missing from URL", "type": "about:blank" }, 450)
+
+    storedMessage = session.query(Message).filter(Message.message_id==message_id).first()
+    if storedMessage is None:
+      return( { "status": 404, "title": "Message not found", "detail": "There is no message corresponding to message_id="+str(message_id), "type": "about:blank" }, 404)
+
+    if storedMessage.message_hash is not None:
+      return self.messageStore.loadMessagePage(storedMessage.message_hash, offset=offset, limit=limit, include_knowledge_graph=includeKnowledgeGraph)
+
+    #### Legacy pickled messages can only be loaded whole, so slice afterwards
+    message = pickle.loads(storedMessage.message_object)
+    if message.get("results") is not None:
+      message["results"] = message["results"][offset:offset+limit]
+    if not includeKnowledgeGraph and message.get("knowledge_graph") is not None:
+      message["knowledge_graph"]["nodes"] = None
+      message["knowledge_graph"]["edges"] = None
+    return message
+
+
+  #### Fetch one page of the nodes or edges of a cached message's knowledge graph
+  def getMessageKnowledgeGraphPage(self, message_id, component, offset=0, limit=1000):
+    session = self.session
+
+    if component not in [ "nodes", "edges" ]:
+      return( { "status": 400, "title": "Bad component", "detail": "Knowledge graph component must be 'nodes' or 'edges'", "type": "about:blank" }, 400)
+
+    storedMessage = session.query(Message).filter(Message.message_id==message_id).first()
+    if storedMessage is None:
+      return( { "status": 404, "title": "Message not found", "detail": "There is no message corresponding to message_id="+str(message_id), "type": "about:blank" }, 404)
+
+    if storedMessage.message_hash is not None:
+      return self.messageStore.loadKnowledgeGraphPage(storedMessage.message_hash, component, offset=offset, limit=limit)
+
+    knowledge_graph = pickle.loads(storedMessage.message_object).get("knowledge_graph")
+    if knowledge_graph is None or knowledge_graph.get(component) is None:
+      return []
+    return knowledge_graph[component][offset:offset+limit]
+
+
   #### Fetch a cached result
   def getResult(self, result_id):
     session = self.session
@@ -563,7 +669,7 @@ class RTXFeedback:
     #### Find the result
     storedResult = session.query(Result).filter(Result.result_id==result_id).first()
     if storedResult is not None:
-      return pickle.loads(storedResult.result_object)
+      return self.loadStoredResult(storedResult)
     else:
       return( { "status": 404, "title": "Result not found", "detail": "There is no result corresponding to result_id="+str(result_id), "type": "about:blank" }, 404)
 
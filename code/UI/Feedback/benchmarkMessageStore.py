@@ -0,0 +1,83 @@
+#!/bin/env python3
+# Compare write/read latency and stored size of legacy pickled messages against the MessageStore on a local sqlite file
+
+import os
+import sys
+import ast
+import time
+import pickle
+import random
+import argparse
+import tempfile
+
+from MessageStore import MessageStore, DirectoryBlobBackend
+
+#### Build a synthetic message shaped like ARAX output
+def make_message(n_results, n_nodes, n_edges, seed):
+  rng = random.Random(seed)
+  nodes = [ { 'id': f"CHEMBL.COMPOUND:CHEMBL{i}", 'name': f"compound {i}", 'type': [ 'chemical_substance' ], 'uri': f"https://www.ebi.ac.uk/chembl/compound/inspect/CHEMBL{i}",
+    'description': "A synthetic compound used for benchmarking the message store. " * 3, 'node_attributes': None, 'qnode_ids': [ 'n00' ] } for i in range(n_nodes) ]
+  edges = [ { 'id': f"KG2:{i}", 'type': 'physically_interacts_with', 'source_id': nodes[rng.randrange(n_nodes)]['id'], 'target_id': nodes[rng.randrange(n_nodes)]['id'],
+    'is_defined_by': 'ARAX/KG2', 'provided_by': 'ChEMBL', 'relation': 'chembl:mechanism', 'edge_attributes': [ { 'name': 'ngd', 'type': 'float', 'value': rng.random() } ],
+    'qedge_ids': [ 'e00' ] } for i in range(n_edges) ]
+  results = []
+  for i in range(n_results):
+    edge = edges[i % n_edges]
+    results.append({ 'id': None, 'confidence': round(1.0 - i/n_results, 3), 'description': f"Result {i}", 'essence': nodes[i % n_nodes]['name'], 'reasoner_id': 'ARAX',
+      'node_bindings': [ { 'qg_id': 'n00', 'kg_id': edge['source_id'] }, { 'qg_id': 'n01', 'kg_id': edge['target_id'] } ],
+      'edge_bindings': [ { 'qg_id': 'e00', 'kg_id': edge['id'] } ], 'result_graph': None, 'row_data': None })
+  return { 'id': None, 'reasoner_id': 'ARAX', 'n_results': n_results, 'code_description': f"Query returned {n_results} results", 'results': results,
+    'query_graph': { 'nodes': [ { 'id': 'n00', 'type': 'chemical_substance' }, { 'id': 'n01', 'type': 'protein' } ], 'edges': [ { 'id': 'e00', 'source_id': 'n00', 'target_id': 'n01' } ] },
+    'knowledge_graph': { 'nodes': nodes, 'edges': edges } }
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the MessageStore against pickled messages")
+  parser.add_argument('--n_messages', type=int, default=20)
+  parser.add_argument('--n_results', type=int, default=500)
+  parser.add_argument('--n_nodes', type=int, default=2000)
+  parser.add_argument('--n_edges', type=int, default=5000)
+  parser.add_argument('--backend', default='sqlite', choices=[ 'sqlite', 'directory' ])
+  args = parser.parse_args()
+
+  #### Half of the messages are repeats of an earlier query, as happens when the same question is asked again
+  messages = [ make_message(args.n_results, args.n_nodes, args.n_edges, seed=i//2) for i in range(args.n_messages) ]
+
+  #### Legacy path: pickle of literal_eval(repr(message)), as RTXFeedback did
+  legacy_bytes = 0
+  start = time.time()
+  pickles = []
+  for message in messages:
+    pickled = pickle.dumps(ast.literal_eval(repr(message)))
+    legacy_bytes += len(pickled)
+    pickles.append(pickled)
+  legacy_write = time.time() - start
+  start = time.time()
+  for pickled in pickles:
+    pickle.loads(pickled)
+  legacy_read = time.time() - start
+
+  with tempfile.TemporaryDirectory() as tmpdir:
+    if args.backend == 'sqlite':
+      store = MessageStore.sqlite(os.path.join(tmpdir, 'store.sqlite'))
+    else:
+      store = MessageStore(DirectoryBlobBackend(os.path.join(tmpdir, 'store')))
+
+    start = time.time()
+    hashes = [ store.storeMessage(message) for message in messages ]
+    store_write = time.time() - start
+    start = time.time()
+    loaded = [ store.loadMessage(message_hash) for message_hash in hashes ]
+    store_read = time.time() - start
+    assert loaded == messages, "Round trip through the MessageStore did not reproduce the messages"
+
+    if args.backend == 'sqlite':
+      store_bytes = os.path.getsize(os.path.join(tmpdir, 'store.sqlite'))
+    else:
+      store_bytes = sum([ os.path.getsize(os.path.join(path, name)) for path, dirs, names in os.walk(os.path.join(tmpdir, 'store')) for name in names ])
+
+  print(f"{args.n_messages} messages, {args.n_results} results, {args.n_nodes} nodes, {args.n_edges} edges each; codec={store.codec.name}, backend={args.backend}")
+  print(f"{'':12s} {'write s/msg':>12s} {'read s/msg':>12s} {'MB total':>10s}")
+  print(f"{'pickle':12s} {legacy_write/args.n_messages:12.4f} {legacy_read/args.n_messages:12.4f} {legacy_bytes/1e6:10.2f}")
+  print(f"{'MessageStore':12s} {store_write/args.n_messages:12.4f} {store_read/args.n_messages:12.4f} {store_bytes/1e6:10.2f}")
+
+if __name__ == "__main__": main()
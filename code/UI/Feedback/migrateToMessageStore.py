@@ -0,0 +1,76 @@
+#!/bin/env python3
+# Move legacy pickled messages and results in the Message/Feedback MySQL database into the MessageStore
+
+import os
+import sys
+import pickle
+import argparse
+
+from sqlalchemy import inspect, text
+
+from RTXFeedback import RTXFeedback, Message, Result
+
+parser = argparse.ArgumentParser(description="Move pickled message09/result09 payloads into the compressed, deduplicated MessageStore")
+parser.add_argument('--batch_size', type=int, default=100, help="number of rows to convert per commit")
+parser.add_argument('--keep_legacy', action='store_true', help="keep the old pickles instead of emptying message_object/result_object")
+parser.add_argument('--limit', type=int, default=None, help="stop after this many results and this many messages (for trying it out)")
+args = parser.parse_args()
+
+#### Create an RTX Feedback management object
+rtxFeedback = RTXFeedback()
+session = rtxFeedback.session
+messageStore = rtxFeedback.messageStore
+
+#### Databases created before the MessageStore lack the message_hash and query_hash columns
+columns = [ column['name'] for column in inspect(rtxFeedback.engine).get_columns(Message.__tablename__) ]
+with rtxFeedback.engine.begin() as connection:
+  if 'message_hash' not in columns:
+    print("Adding column message_hash to "+Message.__tablename__)
+    connection.execute(text("ALTER TABLE "+Message.__tablename__+" ADD COLUMN message_hash VARCHAR(64) NULL"))
+  if 'query_hash' not in columns:
+    #### Old rows keep a NULL query_hash: they were keyed on a lossy terms string and simply become cache misses
+    print("Adding indexed column query_hash to "+Message.__tablename__)
+    connection.execute(text("ALTER TABLE "+Message.__tablename__+" ADD COLUMN query_hash VARCHAR(64) NULL"))
+    connection.execute(text("CREATE INDEX ix_"+Message.__tablename__+"_query_hash ON "+Message.__tablename__+" (query_hash)"))
+
+#### Convert the results first so their blobs are already present when the messages that contain them are stored
+#### Each batch of blobs is written in the same transaction as the updated rows
+n_results = 0
+last_result_id = 0
+while args.limit is None or n_results < args.limit:
+  batch_size = args.batch_size if args.limit is None else min(args.batch_size, args.limit - n_results)
+  storedResults = session.query(Result).filter(Result.result_object != b'').filter(Result.result_id > last_result_id).order_by(Result.result_id).limit(batch_size).all()
+  if len(storedResults) == 0:
+    break
+  pending = {}
+  for storedResult in storedResults:
+    last_result_id = storedResult.result_id
+    result_hash = messageStore.addResult(pending, pickle.loads(storedResult.result_object))
+    if not args.keep_legacy:
+      storedResult.result_hash = result_hash
+      storedResult.result_object = b''
+    n_results += 1
+  messageStore.flush(pending, commit=False)
+  session.commit()
+  print(f"Converted {n_results} results, up to result_id {last_result_id}")
+
+n_messages = 0
+last_message_id = 0
+while args.limit is None or n_messages < args.limit:
+  batch_size = args.batch_size if args.limit is None else min(args.batch_size, args.limit - n_messages)
+  storedMessages = session.query(Message).filter(Message.message_hash == None).filter(Message.message_id > last_message_id).order_by(Message.message_id).limit(batch_size).all()
+  if len(storedMessages) == 0:
+    break
+  pending = {}
+  for storedMessage in storedMessages:
+    last_message_id = storedMessage.message_id
+    message = pickle.loads(storedMessage.message_object)
+    storedMessage.message_hash = messageStore.addMessage(pending, message)
+    if not args.keep_legacy:
+      storedMessage.message_object = b''
+    n_messages += 1
+  messageStore.flush(pending, commit=False)
+  session.commit()
+  print(f"Converted {n_messages} messages, up to message_id {last_message_id}")
+
+print(f"Done. Converted {n_results} results and {n_messages} messages")
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# Unit tests of the MessageStore against an in-memory sqlite database
+# Usage: python -m pytest -v test_MessageStore.py
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from MessageStore import MessageStore, SqlBlobBackend, DirectoryBlobBackend, Blob, Codec, FRAGMENT_SIZE, content_hash
+
+
+def make_result(result_id, node_ids):
+  return { 'id': result_id, 'confidence': 0.5, 'description': 'result with '+', '.join(node_ids),
+    'result_graph': { 'nodes': [ { 'id': node_id } for node_id in node_ids ], 'edges': [] } }
+
+
+def make_message(n_nodes=3):
+  return { 'id': 'https://arax.rtx.ai/api/rtx/v1/message/1', 'restated_question': 'What is malaria?',
+    'results': [ make_result('r1', ['DOID:12365']), make_result('r2', ['DOID:12365', 'CHEMBL:1']), make_result('r3', ['DOID:12365']) ],
+    'knowledge_graph': { 'nodes': [ { 'id': 'N:'+str(i) } for i in range(n_nodes) ], 'edges': [ { 'id': 'E:1', 'source_id': 'N:0', 'target_id': 'N:1' } ] } }
+
+
+class MessageStoreTests(unittest.TestCase):
+
+  def setUp(self):
+    self.engine = create_engine("sqlite://")
+    self.session = sessionmaker(bind=self.engine)()
+    self.store = MessageStore(SqlBlobBackend(self.engine, session=self.session))
+
+  def tearDown(self):
+    self.session.close()
+
+  def n_blobs(self):
+    return self.session.query(Blob).count()
+
+  def test_round_trip(self):
+    message = make_message(n_nodes=2*FRAGMENT_SIZE+1)
+    manifest_hash = self.store.storeMessage(message)
+    self.assertEqual(self.store.loadMessage(manifest_hash), message)
+    self.assertEqual(self.store.loadResultsPage(manifest_hash, offset=1, limit=1), message['results'][1:2])
+    self.assertEqual(self.store.loadKnowledgeGraphPage(manifest_hash, 'nodes', offset=FRAGMENT_SIZE-1, limit=3),
+      message['knowledge_graph']['nodes'][FRAGMENT_SIZE-1:FRAGMENT_SIZE+2])
+
+  def test_identical_content_is_stored_once(self):
+    #### r1 and r3 differ only by their id, so 2 result blobs + 2 fragment blobs + 1 manifest
+    manifest_hash = self.store.storeMessage(make_message())
+    self.assertEqual(self.n_blobs(), 5)
+    self.assertEqual(self.store.storeMessage(make_message()), manifest_hash)
+    self.assertEqual(self.n_blobs(), 5)
+    self.assertEqual(self.store.storeResult(make_result('r9', ['DOID:12365'])), self.store.loadManifest(manifest_hash)['results'][0]['hash'])
+    self.assertEqual(self.n_blobs(), 5)
+    self.assertEqual(self.store.loadResult(self.store.storeResult(make_result('r9', ['DOID:12365'])), 'r9'), make_result('r9', ['DOID:12365']))
+
+  def test_precomputed_result_hashes(self):
+    message = make_message()
+    pending = {}
+    result_hashes = [ self.store.addResult(pending, result) for result in message['results'] ]
+    manifest_hash = self.store.addMessage(pending, message, result_hashes=result_hashes)
+    self.assertEqual(self.store.flush(pending), 5)
+    self.assertEqual(manifest_hash, self.store.storeMessage(message))
+    self.assertEqual(self.store.loadMessage(manifest_hash), message)
+
+  def test_uncommitted_blobs_are_rolled_back(self):
+    pending = {}
+    manifest_hash = self.store.addMessage(pending, make_message())
+    self.store.flush(pending, commit=False)
+    self.assertEqual(self.n_blobs(), 5)
+    self.session.rollback()
+    self.assertEqual(self.n_blobs(), 0)
+    with self.assertRaises(Exception):
+      self.store.loadMessage(manifest_hash)
+
+    #### After a commit, the blobs are kept
+    self.store.flush(pending, commit=False)
+    self.session.commit()
+    self.session.rollback()
+    self.assertEqual(self.store.loadMessage(manifest_hash), make_message())
+
+  def test_blobs_are_compressed_and_content_addressed(self):
+    message = make_message(n_nodes=FRAGMENT_SIZE)
+    self.store.storeMessage(message)
+    blobs = self.session.query(Blob).all()
+    self.assertEqual(len(blobs), 5)
+    for blob in blobs:
+      self.assertEqual(blob.codec, self.store.codec.name)
+      self.assertEqual(blob.stored_size, len(blob.data))
+      canonical_bytes = Codec.decompress(blob.codec, blob.data)
+      self.assertEqual(blob.raw_size, len(canonical_bytes))
+      self.assertEqual(content_hash(canonical_bytes), blob.blob_hash)
+      json.loads(canonical_bytes)
+    #### A full fragment of similar nodes compresses well
+    largest = max(blobs, key=lambda blob: blob.raw_size)
+    self.assertLess(largest.stored_size, largest.raw_size / 2)
+
+  def test_blobs_of_another_codec_are_read(self):
+    codec = Codec()
+    codec.name = 'zlib'
+    zlib_store = MessageStore(SqlBlobBackend(self.engine, session=self.session), codec=codec)
+    manifest_hash = zlib_store.storeMessage(make_message())
+    self.assertEqual(set(row.codec for row in self.session.query(Blob.codec)), set(['zlib']))
+    self.assertEqual(self.store.loadMessage(manifest_hash), make_message())
+
+  def test_existing_blobs_are_probed_once_per_flush(self):
+    statements = []
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+      if statement.lstrip().upper().startswith('SELECT') and 'blob09' in statement:
+        statements.append(statement)
+    event.listen(self.engine, 'before_cursor_execute', record_statement)
+    try:
+      self.store.storeMessage(make_message())
+      self.assertEqual(len(statements), 1)
+      self.assertEqual(self.store.storeMessage(make_message()), self.store.storeMessage(make_message()))
+      self.assertEqual(len(statements), 3)
+    finally:
+      event.remove(self.engine, 'before_cursor_execute', record_statement)
+    self.assertEqual(self.n_blobs(), 5)
+
+  def test_directory_backend_round_trip(self):
+    with tempfile.TemporaryDirectory() as directory:
+      store = MessageStore(DirectoryBlobBackend(directory))
+      message = make_message(n_nodes=FRAGMENT_SIZE+1)
+      manifest_hash = store.storeMessage(message)
+      self.assertEqual(store.storeMessage(message), manifest_hash)
+      self.assertEqual(MessageStore(DirectoryBlobBackend(directory)).loadMessage(manifest_hash), message)
+      self.assertEqual(sum(len(files) for _, _, files in os.walk(directory)), 6)
+
+
+if __name__ == '__main__':
+  unittest.main()
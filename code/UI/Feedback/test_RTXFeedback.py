@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# Unit tests of the RTXFeedback query hash and message paging against an in-memory sqlite database
+# Usage: python -m pytest -v test_RTXFeedback.py
+
+import os
+import sys
+import pickle
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import RTXFeedback as RTXFeedbackModule
+from RTXFeedback import RTXFeedback, Base, Message
+from MessageStore import MessageStore, SqlBlobBackend
+from swagger_server.models.message import Message as TxMessage
+from swagger_server.models.result import Result as TxResult
+from swagger_server.models.knowledge_graph import KnowledgeGraph
+from swagger_server.models.node import Node
+
+
+#### Stands in for RTXConfiguration, which reads (and may fetch) the deployment's config.json
+class LocalConfiguration:
+  version = "ARAX test"
+  live = "Production"
+  neo4j_bolt = "bolt://localhost:7687"
+
+
+def make_query(reverse=False):
+  query_graph = { 'nodes': [ { 'id': 'n00', 'curie': 'DOID:14330', 'type': 'disease' }, { 'id': 'n01', 'type': 'protein' } ],
+    'edges': [ { 'id': 'e00', 'source_id': 'n00', 'target_id': 'n01' } ] }
+  query = { 'query_type_id': 'Q0', 'message': { 'query_graph': query_graph } }
+  if reverse:
+    #### The same content with all the keys in the opposite order
+    def reverse_keys(obj):
+      if isinstance(obj, dict):
+        return { key: reverse_keys(obj[key]) for key in reversed(list(obj.keys())) }
+      if isinstance(obj, list):
+        return [ reverse_keys(item) for item in obj ]
+      return obj
+    query = reverse_keys(query)
+  return query
+
+
+class RTXFeedbackTests(unittest.TestCase):
+
+  def setUp(self):
+    self.patcher = mock.patch.object(RTXFeedbackModule, 'RTXConfiguration', LocalConfiguration)
+    self.patcher.start()
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    #### Connect to the sqlite database instead of the MySQL one of the configuration
+    self.feedback = RTXFeedback.__new__(RTXFeedback)
+    self.feedback.databaseName = "RTXFeedback"
+    self.feedback.engine = engine
+    self.feedback.session = session
+    self.feedback.messageStore = MessageStore(SqlBlobBackend(engine, session=session))
+
+  def tearDown(self):
+    self.feedback.disconnect()
+    self.patcher.stop()
+
+  def store_message(self, n_results=7, n_nodes=5):
+    message = TxMessage(message_code='OK', results=[ TxResult(description='result '+str(i), confidence=i/10) for i in range(n_results) ],
+      knowledge_graph=KnowledgeGraph(nodes=[ Node(id='N:'+str(i)) for i in range(n_nodes) ], edges=[]))
+    message_id = self.feedback.addNewMessage(message, make_query())
+    return message_id, message.to_dict()
+
+  def store_legacy_message(self, message):
+    storedMessage = Message(message_datetime=datetime.now(), restated_question='', query_type='Q0', terms='{}', tool_version='ARAX test',
+      result_code='OK', message='legacy', n_results=len(message['results']), message_object=pickle.dumps(message))
+    self.feedback.session.add(storedMessage)
+    self.feedback.session.commit()
+    return storedMessage.message_id
+
+  def test_query_hash_is_stable_under_key_reordering(self):
+    query_hash = self.feedback.calcQueryHash(make_query())
+    self.assertEqual(self.feedback.calcQueryHash(make_query(reverse=True)), query_hash)
+    self.assertEqual(len(query_hash), 64)
+    #### A different query, or another tool version, has another hash
+    other_query = make_query()
+    other_query['message']['query_graph']['nodes'][1]['type'] = 'chemical_substance'
+    self.assertNotEqual(self.feedback.calcQueryHash(other_query), query_hash)
+    with mock.patch.object(LocalConfiguration, 'version', "ARAX other"):
+      self.assertNotEqual(self.feedback.calcQueryHash(make_query()), query_hash)
+
+  def test_cached_message_is_found_by_reordered_query(self):
+    message_id, message = self.store_message()
+    cached_message = self.feedback.getCachedMessage(make_query(reverse=True))
+    self.assertEqual(cached_message['id'], message['id'])
+    self.assertEqual([ result['id'] for result in cached_message['results'] ], [ result['id'] for result in message['results'] ])
+
+  def check_pages(self, message_id, result_ids, node_ids):
+    def page_result_ids(offset, limit):
+      return [ result['id'] for result in self.feedback.getMessagePage(message_id, offset=offset, limit=limit)['results'] ]
+    #### First page, a page in the middle, the last partial page, and pages past the end
+    self.assertEqual(page_result_ids(0, 3), result_ids[0:3])
+    self.assertEqual(page_result_ids(3, 3), result_ids[3:6])
+    self.assertEqual(page_result_ids(6, 3), result_ids[6:7])
+    self.assertEqual(page_result_ids(7, 3), [])
+    self.assertEqual(page_result_ids(100, 3), [])
+    self.assertEqual(page_result_ids(0, 100), result_ids)
+
+    #### The knowledge graph is left out unless asked for
+    page = self.feedback.getMessagePage(message_id, offset=0, limit=3)
+    self.assertIsNone(page['knowledge_graph']['nodes'])
+    page = self.feedback.getMessagePage(message_id, offset=0, limit=3, includeKnowledgeGraph=True)
+    self.assertEqual([ node['id'] for node in page['knowledge_graph']['nodes'] ], node_ids)
+
+    def page_node_ids(offset, limit):
+      return [ node['id'] for node in self.feedback.getMessageKnowledgeGraphPage(message_id, 'nodes', offset=offset, limit=limit) ]
+    self.assertEqual(page_node_ids(0, 2), node_ids[0:2])
+    self.assertEqual(page_node_ids(4, 2), node_ids[4:5])
+    self.assertEqual(page_node_ids(5, 2), [])
+    self.assertEqual(self.feedback.getMessageKnowledgeGraphPage(message_id, 'edges', offset=0, limit=2), [])
+    self.assertEqual(self.feedback.getMessageKnowledgeGraphPage(message_id, 'results')[1], 400)
+
+  def test_pages_of_stored_message(self):
+    message_id, message = self.store_message()
+    self.assertIsNotNone(self.feedback.session.query(Message).filter(Message.message_id==message_id).first().message_hash)
+    self.check_pages(message_id, [ result['id'] for result in message['results'] ], [ 'N:'+str(i) for i in range(5) ])
+    page = self.feedback.getMessagePage(message_id, offset=6, limit=3)
+    self.assertEqual(page['results'], message['results'][6:7])
+
+  def test_pages_of_legacy_pickled_message(self):
+    message = { 'results': [ { 'id': 'r'+str(i), 'description': 'result '+str(i) } for i in range(7) ],
+      'knowledge_graph': { 'nodes': [ { 'id': 'N:'+str(i) } for i in range(5) ], 'edges': [] } }
+    message_id = self.store_legacy_message(message)
+    self.check_pages(message_id, [ 'r'+str(i) for i in range(7) ], [ 'N:'+str(i) for i in range(5) ])
+    self.assertEqual(self.feedback.getMessage(message_id), message)
+
+  def test_missing_message(self):
+    self.assertEqual(self.feedback.getMessagePage(999)[1], 404)
+    self.assertEqual(self.feedback.getMessagePage(None)[1], 450)
+    self.assertEqual(self.feedback.getMessageKnowledgeGraphPage(999, 'nodes')[1], 404)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -9,12 +9,15 @@ import subprocess
 import json
 import datetime
 import ast
+import time
+import concurrent.futures
 import requests
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../")
 from RTXConfiguration import RTXConfiguration
 
 from swagger_server.models.message import Message
+from swagger_server.models.knowledge_graph import KnowledgeGraph
 from swagger_server.models.q_node import QNode
 from swagger_server.models.q_edge import QEdge
 
@@ -34,6 +37,16 @@ from RTXFeedback import RTXFeedback
 
 class RTXQuery:
 
+    #### The query endpoints of the reasoners that can be integrated (None if a reasoner is currently not queried)
+    REASONER_URLS = {
+        "RTX": "https://arax.rtx.ai/devED/api/rtx/v1/query",
+        "Robokop": "http://robokop.renci.org:6011/api/query",
+        "Indigo": None,    # "https://indigo.ncats.io/reasoner/api/v0/query"
+    }
+    #### How long to wait for each reasoner's answer (in seconds)
+    REASONER_TIMEOUT_SEC = { "RTX": 300, "Robokop": 300, "Indigo": 300 }
+    DEFAULT_REASONER_TIMEOUT_SEC = 300
+
     def query(self,query):
 
         #### Get our configuration information
@@ -394,40 +407,65 @@ class RTXQuery:
                 eprint(targets)
 
                 final_message = Message()
+                query["options"] = "foo"
 
+                #### Send the query to all the reasoners at the same time, each with its own timeout
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(targets))
+                start_time = time.time()
+                queries = []
                 for reasoner_id in targets:
+                    if reasoner_id not in self.REASONER_URLS:
+                        eprint("ERROR: Unrecognized target '"+reasoner_id+"'")
+                    elif self.REASONER_URLS[reasoner_id] is not None:
+                        url = self.REASONER_URLS[reasoner_id]
+                        timeout = self.REASONER_TIMEOUT_SEC.get(reasoner_id, self.DEFAULT_REASONER_TIMEOUT_SEC)
+                        eprint("Querying url "+url)
+                        queries.append( (reasoner_id, timeout, executor.submit(self.query_reasoner, url, query, timeout)) )
+
+                #### Then merge their messages in the order of the targets
+                for reasoner_id, timeout, future in queries:
                     eprint("Looping with reasoner_id="+reasoner_id)
-                    query["options"] = "foo"
-                    url = None
+                    try:
+                        message = future.result(timeout=max(start_time + timeout - time.time(), 0))
+                    except concurrent.futures.TimeoutError:
+                        eprint("ERROR: No answer from "+reasoner_id+" within "+str(timeout)+" seconds")
+                        continue
+                    if message is None:
+                        continue
                     if reasoner_id == "RTX":
-                        url = "https://arax.rtx.ai/devED/api/rtx/v1/query"
-                    elif reasoner_id == "Robokop":
-                        url = "http://robokop.renci.org:6011/api/query"
-                    elif reasoner_id == "Indigo":
-                        url = "https://indigo.ncats.io/reasoner/api/v0/query"
-                        url = None
-                    else:
-                        eprint("ERROR: Unrecognized target '"+target+"'")
-                    if url is not None:
-                        eprint("Querying url "+url)
-                        message_content = requests.post(url, headers={'accept': 'application/json'}, json=query)
-                        status_code = message_content.status_code
-                        message_dict = message_content.json()
-                        message = Message.from_dict(message_dict)
-                        if reasoner_id == "RTX":
-                            final_message = message
-                        if reasoner_id == "Robokop" or reasoner_id == "Indigo":
-                        #if reasoner_id == "Robokop":
-                            eprint("Merging in "+reasoner_id)
-                            message = self.fix_message(query,message,reasoner_id)
-                            if message.results is not None:
-                                final_message = self.merge_message2(final_message,message)
+                        final_message = message
+                    if reasoner_id == "Robokop" or reasoner_id == "Indigo":
+                        eprint("Merging in "+reasoner_id)
+                        message = self.fix_message(query,message,reasoner_id)
+                        if message.results is not None:
+                            final_message = self.merge_message2(final_message,message)
+                executor.shutdown(wait=False)
 
                 return(final_message)
             return(None)
         return(None)
 
 
+    @staticmethod
+    def query_reasoner(url,query,timeout):
+        try:
+            message_content = requests.post(url, headers={'accept': 'application/json'}, json=query, timeout=timeout)
+            status_code = message_content.status_code
+            if status_code != 200:
+                eprint("ERROR: Query to "+url+" returned status code "+str(status_code))
+                return(None)
+            message_dict = message_content.json()
+        except (requests.exceptions.RequestException, ValueError) as error:
+            eprint("ERROR: Query to "+url+" failed: "+str(error))
+            return(None)
+        message = Message.from_dict(message_dict)
+        if message.results is not None:
+            for result in message.results:
+                if result.result_graph is not None and not isinstance(result.result_graph, KnowledgeGraph):
+                    result.result_graph = KnowledgeGraph.from_dict(result.result_graph)
+        return(message)
+
+
     def fix_message(self,query,message,reasoner_id):
 
         if reasoner_id == "RTX":
@@ -437,7 +475,7 @@ class RTXQuery:
         elif reasoner_id == "Indigo":
             base_url = "https://indigo.ncats.io/reasoner/api/v0"
         else:
-            eprint("ERROR: Unrecognized target '"+target+"'")
+            eprint("ERROR: Unrecognized target '"+reasoner_id+"'")
 
         if message.context is None:
             message.context = "https://raw.githubusercontent.com/biolink/biolink-model/master/context.jsonld"
@@ -478,11 +516,49 @@ class RTXQuery:
         return(final_message)
 
 
-    def merge_message2(self,final_message,message_to_merge):
+    @staticmethod
+    def get_result_nodes(result):
+        if result.result_graph is None or result.result_graph.nodes is None:
+            return([])
+        return(result.result_graph.nodes)
+
+
+    @staticmethod
+    def node_has_type(node,node_type):
+        if isinstance(node.type,list):
+            return(node_type in node.type)
+        return(node.type == node_type)
+
+
+    def index_results_by_protein(self,results):
+        #### Index the positions of the nodes of the results that can be matched to a protein: the targets (Indigo) by
+        #### their UniProtKB curie and the genes (Robokop) by their id
+        protein_index = {}
+        gene_index = {}
+        for i_result, result in enumerate(results):
+            for i_node, node in enumerate(self.get_result_nodes(result)):
+                if self.node_has_type(node,"Target"):
+                    if node.node_attributes is not None:
+                        for i_attribute, attribute in enumerate(node.node_attributes):
+                            if attribute.name == "uniprot_id":
+                                protein_index.setdefault("UniProtKB:"+str(attribute.value),[]).append( (i_result,i_node,i_attribute) )
+                elif self.node_has_type(node,"gene"):
+                    gene_index.setdefault(node.id,[]).append( (i_result,i_node,0) )
+        return(protein_index,gene_index)
+
+
+    def merge_message2(self,final_message,message_to_merge,mapper=None):
         new_results = []
-        mapper = SynonymMapper()
         result_group_counter = 1
         if final_message.results is None: final_message.results = []
+
+        #### Look up the results to merge by protein rather than comparing every pair of results, and map each protein
+        #### to its genes just once
+        protein_index, gene_index = self.index_results_by_protein(message_to_merge.results)
+        genes_by_protein = {}
+        if mapper is None and gene_index:
+            mapper = SynonymMapper()
+
         for main_result in final_message.results:
             new_results.append(main_result)
             if main_result.result_group is None:
@@ -492,35 +568,23 @@ class RTXQuery:
               num = re.sub("G","",main_result.result_group)
               result_group_counter = int(num) + 1
             protein = None
-            for node in main_result.knowledge_graph.nodes:
-              if node.type == "protein":
+            for node in self.get_result_nodes(main_result):
+              if self.node_has_type(node,"protein"):
                 protein = node.id
             if protein is not None:
                 eprint("protein="+protein)
-                for other_result in message_to_merge.results:
-                    for node in other_result.knowledge_graph.nodes:
-
-                        #### Custom code for Indigo proteins/genes
-                        if node.type == "Target":
-                            match = mapper.prot_to_gene(protein)
-                            eprint("  "+node.id)
-                            if node.node_attributes is not None:
-                                for attribute in node.node_attributes:
-                                    if attribute.name == "uniprot_id" and protein == "UniProtKB:"+attribute.value:
-                                        new_results.append(other_result)
-                                        other_result.result_group = main_result.result_group
-                                        eprint("             "+attribute.value)
-
-                        #### Custom code for Robokop proteins/genes
-                        elif node.type == "gene":
-                            match = mapper.prot_to_gene(protein)
-                            eprint("  "+node.id)
-                            if node.id in match:
-                                new_results.append(other_result)
-                                other_result.result_group = main_result.result_group
-                                eprint("  "+node.name)
-                        else:
-                            pass
+                matches = list(protein_index.get(protein,[]))
+                if gene_index:
+                    if protein not in genes_by_protein:
+                        genes_by_protein[protein] = set(mapper.prot_to_gene(protein) or [])
+                    for gene_id in genes_by_protein[protein]:
+                        matches.extend(gene_index.get(gene_id,[]))
+
+                #### Group each matching result with the main result (once per matching node), in their original order
+                for i_result, i_node, i_attribute in sorted(matches):
+                    other_result = message_to_merge.results[i_result]
+                    new_results.append(other_result)
+                    other_result.result_group = main_result.result_group
 
         for other_result in message_to_merge.results:
             if other_result.result_group is None:
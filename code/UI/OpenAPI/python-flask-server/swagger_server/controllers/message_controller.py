@@ -11,18 +11,54 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../../Feedbac
 from RTXFeedback import RTXFeedback
 
 
-def get_message(message_id):  # noqa: E501
+def get_message(message_id, offset=None, limit=None, knowledge_graph=None):  # noqa: E501
     """Request stored messages and results from RTX
 
      # noqa: E501
 
     :param message_id: Integer identifier of the message to return
     :type message_id: int
+    :param offset: Index of the first result to return. If offset or limit is given, only that page of results is returned
+    :type offset: int
+    :param limit: Maximum number of results to return
+    :type limit: int
+    :param knowledge_graph: When paging, whether to include the knowledge graph nodes and edges (default false)
+    :type knowledge_graph: bool
 
     :rtype: Message
     """
     rtxFeedback = RTXFeedback()
-    return rtxFeedback.getMessage(message_id)
+    if offset is None and limit is None:
+        return rtxFeedback.getMessage(message_id)
+    if offset is None:
+        offset = 0
+    if limit is None:
+        limit = 100
+    return rtxFeedback.getMessagePage(message_id, offset=offset, limit=limit, includeKnowledgeGraph=bool(knowledge_graph))
+
+
+def get_message_knowledge_graph(message_id, component, offset=None, limit=None):  # noqa: E501
+    """Request one page of the nodes or edges of the knowledge graph of a stored message
+
+     # noqa: E501
+
+    :param message_id: Integer identifier of the message
+    :type message_id: int
+    :param component: Which part of the knowledge graph to return
+    :type component: str
+    :param offset: Index of the first node or edge to return
+    :type offset: int
+    :param limit: Maximum number of nodes or edges to return (default 1000)
+    :type limit: int
+
+    :rtype: List[object]
+    """
+    rtxFeedback = RTXFeedback()
+    if offset is None:
+        offset = 0
+    if limit is None:
+        limit = 1000
+    return rtxFeedback.getMessageKnowledgeGraphPage(message_id, component, offset=offset, limit=limit)
 
 
 def get_message_feedback(message_id):  # noqa: E501
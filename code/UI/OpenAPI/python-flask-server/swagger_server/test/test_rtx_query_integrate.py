@@ -0,0 +1,101 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
+import RTXQuery as rtx_query_module
+from RTXQuery import RTXQuery
+
+
+def _make_result(result_id, nodes):
+    return {"id": result_id, "result_graph": {"nodes": nodes, "edges": []}}
+
+
+#### The messages of the stub reasoners: RTX finds two proteins, Robokop finds genes (one of which codes for P12345)
+STUB_MESSAGES = {
+    "/rtx/query": {"results": [_make_result("rtx1", [{"id": "UniProtKB:P12345", "type": ["protein"]}]),
+                               _make_result("rtx2", [{"id": "UniProtKB:Q99999", "type": ["protein"]}])]},
+    "/robokop/query": {"results": [_make_result("robokop1", [{"id": "NCBIGene:1234", "type": ["gene", "named_thing"]}]),
+                                   _make_result("robokop2", [{"id": "NCBIGene:5678", "type": ["gene"]}])]},
+}
+
+
+class StubReasonerHandler(BaseHTTPRequestHandler):
+    delay_sec = {"/rtx/query": 0.3, "/robokop/query": 0.3}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.delay_sec[self.path])
+        body = json.dumps(STUB_MESSAGES[self.path]).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSynonymMapper:
+    def prot_to_gene(self, curie_id):
+        return {"UniProtKB:P12345": ["NCBIGene:1234", "HGNC.Symbol:ABC1"]}.get(curie_id, [])
+
+
+class TestRTXQueryIntegrate(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubReasonerHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:" + str(self.server.server_port)
+        self.patches = [
+            mock.patch.object(RTXQuery, 'REASONER_URLS', {"RTX": base_url + "/rtx/query", "Robokop": base_url + "/robokop/query", "Indigo": None}),
+            mock.patch.object(RTXQuery, 'REASONER_TIMEOUT_SEC', {"RTX": 5, "Robokop": 5}),
+            mock.patch.object(StubReasonerHandler, 'delay_sec', {"/rtx/query": 0.3, "/robokop/query": 0.3}),
+            mock.patch.object(rtx_query_module, 'SynonymMapper', FakeSynonymMapper),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def integrate(self):
+        query = {"options": "integrate=RTX,Robokop", "original_question": "what proteins does acetaminophen target",
+                 "restated_question": "Which proteins does acetaminophen target?"}
+        return RTXQuery().integrate(query)
+
+    def test_reasoners_are_queried_concurrently_and_merged(self):
+        start = time.time()
+        message = self.integrate()
+        elapsed = time.time() - start
+        self.assertLess(elapsed, 0.6)
+        # the Robokop gene result is grouped right after the RTX protein result it codes for
+        self.assertEqual([(result.id, result.result_group) for result in message.results],
+                         [("rtx1", "G1"), ("robokop1", "G1"), ("rtx2", "G2"), ("robokop2", "G3")])
+        self.assertEqual(message.n_results, 4)
+
+    def test_reasoner_that_times_out_is_left_out(self):
+        RTXQuery.REASONER_TIMEOUT_SEC["Robokop"] = 0.1
+        StubReasonerHandler.delay_sec["/robokop/query"] = 1
+        message = self.integrate()
+        self.assertEqual([result.id for result in message.results], ["rtx1", "rtx2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the autocomplete server.
+
+Simulates many people typing into autocomplete boxes at once: each simulated typist types a
+word one character at a time and fires a request per keystroke without waiting for the previous
+answer, just like the typeahead widget does. Reports throughput and latency percentiles.
+
+Usage:
+  python3 load_test.py --url http://localhost:4999 --typists 300
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import urllib.parse
+
+import tornado.httpclient
+
+DEFAULT_WORDS = ["acetaminophen", "ibuprofen", "malaria", "insulin", "lovastatin", "naproxen",
+                 "parkinson", "alzheimer", "cystic fibrosis", "what proteins does acetaminophen target"]
+
+
+def percentile(sorted_values, fraction):
+    if len(sorted_values) == 0:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def send_keystroke(http_client, url, endpoint, client_id, word, limit, latencies, failures):
+    query = urllib.parse.urlencode({"word": word, "limit": limit, "callback": "cb", "client": client_id})
+    start = time.monotonic()
+    try:
+        response = await http_client.fetch("%s/%s?%s" % (url, endpoint, query), raise_error=False)
+        if response.code != 200 or response.body == b"error":
+            failures.append(response.code)
+    except Exception as error:
+        failures.append(repr(error))
+    latencies.append(time.monotonic() - start)
+
+
+async def typist(http_client, url, endpoint, client_id, words, n_words, keystroke_interval, limit, latencies, failures):
+    requests = []
+    for word in random.sample(words, min(n_words, len(words))):
+        for length in range(1, len(word) + 1):
+            requests.append(asyncio.ensure_future(send_keystroke(http_client, url, endpoint, client_id, word[:length],
+                                                                 limit, latencies, failures)))
+            await asyncio.sleep(random.uniform(0.5, 1.5) * keystroke_interval)
+    await asyncio.gather(*requests)
+
+
+async def run(args):
+    words = DEFAULT_WORDS
+    if args.words is not None:
+        with open(args.words) as infile:
+            words = [line.strip() for line in infile if line.strip() != ""]
+
+    tornado.httpclient.AsyncHTTPClient.configure(None, max_clients=args.typists * 4)
+    http_client = tornado.httpclient.AsyncHTTPClient()
+    latencies = []
+    failures = []
+    start = time.monotonic()
+    await asyncio.gather(*[typist(http_client, args.url, args.endpoint, "loadtest-%d" % i, words, args.words_per_typist,
+                                  args.keystroke_interval, args.limit, latencies, failures)
+                           for i in range(args.typists)])
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    print("Typists: %d, requests: %d, failures: %d, elapsed: %.2f s" % (args.typists, len(latencies), len(failures), elapsed))
+    print("Throughput: %.1f requests/s" % (len(latencies) / elapsed))
+    for label, fraction in [("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)]:
+        print("Latency %s: %.1f ms" % (label, 1000 * percentile(latencies, fraction)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent typists against the autocomplete server")
+    parser.add_argument("--url", default="http://localhost:4999", help="base URL of the server")
+    parser.add_argument("--endpoint", default="auto", choices=["auto", "fuzzy", "autofuzzy", "nodeslike"])
+    parser.add_argument("--typists", type=int, default=200, help="number of simultaneous typists")
+    parser.add_argument("--words-per-typist", type=int, default=3)
+    parser.add_argument("--keystroke-interval", type=float, default=0.1, help="mean seconds between keystrokes")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--words", default=None, help="file with one word or phrase per line to type")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,39 @@
 import sqlite3
 import re
+import threading
 
+database_file = 'dict.db'
 conn = None
 cursor = None
 
-def load():
-    global conn
-    global cursor
-    conn = sqlite3.connect('dict.db')
-    conn.enable_load_extension(True)
+#### Each thread that does lookups gets its own sqlite handle, since sqlite connections can't be shared across threads
+thread_state = threading.local()
+
+def connect():
+    #### Open the dictionary read-only; the server never writes to it
+    connection = sqlite3.connect('file:%s?mode=ro' % database_file, uri=True)
+    connection.enable_load_extension(True)
 
     #### Comment out on Windows because I don't have it installed
-    conn.load_extension("./spellfix")
+    connection.load_extension("./spellfix")
+
+    return connection
 
-    cursor = conn.cursor()
+def get_cursor():
+    if getattr(thread_state, 'cursor', None) is None:
+        thread_state.conn = connect()
+        thread_state.cursor = thread_state.conn.cursor()
+    return thread_state.cursor
+
+def load():
+    global conn
+    global cursor
+    cursor = get_cursor()
+    conn = thread_state.conn
     return True
 
 def prefix(word,limit):
+    cursor = get_cursor()
     #cursor.execute("SELECT str FROM dict WHERE str LIKE \"%s%%\" ORDER BY rank DESC, length(str)  LIMIT %s" % (word,limit))
     #rows = cursor.fetchall()
     #rows = [ "%s" % x for x in rows]
@@ -106,6 +123,7 @@ def prefix(word,limit):
     return []
 
 def get_term_type(term):
+    cursor = get_cursor()
     try:
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         table_names = cursor.fetchall()
@@ -121,6 +139,7 @@ def get_term_type(term):
     return None, None
     
 def get_alt_table_suggs(table,word,limit):
+    cursor = get_cursor()
     try:
         cursor.execute("SELECT str FROM %s WHERE str LIKE \"%s%%\" ORDER BY length(str)" % (table,word))
         rows = cursor.fetchall()
@@ -134,6 +153,7 @@ def get_alt_table_suggs(table,word,limit):
 
 
 def fuzzy(word,limit):
+    cursor = get_cursor()
     cursor.execute("SELECT word FROM spell WHERE word MATCH \"%s\" LIMIT %s" % (word,limit))
     #cursor.execute("SELECT word FROM spell WHERE word MATCH \"%s*\" AND TOP=%s" % (word,limit))
     rows = cursor.fetchall()
@@ -141,6 +161,7 @@ def fuzzy(word,limit):
 
 
 def get_nodes_like(word,limit):
+    cursor = get_cursor()
     #### Get a list of matching node names that begin with these letters
     cursor.execute("SELECT curie,name,type FROM node WHERE name LIKE \"%s%%\" ORDER BY length(name),name LIMIT %s" % (word,limit))
     rows = cursor.fetchall()
@@ -181,12 +202,14 @@ def get_nodes_like(word,limit):
 
 
 def get_tables():
+    cursor = get_cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
     rows = cursor.fetchall()
     return rows
 
 
 def autofuzzy(word,limit):
+    cursor = get_cursor()
     cursor.execute("SELECT word FROM spell WHERE word MATCH \"%s*\" LIMIT %s" % (word,limit))                                                             
     rows = cursor.fetchall()
     return rows
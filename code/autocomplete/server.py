@@ -4,6 +4,9 @@ import os
 #import sqlite3
 import json
 import sys
+import asyncio
+import collections
+import concurrent.futures
 import rtxcomplete
 import traceback
 
@@ -19,95 +22,105 @@ rtxcomplete.load()
 #conn.load_extension("./spellfix")
 #cursor = conn.cursor()
 
-class autoSearch(tornado.web.RequestHandler):
+#### Number of threads doing sqlite lookups. Each thread opens its own read-only handle on dict.db
+MAX_WORKERS = 8
+
+#### Prefixes up to this many characters are answered from memory after the first lookup
+PREFIX_CACHE_MAX_LENGTH = 3
+PREFIX_CACHE_SIZE = 10000
+
+
+class LookupScheduler:
+    """Run rtxcomplete lookups on a bounded thread pool so a slow query never blocks the IOLoop.
+
+    Only the newest request per client and lookup type is worth answering: when a new keystroke
+    arrives, the previous request from that client is cancelled if it has not started yet.
+    All methods are called on the IOLoop thread, so no locking is needed for the bookkeeping.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, cache_max_prefix_length=PREFIX_CACHE_MAX_LENGTH, cache_size=PREFIX_CACHE_SIZE):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, initializer=rtxcomplete.get_cursor)
+        self.cache_max_prefix_length = cache_max_prefix_length
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+
+    async def lookup(self, client, function_name, word, limit):
+        """Return the result of rtxcomplete.<function_name>(word, limit), or None if the request was superseded."""
+        cache_key = None
+        if len(word.strip()) <= self.cache_max_prefix_length:
+            cache_key = (function_name, word, str(limit))
+            if cache_key in self.cache:
+                self.cache.move_to_end(cache_key)
+                return self.cache[cache_key]
+
+        pending_key = (client, function_name)
+        previous = self.pending.get(pending_key)
+        if previous is not None:
+            previous.cancel()
+
+        future = self.executor.submit(getattr(rtxcomplete, function_name), word, limit)
+        self.pending[pending_key] = future
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            return None
+        finally:
+            if self.pending.get(pending_key) is future:
+                del self.pending[pending_key]
 
-    def get(self, arg,word=None):
-        #print "match auto"
+        if cache_key is not None:
+            self.cache[cache_key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+
+scheduler = LookupScheduler()
+
+
+class LookupHandler(tornado.web.RequestHandler):
+    """Common jsonp handling for the lookup endpoints; subclasses just name the rtxcomplete function"""
+    function_name = None
+
+    def get_client(self):
+        #### Clients may identify themselves explicitly (e.g., one id per input box), otherwise fall back to the connection
+        client = self.get_argument("client", None)
+        if client is None:
+            client = self.request.remote_ip + " " + self.request.headers.get("User-Agent", "")
+        return client
+
+    async def get(self, arg, word=None):
         try:
             limit = self.get_argument("limit")
             word = self.get_argument("word")
             callback = self.get_argument("callback") #jsonp
 
-            result = rtxcomplete.prefix(word,limit)
+            result = await scheduler.lookup(self.get_client(), self.function_name, word, limit)
+
+            #### A newer keystroke from the same client replaced this request, so answer with nothing
+            if result is None:
+                result = []
 
             result = callback+"("+json.dumps(result)+");" #jsonp
-            #result = json.dumps(result) #typeahead
-            
             self.write(result)
-            
-        except:
-            print(sys.exc_info()[:])
-            traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[2]
-            self.write("error")
 
-class fuzzySearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #print "matched fuzzy"
-        try:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            #print word
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "\" LIMIT " + limit)
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "*\" LIMIT " + limit)
-            result = rtxcomplete.fuzzy(word,limit);
-            #rows = cursor.fetchall()
-            #print type(rows)
-            result = callback+"("+json.dumps(result)+");"
-            #print arg, result
-            #if (len(rows) > 0):
-            self.write(result)
-            #else:
-            #self.write(callback+"("+json.dumps([["NO SUGGESTIONS"]])+");")
-            #self.write(json.dumps(rows))
         except:
             print(sys.exc_info()[:])
             traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[:]
             self.write("error")
 
-class autofuzzySearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #print "matched autofuzzy"
-        try:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            #print word
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "\" LIMIT " + limit)
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "*\" LIMIT " + limit)
-            result = rtxcomplete.autofuzzy(word,limit);
-            #rows = cursor.fetchall()
-            #print type(rows)
-            result = callback+"("+json.dumps(result)+");"
-            #print arg, result
-            #if (len(rows) > 0):
-            self.write(result)
-            #else:
-            #self.write(callback+"("+json.dumps([["NO SUGGESTIONS"]])+");")
-            #self.write(json.dumps(rows))
-        except:
-            print(sys.exc_info()[:])
-            traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[:]
-            self.write("error")
+class autoSearch(LookupHandler):
+    function_name = "prefix"
 
+class fuzzySearch(LookupHandler):
+    function_name = "fuzzy"
 
-class nodesLikeSearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #try:
-        if 1 == 1:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            result = rtxcomplete.get_nodes_like(word,limit);
-            result = callback+"("+json.dumps(result)+");"
-            self.write(result)
-        #except:
-        #    print(sys.exc_info()[:])
-        #    traceback.print_tb(sys.exc_info()[-1])
-        #    self.write("error")
+class autofuzzySearch(LookupHandler):
+    function_name = "autofuzzy"
+
+class nodesLikeSearch(LookupHandler):
+    function_name = "get_nodes_like"
 
 
 class defineSearch(tornado.web.RequestHandler):
@@ -15,8 +15,10 @@ __status__ = 'Prototype'
 
 
 import argparse
+import itertools
 import kg2_util
 import pymysql
+import pymysql.cursors
 
 CHEMBL_CURIE_BASE_COMPOUND = 'CHEMBL.COMPOUND'
 CHEMBL_CURIE_BASE_TARGET = 'CHEMBL.TARGET'
@@ -27,6 +29,7 @@ CHEMBL_BASE_IRI_TARGET = 'https://www.ebi.ac.uk/chembl/target_report_card/'
 CHEMBL_BASE_IRI_PREDICATE = 'https://www.ebi.ac.uk/chembl#'
 
 ROW_LIMIT_TEST_MODE = 10000
+SQL_ROW_LIMIT_TEST_MODE = ' limit ' + str(ROW_LIMIT_TEST_MODE)
 
 TARGET_TYPE_TO_CATEGORY = {
     'CELL-LINE': 'cell type',
@@ -96,32 +99,47 @@ def make_node(id: str,
                                    update_date,
                                    CHEMBL_KB_IRI)
     node_dict['description'] = description
-    node_dict['synonym'] = synonyms
+    node_dict['synonym'] = synonym
     node_dict['publications'] = publications
     return node_dict
 
 
-if __name__ == '__main__':
-    args = get_args()
-    mysql_config_file = args.mysqlConfigFile
-    mysql_db_name = args.mysqlDBName
-    output_file_name = args.outputFile
-    test_mode = args.test
-    connection = pymysql.connect(read_default_file=mysql_config_file, db=mysql_db_name)
-
-    nodes = []
-    edges = []
+def stream_query(connection, sql: str):
+    '''Yields the result rows of `sql` one at a time; for MySQL, uses an unbuffered
+    (server-side) cursor so that the result set is never held in memory as a whole.
+    Any other DB-API connection (e.g., a sqlite3 test fixture) uses its default cursor.'''
+    if isinstance(connection, pymysql.connections.Connection):
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+    else:
+        cursor = connection.cursor()
+    try:
+        cursor.execute(sql)
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
 
-    str_sql_row_limit_test_mode = ' limit ' + str(ROW_LIMIT_TEST_MODE)
 
+def get_update_date(connection):
     sql = "select DATE_FORMAT(creation_date, '%Y-%m-%d') from version"
-    with connection.cursor() as cursor:
+    cursor = connection.cursor()
+    try:
         cursor.execute(sql)
-        update_date = cursor.fetchone()[0]
-
-# create node objects for ChEMBL compounds
-
-    sql = '''select distinct
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def get_compound_nodes(molecule_connection,
+                       synonym_connection,
+                       update_date: str,
+                       test_mode: bool = False):
+    '''Yields a node for each ChEMBL molecule, with the synonyms and publications from its
+    compound records.  Rather than issuing one synonyms query per molecule, the molecules and
+    the compound records are each streamed once, ordered by molregno, and merge-joined here;
+    the two streams need separate connections because an unbuffered MySQL result set must be
+    read to completion before another query can be run on the same connection.'''
+    sql_molecules = '''select distinct
        molecule_dictionary.chembl_id,
        molecule_dictionary.pref_name,
        molecule_dictionary.molecule_type,
@@ -134,12 +152,26 @@ if __name__ == '__main__':
        molecule_dictionary.molregno
        from (molecule_dictionary
        left join compound_structures on molecule_dictionary.molregno = compound_structures.molregno)
-       left join compound_properties on molecule_dictionary.molregno = compound_properties.molregno'''
+       left join compound_properties on molecule_dictionary.molregno = compound_properties.molregno
+       order by molecule_dictionary.molregno'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        molecule_sql_results = cursor.fetchall()
+        sql_molecules += SQL_ROW_LIMIT_TEST_MODE
+
+    # query to get all synonyms and publications associated with the ChEMBL molecules
+
+    sql_synonyms_tables = '''(compound_records natural join source)
+                      left join docs on compound_records.doc_id = docs.doc_id'''
+    if test_mode:
+        sql_synonyms_tables = '(select molregno from molecule_dictionary order by molregno' + \
+                              SQL_ROW_LIMIT_TEST_MODE + ') as test_molecules natural join ' + \
+                              sql_synonyms_tables
+    sql_synonyms = '''select distinct molregno, compound_name, src_short_name, src_compound_id, pubmed_id
+                      from ''' + sql_synonyms_tables + '''
+                      order by molregno'''
+    synonym_groups = itertools.groupby(stream_query(synonym_connection, sql_synonyms),
+                                       key=lambda row: row[0])
+    synonym_molregno, synonym_rows = next(synonym_groups, (None, ()))
+
     row_ctr = 0
     for (chembl_id,
          pref_name,
@@ -150,7 +182,7 @@ if __name__ == '__main__':
          standard_inchi_key,
          canonical_smiles,
          full_mwt,
-         molregno) in molecule_sql_results:
+         molregno) in stream_query(molecule_connection, sql_molecules):
         row_ctr += 1
         if row_ctr % 100000 == 0:
             print("have processed " + str(row_ctr) + " compounds")
@@ -162,34 +194,32 @@ if __name__ == '__main__':
         if canonical_smiles is not None:
             synonyms.append(canonical_smiles)
 
-        curie_id = 'CHEMBL.COMPOUND:' + chembl_id
         category_label = 'chemical_substance'
 
-        # query to get all synonyms and publications associated with the ChEMBL molecule
-
-        sql_synonyms = '''select distinct compound_name, src_short_name, src_compound_id, pubmed_id 
-                          from (compound_records natural join source) 
-                          left join docs on compound_records.doc_id = docs.doc_id 
-                          where molregno ='''
+        # advance the compound-records stream to this molecule's group (if it has one)
+        while synonym_molregno is not None and synonym_molregno < molregno:
+            synonym_molregno, synonym_rows = next(synonym_groups, (None, ()))
+        if synonym_molregno == molregno:
+            synonym_results = list(synonym_rows)
+            synonym_molregno, synonym_rows = next(synonym_groups, (None, ()))
+        else:
+            synonym_results = ()
 
-        sql_synonyms += str(molregno)
         publications = []
         publications_set = set()
-        with connection.cursor() as cursor:
-            cursor.execute(sql_synonyms)
-            synonym_results = cursor.fetchall()
-            synonym_set = set()
-            for (compound_name,
-                 src_short_name,
-                 src_compound_id,
-                 pubmed_id) in synonym_results:
-                if pref_name is None and compound_name is not None:
-                    pref_name = compound_name
-                synonym_set.add(compound_name)
-                if pubmed_id is not None:
-                    publications_set.add('PMID:' + str(pubmed_id))
-                if src_compound_id is not None and src_short_name is not None and src_short_name != "LITERATURE":
-                    synonym_set.add(src_short_name + ':' + src_compound_id)
+        synonym_set = set()
+        for (_,
+             compound_name,
+             src_short_name,
+             src_compound_id,
+             pubmed_id) in synonym_results:
+            if pref_name is None and compound_name is not None:
+                pref_name = compound_name
+            synonym_set.add(compound_name)
+            if pubmed_id is not None:
+                publications_set.add('PMID:' + str(pubmed_id))
+            if src_compound_id is not None and src_short_name is not None and src_short_name != "LITERATURE":
+                synonym_set.add(src_short_name + ':' + src_compound_id)
         compound_synonyms = list(synonym_set)
         publications += list(publications_set)
         synonyms += compound_synonyms
@@ -203,15 +233,38 @@ if __name__ == '__main__':
             description += '; MAX_FDA_APPROVAL_PHASE: ' + str(max_phase_int)
         id = CHEMBL_CURIE_BASE_COMPOUND + ':' + chembl_id
         iri = CHEMBL_BASE_IRI_COMPOUND + '/' + chembl_id
-        node_dict = make_node(id,
-                              iri,
-                              pref_name,
-                              category_label,
-                              description,
-                              synonyms,
-                              publications,
-                              update_date)
-        nodes.append(node_dict)
+        yield make_node(id,
+                        iri,
+                        pref_name,
+                        category_label,
+                        description,
+                        synonyms,
+                        publications,
+                        update_date)
+
+    # finish reading the compound-records stream so that its cursor is released
+    for _ in synonym_groups:
+        pass
+
+
+if __name__ == '__main__':
+    args = get_args()
+    mysql_config_file = args.mysqlConfigFile
+    mysql_db_name = args.mysqlDBName
+    output_file_name = args.outputFile
+    test_mode = args.test
+    connection = pymysql.connect(read_default_file=mysql_config_file, db=mysql_db_name)
+    synonym_connection = pymysql.connect(read_default_file=mysql_config_file, db=mysql_db_name)
+
+    update_date = get_update_date(connection)
+
+    kg_writer = kg2_util.KGWriter(output_file_name, test_mode)
+
+# create node objects for ChEMBL compounds
+
+    for node_dict in get_compound_nodes(connection, synonym_connection, update_date, test_mode):
+        kg_writer.write_node(node_dict)
+    synonym_connection.close()
 
 # create node objects for ChEMBL targets
 
@@ -222,10 +275,8 @@ if __name__ == '__main__':
              target_type.target_type from
              target_dictionary natural join target_type'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (chembl_id,
          tax_id,
          pref_name,
@@ -244,19 +295,17 @@ if __name__ == '__main__':
                               pref_name,
                               category_label,
                               description,
-                              synonyms,
+                              [],
                               [],
                               update_date)
-        nodes.append(node_dict)
+        kg_writer.write_node(node_dict)
 
 # create node objects for "mechanism_of_action" types
 
     sql = 'select distinct mechanism_of_action from drug_mechanism'
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (mechanism_of_action,) in results:
         if mechanism_of_action is not None:
             node_label = mechanism_of_action.lower().replace(' ', '_')
@@ -270,14 +319,12 @@ if __name__ == '__main__':
                                   [],
                                   [],
                                   update_date)
-            nodes.append(node_dict)
+            kg_writer.write_node(node_dict)
 
 # get action_type nodes and their subclass_of relationships
 
     sql = 'select action_type, description, parent_type from action_type'
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+    results = stream_query(connection, sql)
     for (action_type, description, parent_type) in results:
         name = action_type.lower()
         predicate_label = name.replace(' ', '_')
@@ -291,13 +338,13 @@ if __name__ == '__main__':
                               [],
                               [],
                               update_date)
-        nodes.append(node_dict)
+        kg_writer.write_node(node_dict)
         parent_label = parent_type.lower().replace(' ', '_')
         parent_curie_id = 'CHEMBL:' + parent_label
-        edges.append(make_edge(curie_id,
-                               parent_curie_id,
-                               'subclass_of',
-                               update_date))
+        kg_writer.write_edge(make_edge(curie_id,
+                                       parent_curie_id,
+                                       'subclass_of',
+                                       update_date))
 
 # get target-to-target subset_of relationships
 
@@ -310,20 +357,18 @@ if __name__ == '__main__':
              target_relations on t1.tid = target_relations.tid) inner join
              target_dictionary as t2 on t2.tid = target_relations.related_tid'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (t1_chembl_id,
          relationship,
          t2_chembl_id) in results:
         subject_curie_id = 'CHEMBL.TARGET:' + t1_chembl_id
         object_curie_id = 'CHEMBL.TARGET:' + t2_chembl_id
         predicate_label = relationship.lower().replace(' ', '_')
-        edges.append(make_edge(subject_curie_id,
-                               object_curie_id,
-                               predicate_label,
-                               update_date))
+        kg_writer.write_edge(make_edge(subject_curie_id,
+                                       object_curie_id,
+                                       predicate_label,
+                                       update_date))
 
 # get ChEMBL target-to-protein and target-to-RNA relationships
 
@@ -340,10 +385,8 @@ if __name__ == '__main__':
              left join component_sequences on target_components.component_id = component_sequences.component_id
              where component_sequences.accession is not NULL'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (chembl_id,
          homologue,
          component_type,
@@ -356,10 +399,10 @@ if __name__ == '__main__':
         elif component_type == 'RNA':
             object_curie_id = kg2_util.CURIE_PREFIX_ENSEMBL + ':' + accession
         predicate_label = 'has_sequence'
-        edges.append(make_edge(subject_curie_id,
-                               object_curie_id,
-                               predicate_label,
-                               update_date))
+        kg_writer.write_edge(make_edge(subject_curie_id,
+                                       object_curie_id,
+                                       predicate_label,
+                                       update_date))
 
 # get drug-to-target edges and additional information about drugs (direct_interaction, has_role, etc.)
 
@@ -376,10 +419,8 @@ if __name__ == '__main__':
              natural join action_type
              left join mechanism_refs on drug_mechanism.mec_id = mechanism_refs.mec_id)'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (molec_chembl_id,
          mechanism_of_action,
          direct_interaction,
@@ -393,23 +434,23 @@ if __name__ == '__main__':
             publications = [ref_url]
         else:
             publications = None
-        edges.append(make_edge(subject_curie_id,
-                               object_curie_id,
-                               predicate_label,
-                               update_date,
-                               publications))
+        kg_writer.write_edge(make_edge(subject_curie_id,
+                                       object_curie_id,
+                                       predicate_label,
+                                       update_date,
+                                       publications))
         if direct_interaction is not None and direct_interaction == 1:
-            edges.append(make_edge(subject_curie_id,
-                                   object_curie_id,
-                                   'directly_interacts_with',
-                                   update_date))
+            kg_writer.write_edge(make_edge(subject_curie_id,
+                                           object_curie_id,
+                                           'directly_interacts_with',
+                                           update_date))
         if mechanism_of_action is not None:
             mech_label = mechanism_of_action.lower().replace(' ', '_')
             mech_curie_id = CHEMBL_CURIE_BASE_MECHANISM + ':' + mech_label
-            edges.append(make_edge(subject_curie_id,
-                                   mech_curie_id,
-                                   'has_role',
-                                   update_date))
+            kg_writer.write_edge(make_edge(subject_curie_id,
+                                           mech_curie_id,
+                                           'has_role',
+                                           update_date))
 
 # get molecule-to-disease indications
 
@@ -417,19 +458,16 @@ if __name__ == '__main__':
              from molecule_dictionary as md 
              inner join drug_indication as di on md.molregno = di.molregno'''
     if test_mode:
-        sql += str_sql_row_limit_test_mode
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        results = cursor.fetchall()
+        sql += SQL_ROW_LIMIT_TEST_MODE
+    results = stream_query(connection, sql)
     for (chembl_id, mesh_id) in results:
         subject_curie_id = CHEMBL_CURIE_BASE_COMPOUND + ':' + chembl_id
         object_curie_id = 'MESH:' + mesh_id
         predicate_label = 'has_indication'
-        edges.append(make_edge(subject_curie_id,
-                               object_curie_id,
-                               predicate_label,
-                               update_date,
-                               []))
-    kg2_util.save_json({'nodes': nodes, 'edges': edges},
-                       output_file_name,
-                       test_mode)
+        kg_writer.write_edge(make_edge(subject_curie_id,
+                                       object_curie_id,
+                                       predicate_label,
+                                       update_date,
+                                       []))
+    kg_writer.close()
+    connection.close()
@@ -2,6 +2,8 @@
 '''Filters the RTX "KG2" second-generation knowledge graph, simplifying predicates and removing redundant edges.
 
    Usage: filter_kg.py <predicate-remap.yaml> <kg-input.json> <kg-output.json>
+
+   Input and output files may be JSON or streamed JSON-lines (.jsonl, .jsonl.gz); see kg2_util.KGWriter
 '''
 
 __author__ = 'Stephen Ramsey'
@@ -56,7 +58,7 @@ if __name__ == '__main__':
         drop_self_edges_except = set(drop_self_edges_except.split(','))
     predicate_remap_config = kg2_util.safe_load_yaml_from_string(kg2_util.read_file_to_string(predicate_remap_file_name))
     curies_to_uri_map = kg2_util.make_curies_to_uri_map(curies_to_uri_lal_file_name)
-    graph = kg2_util.load_json(input_file_name)
+    kg_writer = kg2_util.KGWriter(output_file_name, test_mode)
     edge_keys = set()
     new_edges = dict()
     relation_curies_not_in_config = set()
@@ -67,12 +69,22 @@ if __name__ == '__main__':
         assert len(command) == 1
         assert next(iter(command.keys())) in command_set
     relation_curies_not_in_nodes = set()
-    nodes_dict = {node['id']: node for node in graph['nodes']}
+    # nodes pass through unchanged; only their IRIs are needed for the edges, which
+    # read_kg_elements yields after all the nodes, in the same pass over the file (a
+    # node without an IRI is left out, so its relation curie gets an IRI as if it had no node)
+    node_iris = dict()
     edge_ctr = 0
-    for edge_dict in graph['edges']:
+    for key, element in kg2_util.read_kg_elements(input_file_name):
+        if key == 'nodes':
+            node_iri = element.get('iri')
+            if node_iri is not None:
+                node_iris[element['id']] = node_iri
+            kg_writer.write_node(element)
+            continue
+        edge_dict = element
         edge_ctr += 1
         if edge_ctr % 1000000 == 0:
-            print('processing edge ' + str(edge_ctr) + ' out of ' + str(len(graph['edges'])))
+            print('processing edge ' + str(edge_ctr))
         if drop_negated and edge_dict['negated']:
             continue
         edge_label = edge_dict['edge label']
@@ -120,8 +132,8 @@ if __name__ == '__main__':
            simplified_edge_label not in drop_self_edges_except:
             continue  # see issue 743
         edge_dict['simplified relation curie'] = simplified_relation_curie
-        if simplified_relation_curie in nodes_dict:
-            simplified_relation = nodes_dict[simplified_relation_curie]['iri']
+        if simplified_relation_curie in node_iris:
+            simplified_relation = node_iris[simplified_relation_curie]
         else:
             simplified_relation_curie_prefix = simplified_relation_curie.split(':')[0]
             simplified_relation_uri_prefix = prefixcommons.expand_uri(simplified_relation_curie_prefix + ':', curies_to_uri_map)
@@ -142,8 +154,8 @@ if __name__ == '__main__':
             existing_edge['publications info'].update(edge_dict['publications info'])
         else:
             new_edges[edge_key] = edge_dict
-    del graph['edges']
-    graph['edges'] = [edge_dict for edge_dict in new_edges.values()]
+    for edge_dict in new_edges.values():
+        kg_writer.write_edge(edge_dict)
     for relation_curie_not_in_config in relation_curies_not_in_config:
         print('relation curie is missing from the YAML config file: ' + relation_curie_not_in_config, file=sys.stderr)
     for relation_curie in record_of_relation_curie_occurrences:
@@ -151,4 +163,4 @@ if __name__ == '__main__':
             print('relation curie is in the config file but was not detected in the graph: ' + relation_curie, file=sys.stderr)
     for relation_curie in relation_curies_not_in_nodes:
         print('could not get IRI for relation curie: ' + relation_curie)
-    kg2_util.save_json(graph, output_file_name, test_mode)
+    kg_writer.close()
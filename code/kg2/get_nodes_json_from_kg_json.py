@@ -16,10 +16,7 @@ __email__ = ''
 __status__ = 'Prototype'
 
 import argparse
-import gzip
-import json
 import kg2_util
-import tempfile
 
 
 def make_arg_parser():
@@ -33,14 +30,8 @@ def make_arg_parser():
 if __name__ == "__main__":
     args = make_arg_parser().parse_args()
     test_mode = args.test
-    temp_file_name = tempfile.mkstemp(prefix="kg2-")[1]
     input_file_name = args.inputFile
-    if not input_file_name.endswith('.gz'):
-        input_file = open(input_file_name, 'r')
-        graph = json.load(input_file)
-    else:
-        input_file = gzip.GzipFile(input_file_name, 'r')
-        graph = json.loads(input_file.read().decode('utf-8'))
-    del graph['edges']
     output_file_name = args.outputFile
-    kg2_util.save_json(graph, output_file_name, test_mode)
+    with kg2_util.KGWriter(output_file_name, test_mode, keys=('nodes',)) as kg_writer:
+        for node in kg2_util.read_kg_nodes(input_file_name):
+            kg_writer.write_node(node)
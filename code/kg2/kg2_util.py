@@ -18,6 +18,7 @@ import copy
 import gzip
 import html.parser
 import io
+import itertools
 import json
 import os
 import pathlib
@@ -87,6 +88,331 @@ def save_json(data, output_file_name: str, test_mode: bool = False):
     shutil.move(temp_output_file_name, output_file_name)
 
 
+def is_jsonl_file_name(file_name: str) -> bool:
+    if file_name.endswith('.gz'):
+        file_name = file_name[:-len('.gz')]
+    return file_name.endswith('.jsonl')
+
+
+def open_text_file(file_name: str, mode: str = 'r'):
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, mode + 't', encoding='utf-8')
+    return open(file_name, mode, encoding='utf-8')
+
+
+class JSONStreamReader:
+    """Parse a JSON document incrementally from a text file, one value at a time.
+
+    Only the current value and a read-ahead chunk are held in memory.  When a
+    value does not fit in the buffer, the buffer is doubled, so that a large
+    value is parsed in amortized linear time.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        chunk = self.input_file.read(max(self.CHUNK_SIZE, len(self.buffer) - self.pos))
+        if chunk == '':
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self._read_more()
+
+    def next_char(self) -> str:
+        """Consume and return the next non-whitespace character ('' at the end of the file)"""
+        self._skip_whitespace()
+        if self.pos >= len(self.buffer):
+            return ''
+        char = self.buffer[self.pos]
+        self.pos += 1
+        return char
+
+    def peek_char(self) -> str:
+        self._skip_whitespace()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else ''
+
+    def expect(self, expected_chars: str) -> str:
+        char = self.next_char()
+        if char == '' or char not in expected_chars:
+            raise ValueError('expected one of ' + repr(expected_chars) + ' but found ' + repr(char) +
+                             ' in JSON file ' + str(getattr(self.input_file, 'name', '')))
+        return char
+
+    def value(self):
+        """Parse and return the next complete JSON value"""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._read_more()
+                continue
+            # a number that ends the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self._read_more()
+                continue
+            self.pos = end
+            return value
+
+    def object_array_elements(self):
+        """Yield (key, element) for each element of each array value of the top-level
+        JSON object, in file order; values that are not arrays are skipped"""
+        self.expect('{')
+        if self.peek_char() == '}':
+            self.next_char()
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if self.peek_char() == '[':
+                self.next_char()
+                if self.peek_char() == ']':
+                    self.next_char()
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.expect(',]') == ']':
+                            break
+            else:
+                self.value()
+            if self.expect(',}') == '}':
+                return
+
+
+def read_kg_elements_in_file_order(input_file_name: str):
+    """Yield (key, element) pairs for every element of every top-level key of a
+    KG2 graph file, in a single streaming pass in file order.
+
+    A JSON-lines file (name ending in .jsonl or .jsonl.gz, as written by
+    KGWriter) has one {key: element} object per line; a plain JSON document
+    (as written by KGWriter or save_json) is parsed incrementally.  Either way,
+    the elements of each key are contiguous in the file.
+    """
+    with open_text_file(input_file_name) as input_file:
+        if is_jsonl_file_name(input_file_name):
+            for line in input_file:
+                for key, element in json.loads(line).items():
+                    yield key, element
+        else:
+            yield from JSONStreamReader(input_file).object_array_elements()
+
+
+def read_kg_elements(input_file_name: str,
+                     keys: typing.Iterable[str] = ('nodes', 'edges')):
+    """Yield (key, element) pairs for every element of the listed top-level
+    keys of a KG2 graph: all elements of the first key, then the second, and so on.
+
+    The file is read once, in bounded memory.  Elements of a key that come
+    before those of an earlier listed key (e.g., the edges of a graph saved
+    in test mode, whose keys are sorted) are spooled to a temporary file and
+    yielded when their turn comes.  A JSON document is read only until all
+    the listed keys have been read.  A ValueError is raised if the elements
+    of a key of a JSON-lines file are not contiguous.
+    """
+    keys = list(keys)
+    key_indices = {key: key_index for key_index, key in enumerate(keys)}
+    spool_files = dict()
+    keys_done = set()
+    current_key_index = 0
+
+    def finish_key(key):
+        # mark a key's (contiguous) block as done, and yield the spooled elements of the keys whose turn comes
+        nonlocal current_key_index
+        keys_done.add(key)
+        while current_key_index < len(keys) and keys[current_key_index] in keys_done:
+            current_key_index += 1
+            if current_key_index < len(keys):
+                spool_file = spool_files.pop(keys[current_key_index], None)
+                if spool_file is not None:
+                    spool_file.seek(0)
+                    for line in spool_file:
+                        yield keys[current_key_index], json.loads(line)
+                    spool_file.close()
+
+    try:
+        previous_key = None
+        for key, element in read_kg_elements_in_file_order(input_file_name):
+            if key != previous_key:
+                if previous_key is not None and previous_key in key_indices:
+                    yield from finish_key(previous_key)
+                    # the keys of a JSON object are unique, but a JSON-lines file is scanned to its
+                    # end to check that the elements of each key are contiguous (see KGWriter)
+                    if current_key_index == len(keys) and not is_jsonl_file_name(input_file_name):
+                        return
+                if key in keys_done:
+                    raise ValueError('elements of key ' + key + ' are not contiguous in file ' + input_file_name)
+                previous_key = key
+            key_index = key_indices.get(key, None)
+            if key_index is None:
+                continue
+            if key_index == current_key_index:
+                yield key, element
+            else:
+                spool_file = spool_files.get(key, None)
+                if spool_file is None:
+                    spool_file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+                    spool_files[key] = spool_file
+                spool_file.write(json.dumps(element) + '\n')
+        for key in keys:
+            if key not in keys_done:
+                yield from finish_key(key)
+    finally:
+        for spool_file in spool_files.values():
+            spool_file.close()
+
+
+def read_kg_elements_unordered(input_file_name: str,
+                               keys: typing.Iterable[str] = ('nodes', 'edges'),
+                               shard_index: int = 0,
+                               num_shards: int = 1):
+    """Yield (key, element) pairs like read_kg_elements, but in file order rather
+    than key by key, so that no element has to be spooled.
+
+    With num_shards > 1, only one of num_shards interleaved shards of the
+    elements is yielded: for a JSON-lines file, the lines whose line number
+    modulo num_shards is shard_index (the other lines are not even parsed); for
+    a JSON document, every num_shards-th element of each key, starting from
+    the shard_index-th one.  Separate processes can thus each handle one shard
+    of the same file.
+    """
+    keys = set(keys)
+    if is_jsonl_file_name(input_file_name):
+        with open_text_file(input_file_name) as input_file:
+            for line_number, line in enumerate(input_file):
+                if line_number % num_shards != shard_index:
+                    continue
+                for key, element in json.loads(line).items():
+                    if key in keys:
+                        yield key, element
+    else:
+        element_counts = dict()
+        for key, element in read_kg_elements_in_file_order(input_file_name):
+            element_count = element_counts.get(key, 0)
+            element_counts[key] = element_count + 1
+            if key in keys and element_count % num_shards == shard_index:
+                yield key, element
+
+
+def read_kg_nodes(input_file_name: str):
+    for key, node in read_kg_elements(input_file_name, ('nodes',)):
+        yield node
+
+
+def read_kg_edges(input_file_name: str):
+    for key, edge in read_kg_elements(input_file_name, ('edges',)):
+        yield edge
+
+
+class KGWriter:
+    """Write a KG2 graph one element at a time, without holding it in memory.
+
+    If the output file name ends in .jsonl or .jsonl.gz, each element is
+    written as a {key: element} line.  Otherwise the output is a single JSON
+    document, byte-for-byte what save_json would write for a dict with the
+    given keys in the given order.  Either way, the elements of each key are
+    spooled to a temporary file and stitched together on close(), so that
+    they are contiguous in the output and can be read back in a single pass.
+
+    Usage:
+        with kg2_util.KGWriter(output_file_name, test_mode) as kg_writer:
+            kg_writer.write_node(node)
+            kg_writer.write_edge(edge)
+    """
+
+    def __init__(self, output_file_name: str,
+                 test_mode: bool = False,
+                 keys: typing.Iterable[str] = ('nodes', 'edges')):
+        self.output_file_name = output_file_name
+        self.test_mode = test_mode
+        self.keys = list(keys)
+        self.jsonl = is_jsonl_file_name(output_file_name)
+        self.counts = {key: 0 for key in self.keys}
+        # the temporary file gets a .gz suffix too, so that open_text_file compresses it
+        self.temp_suffix = '.gz' if output_file_name.endswith('.gz') else ''
+        self.spool_files = {key: tempfile.TemporaryFile(mode='w+', encoding='utf-8') for key in self.keys}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, key: str, element):
+        if key not in self.counts:
+            raise ValueError('KGWriter was not set up for key: ' + key)
+        spool_file = self.spool_files[key]
+        if self.jsonl:
+            spool_file.write(json.dumps({key: element}, sort_keys=self.test_mode) + '\n')
+        else:
+            if self.test_mode:
+                # match json.dump(..., indent=4, sort_keys=True): elements sit two levels deep
+                element_str = json.dumps(element, indent=4, sort_keys=True).replace('\n', '\n        ')
+                spool_file.write((',\n        ' if self.counts[key] > 0 else '\n        ') + element_str)
+            else:
+                spool_file.write((', ' if self.counts[key] > 0 else '') + json.dumps(element))
+        self.counts[key] += 1
+
+    def write_node(self, node: dict):
+        self.write('nodes', node)
+
+    def write_edge(self, edge: dict):
+        self.write('edges', edge)
+
+    def close(self):
+        temp_output_file_name = tempfile.mkstemp(prefix=TEMP_FILE_PREFIX + '-', suffix=self.temp_suffix)[1]
+        keys = sorted(self.keys) if self.test_mode else self.keys
+        if self.jsonl:
+            with open_text_file(temp_output_file_name, 'w') as output_file:
+                for key in keys:
+                    spool_file = self.spool_files[key]
+                    spool_file.seek(0)
+                    shutil.copyfileobj(spool_file, output_file)
+                    spool_file.close()
+            shutil.move(temp_output_file_name, self.output_file_name)
+            return
+        with open_text_file(temp_output_file_name, 'w') as output_file:
+            output_file.write('{')
+            for key_ctr, key in enumerate(keys):
+                if self.test_mode:
+                    output_file.write((',' if key_ctr > 0 else '') + '\n    ' + json.dumps(key) + ': [')
+                else:
+                    output_file.write((', ' if key_ctr > 0 else '') + json.dumps(key) + ': [')
+                spool_file = self.spool_files[key]
+                spool_file.seek(0)
+                shutil.copyfileobj(spool_file, output_file)
+                spool_file.close()
+                if self.test_mode and self.counts[key] > 0:
+                    output_file.write('\n    ')
+                output_file.write(']')
+            if self.test_mode and len(keys) > 0:
+                output_file.write('\n')
+            output_file.write('}')
+        shutil.move(temp_output_file_name, self.output_file_name)
+
+    def abort(self):
+        for spool_file in self.spool_files.values():
+            spool_file.close()
+
+
 def get_file_last_modified_timestamp(file_name: str):
     return time.gmtime(os.path.getmtime(file_name))
 
@@ -142,8 +468,11 @@ def log_message(message: str,
     print(ont_str + message + node_str, file=output_stream)
 
 
-def merge_two_dicts(x: dict, y: dict):
-    ret_dict = copy.deepcopy(x)
+def merge_two_dicts(x: dict, y: dict, copy_values: bool = True):
+    '''Merges y into a copy of x, using field-aware rules for conflicting values; with
+       copy_values=False the copy of x is shallow, so the returned dict shares unchanged
+       values with x and y (neither input is modified in either case)'''
+    ret_dict = copy.deepcopy(x) if copy_values else dict(x)
     for key, value in y.items():
         stored_value = ret_dict.get(key, None)
         if stored_value is None:
@@ -198,7 +527,7 @@ def merge_two_dicts(x: dict, y: dict):
                 elif type(value) == str and type(stored_value) == list:
                     ret_dict[key] = list(set([value] + stored_value))
                 elif type(value) == dict and type(stored_value) == dict:
-                    ret_dict[key] = merge_two_dicts(value, stored_value)
+                    ret_dict[key] = merge_two_dicts(value, stored_value, copy_values)
                 elif key == 'deprecated' and type(value) == bool:
                     ret_dict[key] = True  # special case for deprecation; True always trumps False for this property
                 else:
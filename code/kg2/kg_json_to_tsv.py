@@ -9,6 +9,8 @@ import json
 import csv as tsv
 import datetime
 import argparse
+import itertools
+import kg2_util
 import sys
 
 __author__ = 'Erica Wood'
@@ -98,17 +100,21 @@ def truncate_node_synonyms_if_too_large(node_synonym_field, node_id):
         return node_synonym_field
 
 
-def nodes(graph, output_file_location):
+def nodes(graph_nodes, output_file_location):
     """
-    :param graph: A dictionary containing KG2
+    :param graph_nodes: An iterable of the KG2 node dictionaries, e.g.,
+                        streamed by kg2_util.read_kg_nodes
     :param output_file_location: A string containing the
                                 path to the TSV output directory
     """
     # Generate list of output file names for the nodes TSV files
     nodes_file = output_files(output_file_location, "nodes")
 
-    # Create dictionary of nodes from KG2
-    nodes = graph["nodes"]
+    # Peek at the first node without consuming the stream of nodes
+    nodes = iter(graph_nodes)
+    first_node = next(nodes, None)
+    if first_node is not None:
+        nodes = itertools.chain([first_node], nodes)
 
     # Open output TSV files
     tsvfile = open(nodes_file[0], 'w+')
@@ -123,14 +129,11 @@ def nodes(graph, output_file_location):
     tsvwrite_h = tsv.writer(tsvfile_h, delimiter="\t",
                             quoting=tsv.QUOTE_MINIMAL)
 
-    # Set single loop to zero and get list of node properties, which will go
+    # Get list of node properties of the first node, which will go
     # in the header, to compare other nodes to
-    single_loop = 0
-    for node in nodes:
-        single_loop += 1
-        if single_loop == 1:
-            nodekeys_official = list(sorted(node.keys()))
-            nodekeys_official.append("category label")
+    if first_node is not None:
+        nodekeys_official = list(sorted(first_node.keys()))
+        nodekeys_official.append("category label")
 
     for node in nodes:
         # Inrease node counter by one each loop
@@ -204,17 +207,17 @@ def limit_publication_info_size(key, pub_inf_dict):
     return pub_inf_dict
 
 
-def edges(graph, output_file_location):
+def edges(graph_edges, output_file_location):
     """
-    :param graph: A dictionary containing KG2
+    :param graph_edges: An iterable of the KG2 edge dictionaries, e.g.,
+                        streamed by kg2_util.read_kg_edges
     :param output_file_location: A string containing the path to the
                                 TSV output directory
     """
     # Generate list of output file names for the edges TSV files
     edges_file = output_files(output_file_location, "edges")
 
-    # Create dictionary of edges from KG2
-    edges = graph["edges"]
+    edges = graph_edges
 
     # Open output TSV files
     tsvfile = open(edges_file[0], 'w+')
@@ -288,16 +291,16 @@ if __name__ == '__main__':
     parser.add_argument("outputFileLocation", help="Path to Directory for Output\
                         TSV Files to Go", type=str)
     arguments = parser.parse_args()
-    print("Start load: ", date())
-    with open(arguments.inputFile) as json_file:
-        graph = json.load(json_file)
-        print("End load: ", date())
-        print("Start nodes: ", date())
-        output_file_location = arguments.outputFileLocation
-        nodes(graph, output_file_location)
-        print("Finish nodes: ", date())
-        print("Start edges: ", date())
-        edges(graph, output_file_location)
-        print("Finish edges: ", date())
-        json_file.close()
-        print("Finish time: ", date())
+    # Nodes and edges are streamed in a single pass over the input: all the
+    # nodes, then all the edges
+    output_file_location = arguments.outputFileLocation
+    writers = {'nodes': nodes, 'edges': edges}
+    for key, key_elements in itertools.groupby(kg2_util.read_kg_elements(arguments.inputFile),
+                                               key=lambda key_element: key_element[0]):
+        print("Start " + key + ": ", date())
+        writers.pop(key)((element for _, element in key_elements), output_file_location)
+        print("Finish " + key + ": ", date())
+    # A graph without nodes or without edges still gets its (empty) TSV files
+    for writer in writers.values():
+        writer([], output_file_location)
+    print("Finish time: ", date())
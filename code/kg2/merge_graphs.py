@@ -3,7 +3,15 @@
 
    Usage: merge_graphs.py --kgFiles <kgFile1> ... <kgFile>
                          [--kgFileOrphanEdges <kgFileOrphanEdges>]
+                         [--numProcesses <n>] [--memoryBudgetMB <mb>]
                          <output.json>
+
+   Input and output files may be JSON or streamed JSON-lines (.jsonl, .jsonl.gz); see kg2_util.KGWriter
+
+   Nodes (keyed by ID) and edges (keyed by kg2_util.make_edge_key) are spooled to disk in
+   partitions by key hash, and the partitions are merged by a pool of worker processes; a
+   partition whose spool file exceeds the memory budget is split further before it is merged.
+   The output has the same nodes and edges, in the same order, as a sequential in-memory merge.
 '''
 
 __author__ = 'Stephen Ramsey'
@@ -16,9 +24,21 @@ __email__ = ''
 __status__ = 'Prototype'
 
 import argparse
-import kg2_util
+import heapq
 import json
+import kg2_util
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
+import zlib
+
+DEFAULT_NUM_PROCESSES = os.cpu_count()
+DEFAULT_MEMORY_BUDGET_MB = 1024
+PARTITIONS_PER_PROCESS = 4
+SPLIT_FANOUT = 8
+MAX_SPLIT_LEVEL = 4
 
 
 def make_arg_parser():
@@ -26,69 +46,181 @@ def make_arg_parser():
     arg_parser.add_argument('--test', dest='test', action="store_true", default=False)
     arg_parser.add_argument('--kgFiles', type=str, nargs='+')
     arg_parser.add_argument('--kgFileOrphanEdges', type=str, nargs='?', default=None)
+    arg_parser.add_argument('--numProcesses', type=int, default=DEFAULT_NUM_PROCESSES)
+    arg_parser.add_argument('--memoryBudgetMB', type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                            help='largest partition spool file (in MB) that a worker merges in memory')
     arg_parser.add_argument('outputFile', type=str)
     return arg_parser
 
 
+def partition_index(key: str, num_partitions: int, level: int = 0):
+    # crc32 rather than hash(), which is salted differently in each worker process
+    return zlib.crc32(key.encode('utf-8'), level) % num_partitions
+
+
+class PartitionSpool:
+    '''Spools (sequence number, key, element) records to one JSON-lines file per partition'''
+    def __init__(self, file_name_prefix: str, num_partitions: int, level: int = 0):
+        self.level = level
+        self.file_names = [file_name_prefix + '-' + str(i) + '.jsonl' for i in range(num_partitions)]
+        self.files = [open(file_name, 'w') for file_name in self.file_names]
+
+    def add(self, seq: int, key: str, element: dict):
+        partition = partition_index(key, len(self.files), self.level)
+        self.files[partition].write(json.dumps([seq, key, element]) + '\n')
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+
+def read_records(file_name: str):
+    with open(file_name, 'r') as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def merge_partition(task: tuple):
+    '''Merges the records in one partition spool file (in sequence order) and writes the merged
+       elements, in order of first appearance, to a new file; returns the list of merged files'''
+    (kind, spool_file_name, memory_budget_bytes, level) = task
+    if os.path.getsize(spool_file_name) > memory_budget_bytes and level < MAX_SPLIT_LEVEL:
+        split_spool = PartitionSpool(spool_file_name[:-len('.jsonl')], SPLIT_FANOUT, level + 1)
+        for seq, key, element in read_records(spool_file_name):
+            split_spool.add(seq, key, element)
+        split_spool.close()
+        os.remove(spool_file_name)
+        merged_file_names = []
+        for split_file_name in split_spool.file_names:
+            merged_file_names += merge_partition((kind, split_file_name, memory_budget_bytes, level + 1))
+        return merged_file_names
+    merged = dict()
+    for seq, key, element in read_records(spool_file_name):
+        stored = merged.get(key, None)
+        if stored is None:
+            merged[key] = [seq, element]
+        elif kind == 'nodes':
+            stored[1] = kg2_util.merge_two_dicts(stored[1], element, copy_values=False)
+        # for edges, only the first occurrence of each edge key is kept
+    os.remove(spool_file_name)
+    merged_file_name = spool_file_name[:-len('.jsonl')] + '-merged.jsonl'
+    with open(merged_file_name, 'w') as merged_file:
+        for record in merged.values():
+            merged_file.write(json.dumps(record) + '\n')
+    return [merged_file_name]
+
+
+def merge_spool(kind: str,
+                spool: PartitionSpool,
+                pool,
+                memory_budget_bytes: int):
+    '''Merges all partitions of a spool and yields the merged elements in order of first appearance'''
+    tasks = [(kind, file_name, memory_budget_bytes, spool.level) for file_name in spool.file_names]
+    if pool is not None:
+        merged_file_lists = pool.map(merge_partition, tasks, chunksize=1)
+    else:
+        merged_file_lists = map(merge_partition, tasks)
+    merged_file_names = [file_name for file_names in merged_file_lists for file_name in file_names]
+    for seq, element in heapq.merge(*[read_records(file_name) for file_name in merged_file_names],
+                                    key=lambda record: record[0]):
+        yield element
+    for file_name in merged_file_names:
+        os.remove(file_name)
+
+
+def merge_graphs(kg_file_names: list,
+                 output_file_name: str,
+                 kg_file_orphan_edges: str = None,
+                 test_mode: bool = False,
+                 num_processes: int = DEFAULT_NUM_PROCESSES,
+                 memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024):
+    '''Merges the KG2 graph files into output_file_name; edges whose subject or object is not a
+       node of any of the graphs are left out, and written to kg_file_orphan_edges if it is given'''
+    num_processes = max(1, num_processes)
+    num_partitions = num_processes * PARTITIONS_PER_PROCESS
+    temp_dir_name = tempfile.mkdtemp(prefix=kg2_util.TEMP_FILE_PREFIX + '-merge-')
+    pool = multiprocessing.Pool(num_processes) if num_processes > 1 else None
+    try:
+        node_ids = set()
+        node_spool = PartitionSpool(os.path.join(temp_dir_name, 'nodes'), num_partitions)
+        node_seq = 0
+        # each input file is read once; its edges are set aside until all the node IDs are known
+        edge_file_names = []
+        for kg_file_index, kg_file_name in enumerate(kg_file_names):
+            kg2_util.log_message("reading nodes and edges from file",
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+            ctr_nodes_added = 0
+            edge_file_name = os.path.join(temp_dir_name, 'input-edges-' + str(kg_file_index) + '.jsonl')
+            with open(edge_file_name, 'w') as edge_file:
+                for key, element in kg2_util.read_kg_elements_unordered(kg_file_name):
+                    if key == 'nodes':
+                        ctr_nodes_added += 1
+                        node_id = element['id']
+                        node_ids.add(node_id)
+                        node_spool.add(node_seq, node_id, element)
+                        node_seq += 1
+                    else:
+                        edge_file.write(json.dumps(element) + '\n')
+            edge_file_names.append(edge_file_name)
+            kg2_util.log_message("number of nodes added: " + str(ctr_nodes_added),
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+        node_spool.close()
+        kg_writer = kg2_util.KGWriter(output_file_name, test_mode)
+        for node in merge_spool('nodes', node_spool, pool, memory_budget_bytes):
+            kg_writer.write_node(node)
+        orphan_edges_writer = None
+        if kg_file_orphan_edges is not None:
+            orphan_edges_writer = kg2_util.KGWriter(kg_file_orphan_edges, test_mode, keys=('edges',))
+        ctr_edges_added = 0
+        ctr_orphan_edges = 0
+        last_edges_added = 0
+        last_orphan_edges = 0
+        edge_spool = PartitionSpool(os.path.join(temp_dir_name, 'edges'), num_partitions)
+        edge_seq = 0
+        for kg_file_name, edge_file_name in zip(kg_file_names, edge_file_names):
+            kg2_util.log_message("merging edges from file",
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+            for rel_dict in read_records(edge_file_name):
+                subject_curie = rel_dict['subject']
+                object_curie = rel_dict['object']
+                if subject_curie in node_ids and object_curie in node_ids:
+                    ctr_edges_added += 1
+                    edge_spool.add(edge_seq, kg2_util.make_edge_key(rel_dict), rel_dict)
+                    edge_seq += 1
+                else:
+                    ctr_orphan_edges += 1
+                    if orphan_edges_writer is not None:
+                        orphan_edges_writer.write_edge(rel_dict)
+            kg2_util.log_message("number of edges added: " + str(ctr_edges_added - last_edges_added),
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+            last_edges_added = ctr_edges_added
+            kg2_util.log_message("number of orphan edges: " + str(ctr_orphan_edges -
+                                                                  last_orphan_edges),
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+            last_orphan_edges = ctr_orphan_edges
+            os.remove(edge_file_name)
+        edge_spool.close()
+        for rel_dict in merge_spool('edges', edge_spool, pool, memory_budget_bytes):
+            kg_writer.write_edge(rel_dict)
+        kg_writer.close()
+        if orphan_edges_writer is not None:
+            orphan_edges_writer.close()
+    finally:
+        if pool is not None:
+            pool.close()
+        shutil.rmtree(temp_dir_name, ignore_errors=True)
+
+
 if __name__ == '__main__':
     args = make_arg_parser().parse_args()
-    kg_file_names = args.kgFiles
-    test_mode = args.test
-    output_file_name = args.outputFile
-    kg_orphan_edges = {'edges': []}
-    nodes = dict()
-    rels = dict()
-    for kg_file_name in kg_file_names:
-        kg2_util.log_message("reading nodes from file",
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-        kg_to_add = json.load(open(kg_file_name, 'r'))
-        kg_to_add_nodes = kg_to_add['nodes']
-        for node in kg_to_add_nodes:
-            node_id = node['id']
-            if node_id not in nodes:
-                nodes[node_id] = node
-            else:
-                nodes[node_id] = kg2_util.merge_two_dicts(nodes[node_id], node)
-        kg2_util.log_message("number of nodes added: " + str(len(kg_to_add_nodes)),
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-    ctr_edges_added = 0
-    edges = []
-    last_edges_added = 0
-    last_orphan_edges = 0
-    edge_keys = set()
-    for kg_file_name in kg_file_names:
-        kg_orphan_edges_new = []
-        kg2_util.log_message("reading edges from file",
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-        kg_to_add = json.load(open(kg_file_name, 'r'))
-        kg_to_add_edges = kg_to_add['edges']
-        for rel_dict in kg_to_add_edges:
-            subject_curie = rel_dict['subject']
-            object_curie = rel_dict['object']
-            if subject_curie in nodes and object_curie in nodes:
-                ctr_edges_added += 1
-                edge_key = kg2_util.make_edge_key(rel_dict)
-                if edge_key not in edge_keys:
-                    edge_keys.add(edge_key)
-                    edges.append(rel_dict)
-            else:
-                kg_orphan_edges_new.append(rel_dict)
-        kg_orphan_edges['edges'] += kg_orphan_edges_new
-        kg2_util.log_message("number of edges added: " + str(ctr_edges_added - last_edges_added),
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-        last_edges_added = ctr_edges_added
-        kg2_util.log_message("number of orphan edges: " + str(len(kg_orphan_edges['edges']) -
-                                                              last_orphan_edges),
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-        last_orphan_edges = len(kg_orphan_edges['edges'])
-    kg = {'nodes': [node for node in nodes.values()],
-          'edges': edges}
-    kg2_util.save_json(kg, output_file_name, test_mode)
-    kg_file_orphan_edges = args.kgFileOrphanEdges
-    if kg_file_orphan_edges is not None:
-        kg2_util.save_json(kg_orphan_edges, kg_file_orphan_edges, test_mode)
+    merge_graphs(args.kgFiles,
+                 args.outputFile,
+                 args.kgFileOrphanEdges,
+                 args.test,
+                 args.numProcesses,
+                 args.memoryBudgetMB * 1024 * 1024)
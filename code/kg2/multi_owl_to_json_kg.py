@@ -23,6 +23,7 @@ import errno
 import functools
 import hashlib
 import kg2_util
+import multiprocessing
 import ontobio
 import os.path
 import pickle
@@ -60,6 +61,7 @@ CUI_PREFIX = 'CUI'
 ENSEMBL_LETTER_TO_CATEGORY = {'P': 'protein',
                               'G': 'gene',
                               'T': 'transcript'}
+DEFAULT_NUM_PROCESSES = os.cpu_count()
 
 
 # -------------- subroutines with side-effects go here ------------------
@@ -168,30 +170,38 @@ def load_owl_file_return_ontology_and_metadata(file_name: str,
     return [ontology, metadata_dict]
 
 
+def load_ontology_source(ont_source_info_dict: dict):
+    if ont_source_info_dict['download']:
+        # get the OWL file onto the local file system and get a full path to it
+        local_file_name = kg2_util.download_file_if_not_exist_locally(ont_source_info_dict['url'],
+                                                                      ont_source_info_dict['file'])
+    else:
+        local_file_name = ont_source_info_dict['file']
+        assert os.path.exists(ont_source_info_dict['file'])
+    # load the OWL file dadta into an ontobio.ontol.Ontology data structure and information dictionary
+    [ont, metadata_dict] = load_owl_file_return_ontology_and_metadata(local_file_name,
+                                                                      ont_source_info_dict['url'],
+                                                                      ont_source_info_dict['title'])
+    metadata_dict['ontology'] = ont
+    return metadata_dict
+
+
 def make_kg2(curies_to_categories: dict,
              uri_to_curie_shortener: callable,
              map_category_label_to_iri: callable,
              owl_urls_and_files: tuple,
              output_file_name: str,
-             test_mode: bool = False):
-
-    owl_file_information_dict_list = []
-
-    # for each OWL file (or URL for an OWL file) described in the YAML config file...
-    for ont_source_info_dict in owl_urls_and_files:
-        if ont_source_info_dict['download']:
-            # get the OWL file onto the local file system and get a full path to it
-            local_file_name = kg2_util.download_file_if_not_exist_locally(ont_source_info_dict['url'],
-                                                                          ont_source_info_dict['file'])
-        else:
-            local_file_name = ont_source_info_dict['file']
-            assert os.path.exists(ont_source_info_dict['file'])
-        # load the OWL file dadta into an ontobio.ontol.Ontology data structure and information dictionary
-        [ont, metadata_dict] = load_owl_file_return_ontology_and_metadata(local_file_name,
-                                                                          ont_source_info_dict['url'],
-                                                                          ont_source_info_dict['title'])
-        metadata_dict['ontology'] = ont
-        owl_file_information_dict_list.append(metadata_dict)
+             test_mode: bool = False,
+             num_processes: int = 1):
+
+    # for each OWL file (or URL for an OWL file) described in the YAML config file, load it
+    # in a worker process; results come back in the same order as the load inventory
+    if num_processes > 1 and len(owl_urls_and_files) > 1:
+        with multiprocessing.Pool(min(num_processes, len(owl_urls_and_files)), maxtasksperchild=1) as pool:
+            owl_file_information_dict_list = pool.map(load_ontology_source, owl_urls_and_files, chunksize=1)
+    else:
+        owl_file_information_dict_list = [load_ontology_source(ont_source_info_dict)
+                                          for ont_source_info_dict in owl_urls_and_files]
 
     kg2_util.log_message('Calling make_nodes_dict_from_ontologies_list')
 
@@ -212,20 +222,19 @@ def make_kg2(curies_to_categories: dict,
                                   uri_to_curie_shortener,
                                   map_of_node_ontology_ids_to_curie_ids)
 
-    kg2_dict = dict()
-    kg2_dict['edges'] = [rel_dict for rel_dict in all_rels_dict.values()]
-    kg2_util.log_message('Number of edges: ' + str(len(kg2_dict['edges'])))
-    kg2_dict['nodes'] = list(nodes_dict.values())
-    kg2_util.log_message('Number of nodes: ' + str(len(kg2_dict['nodes'])))
-    del nodes_dict
-
-    # delete xrefs from all_nodes_dict
-    for node_dict in kg2_dict['nodes']:
-        del node_dict['xrefs']
-        del node_dict['ontology node ids']
+    kg2_util.log_message('Number of edges: ' + str(len(all_rels_dict)))
+    kg2_util.log_message('Number of nodes: ' + str(len(nodes_dict)))
 
     kg2_util.log_message('Saving JSON file')
-    kg2_util.save_json(kg2_dict, output_file_name, test_mode)
+    with kg2_util.KGWriter(output_file_name, test_mode, keys=('edges', 'nodes')) as kg_writer:
+        for rel_dict in all_rels_dict.values():
+            kg_writer.write_edge(rel_dict)
+        del all_rels_dict
+        for node_dict in nodes_dict.values():
+            # delete xrefs from all_nodes_dict
+            del node_dict['xrefs']
+            del node_dict['ontology node ids']
+            kg_writer.write_node(node_dict)
 
 
 def get_depth_of_ontology_term(ontology_node_id: str,
@@ -256,16 +265,49 @@ def get_biolink_category_for_node(ontology_node_id: str,
                                   curies_to_categories: dict,
                                   uri_to_curie_shortener: callable,
                                   ontology_node_ids_previously_seen: set,
-                                  get_node_id_of_node_with_category: bool):
+                                  get_node_id_of_node_with_category: bool,
+                                  category_memo: dict = None):
+    # category_memo (a dict for this ontology, shared across calls) memoizes the category of each
+    # term whose hierarchy walk has been completed, so that the parents of a term are walked once
+    # per ontology rather than once per descendant term; it is only used when the node ID of the
+    # node with the category is not requested
+    if get_node_id_of_node_with_category:
+        category_memo = None
+    return walk_hierarchy_for_biolink_category(ontology_node_id,
+                                               node_curie_id,
+                                               ontology,
+                                               curies_to_categories,
+                                               uri_to_curie_shortener,
+                                               ontology_node_ids_previously_seen,
+                                               get_node_id_of_node_with_category,
+                                               category_memo)[0:2]
+
+
+def walk_hierarchy_for_biolink_category(ontology_node_id: str,
+                                        node_curie_id: str,
+                                        ontology: ontobio.ontol.Ontology,
+                                        curies_to_categories: dict,
+                                        uri_to_curie_shortener: callable,
+                                        ontology_node_ids_previously_seen: set,
+                                        get_node_id_of_node_with_category: bool,
+                                        category_memo: dict):
+    # returns [category, ontology node ID of node with category, walk completed]; the walk is not
+    # completed if it was cut short at a node already seen in this walk whose category is not yet
+    # memoized (i.e., a subClassOf cycle), in which case a walk started from one of the nodes on
+    # the cycle could come out differently, so the result is not memoized
+
+    if category_memo is not None and ontology_node_id in category_memo:
+        return [category_memo[ontology_node_id], None, True]
 
     # if we have already looked for a category for this node, return None
     if ontology_node_id in ontology_node_ids_previously_seen:
-        return [None, None]
+        return [None, None, False]
 
     if ontology_node_id == OWL_NOTHING or node_curie_id is None:
-        return [None, None]
+        return [None, None, True]
 
     ontology_node_ids_previously_seen.add(ontology_node_id)
+    walk_completed = True
 
     curie_prefix = get_prefix_from_curie_id(node_curie_id)
 
@@ -273,7 +315,7 @@ def get_biolink_category_for_node(ontology_node_id: str,
     # to use get_biolink_category_for_node to determine the specific semantic type of a CUI: based on its
     # TUI: record. Need to think about a more elegant way to do this. [SAR]
     if curie_prefix == 'TUI' and ontology.id.endswith('/umls/STY/'):
-        return ['semantic type', None]
+        return ['semantic type', None, True]
 
     if get_node_id_of_node_with_category:
         ret_ontology_node_id_of_node_with_category = ontology_node_id
@@ -293,13 +335,16 @@ def get_biolink_category_for_node(ontology_node_id: str,
                                                                                uri_to_curie_shortener)
                 try:
                     [ret_category,
-                     ontology_node_id_of_node_with_category] = get_biolink_category_for_node(parent_ontology_node_id,
-                                                                                             parent_node_curie_id,
-                                                                                             ontology,
-                                                                                             curies_to_categories,
-                                                                                             uri_to_curie_shortener,
-                                                                                             ontology_node_ids_previously_seen,
-                                                                                             get_node_id_of_node_with_category)
+                     ontology_node_id_of_node_with_category,
+                     parent_walk_completed] = walk_hierarchy_for_biolink_category(parent_ontology_node_id,
+                                                                                  parent_node_curie_id,
+                                                                                  ontology,
+                                                                                  curies_to_categories,
+                                                                                  uri_to_curie_shortener,
+                                                                                  ontology_node_ids_previously_seen,
+                                                                                  get_node_id_of_node_with_category,
+                                                                                  category_memo)
+                    walk_completed = walk_completed and parent_walk_completed
                     if get_node_id_of_node_with_category and ontology_node_id_of_node_with_category is not None:
                         ret_ontology_node_id_of_node_with_category = ontology_node_id_of_node_with_category
                 except RecursionError:
@@ -323,7 +368,10 @@ def get_biolink_category_for_node(ontology_node_id: str,
                                          node_curie_id=node_curie_id,
                                          output_stream=sys.stderr)
 
-    return [ret_category, ret_ontology_node_id_of_node_with_category]
+    if walk_completed and category_memo is not None:
+        category_memo[ontology_node_id] = ret_category
+
+    return [ret_category, ret_ontology_node_id_of_node_with_category, walk_completed]
 
 
 # --------------- subroutines that have no side effects except logging printing ----------
@@ -395,6 +443,8 @@ def make_nodes_dict_from_ontologies_list(ontology_info_list: list,
 
         ontologies_iris_to_curies[iri_of_ontology] = ontology_curie_id
 
+        category_memo = dict()
+
         for ontology_node_id in ontology.nodes():
             onto_node_dict = ontology.node(ontology_node_id)
             assert onto_node_dict is not None
@@ -436,7 +486,8 @@ def make_nodes_dict_from_ontologies_list(ontology_info_list: list,
                                                                                 ontology,
                                                                                 curies_to_categories,
                                                                                 uri_to_curie_shortener,
-                                                                                set(), False)
+                                                                                set(), False,
+                                                                                category_memo)
 
             node_deprecated = False
             node_description = None
@@ -917,6 +968,8 @@ def xref_as_a_publication(xref: str):
 def make_arg_parser():
     arg_parser = argparse.ArgumentParser(description='multi_owl_to_json_kg.py: builds the KG2 knowledge graph for the RTX system')
     arg_parser.add_argument('--test', dest='test', action="store_true", default=False)
+    arg_parser.add_argument('--numProcesses', type=int, default=DEFAULT_NUM_PROCESSES,
+                            help='number of OWL files to load in parallel')
     arg_parser.add_argument('categoriesFile', type=str)
     arg_parser.add_argument('curiesToURILALFile', type=str)
     arg_parser.add_argument('owlLoadInventoryFile', type=str)
@@ -947,4 +1000,5 @@ if __name__ == '__main__':
              map_category_label_to_iri,
              owl_urls_and_files,
              output_file,
-             test_mode)
+             test_mode,
+             args.numProcesses)
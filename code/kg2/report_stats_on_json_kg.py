@@ -2,8 +2,11 @@
 
 '''Prints a JSON overview report of a JSON knowledge graph in Biolink format, to STDOUT.
 
-   Usage: report_stats_on_json_kg.py [--useSimplifiedPredicates] <inputKGFile.json> <outputKGFile.json>
-   The input file can be optionally gzipped (specify with the .gz extension).
+   Usage: report_stats_on_json_kg.py [--useSimplifiedPredicates] [--numProcesses <n>] <inputKGFile.json> <outputKGFile.json>
+   The input file can be optionally gzipped (specify with the .gz extension).  It can also be in
+   the streamed JSON-lines format (.jsonl, .jsonl.gz; see kg2_util.KGWriter), in which case all
+   counters are computed in one pass over the file, split into interleaved shards across
+   --numProcesses worker processes.
 '''
 
 __author__ = 'Stephen Ramsey'
@@ -19,11 +22,15 @@ __status__ = 'Prototype'
 import argparse
 import collections
 import datetime
-import gzip
+import functools
 import json
+import kg2_util
+import multiprocessing
+import os
 import shutil
 import sys
 import tempfile
+import typing
 
 
 def make_arg_parser():
@@ -31,6 +38,8 @@ def make_arg_parser():
     arg_parser.add_argument('inputFile', type=str)
     arg_parser.add_argument('outputFile', type=str)
     arg_parser.add_argument('--useSimplifiedPredicates', dest='use_simplified_predicates', action='store_true', default=False)
+    arg_parser.add_argument('--numProcesses', type=int, default=os.cpu_count(),
+                            help='number of shards of a JSON-lines input file to process in parallel')
     return arg_parser
 
 
@@ -39,136 +48,128 @@ def get_prefix_from_curie_id(curie_id: str):
     return curie_id.split(':')[0]
 
 
-def get_nodes_with_none_category(nodes: list):
-    return [node for node in nodes if
-            node['category label'] is None or node['category label'] == 'unknown category']
-
-
-def count_nodes_by_curie_prefix(nodes: list):
-    return collections.Counter([get_prefix_from_curie_id(node['id']) for node in nodes])
-
-
-def count_nodes_by_curie_prefix_given_no_category(nodes: list):
-    return count_nodes_by_curie_prefix(get_nodes_with_none_category(nodes))
-
-
-def count_nodes_by_category(nodes: list):
-    return collections.Counter([node['category label'] for node in nodes])
-
-
-def count_nodes_by_source(nodes: list):
-    return collections.Counter([node['provided by'] for node in nodes])
-
-
-def count_number_of_nodes_by_source_and_category(nodes: list):
-    fulldict = {}
-    sourcedict = collections.Counter([node['provided by'] for node in nodes])
-    sourcecatdict = {}
-    categorylist = []
-    for source in sourcedict:
-        categorylist = []
-        for node in nodes:
-            if node['provided by'] == source:
-                categorylist.append(node['category label'])
-        sourcecatdict.update({source: categorylist})
-    for defintion in sourcecatdict:
-        sourcecount = collections.Counter(sourcecatdict.get(defintion))
-        fulldict.update({defintion: sourcecount})
-    return fulldict
-
-
-def count_edges_by_source(edges: list):
-    ret_data = None
-    if type(edges[0]['provided by']) == str:
-        ret_data = collections.Counter([edge['provided by'] for edge in edges])
-    else:
-        assert type(edges[0]['provided by'] == list)
-        provby_list = []
-        for edge in edges:
-            provby_list += edge['provided by']
-        ret_data = collections.Counter(provby_list)
-    return ret_data
-
-
-def count_edges_by_predicate_curie(edges: list):
-    curie_field = 'relation curie' if not args.use_simplified_predicates else 'simplified relation curie'
-    return collections.Counter([edge[curie_field] for edge in edges])
-
-
-def count_edges_by_predicate_type(edges: list):
-    label_field = 'edge label' if not args.use_simplified_predicates else 'simplified edge label'
-    return collections.Counter([edge[label_field] for edge in edges])
-
-
-def count_edges_by_predicate_curie_prefix(edges: list):
-    curie_field = 'relation curie' if not args.use_simplified_predicates else 'simplified relation curie'
-    return collections.Counter([get_prefix_from_curie_id(edge[curie_field]) for edge in edges])
-
-
-def count_predicates_by_predicate_curie_prefix(edges: list):
-    curie_field = 'relation curie' if not args.use_simplified_predicates else 'simplified relation curie'
-    unique_relation_curies = set([edge[curie_field] for edge in edges])
-    return collections.Counter([get_prefix_from_curie_id(curie) for curie in unique_relation_curies])
-
-
-def count_types_of_pairs_of_curies_for_xrefs(edges: list):
-    prefix_pairs_list = list()
-    for edge in edges:
-        if edge['edge label'] == 'xref':
-            subject_curie = edge['subject']
-            subject_prefix = get_prefix_from_curie_id(subject_curie)
-            object_curie = edge['object']
-            object_prefix = get_prefix_from_curie_id(object_curie)
-            key = subject_prefix + '---' + object_prefix
-            prefix_pairs_list.append(key)
-    return collections.Counter(prefix_pairs_list)
-
-
-def count_types_of_pairs_of_curies_for_equivs(edges: list):
-    prefix_pairs_list = list()
-    for edge in edges:
-        if edge['edge label'] == 'equivalent_to':
-            subject_curie = edge['subject']
-            subject_prefix = get_prefix_from_curie_id(subject_curie)
-            object_curie = edge['object']
-            object_prefix = get_prefix_from_curie_id(object_curie)
-            key = subject_prefix + '---' + object_prefix
-            prefix_pairs_list.append(key)
-    return collections.Counter(prefix_pairs_list)
+class KGStats:
+    '''Accumulates all of the report's counters in a single pass over nodes and edges; the
+       counters of separately-processed shards of a KG can be combined with update()'''
+    def __init__(self, use_simplified_predicates: bool = False):
+        self.curie_field = 'relation curie' if not use_simplified_predicates else 'simplified relation curie'
+        self.label_field = 'edge label' if not use_simplified_predicates else 'simplified edge label'
+        self.number_of_nodes = 0
+        self.number_of_edges = 0
+        self.nodes_by_curie_prefix = collections.Counter()
+        self.nodes_without_category_by_curie_prefix = collections.Counter()
+        self.nodes_by_category_label = collections.Counter()
+        self.nodes_by_source = collections.Counter()
+        self.nodes_by_source_and_category = collections.defaultdict(collections.Counter)
+        self.edges_by_predicate_curie = collections.Counter()
+        self.edges_by_predicate_type = collections.Counter()
+        self.edges_by_predicate_curie_prefix = collections.Counter()
+        self.edges_by_source = collections.Counter()
+        self.pairs_of_curies_for_xrefs = collections.Counter()
+        self.pairs_of_curies_for_equivs = collections.Counter()
+
+    def add_node(self, node: dict):
+        self.number_of_nodes += 1
+        curie_prefix = get_prefix_from_curie_id(node['id'])
+        category_label = node['category label']
+        provided_by = node['provided by']
+        self.nodes_by_curie_prefix[curie_prefix] += 1
+        if category_label is None or category_label == 'unknown category':
+            self.nodes_without_category_by_curie_prefix[curie_prefix] += 1
+        self.nodes_by_category_label[category_label] += 1
+        self.nodes_by_source[provided_by] += 1
+        self.nodes_by_source_and_category[provided_by][category_label] += 1
+
+    def add_edge(self, edge: dict):
+        self.number_of_edges += 1
+        relation_curie = edge[self.curie_field]
+        self.edges_by_predicate_curie[relation_curie] += 1
+        self.edges_by_predicate_type[edge[self.label_field]] += 1
+        self.edges_by_predicate_curie_prefix[get_prefix_from_curie_id(relation_curie)] += 1
+        provided_by = edge['provided by']
+        if type(provided_by) == str:
+            self.edges_by_source[provided_by] += 1
+        else:
+            assert type(provided_by) == list
+            self.edges_by_source.update(provided_by)
+        edge_label = edge['edge label']
+        if edge_label == 'xref' or edge_label == 'equivalent_to':
+            key = get_prefix_from_curie_id(edge['subject']) + '---' + get_prefix_from_curie_id(edge['object'])
+            if edge_label == 'xref':
+                self.pairs_of_curies_for_xrefs[key] += 1
+            else:
+                self.pairs_of_curies_for_equivs[key] += 1
+
+    def add_elements(self, elements: typing.Iterable[tuple]):
+        for key, element in elements:
+            if key == 'nodes':
+                self.add_node(element)
+            else:
+                self.add_edge(element)
+        return self
+
+    def update(self, other):
+        self.number_of_nodes += other.number_of_nodes
+        self.number_of_edges += other.number_of_edges
+        for attribute_name, counter in vars(other).items():
+            if isinstance(counter, collections.Counter):
+                getattr(self, attribute_name).update(counter)
+        for provided_by, counter in other.nodes_by_source_and_category.items():
+            self.nodes_by_source_and_category[provided_by].update(counter)
+        return self
+
+    def report(self, report_datetime: str):
+        # the number of distinct predicates for each curie prefix
+        predicates_by_curie_prefix = collections.Counter([get_prefix_from_curie_id(curie) for curie in
+                                                          self.edges_by_predicate_curie])
+        return {'_number_of_nodes': self.number_of_nodes,   # underscore is to make sure it sorts to the top of the report
+                '_number_of_edges': self.number_of_edges,   # underscore is to make sure it sorts to the top of the report
+                '_report_datetime': report_datetime,
+                'number_of_nodes_by_curie_prefix': dict(self.nodes_by_curie_prefix),
+                'number_of_nodes_without_category__by_curie_prefix': dict(self.nodes_without_category_by_curie_prefix),
+                'number_of_nodes_by_category_label': dict(self.nodes_by_category_label),
+                'number_of_nodes_by_source': dict(self.nodes_by_source),
+                'number_of_edges_by_predicate_curie': dict(self.edges_by_predicate_curie),
+                'number_of_edges_by_predicate_type': dict(self.edges_by_predicate_type),
+                'number_of_edges_by_predicate_curie_prefixes': dict(self.edges_by_predicate_curie_prefix),
+                'number_of_predicates_by_predicate_curie_prefixes': dict(predicates_by_curie_prefix),
+                'number_of_edges_by_source': dict(self.edges_by_source),
+                'types_of_pairs_of_curies_for_xrefs': dict(self.pairs_of_curies_for_xrefs),
+                'types_of_pairs_of_curies_for_equivs': dict(self.pairs_of_curies_for_equivs),
+                'number_of_nodes_by_source_and_category': {provided_by: dict(counter) for provided_by, counter in
+                                                           self.nodes_by_source_and_category.items()}}
+
+
+def compute_stats_for_shard(shard: tuple):
+    (input_file_name, shard_index, num_shards, use_simplified_predicates) = shard
+    elements = kg2_util.read_kg_elements_unordered(input_file_name,
+                                                   shard_index=shard_index,
+                                                   num_shards=num_shards)
+    return KGStats(use_simplified_predicates).add_elements(elements)
 
 
 if __name__ == '__main__':
     args = make_arg_parser().parse_args()
     input_file_name = args.inputFile
-    if not input_file_name.endswith('.gz'):
-        input_file = open(input_file_name, 'r')
-        graph = json.load(input_file)
+    num_processes = max(1, args.numProcesses)
+    if not kg2_util.is_jsonl_file_name(input_file_name):
+        # a JSON document has to be loaded whole, so every shard would load it again
+        num_processes = 1
+    shards = [(input_file_name, shard_index, num_processes, args.use_simplified_predicates)
+              for shard_index in range(num_processes)]
+    if num_processes > 1:
+        with multiprocessing.Pool(num_processes) as pool:
+            shard_stats = pool.map(compute_stats_for_shard, shards, chunksize=1)
     else:
-        input_file = gzip.GzipFile(input_file_name, 'r')
-        graph = json.loads(input_file.read().decode('utf-8'))
-
-    if 'nodes' not in graph:
-        print("WARNING: 'nodes' property is missing from the input JSON.", file=sys.stderr)
-    nodes = graph.get('nodes', [])
-    if 'edges' not in graph:
-        print("WARNING: 'edges' property is missing from the input JSON.", file=sys.stderr)
-    edges = graph.get('edges', [])
-
-    stats = {'_number_of_nodes': len(nodes),   # underscore is to make sure it sorts to the top of the report
-             '_number_of_edges': len(edges),   # underscore is to make sure it sorts to the top of the report
-             '_report_datetime': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-             'number_of_nodes_by_curie_prefix': dict(count_nodes_by_curie_prefix(nodes)),
-             'number_of_nodes_without_category__by_curie_prefix': dict(count_nodes_by_curie_prefix_given_no_category(nodes)),
-             'number_of_nodes_by_category_label': dict(count_nodes_by_category(nodes)),
-             'number_of_nodes_by_source': dict(count_nodes_by_source(nodes)),
-             'number_of_edges_by_predicate_curie': dict(count_edges_by_predicate_curie(edges)),
-             'number_of_edges_by_predicate_type': dict(count_edges_by_predicate_type(edges)),
-             'number_of_edges_by_predicate_curie_prefixes': dict(count_edges_by_predicate_curie_prefix(edges)),
-             'number_of_predicates_by_predicate_curie_prefixes': dict(count_predicates_by_predicate_curie_prefix(edges)),
-             'number_of_edges_by_source': dict(count_edges_by_source(edges)),
-             'types_of_pairs_of_curies_for_xrefs': dict(count_types_of_pairs_of_curies_for_xrefs(edges)),
-             'types_of_pairs_of_curies_for_equivs': dict(count_types_of_pairs_of_curies_for_equivs(edges)),
-             'number_of_nodes_by_source_and_category': dict(count_number_of_nodes_by_source_and_category(nodes))}
+        shard_stats = [compute_stats_for_shard(shard) for shard in shards]
+    kg_stats = functools.reduce(KGStats.update, shard_stats)
+
+    if kg_stats.number_of_nodes == 0:
+        print("WARNING: no 'nodes' were found in the input.", file=sys.stderr)
+    if kg_stats.number_of_edges == 0:
+        print("WARNING: no 'edges' were found in the input.", file=sys.stderr)
+
+    stats = kg_stats.report(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
     temp_output_file = tempfile.mkstemp(prefix='kg2-')[1]
     with open(temp_output_file, 'w') as outfile:
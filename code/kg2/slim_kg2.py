@@ -12,7 +12,6 @@ __maintainer__ = ''
 __email__ = ''
 __status__ = 'Prototype'
 
-import json
 import argparse
 import kg2_util
 
@@ -31,21 +30,11 @@ if __name__ == "__main__":
 
     args = make_arg_parser().parse_args()
     test_mode = args.test
-    reduced = {"nodes": [], "edges": []}
-    with open(args.inputFilepath, "r") as fp:
-        all_data = json.load(fp)
-        for node in all_data["nodes"]:
-            temp_node = {}
-            for key, val in node.items():
-                if key in node_set:
-                    temp_node[key] = val
-            reduced["nodes"].append(temp_node)
-
-        for edge in all_data["edges"]:
-            temp_edge = {}
-            for key, val in edge.items():
-                if key in edge_set:
-                    temp_edge[key] = val
-            reduced["edges"].append(temp_edge)
-
-    kg2_util.save_json(reduced, args.outputFilepath, test_mode)
+    with kg2_util.KGWriter(args.outputFilepath, test_mode) as kg_writer:
+        for key, element in kg2_util.read_kg_elements(args.inputFilepath, ('nodes', 'edges')):
+            key_set = node_set if key == 'nodes' else edge_set
+            temp_element = {}
+            for element_key, val in element.items():
+                if element_key in key_set:
+                    temp_element[element_key] = val
+            kg_writer.write(key, temp_element)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+'''Tests that the merge-joined ChEMBL compound nodes of chembl_mysql_to_kg_json.py are the same as
+   the ones built with a synonyms query per molecule, on a small sqlite fixture of the ChEMBL schema
+
+   Usage:  pytest -v test_chembl_mysql_to_kg_json.py
+'''
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import chembl_mysql_to_kg_json as chembl
+
+UPDATE_DATE = '2020-03-01'
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    connection.create_function('DATE_FORMAT', 2, lambda date, date_format: date[:10])
+    connection.executescript('''
+        create table version (creation_date text);
+        create table molecule_dictionary (molregno integer, chembl_id text, pref_name text, molecule_type text,
+                                          max_phase integer, availability_type integer);
+        create table compound_structures (molregno integer, standard_inchi text, standard_inchi_key text,
+                                          canonical_smiles text);
+        create table compound_properties (molregno integer, full_mwt real);
+        create table source (src_id integer, src_short_name text);
+        create table docs (doc_id integer, pubmed_id integer);
+        create table compound_records (record_id integer, molregno integer, doc_id integer, src_id integer,
+                                       compound_name text, src_compound_id text);
+        insert into version values ('2020-03-01 12:00:00');
+        insert into source values (1, 'LITERATURE'), (2, 'DRUGBANK'), (3, 'PUBCHEM');
+        insert into docs values (10, 123456), (11, null), (12, 654321);
+    ''')
+    # molecules are inserted out of molregno order; some have no structure, properties or compound records
+    for molregno in [5, 1, 4, 2, 3, 7, 6]:
+        connection.execute('insert into molecule_dictionary values (?, ?, ?, ?, ?, ?)',
+                           (molregno, 'CHEMBL' + str(molregno), None if molregno % 3 == 0 else 'MOLECULE ' + str(molregno),
+                            'Small molecule', molregno % 5 if molregno != 2 else None, 1))
+        if molregno != 4:
+            connection.execute('insert into compound_structures values (?, ?, ?, ?)',
+                               (molregno, 'InChI=1S/' + str(molregno), 'KEY' + str(molregno),
+                                None if molregno == 1 else 'C' * molregno))
+        if molregno != 6:
+            connection.execute('insert into compound_properties values (?, ?)', (molregno, 100.5 + molregno))
+    record_id = 0
+    for molregno, doc_id, src_id, compound_name, src_compound_id in [(3, 10, 1, 'NAME 3', None),
+                                                                     (3, 11, 2, 'NAME 3B', 'DB003'),
+                                                                     (1, 12, 3, 'NAME 1', 'CID1'),
+                                                                     (1, 10, 3, 'NAME 1', 'CID1'),
+                                                                     (6, 11, 2, None, 'DB006'),
+                                                                     (5, 12, 1, 'NAME 5', 'L5'),
+                                                                     (7, 10, 2, 'NAME 7', None),
+                                                                     (9, 10, 2, 'NO MOLECULE', 'DB009')]:
+        record_id += 1
+        connection.execute('insert into compound_records values (?, ?, ?, ?, ?, ?)',
+                           (record_id, molregno, doc_id, src_id, compound_name, src_compound_id))
+    yield connection
+    connection.close()
+
+
+def old_get_compound_nodes(connection, update_date: str, test_mode: bool = False):
+    '''The compound nodes as built before the merge join, with one synonyms query per molecule'''
+    sql = '''select distinct
+       molecule_dictionary.chembl_id,
+       molecule_dictionary.pref_name,
+       molecule_dictionary.max_phase,
+       compound_structures.standard_inchi,
+       compound_structures.standard_inchi_key,
+       compound_structures.canonical_smiles,
+       compound_properties.full_mwt,
+       molecule_dictionary.molregno
+       from (molecule_dictionary
+       left join compound_structures on molecule_dictionary.molregno = compound_structures.molregno)
+       left join compound_properties on molecule_dictionary.molregno = compound_properties.molregno
+       order by molecule_dictionary.molregno'''
+    if test_mode:
+        sql += chembl.SQL_ROW_LIMIT_TEST_MODE
+    nodes = []
+    for (chembl_id, pref_name, max_phase_int, standard_inchi, standard_inchi_key, canonical_smiles,
+         full_mwt, molregno) in connection.execute(sql).fetchall():
+        synonyms = [synonym for synonym in [standard_inchi, standard_inchi_key, canonical_smiles] if synonym is not None]
+        sql_synonyms = '''select distinct compound_name, src_short_name, src_compound_id, pubmed_id
+                          from (compound_records natural join source)
+                          left join docs on compound_records.doc_id = docs.doc_id
+                          where molregno =''' + str(molregno)
+        publications_set = set()
+        synonym_set = set()
+        for (compound_name, src_short_name, src_compound_id, pubmed_id) in connection.execute(sql_synonyms).fetchall():
+            if pref_name is None and compound_name is not None:
+                pref_name = compound_name
+            synonym_set.add(compound_name)
+            if pubmed_id is not None:
+                publications_set.add('PMID:' + str(pubmed_id))
+            if src_compound_id is not None and src_short_name is not None and src_short_name != "LITERATURE":
+                synonym_set.add(src_short_name + ':' + src_compound_id)
+        synonyms += list(synonym_set)
+        description = pref_name if pref_name is not None else ''
+        if full_mwt is not None:
+            description += '; FULL_MW:' + str(full_mwt)
+        if max_phase_int is not None:
+            description += '; MAX_FDA_APPROVAL_PHASE: ' + str(max_phase_int)
+        nodes.append(chembl.make_node(chembl.CHEMBL_CURIE_BASE_COMPOUND + ':' + chembl_id,
+                                      chembl.CHEMBL_BASE_IRI_COMPOUND + '/' + chembl_id,
+                                      pref_name,
+                                      'chemical_substance',
+                                      description,
+                                      synonyms,
+                                      list(publications_set),
+                                      update_date))
+    return nodes
+
+
+def normalize(nodes: list):
+    # the synonyms and publications from the compound records come from sets, so their order is arbitrary
+    return [dict(node, synonym=sorted(node['synonym'], key=str), publications=sorted(node['publications']))
+            for node in nodes]
+
+
+def test_update_date(connection):
+    assert chembl.get_update_date(connection) == UPDATE_DATE
+
+
+@pytest.mark.parametrize('test_mode', [False, True])
+def test_compound_nodes_match_per_molecule_queries(connection, monkeypatch, test_mode):
+    monkeypatch.setattr(chembl, 'SQL_ROW_LIMIT_TEST_MODE', ' limit 4')
+    nodes = list(chembl.get_compound_nodes(connection, connection, UPDATE_DATE, test_mode))
+    assert len(nodes) == (4 if test_mode else 7)
+    assert normalize(nodes) == normalize(old_get_compound_nodes(connection, UPDATE_DATE, test_mode))
+    nodes_by_id = {node['id']: node for node in nodes}
+    # a molecule without a preferred name is named after its first compound record
+    assert nodes_by_id['CHEMBL.COMPOUND:CHEMBL3']['name'] in ('NAME 3', 'NAME 3B')
+    assert sorted(nodes_by_id['CHEMBL.COMPOUND:CHEMBL1']['publications']) == ['PMID:123456', 'PMID:654321']
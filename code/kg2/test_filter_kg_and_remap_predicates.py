@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+'''Tests that filter_kg_and_remap_predicates.py takes the IRIs of the simplified relations from
+   the nodes of the graph, and falls back to the CURIE prefix map for nodes without an IRI
+
+   Usage:  pytest -v test_filter_kg_and_remap_predicates.py
+'''
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import kg2_util
+
+SCRIPT_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filter_kg_and_remap_predicates.py')
+PREDICATE_REMAP_YAML = '''
+RO:0002434:
+  rename:
+    - interacts_with
+    - RO:0002434
+BFO:0000050:
+  rename:
+    - part_of
+    - BFO:0000050
+RO:0002202:
+  keep:
+'''
+CURIES_TO_URLS_YAML = '''
+-
+  RO: http://purl.obolibrary.org/obo/RO_
+-
+  BFO: http://purl.obolibrary.org/obo/BFO_
+'''
+
+
+def make_edge(subject: str, relation_curie: str, edge_label: str, obj: str):
+    return {'subject': subject,
+            'object': obj,
+            'edge label': edge_label,
+            'relation': 'http://example.org/' + edge_label,
+            'relation curie': relation_curie,
+            'negated': False,
+            'publications': [],
+            'publications info': {},
+            'update date': None,
+            'provided by': 'test'}
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.jsonl'])
+def test_relation_iris_of_nodes_with_and_without_iris(tmp_path, suffix):
+    # RO:0002434 has a node with an IRI; BFO:0000050 has a node without one, and RO:0002202
+    # a node whose IRI is None
+    nodes = [{'id': 'TEST:1', 'iri': 'http://example.org/1', 'name': 'node 1'},
+             {'id': 'TEST:2', 'name': 'node 2'},
+             {'id': 'RO:0002434', 'iri': 'http://example.org/interacts_with', 'name': 'interacts with'},
+             {'id': 'BFO:0000050', 'name': 'part of'},
+             {'id': 'RO:0002202', 'iri': None, 'name': 'develops from'}]
+    edges = [make_edge('TEST:1', 'RO:0002434', 'interacts_with', 'TEST:2'),
+             make_edge('TEST:2', 'BFO:0000050', 'part_of', 'TEST:1'),
+             make_edge('TEST:2', 'RO:0002202', 'develops_from', 'TEST:1')]
+    input_file_name = str(tmp_path / ('input' + suffix))
+    output_file_name = str(tmp_path / ('output' + suffix))
+    with kg2_util.KGWriter(input_file_name, False) as kg_writer:
+        for node in nodes:
+            kg_writer.write_node(node)
+        for edge in edges:
+            kg_writer.write_edge(edge)
+    (tmp_path / 'predicate-remap.yaml').write_text(PREDICATE_REMAP_YAML)
+    (tmp_path / 'curies-to-urls.yaml').write_text(CURIES_TO_URLS_YAML)
+    subprocess.run([sys.executable, SCRIPT_FILE_NAME, str(tmp_path / 'predicate-remap.yaml'),
+                    str(tmp_path / 'curies-to-urls.yaml'), input_file_name, output_file_name], check=True)
+    assert list(kg2_util.read_kg_nodes(output_file_name)) == nodes
+    simplified_relations = {edge['simplified relation curie']: edge['simplified relation']
+                            for edge in kg2_util.read_kg_edges(output_file_name)}
+    assert simplified_relations['RO:0002434'] == 'http://example.org/interacts_with'
+    # the nodes without an IRI get one from the CURIE prefix map
+    for relation_curie, edge_label, uri_prefix in [('BFO:0000050', 'part_of', 'http://purl.obolibrary.org/obo/BFO_'),
+                                                   ('RO:0002202', 'develops_from', 'http://purl.obolibrary.org/obo/RO_')]:
+        assert simplified_relations[relation_curie] == \
+            kg2_util.predicate_label_to_iri_and_curie(edge_label, relation_curie.split(':')[0], uri_prefix)[0]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+'''Tests that the streaming KG2 graph readers and writer of kg2_util give the same graphs as
+   loading and saving the whole graph with json.load and kg2_util.save_json
+
+   Usage:  pytest -v test_kg2_util.py
+'''
+
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import kg2_util
+
+
+def make_graph(num_nodes: int = 50):
+    nodes = [{'id': 'CHEMBL.COMPOUND:CHEMBL' + str(i),
+              'name': 'compound ' + str(i) + ' é "quoted" [bracketed] {braced}',
+              'synonym': ['syn' + str(j) for j in range(i % 4)],
+              'publications': [],
+              'update date': None,
+              'deprecated': i % 7 == 0,
+              'score': i / 3} for i in range(num_nodes)]
+    edges = [{'subject': nodes[i]['id'],
+              'object': nodes[(i * 7 + 1) % num_nodes]['id'],
+              'edge label': 'interacts_with',
+              'negated': False,
+              'publications': ['PMID:' + str(i)],
+              'publications info': {'PMID:' + str(i): {'sentence': 'a, b: [c]'}},
+              'provided by': 'test'} for i in range(num_nodes * 2 // 3)]
+    return {'nodes': nodes, 'edges': edges}
+
+
+def old_read_kg_elements(input_file_name: str, keys=('nodes', 'edges')):
+    if input_file_name.endswith('.gz'):
+        graph = json.loads(gzip.open(input_file_name, 'rb').read().decode('utf-8'))
+    else:
+        graph = json.load(open(input_file_name, 'r'))
+    return [(key, element) for key in keys for element in graph.get(key, [])]
+
+
+def write_graph(graph: dict, output_file_name: str, test_mode: bool, keys=('nodes', 'edges')):
+    with kg2_util.KGWriter(output_file_name, test_mode, keys=keys) as kg_writer:
+        # interleave the keys, as the KG2 build scripts do
+        for i in range(max(len(graph[key]) for key in keys)):
+            for key in keys:
+                if i < len(graph[key]):
+                    kg_writer.write(key, graph[key][i])
+
+
+def read_bytes(file_name: str):
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rb').read()
+    return open(file_name, 'rb').read()
+
+
+@pytest.fixture(params=[kg2_util.JSONStreamReader.CHUNK_SIZE, 7])
+def chunk_size(request, monkeypatch):
+    # a tiny chunk size makes values straddle the buffer refills
+    monkeypatch.setattr(kg2_util.JSONStreamReader, 'CHUNK_SIZE', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('test_mode', [False, True])
+@pytest.mark.parametrize('suffix', ['.json', '.json.gz'])
+def test_json_writer_matches_save_json(tmp_path, test_mode, suffix):
+    graph = make_graph()
+    old_file_name = str(tmp_path / ('old' + suffix))
+    new_file_name = str(tmp_path / ('new' + suffix))
+    kg2_util.save_json(graph, old_file_name, test_mode)
+    write_graph(graph, new_file_name, test_mode)
+    assert read_bytes(new_file_name) == read_bytes(old_file_name)
+
+
+@pytest.mark.parametrize('test_mode', [False, True])
+@pytest.mark.parametrize('keys', [('nodes', 'edges'), ('edges', 'nodes')])
+def test_streaming_reader_matches_json_load(tmp_path, chunk_size, test_mode, keys):
+    graph = make_graph()
+    graph['build'] = {'version': '2.0', 'sources': [{'name': 'ChEMBL'}]}
+    file_name = str(tmp_path / 'graph.json')
+    kg2_util.save_json(graph, file_name, test_mode)
+    expected = old_read_kg_elements(file_name, keys)
+    assert list(kg2_util.read_kg_elements(file_name, keys)) == expected
+    assert list(kg2_util.read_kg_nodes(file_name)) == graph['nodes']
+    assert list(kg2_util.read_kg_edges(file_name)) == graph['edges']
+    assert sorted(map(json.dumps, kg2_util.read_kg_elements_unordered(file_name, keys))) == \
+        sorted(map(json.dumps, expected))
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.jsonl', '.jsonl.gz'])
+def test_written_graph_reads_back(tmp_path, chunk_size, suffix):
+    graph = make_graph()
+    file_name = str(tmp_path / ('graph' + suffix))
+    write_graph(graph, file_name, False)
+    assert list(kg2_util.read_kg_elements(file_name)) == \
+        [(key, element) for key in ('nodes', 'edges') for element in graph[key]]
+    shards = [list(kg2_util.read_kg_elements_unordered(file_name, shard_index=i, num_shards=3)) for i in range(3)]
+    assert sorted(json.dumps(key_element) for shard in shards for key_element in shard) == \
+        sorted(json.dumps((key, element)) for key in ('nodes', 'edges') for element in graph[key])
+
+
+def test_empty_and_missing_keys(tmp_path):
+    file_name = str(tmp_path / 'graph.json')
+    kg2_util.save_json({'nodes': [], 'edges': [{'subject': 'a', 'object': 'b'}]}, file_name)
+    assert list(kg2_util.read_kg_elements(file_name, ('nodes', 'edges', 'other'))) == [('edges', {'subject': 'a', 'object': 'b'})]
+    kg2_util.save_json({}, file_name)
+    assert list(kg2_util.read_kg_elements(file_name)) == []
+
+
+def test_graph_is_read_in_one_pass(tmp_path, monkeypatch):
+    graph = make_graph()
+    file_names = [str(tmp_path / 'graph.json'), str(tmp_path / 'graph.jsonl')]
+    kg2_util.save_json(graph, file_names[0], True)
+    write_graph(graph, file_names[1], False)
+    open_text_file = kg2_util.open_text_file
+    num_opens = {file_name: 0 for file_name in file_names}
+
+    def counting_open_text_file(file_name, mode='r'):
+        num_opens[file_name] += 1
+        return open_text_file(file_name, mode)
+
+    monkeypatch.setattr(kg2_util, 'open_text_file', counting_open_text_file)
+    for file_name in file_names:
+        assert len(list(kg2_util.read_kg_elements(file_name))) == len(graph['nodes']) + len(graph['edges'])
+        assert num_opens[file_name] == 1
+
+
+def test_non_contiguous_keys_are_rejected(tmp_path):
+    file_name = str(tmp_path / 'graph.jsonl')
+    with open(file_name, 'w') as output_file:
+        for key in ['nodes', 'edges', 'nodes']:
+            output_file.write(json.dumps({key: {'id': key}}) + '\n')
+    with pytest.raises(ValueError):
+        list(kg2_util.read_kg_elements(file_name))
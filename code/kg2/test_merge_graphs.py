@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+'''Tests that the partitioned, spooled merge of merge_graphs.py writes the same bytes as the
+   sequential in-memory merge that it replaced, on small source graphs
+
+   Usage:  pytest -v test_merge_graphs.py
+'''
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import kg2_util
+import merge_graphs
+
+
+def old_merge_graphs(kg_file_names: list, output_file_name: str, kg_file_orphan_edges: str, test_mode: bool):
+    '''The sequential in-memory merge of merge_graphs.py before it was partitioned'''
+    nodes = dict()
+    for kg_file_name in kg_file_names:
+        for node in kg2_util.read_kg_nodes(kg_file_name):
+            node_id = node['id']
+            if node_id not in nodes:
+                nodes[node_id] = node
+            else:
+                nodes[node_id] = kg2_util.merge_two_dicts(nodes[node_id], node)
+    kg_writer = kg2_util.KGWriter(output_file_name, test_mode)
+    for node in nodes.values():
+        kg_writer.write_node(node)
+    orphan_edges_writer = kg2_util.KGWriter(kg_file_orphan_edges, test_mode, keys=('edges',))
+    edge_keys = set()
+    for kg_file_name in kg_file_names:
+        for rel_dict in kg2_util.read_kg_edges(kg_file_name):
+            if rel_dict['subject'] in nodes and rel_dict['object'] in nodes:
+                edge_key = kg2_util.make_edge_key(rel_dict)
+                if edge_key not in edge_keys:
+                    edge_keys.add(edge_key)
+                    kg_writer.write_edge(rel_dict)
+            else:
+                orphan_edges_writer.write_edge(rel_dict)
+    kg_writer.close()
+    orphan_edges_writer.close()
+
+
+def make_graph(rng: random.Random, source: str, num_nodes: int = 80, num_edges: int = 150):
+    # node IDs overlap between the graphs, so that nodes and edges get merged; some edges are orphans
+    nodes = []
+    for node_index in rng.sample(range(120), num_nodes):
+        nodes.append({'id': 'TEST:' + str(node_index),
+                      'iri': 'http://example.org/' + str(node_index),
+                      'name': rng.choice(['node ', 'Node ']) + str(node_index),
+                      'full name': None,
+                      'description': rng.choice([None, 'short', 'a longer description from ' + source]),
+                      'category': rng.choice(['https://biolink.github.io/biolink-model/docs/Protein',
+                                              'https://biolink.github.io/biolink-model/docs/UnknownCategory']),
+                      'category label': rng.choice(['protein', 'unknown_category']),
+                      'synonym': rng.sample(['syn' + str(i) for i in range(6)], 3),
+                      'publications': ['PMID:' + str(rng.randrange(10))],
+                      'update date': rng.choice([None, '2019', '2020-01-01']),
+                      'provided by': source,
+                      'replaced by': None,
+                      'deprecated': False})
+    edges = []
+    for _ in range(num_edges):
+        edges.append({'subject': 'TEST:' + str(rng.randrange(130)),
+                      'object': 'TEST:' + str(rng.randrange(130)),
+                      'edge label': rng.choice(['interacts_with', 'subclass_of']),
+                      'relation curie': 'TEST:' + rng.choice(['interacts_with', 'subclass_of']),
+                      'negated': False,
+                      'publications': [],
+                      'publications info': {},
+                      'update date': None,
+                      'provided by': source})
+    return {'nodes': nodes, 'edges': edges}
+
+
+def read_bytes(file_name: str):
+    with open(file_name, 'rb') as file:
+        return file.read()
+
+
+@pytest.mark.parametrize('test_mode', [False, True])
+@pytest.mark.parametrize('suffix', ['.json', '.jsonl'])
+@pytest.mark.parametrize('num_processes,memory_budget_bytes', [(1, 1024 * 1024), (2, 1024 * 1024), (1, 4000)])
+def test_merge_is_byte_identical_to_in_memory_merge(tmp_path, test_mode, suffix, num_processes, memory_budget_bytes):
+    rng = random.Random(31)
+    kg_file_names = []
+    for source_index in range(3):
+        kg_file_name = str(tmp_path / ('source' + str(source_index) + suffix))
+        graph = make_graph(rng, 'source' + str(source_index))
+        with kg2_util.KGWriter(kg_file_name, test_mode) as kg_writer:
+            for node in graph['nodes']:
+                kg_writer.write_node(node)
+            for edge in graph['edges']:
+                kg_writer.write_edge(edge)
+        kg_file_names.append(kg_file_name)
+    old_merge_graphs(kg_file_names, str(tmp_path / ('old' + suffix)), str(tmp_path / ('old-orphans' + suffix)), test_mode)
+    # with a 4000-byte memory budget, the partition spool files are split before they are merged
+    merge_graphs.merge_graphs(kg_file_names, str(tmp_path / ('new' + suffix)), str(tmp_path / ('new-orphans' + suffix)),
+                              test_mode, num_processes, memory_budget_bytes)
+    assert read_bytes(str(tmp_path / ('new' + suffix))) == read_bytes(str(tmp_path / ('old' + suffix)))
+    assert read_bytes(str(tmp_path / ('new-orphans' + suffix))) == read_bytes(str(tmp_path / ('old-orphans' + suffix)))
+    assert len(list(kg2_util.read_kg_edges(str(tmp_path / ('new-orphans' + suffix))))) > 0
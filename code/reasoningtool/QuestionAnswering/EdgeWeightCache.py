@@ -0,0 +1,143 @@
+# This module keeps edge weights (google distance, COHD frequency, ...) that are expensive to compute, so that
+# questions about the same node pairs do not have to look them up again
+import sqlite3
+import threading
+import math
+import time
+
+
+class EdgeWeightCache:
+	"""
+	A persistent (sqlite) cache of edge weights, keyed by metric and by the pair of curie ids of the edge's nodes.
+	Each metric has a version: weights stored under an older version of a metric are ignored (and can be purged),
+	so bumping the version of a metric whose computation changed invalidates the weights cached for it.
+	A NaN weight (no data, but also what a failed lookup gives) is only kept for nan_ttl_sec, so that an outage of
+	a source does not leave NaN weights in the cache for good.
+	"""
+
+	DEFAULT_NAN_TTL_SEC = 3600
+
+	def __init__(self, db_file, metric_versions, nan_ttl_sec=DEFAULT_NAN_TTL_SEC):
+		"""
+		:param db_file: path of the sqlite database file (created if it does not exist)
+		:param metric_versions: dictionary of metric name -> current version (int)
+		:param nan_ttl_sec: how long (in seconds) a NaN weight is kept
+		"""
+		self.metric_versions = metric_versions
+		self.nan_ttl_sec = nan_ttl_sec
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(db_file, check_same_thread=False)
+		with self.connection:
+			self.connection.execute("CREATE TABLE IF NOT EXISTS edge_weight (metric TEXT, version INTEGER, context TEXT, "
+									"source TEXT, target TEXT, weight REAL, timestamp REAL, PRIMARY KEY (metric, version, context, source, target))")
+			# caches created before NaN weights expired have no timestamps: their NaN weights count as expired
+			columns = [row[1] for row in self.connection.execute("PRAGMA table_info(edge_weight)")]
+			if 'timestamp' not in columns:
+				self.connection.execute("ALTER TABLE edge_weight ADD COLUMN timestamp REAL")
+
+	@staticmethod
+	def make_key(source_id, target_id, symmetric=True):
+		"""
+		Returns the (source, target) key of an edge; for a symmetric metric the key does not depend on the direction
+		"""
+		if symmetric and target_id < source_id:
+			return target_id, source_id
+		return source_id, target_id
+
+	def get_many(self, metric, keys, context=''):
+		"""
+		Look up the weights of many edges
+		:param metric: name of the metric (eg. 'gd_weight')
+		:param keys: iterable of (source, target) keys (see make_key)
+		:param context: (optional) anything else that the weights depend on, such as the curie id of a context node
+		:return: dictionary of key -> weight for the keys that are in the cache (NaN weights are cached too, until they expire)
+		"""
+		version = self.metric_versions[metric]
+		keys = list(set(keys))
+		key_to_weight = dict()
+		nan_expiry_time = time.time() - self.nan_ttl_sec
+		with self.lock:
+			for start in range(0, len(keys), 400):  # stay under sqlite's limit on the number of query parameters
+				batch = keys[start:start + 400]
+				query = "SELECT source, target, weight, timestamp FROM edge_weight WHERE metric = ? AND version = ? AND context = ? AND (" + \
+						" OR ".join(["(source = ? AND target = ?)"] * len(batch)) + ")"
+				params = [metric, version, context] + [node_id for key in batch for node_id in key]
+				for source, target, weight, timestamp in self.connection.execute(query, params):
+					if weight is not None:
+						key_to_weight[(source, target)] = weight
+					elif timestamp is not None and timestamp >= nan_expiry_time:
+						key_to_weight[(source, target)] = math.nan  # sqlite stores NaN as NULL
+		return key_to_weight
+
+	def get(self, metric, key, context=''):
+		return self.get_many(metric, [key], context=context).get(key, None)
+
+	def set_many(self, metric, key_to_weight, context=''):
+		"""
+		Store the weights of many edges, in one transaction
+		:param metric: name of the metric
+		:param key_to_weight: dictionary of (source, target) key -> weight
+		:param context: (optional) as in get_many
+		"""
+		version = self.metric_versions[metric]
+		now = time.time()
+		rows = [(metric, version, context, key[0], key[1], None if math.isnan(weight) else weight, now)
+				for key, weight in key_to_weight.items()]
+		with self.lock:
+			with self.connection:
+				self.connection.executemany("INSERT OR REPLACE INTO edge_weight (metric, version, context, source, target, weight, timestamp) "
+											"VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+	def set(self, metric, key, weight, context=''):
+		self.set_many(metric, {key: weight}, context=context)
+
+	def purge_stale_versions(self):
+		"""
+		Delete the weights that were stored under older versions of the metrics (or for metrics no longer in use),
+		and the expired NaN weights
+		"""
+		with self.lock:
+			with self.connection:
+				self.connection.execute("DELETE FROM edge_weight WHERE weight IS NULL AND (timestamp IS NULL OR timestamp < ?)",
+										(time.time() - self.nan_ttl_sec,))
+				self.connection.execute("DELETE FROM edge_weight WHERE metric NOT IN (%s)" %
+										",".join("?" * len(self.metric_versions)), list(self.metric_versions.keys()))
+				for metric, version in self.metric_versions.items():
+					self.connection.execute("DELETE FROM edge_weight WHERE metric = ? AND version != ?", (metric, version))
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+
+def test_edge_weight_cache():
+	import tempfile
+	import os
+	db_file = os.path.join(tempfile.mkdtemp(), 'edge_weights.sqlite')
+	cache = EdgeWeightCache(db_file, {'gd_weight': 1})
+	key = EdgeWeightCache.make_key("DOID:8398", "CHEMBL.COMPOUND:CHEMBL521")
+	assert key == ("CHEMBL.COMPOUND:CHEMBL521", "DOID:8398")
+	assert cache.get('gd_weight', key) is None
+	cache.set_many('gd_weight', {key: 0.5, ("A", "B"): math.nan})
+	assert cache.get_many('gd_weight', [key, ("A", "B"), ("A", "C")]).keys() == {key, ("A", "B")}
+	assert math.isnan(cache.get('gd_weight', ("A", "B")))
+	assert cache.get('gd_weight', key, context="DOID:8398") is None
+	cache.close()
+	# NaN weights expire (the other weights do not)
+	cache = EdgeWeightCache(db_file, {'gd_weight': 1}, nan_ttl_sec=-1)
+	assert cache.get_many('gd_weight', [key, ("A", "B")]) == {key: 0.5}
+	cache.purge_stale_versions()
+	cache.close()
+	cache = EdgeWeightCache(db_file, {'gd_weight': 1})
+	assert cache.get_many('gd_weight', [key, ("A", "B")]) == {key: 0.5}
+	cache.close()
+	# bumping the version of the metric invalidates what was cached under the old version
+	cache = EdgeWeightCache(db_file, {'gd_weight': 2})
+	assert cache.get('gd_weight', key) is None
+	cache.purge_stale_versions()
+	cache.close()
+	os.remove(db_file)
+
+
+if __name__ == '__main__':
+	test_edge_weight_cache()
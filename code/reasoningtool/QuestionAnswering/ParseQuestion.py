@@ -26,6 +26,7 @@ class ParseQuestion:
 		self._query_type_id_to_question = dict()
 		for q in question_templates:
 			self._query_type_id_to_question[q.query_type_id] = q
+		self._corpus_index = wd.get_corpus_index([q.corpus for q in question_templates])
 
 	def parse_question(self, input_question):
 		"""
@@ -34,11 +35,8 @@ class ParseQuestion:
 		:return: question (Question class, or None), parameters (dict or None), error_message (string or None), error_code (string or None)
 		"""
 		input_question = input_question.replace("?", "")
-		# first, compute the wordnet distance for each corpus
-		wd_distances = []
-		for question in self._question_templates:
-			ind, val = wd.max_in_corpus(input_question, question.corpus)
-			wd_distances.append(val)
+		# first, compute the wordnet distance for each corpus (all at once, against the preprocessed corpora)
+		wd_distances = [val for ind, val in self._corpus_index.max_in_corpora(input_question)]
 
 		# Sort the indices based on wd_distance
 		indicies = range(len(self._question_templates))
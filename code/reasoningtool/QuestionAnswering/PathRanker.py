@@ -0,0 +1,147 @@
+# This module finds the top k weighted (shortest) paths between two nodes of a graph, using Yen's algorithm
+import heapq
+import itertools
+
+
+class PathRanker:
+	"""
+	Ranks the simple paths between two nodes by their total weight (smallest first). The nodes are indexed by
+	integers, and edge weights are resolved lazily: the weight function is only called (once) for an edge when the
+	search reaches it, so the edges that are far from every candidate path are never weighted.
+	"""
+
+	def __init__(self, num_nodes, neighbors, weight_function):
+		"""
+		:param num_nodes: number of nodes; the nodes are 0, ..., num_nodes - 1
+		:param neighbors: list (indexed by node) of the lists of nodes that each node has an edge to
+		:param weight_function: function (u, v) -> non-negative weight of the edge u -> v
+		"""
+		self.num_nodes = num_nodes
+		self.neighbors = neighbors
+		self.weight_function = weight_function
+		self.edge_weights = dict()
+
+	@classmethod
+	def from_networkx(cls, g, weight_function):
+		"""
+		Make a ranker for a (simple) networkx graph
+		:param g: networkx Graph or DiGraph
+		:param weight_function: function (u, v) -> weight of the edge u -> v, in terms of the networkx nodes
+		:return: tuple (ranker, list of networkx nodes indexed by integer, dictionary of networkx node -> integer)
+		"""
+		nodes = list(g.nodes())
+		node_to_index = {node: index for index, node in enumerate(nodes)}
+		neighbors = [[node_to_index[neighbor] for neighbor in g.neighbors(node)] for node in nodes]
+		ranker = cls(len(nodes), neighbors, lambda u, v: weight_function(nodes[u], nodes[v]))
+		return ranker, nodes, node_to_index
+
+	def get_edge_weight(self, u, v):
+		weight = self.edge_weights.get((u, v), None)
+		if weight is None:
+			weight = self.weight_function(u, v)
+			self.edge_weights[(u, v)] = weight
+		return weight
+
+	def get_path_weight(self, path):
+		return sum(self.get_edge_weight(u, v) for u, v in zip(path, path[1:]))
+
+	def shortest_path(self, source, target, removed_nodes=frozenset(), removed_edges=frozenset()):
+		"""
+		Dijkstra's algorithm, skipping the given nodes and edges
+		:return: tuple (weight, path as a list of nodes), or None if the target cannot be reached
+		"""
+		distances = {source: 0}
+		predecessors = dict()
+		settled = set()
+		heap = [(0, source)]
+		while heap:
+			distance, u = heapq.heappop(heap)
+			if u in settled:
+				continue
+			if u == target:
+				path = [target]
+				while path[-1] != source:
+					path.append(predecessors[path[-1]])
+				return distance, path[::-1]
+			settled.add(u)
+			for v in self.neighbors[u]:
+				if v in settled or v in removed_nodes or (u, v) in removed_edges:
+					continue
+				new_distance = distance + self.get_edge_weight(u, v)
+				if new_distance < distances.get(v, float('inf')):
+					distances[v] = new_distance
+					predecessors[v] = u
+					heapq.heappush(heap, (new_distance, v))
+		return None
+
+	def iter_shortest_paths(self, source, target):
+		"""
+		Yen's algorithm: generates the simple paths from source to target in order of increasing weight
+		:return: generator of tuples (weight, path as a list of nodes)
+		"""
+		first = self.shortest_path(source, target)
+		if first is None:
+			return
+		found_paths = [first[1]]
+		found_path_set = {tuple(first[1])}
+		yield first
+		candidates = []
+		candidate_path_set = set()
+		counter = itertools.count()  # breaks ties between candidates of the same weight in the order they were found
+		while True:
+			last_path = found_paths[-1]
+			for i in range(len(last_path) - 1):
+				spur_node = last_path[i]
+				root_path = last_path[:i + 1]
+				# remove the next edge of every found path that shares this root, and the nodes of the root itself
+				removed_edges = set()
+				for path in found_paths:
+					if len(path) > i + 1 and path[:i + 1] == root_path:
+						removed_edges.add((path[i], path[i + 1]))
+				removed_nodes = set(root_path[:-1])
+				spur = self.shortest_path(spur_node, target, removed_nodes, removed_edges)
+				if spur is None:
+					continue
+				candidate_path = root_path[:-1] + spur[1]
+				candidate_key = tuple(candidate_path)
+				if candidate_key in candidate_path_set or candidate_key in found_path_set:
+					continue
+				candidate_path_set.add(candidate_key)
+				heapq.heappush(candidates, (self.get_path_weight(candidate_path), next(counter), candidate_path))
+			if not candidates:
+				return
+			weight, _, path = heapq.heappop(candidates)
+			candidate_path_set.discard(tuple(path))
+			found_paths.append(path)
+			found_path_set.add(tuple(path))
+			yield weight, path
+
+	def top_k_paths(self, source, target, k):
+		"""
+		:return: list of the (up to) k lightest simple paths from source to target, as tuples (weight, path)
+		"""
+		return list(itertools.islice(self.iter_shortest_paths(source, target), k))
+
+
+def test_path_ranker():
+	# 0 -> 1 -> 3, 0 -> 2 -> 3, 0 -> 3 and 1 -> 2
+	neighbors = [[1, 2, 3], [3, 2], [3], [], [0]]
+	weights = {(0, 1): 1, (1, 3): 1, (0, 2): 2, (2, 3): 2, (0, 3): 3, (1, 2): 0.5, (4, 0): 1}
+	weighted_edges = []
+
+	def weight_function(u, v):
+		weighted_edges.append((u, v))
+		return weights[(u, v)]
+
+	ranker = PathRanker(5, neighbors, weight_function)
+	res = ranker.top_k_paths(0, 3, 10)
+	assert [path for weight, path in res] == [[0, 1, 3], [0, 3], [0, 1, 2, 3], [0, 2, 3]]
+	assert [weight for weight, path in res] == [2, 3, 3.5, 4]
+	# each edge is only weighted once, and the edge into the source is never weighted
+	assert len(weighted_edges) == len(set(weighted_edges))
+	assert (4, 0) not in weighted_edges
+	assert ranker.top_k_paths(3, 0, 1) == []
+
+
+if __name__ == '__main__':
+	test_path_ranker()
@@ -169,16 +169,17 @@ class Q4:
 		# Otherwise there are results to return, first sort them largest to smallest
 		disease_jaccard_tuples_sorted = [(x, y) for x, y in
 										 sorted(disease_jaccard_tuples, key=lambda pair: pair[1], reverse=True)]
+		other_disease_ID_to_description = RU.get_nodes_property([x for x, y in disease_jaccard_tuples_sorted], 'description')
 		if not use_json:
 			to_print = "The diseases with phenotypes similar to %s are: \n" % disease_description
 			for other_disease_ID, jaccard in disease_jaccard_tuples_sorted:
 				to_print += "%s\t%s\tJaccard %f\n" % (
-				other_disease_ID, RU.get_node_property(other_disease_ID, 'description'), jaccard)
+				other_disease_ID, other_disease_ID_to_description[other_disease_ID], jaccard)
 			print(to_print)
 		else:
 			for other_disease_ID, jaccard in disease_jaccard_tuples_sorted:
 				to_print = "%s is phenotypically similar to the disease %s with similarity value %f" % (
-				disease_description, RU.get_node_property(other_disease_ID, 'description'), jaccard)
+				disease_description, other_disease_ID_to_description[other_disease_ID], jaccard)
 				g = RU.get_node_as_graph(other_disease_ID)
 				response.add_subgraph(g.nodes(data=True), g.edges(data=True), to_print, jaccard)
 			response.print()
@@ -437,16 +438,17 @@ def old_answer(disease_ID, use_json=False, threshold=0.2):
 	# Otherwise there are results to return, first sort them largest to smallest
 	disease_jaccard_tuples_sorted = [(x, y) for x, y in
 									 sorted(disease_jaccard_tuples, key=lambda pair: pair[1], reverse=True)]
+	other_disease_ID_to_description = RU.get_nodes_property([x for x, y in disease_jaccard_tuples_sorted], 'description')
 	if not use_json:
 		to_print = "The diseases similar to %s are: \n" % disease_description
 		for other_disease_ID, jaccard in disease_jaccard_tuples_sorted:
 			to_print += "%s\t%s\tJaccard %f\n" % (
-			other_disease_ID, RU.get_node_property(other_disease_ID, 'description'), jaccard)
+			other_disease_ID, other_disease_ID_to_description[other_disease_ID], jaccard)
 		print(to_print)
 	else:
 		for other_disease_ID, jaccard in disease_jaccard_tuples_sorted:
 			to_print = "%s is similar to the disease %s with similarity value %f" % (
-			disease_description, RU.get_node_property(other_disease_ID, 'decription'), jaccard)
+			disease_description, other_disease_ID_to_description[other_disease_ID], jaccard)
 			g = RU.get_node_as_graph(other_disease_ID)
 			response.add_subgraph(g.nodes(data=True), g.edges(data=True), to_print, jaccard)
 		response.print()
\ No newline at end of file
@@ -18,6 +18,7 @@ import requests_cache
 from itertools import islice
 import itertools
 import functools
+import threading
 import CustomExceptions
 import pickle
 
@@ -51,6 +52,8 @@ QueryEBIOLS = QueryEBIOLS.QueryEBIOLS()
 QueryNCBIeUtils = QueryNCBIeUtils.QueryNCBIeUtils()
 
 import fisher_exact
+from EdgeWeightCache import EdgeWeightCache
+from PathRanker import PathRanker
 
 #requests_cache.install_cache('orangeboard')
 # specifiy the path of orangeboard database
@@ -59,13 +62,85 @@ RTXindex = pathlist.index("RTX")
 dbpath = os.path.sep.join([*pathlist[:(RTXindex+1)],'data','orangeboard'])
 requests_cache.install_cache(dbpath)
 
+# persistent cache of edge weights; bump the version of a metric when the way it is computed changes
+EDGE_WEIGHT_METRIC_VERSIONS = {'gd_weight': 1, 'cohd_freq': 1}
+edge_weight_cache_file = os.path.sep.join([*pathlist[:(RTXindex+1)], 'data', 'edge_weights.sqlite'])
+edge_weight_cache = None
+
+
+def get_edge_weight_cache():
+	"""
+	Opens the edge weight cache on first use
+	:return: EdgeWeightCache
+	"""
+	global edge_weight_cache
+	if edge_weight_cache is None:
+		edge_weight_cache = EdgeWeightCache(edge_weight_cache_file, EDGE_WEIGHT_METRIC_VERSIONS)
+	return edge_weight_cache
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
 from RTXConfiguration import RTXConfiguration
 rtxConfig = RTXConfiguration()
 
+
+class LazyNeo4jDriver:
+	"""
+	Stands in for the neo4j driver that is shared by the functions of this module (and by the modules that
+	import it): the driver, and with it the connection pool that every driver.session() draws from, is only
+	created the first time it is used, so that importing this module does not connect to neo4j.
+	"""
+	def __init__(self, uri, user, password):
+		self.uri = uri
+		self.user = user
+		self.password = password
+		self._driver = None
+		self._lock = threading.Lock()
+
+	def get_driver(self):
+		if self._driver is None:
+			with self._lock:
+				if self._driver is None:
+					self._driver = GraphDatabase.driver(self.uri, auth=basic_auth(self.user, self.password))
+		return self._driver
+
+	def session(self, *args, **kwargs):
+		return self.get_driver().session(*args, **kwargs)
+
+	def close(self):
+		with self._lock:
+			if self._driver is not None:
+				self._driver.close()
+				self._driver = None
+
+	def __getattr__(self, name):
+		return getattr(self.get_driver(), name)
+
+
+class LazyNeo4jSession:
+	"""
+	Stands in for the long-lived module-level session, which is likewise only opened on first use
+	"""
+	def __init__(self, lazy_driver):
+		self.lazy_driver = lazy_driver
+		self._session = None
+
+	def get_session(self):
+		if self._session is None:
+			self._session = self.lazy_driver.session()
+		return self._session
+
+	def close(self):
+		if self._session is not None:
+			self._session.close()
+			self._session = None
+
+	def __getattr__(self, name):
+		return getattr(self.get_session(), name)
+
+
 # Connection information for the neo4j server, populated with orangeboard
-driver = GraphDatabase.driver(rtxConfig.neo4j_bolt, auth=basic_auth(rtxConfig.neo4j_username, rtxConfig.neo4j_password))
-session = driver.session()
+driver = LazyNeo4jDriver(rtxConfig.neo4j_bolt, rtxConfig.neo4j_username, rtxConfig.neo4j_password)
+session = LazyNeo4jSession(driver)
 
 # Connection information for the ipython-cypher package
 connection = "http://" + rtxConfig.neo4j_username + ":" + rtxConfig.neo4j_password + "@" + rtxConfig.neo4j_database
@@ -303,6 +378,48 @@ def get_node_properties(name, node_label="", name_type="id", debug=False):
 		raise Exception("Node or properties not found using query: '%s'" % query)
 
 
+def get_nodes_properties(names, node_properties, node_label="", name_type="id", debug=False):
+	"""
+	Get properties of many nodes with a single (parameterized) query; the bulk version of get_node_property
+	:param names: names of the nodes
+	:param node_properties: list of properties you wish to get info on (such as ["name", "description"]); as in
+	get_node_property, "label" gets the kind of the node
+	:param node_label: (optional) label (kind) of the nodes (makes the operation slightly faster)
+	:param name_type: (optional) which property to search by (default: id)
+	:param debug: just return the query
+	:return: a dictionary mapping each name to a dictionary of its properties
+	"""
+	if node_label == "":
+		query = "match (n) where n.%s in $names return n.%s as name, labels(n) as labels, [p in $properties | n[p]] as values" % (name_type, name_type)
+	else:
+		query = "match (n:%s) where n.%s in $names return n.%s as name, labels(n) as labels, [p in $properties | n[p]] as values" % (node_label, name_type, name_type)
+	if debug: return query
+	names = list(set(names))
+	with driver.session() as session:
+		res = session.run(query, names=names, properties=node_properties)
+	name_to_properties = dict()
+	for record in res:
+		properties = dict(zip(node_properties, record["values"]))
+		if "label" in node_properties:
+			non_base_node_types = list(set(record["labels"]).difference({"Base"}))
+			properties["label"] = non_base_node_types.pop()  # TODO: this assumes only a single result is returned
+		name_to_properties[record["name"]] = properties
+	missing_names = [name for name in names if name not in name_to_properties]
+	if missing_names:
+		raise Exception("Nodes or properties not found for names %s using query: '%s'" % (missing_names, query))
+	return name_to_properties
+
+
+def get_nodes_property(names, node_property, node_label="", name_type="id", debug=False):
+	"""
+	Get a property of many nodes with a single query (see get_nodes_properties)
+	:return: a dictionary mapping each name to the property value
+	"""
+	if debug: return get_nodes_properties(names, [node_property], node_label=node_label, name_type=name_type, debug=debug)
+	name_to_properties = get_nodes_properties(names, [node_property], node_label=node_label, name_type=name_type)
+	return {name: properties[node_property] for name, properties in name_to_properties.items()}
+
+
 # Get node names in paths between two fixed endpoints
 def get_node_names_of_type_connected_to_target(source_label, source_name, target_label, max_path_len=4, debug=False, verbose=False, direction="u", is_omim=False):
 	"""
@@ -927,6 +1044,46 @@ def interleave_nodes_and_relationships(source_node, source_node_label, target_no
 	return res_name, res_type
 
 
+INTERLEAVE_BATCH_SIZE = 500
+
+
+def interleave_nodes_and_relationships_batch(source_target_pairs, source_node_label, target_node_label, max_path_len=3, debug=False):
+	"""
+	The batch version of interleave_nodes_and_relationships: gets the paths between many (source, target) pairs with
+	one (parameterized) Bolt query per INTERLEAVE_BATCH_SIZE pairs
+	:param source_target_pairs: list of (source_node, target_node) pairs, eg. [("OMIM:1234", "DOID:1234")]
+	:param source_node_label: kind of the source nodes (eg. disease)
+	:param target_node_label: kind of the target nodes (eg. disease)
+	:param max_path_len: maximum path length to search over
+	:param debug: if you just want the query to be returned
+	:return: dictionary of (source_node, target_node) -> (list of paths of node names, list of paths of node types),
+	as returned by interleave_nodes_and_relationships
+	"""
+	query = "unwind $pairs as pair " \
+			"match (s:%s), (t:%s) " \
+			"where s.id=pair[0] " \
+			"and t.id=pair[1] " \
+			"match p= shortestPath((s)-[*1..%d]-(t)) " \
+			"with pair, nodes(p) as ns, rels(p) as rs, range(0,length(nodes(p))+length(rels(p))-1) as idx " \
+			"return pair[0] as source, pair[1] as target, " \
+			"[i in idx | case i %% 2 = 0 when true then coalesce((ns[i/2]).id, (ns[i/2]).title) else type(rs[i/2]) end] as path_name, " \
+			"[i in idx | case i %% 2 = 0 when true then coalesce(labels(ns[i/2])[1], (ns[i/2]).title) else type(rs[i/2]) end] as path_type " \
+			"" % (source_node_label, target_node_label, max_path_len)
+	if debug:
+		return query
+	source_target_pairs = list(dict.fromkeys(tuple(pair) for pair in source_target_pairs))
+	pair_to_paths = {pair: ([], []) for pair in source_target_pairs}
+	for start in range(0, len(source_target_pairs), INTERLEAVE_BATCH_SIZE):
+		pairs = [list(pair) for pair in source_target_pairs[start:start + INTERLEAVE_BATCH_SIZE]]
+		with driver.session() as session:
+			res = session.run(query, pairs=pairs)
+		for record in res:
+			path_names, path_types = pair_to_paths[(record['source'], record['target'])]
+			path_names.append(record['path_name'])
+			path_types.append(record['path_type'])
+	return pair_to_paths
+
+
 def get_results_object_model(target_node, paths_dict, name_to_description, q1_doid_to_disease, probs=False):
 	"""
 	Returns pathway results as an object model
@@ -955,6 +1112,12 @@ def get_results_object_model(target_node, paths_dict, name_to_description, q1_do
 				source_node_names.append(name_to_description[source_node])
 			else:
 				source_node_names.append(source_node)
+		path_node_names = set()
+		for source_node in source_node_list:
+			path_names, path_types = paths_dict[source_node]
+			if len(path_names) == 1:
+				path_node_names.update(path_names[0][2:-1:2])
+		path_node_name_to_name = get_nodes_property(path_node_names, 'name') if path_node_names else dict()
 		for source_node in source_node_list:
 			source_node_dict = {}
 
@@ -973,7 +1136,7 @@ def get_results_object_model(target_node, paths_dict, name_to_description, q1_do
 					else:
 						path_list.append({'type': 'node',
 										  'name': path_names[index],
-										  'desc': get_node_property(path_names[index], 'name')})
+										  'desc': path_node_name_to_name[path_names[index]]})
 				path_list.append({'type': 'node',
 								  'name': target_node,
 								  'desc': q1_doid_to_disease.get(target_node, '')})
@@ -1007,6 +1170,49 @@ def get_results_object_model(target_node, paths_dict, name_to_description, q1_do
 	return ret_obj
 
 
+def get_google_distances(key_to_nodes, context_node_id=None, context_node_descr=None):
+	"""
+	Gets the (raw, possibly NaN) google distances between pairs of nodes, from the edge weight cache if they were computed before (NaN distances are only cached for a short while, as a failed lookup also gives NaN)
+	:param key_to_nodes: dictionary of EdgeWeightCache key -> (source_id, target_id, source_descr, target_descr)
+	:param context_node_id: (optional) curie id of a node to include in each google distance
+	:param context_node_descr: (optional) description of that node
+	:return: dictionary of key -> google distance
+	"""
+	use_context = context_node_id is not None and context_node_descr is not None
+	context = context_node_id if use_context else ''
+	cache = get_edge_weight_cache()
+	key_to_gd = cache.get_many('gd_weight', key_to_nodes.keys(), context=context)
+	new_key_to_gd = dict()
+	for key, (source_id, target_id, source_descr, target_descr) in key_to_nodes.items():
+		if key in key_to_gd:
+			continue
+		if use_context:
+			gd_temp = NormGoogleDistance.get_ngd_for_all([source_id, target_id, context_node_id], [source_descr, target_descr, context_node_descr])
+		else:
+			gd_temp = NormGoogleDistance.get_ngd_for_all([source_id, target_id], [source_descr, target_descr])
+		new_key_to_gd[key] = gd_temp
+	if new_key_to_gd:
+		cache.set_many('gd_weight', new_key_to_gd, context=context)
+		key_to_gd.update(new_key_to_gd)
+	return key_to_gd
+
+
+def google_distance_to_weight(gd_temp, default_value=10):
+	"""
+	Turns a raw google distance into an edge weight, capped at (and defaulting to) default_value
+	"""
+	gd = np.inf
+	if not np.isnan(gd_temp):
+		if gd_temp < gd:
+			gd = gd_temp
+	if not np.isinf(gd):
+		if gd > default_value:
+			gd = default_value
+		return gd
+	else:
+		return default_value  # TODO: check if this default threshold (10) is acceptable
+
+
 def weight_graph_with_google_distance(g, context_node_id=None, context_node_descr=None, default_value=10):
 	"""
 	Creates a new property on the edges called 'gd_weight' that gives the google distance between source/target between that edge
@@ -1015,29 +1221,19 @@ def weight_graph_with_google_distance(g, context_node_id=None, context_node_desc
 	"""
 	descriptions = nx.get_node_attributes(g, 'description')
 	curie_id = nx.get_node_attributes(g, 'id')
-	labels = nx.get_node_attributes(g, 'labels')
-	nodes = list(nx.nodes(g))
 	edges = list(nx.edges(g))
-	edges2gd = dict()
+	edges2key = dict()
+	key_to_nodes = dict()
 	for edge in edges:
 		source_id = curie_id[edge[0]]
 		target_id = curie_id[edge[1]]
-		source_descr = descriptions[edge[0]]
-		target_descr = descriptions[edge[1]]
-		gd = np.inf
-		if context_node_id is not None and context_node_descr is not None:
-			gd_temp = NormGoogleDistance.get_ngd_for_all([source_id, target_id, context_node_id], [source_descr, target_descr, context_node_descr])
-		else:
-			gd_temp = NormGoogleDistance.get_ngd_for_all([source_id, target_id], [source_descr, target_descr])
-		if not np.isnan(gd_temp):
-			if gd_temp < gd:
-				gd = gd_temp
-		if not np.isinf(gd):
-			if gd > default_value:
-				gd = default_value
-			edges2gd[edge] = gd
-		else:
-			edges2gd[edge] = default_value  # TODO: check if this default threshold (10) is acceptable
+		key = EdgeWeightCache.make_key(source_id, target_id)
+		edges2key[edge] = key
+		key_to_nodes[key] = (source_id, target_id, descriptions[edge[0]], descriptions[edge[1]])
+	key_to_gd = get_google_distances(key_to_nodes, context_node_id=context_node_id, context_node_descr=context_node_descr)
+	edges2gd = dict()
+	for edge in edges:
+		edges2gd[edge] = google_distance_to_weight(key_to_gd[edges2key[edge]], default_value=default_value)
 
 	# decorate the edges with these weights
 	#g2 = nx.set_edge_attributes(g, edges2gd)  # This only works if I use the keys of the multigraph, not sure I want that since I'm basing it off source/target
@@ -1129,7 +1325,8 @@ def make_graph_simple(g, directed=False):
 def get_top_shortest_paths(g, source_name, target_name, k, num_nodes=None, property='gd_weight', default_value=10, max_check=100):
 	"""
 	Returns the top k shortest paths through the graph g (which has been weighted with Google distance using
-	weight_graph_with_google_distance). This will weight the graph with google distance if it is not already.
+	weight_graph_with_google_distance). If the graph is not weighted with Google distance yet, only the edges that the
+	path search reaches are weighted (see PathRanker).
 	:param g:  Google weighted network x graph
 	:param source_name: name of the source node of interest
 	:param target_name: name of the target node of interest
@@ -1146,36 +1343,66 @@ def get_top_shortest_paths(g, source_name, target_name, k, num_nodes=None, prope
 		else:
 			weighted_flag = False
 		break
-	if weighted_flag is False:
-		if property == 'gd_weights':
-			weight_graph_with_google_distance(g)
-		else:
-			weight_graph_with_property(g, property, default_value=default_value)
+	lazy_google_distance = weighted_flag is False and property == 'gd_weight'
+	if weighted_flag is False and not lazy_google_distance:
+		weight_graph_with_property(g, property, default_value=default_value)
 	# Check if the graph is simple or not
-	if isinstance(g, nx.MultiDiGraph):
+	if lazy_google_distance:
+		# keep a single edge between each pair of nodes; its weight is resolved when it is reached (below)
+		if g.is_directed():
+			g_simple = nx.DiGraph(g)
+		else:
+			g_simple = nx.Graph(g)
+	elif isinstance(g, nx.MultiDiGraph):
 		g_simple = make_graph_simple(g, directed=True)
 	elif isinstance(g, nx.MultiGraph):
 		g_simple = make_graph_simple(g, directed=False)
 	else:
 		g_simple = g
+	if lazy_google_distance:
+		descriptions = nx.get_node_attributes(g, 'description')
+		curie_id = nx.get_node_attributes(g, 'id')
+
+		def weight_function(u, v):
+			data = g_simple[u][v]
+			if property not in data:
+				key = EdgeWeightCache.make_key(curie_id[u], curie_id[v])
+				gd_temp = get_google_distances({key: (curie_id[u], curie_id[v], descriptions[u], descriptions[v])})[key]
+				gd = google_distance_to_weight(gd_temp, default_value=default_value)
+				if g.is_multigraph():
+					# merge the parallel edges the same way make_graph_simple does, adding up the weights of differing ones
+					parallel_edges_data = [dict(edge_data, **{property: gd}) for edge_data in g[u][v].values()]
+					data.clear()
+					data.update(parallel_edges_data[0])
+					for edge_data in parallel_edges_data[1:]:
+						if data != edge_data:
+							data[property] += gd
+				else:
+					data[property] = gd
+			return data[property]
+	else:
+		def weight_function(u, v):
+			return g_simple[u][v][property]
 	# Map back and forth between nodes and names (this assume names are unique, which they are since they're neo4j keys)
 	nodes2names = nx.get_node_attributes(g_simple, 'names')
 	names2nodes = dict()
 	for node in nodes2names.keys():
 		names2nodes[nodes2names[node]] = node
+	ranker, index2nodes, nodes2index = PathRanker.from_networkx(g_simple, weight_function)
+	ranked_paths = ranker.iter_shortest_paths(nodes2index[names2nodes[source_name]], nodes2index[names2nodes[target_name]])
 	if num_nodes:
 		paths = []
 		num_tried = 0
 		num_found = 0
-		for path in nx.shortest_simple_paths(g_simple, names2nodes[source_name], names2nodes[target_name], weight=property):
+		for path_weight, path in ranked_paths:
 			if len(path) == num_nodes:
-				paths.append(path)
+				paths.append([index2nodes[node] for node in path])
 				num_found += 1
 			num_tried += 1
 			if num_found == k or num_tried > max_check:
 				break
 	else:
-		paths = list(islice(nx.shortest_simple_paths(g_simple, names2nodes[source_name], names2nodes[target_name], weight=property), k))
+		paths = [[index2nodes[node] for node in path] for path_weight, path in islice(ranked_paths, k)]
 	#g_simple_nodes = g_simple.nodes(data=True)
 	g_simple_nodes = dict()
 	for u,d in g_simple.nodes(data=True):
@@ -1271,27 +1498,35 @@ def weight_graph_with_cohd_frequency(g, default_value=0, normalized=False):
 	"""
 	descriptions = nx.get_node_attributes(g, 'description')
 	names = nx.get_node_attributes(g, 'names')
-	labels = nx.get_node_attributes(g, 'labels')
-	nodes = list(nx.nodes(g))
 	edges = list(nx.edges(g))
-	edges2freq = dict()
+	edges2key = dict()
 	for edge in edges:
-		source_id = names[edge[0]]
-		target_id = names[edge[1]]
+		edges2key[edge] = EdgeWeightCache.make_key(names[edge[0]], names[edge[1]])
+	# the frequencies of node pairs that were looked up before are in the edge weight cache (NaN if there was none,
+	# kept only for a short while since a failed lookup also gives NaN)
+	cache = get_edge_weight_cache()
+	key_to_freq = cache.get_many('cohd_freq', edges2key.values())
+	new_key_to_freq = dict()
+	for edge in edges:
+		key = edges2key[edge]
+		if key in key_to_freq or key in new_key_to_freq:
+			continue
 		source_descr = descriptions[edge[0]]
 		target_descr = descriptions[edge[1]]
 		res = cohd_pair_frequency(source_descr, target_descr)
+		freq = math.nan
 		if res:
 			if "concept_frequency" in res:
 				if isinstance(res["concept_frequency"], float):
 					freq = res["concept_frequency"]
-				else:
-					freq = default_value
-			else:
-				freq = default_value
-		else:
-			freq = default_value
-		edges2freq[edge] = freq
+		new_key_to_freq[key] = freq
+	if new_key_to_freq:
+		cache.set_many('cohd_freq', new_key_to_freq)
+		key_to_freq.update(new_key_to_freq)
+	edges2freq = dict()
+	for edge in edges:
+		freq = key_to_freq[edges2key[edge]]
+		edges2freq[edge] = freq if not math.isnan(freq) else default_value
 
 	if normalized:
 		total = float(np.sum(list(edges2freq.values())))
@@ -1729,19 +1964,28 @@ def display_results_str(doid, paths_dict, probs=False):
 		#	doid_name = q1_doid_to_disease[doid]
 		#else:
 		#	doid_name = doid
-		doid_name = get_node_property(doid, 'name')
+		# look up the names and labels of all nodes that are displayed in one query
+		displayed_node_names = {doid}
+		displayed_node_names.update(omim_list)
+		for omim in omim_list:
+			path_names, path_types = paths_dict[omim]
+			if len(path_names) == 1:
+				displayed_node_names.update(path_names[0][2:-1:2])
+				displayed_node_names.add(path_names[0][-1])
+		node_properties = get_nodes_properties(displayed_node_names, ['name', 'label'])
+		doid_name = node_properties[doid]['name']
 		omim_names = []
 		for omim in omim_list:
 			#if omim in omim_to_genetic_cond:
 			#	omim_names.append(omim_to_genetic_cond[omim])
 			#else:
 			#	omim_names.append(omim)
-			omim_name = get_node_property(omim, 'name')
+			omim_name = node_properties[omim]['name']
 			omim_names.append(omim_name)
 		ret_str = "Possible genetic conditions that protect against {doid_name}: ".format(doid_name=doid_name) + str(omim_names) + '\n'
 		for omim in omim_list:
 			#if omim in omim_to_genetic_cond:
-			to_print += "The proposed mechanism of action for %s (%s) is: " % (get_node_property(omim, 'name'), omim)
+			to_print += "The proposed mechanism of action for %s (%s) is: " % (node_properties[omim]['name'], omim)
 			#else:
 			#	to_print += "The proposed mechanism of action for %s is: " % omim
 			path_names, path_types = paths_dict[omim]
@@ -1752,18 +1996,18 @@ def display_results_str(doid, paths_dict, probs=False):
 				#	to_print += "(%s)" % (omim_to_genetic_cond[omim])
 				#else:
 				#to_print += "(%s:%s)" % (path_types[0], path_names[0])
-				to_print += "(%s:%s)" % (omim, get_node_property(omim, 'name'))
+				to_print += "(%s:%s)" % (omim, node_properties[omim]['name'])
 				for index in range(1, len(path_names) - 1):
 					if index % 2 == 1:
 						to_print += "--[%s]-->" % (path_types[index])
 					else:
 						#to_print += "(%s:%s:%s)" % (node_to_description(path_names[index]), path_names[index], path_types[index])
-						to_print += "(%s:%s:%s)" % (get_node_property(path_names[index], "name"), path_names[index], get_node_property(path_names[index], 'label'))
+						to_print += "(%s:%s:%s)" % (node_properties[path_names[index]]["name"], path_names[index], node_properties[path_names[index]]['label'])
 				#if doid in q1_doid_to_disease:
 				#	to_print += "(%s). " % q1_doid_to_disease[doid]
 				#else:
 				#to_print += "(%s:%s). " % (path_names[-1], path_types[-1])
-				to_print += "(%s:%s:%s). " % (path_names[-1], get_node_property(path_names[-1], 'name'), get_node_property(path_names[-1], 'label'))
+				to_print += "(%s:%s:%s). " % (path_names[-1], node_properties[path_names[-1]]['name'], node_properties[path_names[-1]]['label'])
 				if probs:
 					if omim in probs:
 						to_print += "Confidence: %f" % probs[omim]
@@ -1857,9 +2101,11 @@ def refine_omims_well_studied(omims, doid, omim_to_mesh, q1_doid_to_mesh, verbos
 	"""
 	# Getting well-studied omims
 	omims_GD = list()
+	if omims:
+		disease_names = get_nodes_property(list(omims) + [doid], "name", node_label="disease")
 	for omim in omims:  # only the on the prioritized ones
-		omim_descr = get_node_property(omim, "name", node_label="disease")
-		doid_descr = get_node_property(doid, "name", node_label="disease")
+		omim_descr = disease_names[omim]
+		doid_descr = disease_names[doid]
 		res = NormGoogleDistance.get_ngd_for_all([omim, doid], [omim_descr, doid_descr])
 		omims_GD.append((omim, res))
 	well_studied_omims = list()
@@ -1886,16 +2132,14 @@ def refine_omims_Markov_chain(omim_list, doid, max_path_len=3, verbose=False):
 	3. a dictionary with keys=omim_subset_list and values=the probabilities given by the Markov chain
 	"""
 	# Select likely paths and report them
-	trained_MC, quad_to_matrix_index = MarkovLearning.trained_MC()  # initialize the Markov chain
+	trained_MC, state_to_index = MarkovLearning.trained_MC()  # initialize the Markov chain
 	paths_dict_prob_all = dict()
 	paths_dict_selected = dict()
+	pair_to_paths = interleave_nodes_and_relationships_batch([(omim, doid) for omim in omim_list], "disease", "disease", max_path_len=max_path_len)
 	# get the probabilities for each path
 	for omim in omim_list:
-		path_name, path_type = interleave_nodes_and_relationships(omim, "disease", doid, "disease", max_path_len=max_path_len)
-		probabilities = []
-		for path in path_type:
-			prob = MarkovLearning.path_probability(trained_MC, quad_to_matrix_index, path)
-			probabilities.append(prob)
+		path_name, path_type = pair_to_paths[(omim, doid)]
+		probabilities = MarkovLearning.path_probabilities(trained_MC, state_to_index, path_type)
 		total_prob = np.sum(
 			probabilities)  # add up all the probabilities of all paths TODO: could also take the mean, etc.
 		# Only select the relevant paths
@@ -2300,6 +2544,14 @@ def test_get_node_property():
 	assert res == 'drug'
 
 
+def test_get_nodes_properties():
+	res = get_nodes_properties(["DOID:14793", "UBERON:0001259"], ["description", "label"])
+	assert res == {"DOID:14793": {"description": 'hypohidrotic ectodermal dysplasia', "label": 'disease'},
+				   "UBERON:0001259": {"description": 'mucosa of urinary bladder', "label": 'anatomical_entity'}}
+	res = get_nodes_property(["DOID:14793", "DOID:13306"], "description", "disease")
+	assert res == {"DOID:14793": 'hypohidrotic ectodermal dysplasia', "DOID:13306": 'diphtheritic cystitis'}
+
+
 def test_get_one_hop_target():
 	res = get_one_hop_target("disease", "DOID:14793", "protein", "gene_associated_with_condition")
 	assert res == ["Q92838"]
@@ -2583,6 +2835,7 @@ def test_cypher_gen_suite():
 def test_suite():
 	test_get_node_names_of_type_connected_to_target()
 	test_get_node_property()
+	test_get_nodes_properties()
 	test_get_one_hop_target()
 	test_get_relationship_types_between()
 	test_return_subgraph_through_node_labels()
@@ -1,5 +1,11 @@
 from nltk import word_tokenize, pos_tag
 from nltk.corpus import wordnet as wn
+from collections import namedtuple
+import functools
+import numpy as np
+
+# A preprocessed sentence: the synsets of its words (Nones filtered out) and the set of its lower case tokens
+SentenceRepresentation = namedtuple("SentenceRepresentation", ["synsets", "tokens"])
 
 
 def penn_to_wn(tag):
@@ -40,6 +46,27 @@ def tagged_to_synset(word, tag):
 		return None
 
 
+@functools.lru_cache(maxsize=None)
+def synset_similarity(synset1, synset2):
+	"""
+	Memoized wordnet path similarity between two synsets
+	:return: float between 0 and 1, or None if it can't be computed
+	"""
+	return synset1.path_similarity(synset2)
+
+
+@functools.lru_cache(maxsize=4096)
+def sentence_representation(sentence):
+	"""
+	Tokenize and tag a sentence and get the synsets of its words (cached, so each sentence is only preprocessed once)
+	:param sentence: input string
+	:return: SentenceRepresentation
+	"""
+	tokens = word_tokenize(sentence)
+	synsets = [tagged_to_synset(*tagged_word) for tagged_word in pos_tag(tokens)]
+	return SentenceRepresentation(tuple([ss for ss in synsets if ss]), frozenset([i.lower() for i in tokens]))
+
+
 def sentence_similarity(sentence1, sentence2):
 	"""
 	Copute sentence similarity based on wordnet
@@ -47,24 +74,18 @@ def sentence_similarity(sentence1, sentence2):
 	:param sentence2: input string
 	:return: float between 0 and 1 giving similarity of sentences
 	"""
-	# Tokenize and tag
-	sentence1_tagged = pos_tag(word_tokenize(sentence1))
-	sentence2_tagged = pos_tag(word_tokenize(sentence2))
-
-	# Get the synsets for the tagged words
-	synsets1 = [tagged_to_synset(*tagged_word) for tagged_word in sentence1_tagged]
-	synsets2 = [tagged_to_synset(*tagged_word) for tagged_word in sentence2_tagged]
-
-	# Filter out the Nones
-	synsets1 = [ss for ss in synsets1 if ss]
-	synsets2 = [ss for ss in synsets2 if ss]
+	# Tokenize and tag, and get the synsets for the tagged words
+	representation1 = sentence_representation(sentence1)
+	representation2 = sentence_representation(sentence2)
+	synsets1 = representation1.synsets
+	synsets2 = representation2.synsets
 
 	score, count = 0.0, 0
 
 	# For each word in the first sentence
 	for synset in synsets1:
 		# Get the similarity value of the most similar word in the other sentence
-		vals = [synset.path_similarity(ss) for ss in synsets2]
+		vals = [synset_similarity(synset, ss) for ss in synsets2]
 		best_score = -1
 		# Take max ignoring None's
 		for val in vals:
@@ -88,8 +109,8 @@ def sentence_similarity(sentence1, sentence2):
 
 	# If the number of synset's is small, no confidence in similarity
 	if count <= 3:
-		sentence1_set = set([i.lower() for i in word_tokenize(sentence1)])
-		sentence2_set = set([i.lower() for i in word_tokenize(sentence2)])
+		sentence1_set = representation1.tokens
+		sentence2_set = representation2.tokens
 		jaccard = len(sentence1_set.intersection(sentence2_set)) / float(len(sentence1_set.union(sentence2_set)))
 		score = jaccard
 	#return max(score, jaccard)
@@ -107,16 +128,128 @@ def symmetric_sentence_similarity(sentence1, sentence2):
 	return (sentence_similarity(sentence1, sentence2) + sentence_similarity(sentence2, sentence1)) / 2
 
 
+class CorpusIndex:
+	"""
+	The sentences of a list of corpora, preprocessed once, so that the similarity (symmetric_sentence_similarity) of an
+	input sentence to all of them is computed at once, with numpy
+	"""
+
+	def __init__(self, corpus_list):
+		"""
+		:param corpus_list: list of list of strings
+		"""
+		self.corpus_offsets = np.cumsum([0] + [len(corpus) for corpus in corpus_list])
+		representations = [sentence_representation(sentence) for corpus in corpus_list for sentence in corpus]
+		# the distinct synsets of the corpora, and the indices of those of each sentence, one sentence after the other
+		synset_to_index = dict()
+		synset_indices = []
+		for representation in representations:
+			for synset in representation.synsets:
+				synset_indices.append(synset_to_index.setdefault(synset, len(synset_to_index)))
+		self.synsets = list(synset_to_index.keys())
+		self.synset_indices = np.array(synset_indices, dtype=int)
+		self.num_synsets = np.array([len(representation.synsets) for representation in representations], dtype=int)
+		self.sentence_offsets = np.cumsum(self.num_synsets) - self.num_synsets
+		# which of the (lower case) tokens each sentence has
+		self.token_to_index = dict()
+		for representation in representations:
+			for token in representation.tokens:
+				self.token_to_index.setdefault(token, len(self.token_to_index))
+		self.token_matrix = np.zeros((len(representations), len(self.token_to_index)), dtype=bool)
+		for sentence_index, representation in enumerate(representations):
+			self.token_matrix[sentence_index, [self.token_to_index[token] for token in representation.tokens]] = True
+		self.num_tokens = self.token_matrix.sum(axis=1)
+		self.synset_to_similarities = dict()
+
+	def get_synset_similarities(self, synset):
+		"""
+		The similarities of a synset to (and from) each of the synsets of the corpora, -1 where there is none
+		:return: tuple of two numpy arrays: synset -> corpus synsets, corpus synsets -> synset
+		"""
+		similarities = self.synset_to_similarities.get(synset, None)
+		if similarities is None:
+			similarities = (np.array([synset_similarity(synset, ss) or -1 for ss in self.synsets], dtype=float),
+							np.array([synset_similarity(ss, synset) or -1 for ss in self.synsets], dtype=float))
+			self.synset_to_similarities[synset] = similarities
+		return similarities
+
+	def similarities(self, sentence):
+		"""
+		Compute symmetric_sentence_similarity of an input sentence to every sentence of the corpora
+		:param sentence: input string
+		:return: numpy array of floats between 0 and 1, one per sentence (the corpora one after the other)
+		"""
+		representation = sentence_representation(sentence)
+		num_sentences = len(self.num_synsets)
+		scores1, counts1 = np.zeros(num_sentences), np.zeros(num_sentences, dtype=int)
+		scores2, counts2 = np.zeros(num_sentences), np.zeros(num_sentences, dtype=int)
+		has_synsets = self.num_synsets > 0
+		if representation.synsets and has_synsets.any():
+			synset_similarities = [self.get_synset_similarities(synset) for synset in representation.synsets]
+			# rows: the synsets of the input sentence, columns: the synsets of each sentence, one sentence after the other
+			forward = np.array([similarities[0] for similarities in synset_similarities])[:, self.synset_indices]
+			backward = np.array([similarities[1] for similarities in synset_similarities])[:, self.synset_indices]
+			starts = self.sentence_offsets[has_synsets]
+			# input sentence -> sentence: the most similar word of the sentence, for each word of the input sentence
+			best_scores = np.maximum.reduceat(forward, starts, axis=1)
+			for best_score in best_scores:  # added up word by word, in order, as in sentence_similarity
+				scores1[has_synsets] += np.where(best_score > -1, best_score, 0)
+			counts1[has_synsets] = (best_scores > -1).sum(axis=0)
+			# sentence -> input sentence: the most similar word of the input sentence, for each word of the sentence
+			best_scores = backward.max(axis=0)
+			for position in range(self.num_synsets.max()):  # added up word by word, in order, as in sentence_similarity
+				long_enough = self.num_synsets > position
+				best_score = best_scores[self.sentence_offsets[long_enough] + position]
+				scores2[long_enough] += np.where(best_score > -1, best_score, 0)
+				counts2[long_enough] += best_score > -1
+		# Average the values
+		scores1 = np.where(counts1 > 0, scores1 / np.maximum(counts1, 1), 0)
+		scores2 = np.where(counts2 > 0, scores2 / np.maximum(counts2, 1), 0)
+		# If the number of synset's is small, no confidence in similarity: use the jaccard index of the tokens instead
+		token_indices = [self.token_to_index[token] for token in representation.tokens if token in self.token_to_index]
+		intersection = self.token_matrix[:, token_indices].sum(axis=1)
+		union = self.num_tokens + len(representation.tokens) - intersection
+		jaccard = intersection / np.maximum(union, 1)
+		scores1 = np.where(counts1 <= 3, jaccard, scores1)
+		scores2 = np.where(counts2 <= 3, jaccard, scores2)
+		return (scores1 + scores2) / 2
+
+	def max_in_corpora(self, sentence):
+		"""
+		Find the sentence of each corpus that is the most similar to the input sentence
+		:param sentence: input sentence
+		:return: list of tuples, one per corpus: tup[0] is location of max in the corpus, tup[1] is the maximum value
+		"""
+		similarities = self.similarities(sentence)
+		res = []
+		for start, end in zip(self.corpus_offsets[:-1], self.corpus_offsets[1:]):
+			max_ind = int(np.argmax(similarities[start:end]))
+			res.append((max_ind, float(similarities[start + max_ind])))
+		return res
+
+
+@functools.lru_cache(maxsize=32)
+def _get_corpus_index(corpus_list):
+	return CorpusIndex(corpus_list)
+
+
+def get_corpus_index(corpus_list):
+	"""
+	Get the (cached) CorpusIndex of a list of corpora
+	:param corpus_list: list of list of strings
+	:return: CorpusIndex
+	"""
+	return _get_corpus_index(tuple([tuple(corpus) for corpus in corpus_list]))
+
+
 def max_in_corpus(sentence, corpus):
-	# TODO: refactor this to return both the max index and the max value
-	max_val = symmetric_sentence_similarity(sentence, corpus[0])
-	max_ind = 0
-	for i in range(len(corpus)):
-		val = symmetric_sentence_similarity(sentence, corpus[i])
-		if val > max_val:
-			max_val = val
-			max_ind = i
-	return (max_ind, max_val)
+	"""
+	Find the sentence of the corpus that is the most similar to the input sentence
+	:param sentence: input sentence
+	:param corpus: list of strings
+	:return: tuple: tup[0] is location of max, tup[1] is the maximum value
+	"""
+	return get_corpus_index([corpus]).max_in_corpora(sentence)[0]
 
 
 def find_corpus(sentence, corpus_list):
@@ -129,8 +262,7 @@ def find_corpus(sentence, corpus_list):
 	"""
 	max_val = 0
 	max_index = -1
-	for i in range(len(corpus_list)):
-		(ind, dist) = max_in_corpus(sentence, corpus_list[i])
+	for i, (ind, dist) in enumerate(get_corpus_index(corpus_list).max_in_corpora(sentence)):
 		if dist > max_val:
 			max_val = dist
 			max_index = i
@@ -25,6 +25,8 @@ from operator import methodcaller
 import timeit
 import argparse
 import sys
+import time
+import concurrent.futures
 
 from Orangeboard import Orangeboard
 from QueryOMIM import QueryOMIM
@@ -43,6 +45,7 @@ from QueryChEMBL import QueryChEMBL
 from QueryKEGG import QueryKEGG
 from QueryUniprot import QueryUniprot
 from DrugMapper import DrugMapper
+import cache_control_helper
 
 
 class BioNetExpander:
@@ -94,14 +97,41 @@ class BioNetExpander:
                                 "cellular_component": "expressed_in",
                                 "molecular_function": "capable_of"}
 
-    def __init__(self, orangeboard):
+    # number of threads that look up the nodes of an expansion frontier concurrently
+    DEFAULT_MAX_WORKERS = 8
+
+    # network requests per second, for each host that the Query* classes use
+    SOURCE_MAX_REQUESTS_PER_SEC = {"api.omim.org": 4,
+                                   "mygene.info": 10,
+                                   "reactome.org": 10,
+                                   "www.disease-ontology.org": 5,
+                                   "www.disgenet.org": 5,
+                                   "www.geneprof.org": 5,
+                                   "api.monarchinitiative.org": 10,
+                                   "mirgate.bioinfo.cnio.es": 5,
+                                   "www.mirbase.org": 5,
+                                   "pharos.ncats.io": 5,
+                                   "scigraph-ontology.monarchinitiative.org": 10,
+                                   "www.ebi.ac.uk": 10,
+                                   "rest.kegg.jp": 3,
+                                   "rest.genome.jp": 3,
+                                   "www.uniprot.org": 10}
+
+    def __init__(self, orangeboard, max_workers=DEFAULT_MAX_WORKERS):
         orangeboard.set_dict_reltype_dirs(self.MASTER_REL_IS_DIRECTED)
         self.orangeboard = orangeboard
+        self.max_workers = max_workers
+        for host, max_requests_per_sec in self.SOURCE_MAX_REQUESTS_PER_SEC.items():
+            cache_control_helper.set_rate_limit(host, max_requests_per_sec)
         self.query_omim_obj = QueryOMIM('1337')
         self.query_mygene_obj = QueryMyGene(debug=False)
         self.gene_symbols_to_protein_nodes = dict()
 
-    def add_node_smart(self, simple_node_type, name, seed_node_bool=False, desc=''):
+    def get_node_smart_props(self, simple_node_type, name, desc=''):
+        """returns the properties of the node that add_node_smart would add (a ``dict`` with the
+        description, URI, CURIE ID and accession), or ``None`` if it would not add a node; the
+        gene symbol of a protein without a description is looked up
+        """
         if name.endswith("PHENOTYPE") or name.startswith("MP:"):
             return None
 
@@ -127,6 +157,23 @@ class BioNetExpander:
             gene_symbol = QueryUniprot.get_protein_gene_symbol(curie_id)
             desc = gene_symbol
 
+        return {"desc": desc,
+                "uri": iri,
+                "id": curie_id,
+                "accession": accession}
+
+    def add_node_smart(self, simple_node_type, name, seed_node_bool=False, desc='', node_props=None):
+        """adds a node, or returns the protein node that is already in the Orangeboard for the same gene symbol
+
+        :param node_props: the properties from ``get_node_smart_props`` (and, for a protein, its
+        ``protein_name``), if they were looked up ahead of time
+        """
+        if node_props is None:
+            node_props = self.get_node_smart_props(simple_node_type, name, desc)
+            if node_props is None:
+                return None
+        desc = node_props["desc"]
+
         node = None
 
         if simple_node_type == "protein":
@@ -136,7 +183,10 @@ class BioNetExpander:
 
         if node is None:
             if simple_node_type == "protein":
-                protein_name = self.query_mygene_obj.get_protein_name(name)
+                if "protein_name" in node_props:
+                    protein_name = node_props["protein_name"]
+                else:
+                    protein_name = self.query_mygene_obj.get_protein_name(name)
                 if protein_name == "None":
                     protein_name = desc
                 node = self.orangeboard.add_node(simple_node_type,
@@ -149,11 +199,11 @@ class BioNetExpander:
                                                  seed_node_bool,
                                                  desc)
 
-            extra_props = {"uri": iri,
-                           "id": curie_id,
-                           "accession": accession}
+            extra_props = {"uri": node_props["uri"],
+                           "id": node_props["id"],
+                           "accession": node_props["accession"]}
 
-            assert ":" in curie_id
+            assert ":" in node_props["id"]
             
             if simple_node_type == "protein" or simple_node_type == "microRNA":
                 extra_props["symbol"] = desc
@@ -166,6 +216,13 @@ class BioNetExpander:
 
         return node
 
+    def add_rel_between_distinct_nodes(self, reltype, sourcedb, source_node, target_node, **kwargs):
+        """adds a relationship unless either node is ``None`` or both are the same node (which
+        ``add_node_smart`` returns for a protein with the gene symbol of the source protein)
+        """
+        if source_node is not None and target_node is not None and source_node.uuid != target_node.uuid:
+            self.orangeboard.add_rel(reltype, sourcedb, source_node, target_node, **kwargs)
+
     @staticmethod
     def is_mir(gene_symbol):
         return re.match('MIR\d.*', gene_symbol) is not None or re.match('MIRLET\d.*', gene_symbol) is not None
@@ -314,8 +371,7 @@ class BioNetExpander:
                                 target_mir_node = self.add_node_smart('microRNA',
                                                                       'NCBIGene:' + str(target_ncbi_entrez_id),
                                                                       desc=target_gene_symbol)
-                                if target_mir_node is not None and target_mir_node != node:
-                                    self.orangeboard.add_rel('regulates', 'miRGate', node, target_mir_node, extended_reltype="regulates_expression_of")
+                                self.add_rel_between_distinct_nodes('regulates', 'miRGate', node, target_mir_node, extended_reltype="regulates_expression_of")
 
     def expand_pathway(self, node):
         assert node.nodetype == "pathway"
@@ -376,8 +432,7 @@ class BioNetExpander:
                 for reg_uniprot_id in reg_uniprot_ids_set:
                     assert '-' not in reg_uniprot_id
                     node2 = self.add_node_smart('protein', reg_uniprot_id, desc=reg_gene_symbol)
-                    if node2 is not None and node2.uuid != node1.uuid:
-                        self.orangeboard.add_rel('regulates', 'GeneProf', node2, node1, extended_reltype="regulates_expression_of")
+                    self.add_rel_between_distinct_nodes('regulates', 'GeneProf', node2, node1, extended_reltype="regulates_expression_of")
 
             # microrna-gene interactions:
             microrna_regulators = QueryMiRGate.get_microrna_ids_that_regulate_gene_symbol(gene_symbol)
@@ -432,16 +487,14 @@ class BioNetExpander:
                 int_alias = int_dict[int_uniprot_id]
                 if 'BINDSGENE:' not in int_alias:
                     node2 = self.add_node_smart('protein', int_uniprot_id, desc=int_alias)
-                    if node2 is not None and node2.uuid != node1.uuid:
-                        self.orangeboard.add_rel('physically_interacts_with', 'reactome', node1, node2, extended_reltype="physically_interacts_with")
+                    self.add_rel_between_distinct_nodes('physically_interacts_with', 'reactome', node1, node2, extended_reltype="physically_interacts_with")
                 else:
                     target_gene_symbol = int_alias.split(':')[1]
                     target_uniprot_ids_set = self.query_mygene_obj.convert_gene_symbol_to_uniprot_id(target_gene_symbol)
                     for target_uniprot_id in target_uniprot_ids_set:
                         assert '-' not in target_uniprot_id
                         node2 = self.add_node_smart('protein', target_uniprot_id, desc=target_gene_symbol)
-                        if node2 is not None and node2 != node1:
-                            self.orangeboard.add_rel('regulates', 'Reactome', node1, node2, extended_reltype="regulates_expression_of")
+                        self.add_rel_between_distinct_nodes('regulates', 'Reactome', node1, node2, extended_reltype="regulates_expression_of")
 
         # protein-to-GO (biological process):
         go_dict = self.query_mygene_obj.get_gene_ontology_ids_for_uniprot_id(uniprot_id_str)
@@ -461,8 +514,7 @@ class BioNetExpander:
         if child_go_ids_dict is not None:
             for child_go_id, child_go_term in child_go_ids_dict.items():
                 child_node = self.add_node_smart(gene_ontology_type_str, child_go_id, desc=child_go_term)
-                if child_node is not None and child_node != node:
-                    self.orangeboard.add_rel("subclass_of", 'gene_ontology', child_node, node, extended_reltype="subclass_of")
+                self.add_rel_between_distinct_nodes("subclass_of", 'gene_ontology', child_node, node, extended_reltype="subclass_of")
 
     def expand_molecular_function(self, node):
         assert node.nodetype == "molecular_function"
@@ -618,18 +670,60 @@ class BioNetExpander:
 
         node.expanded = True
 
+    def record_expansion(self, node):
+        """Expands a node with an ``ExpansionRecorder``, which makes the web queries but records the
+        nodes and relationships instead of adding them to the Orangeboard, so that this can run in a
+        worker thread; returns the recorder, or ``None`` if the expansion failed
+        """
+        try:
+            return ExpansionRecorder(self, node).record()
+        except Exception as e:
+            # the node is expanded directly in expand_all_nodes, which reports the error if it recurs
+            print('Concurrent expansion failed for node ' + node.name + ': ' + repr(e), file=sys.stderr)
+            return None
+
+    def add_recorded_expansion(self, recorder):
+        """Adds the nodes and relationships recorded by an ``ExpansionRecorder`` to the Orangeboard,
+        in the order that the expansion added them, and marks the expanded node as expanded
+        """
+        nodes = dict()
+        for recorded_node, method_name, args, kwargs in recorder.operations:
+            args = [nodes.get(arg, arg) if isinstance(arg, RecordedNode) else arg for arg in args]
+            if method_name == 'add_rel':
+                self.orangeboard.add_rel(*args, **kwargs)
+            else:
+                result = getattr(self, method_name)(*args, **kwargs)
+                if recorded_node is not None:
+                    nodes[recorded_node] = result
+        recorder.node.expanded = True
+
     def expand_all_nodes(self):
-        nodes = self.orangeboard.get_all_nodes_for_current_seed_node()
-        num_nodes_to_expand = sum([not mynode.expanded for mynode in nodes])
+        """Expands the nodes of the current expansion frontier.  With ``max_workers`` > 1, the nodes
+        are expanded concurrently by ``record_expansion``, and this thread alone adds the recorded
+        expansions to the Orangeboard, in the order of the nodes, so the result does not depend on
+        the number of threads
+        """
+        nodes = [mynode for mynode in self.orangeboard.get_list_nodes_for_current_seed_node() if not mynode.expanded]
+        num_nodes_to_expand = len(nodes)
         print('----------------------------------------------------')
         print('Number of nodes to expand: ' + str(num_nodes_to_expand))
         print('----------------------------------------------------')
-        for node in nodes:
-            if not node.expanded:
-                self.expand_node(node)
-                num_nodes_to_expand -= 1
-                if (num_nodes_to_expand % 100 == 0):
-                    print('Number of nodes left to expand in this iteration: ' + str(num_nodes_to_expand))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            if self.max_workers > 1 and len(nodes) > 1:
+                recorders = executor.map(self.record_expansion, nodes)
+            else:
+                recorders = [None] * len(nodes)
+            for node, recorder in zip(nodes, recorders):
+                if not node.expanded:
+                    # a recording is only valid if it used the description that the node has now (an
+                    # expansion that was added before it can give the node a description)
+                    if recorder is not None and recorder.node_desc == node.desc:
+                        self.add_recorded_expansion(recorder)
+                    else:
+                        self.expand_node(node)
+                    num_nodes_to_expand -= 1
+                    if (num_nodes_to_expand % 100 == 0):
+                        print('Number of nodes left to expand in this iteration: ' + str(num_nodes_to_expand))
 
     def test_go_bp_protein():
         ob = Orangeboard(debug=False)
@@ -744,6 +838,64 @@ class BioNetExpander:
         ob.neo4j_set_auth()
         ob.neo4j_push()
 
+    def test_concurrent_expansion():
+        # local stubs of the source APIs, so that the result can be checked offline; like the
+        # web cache, the stubs only take time for a request that they have not seen before
+        stub_web_cache = set()
+        stub_web_requests = []
+
+        def stub_web_request(url):
+            stub_web_requests.append(url)
+            if url not in stub_web_cache:
+                time.sleep(0.05)
+                stub_web_cache.add(url)
+
+        def stub_query_omim_init(self, encryption_key):
+            self.cookie = None
+
+        def stub_get_protein_name(self, protein_id):
+            stub_web_request('mygene/' + protein_id)
+            return "None"
+
+        def stub_pathway_id_to_uniprot_ids_desc(reactome_id_str):
+            stub_web_request('reactome/' + reactome_id_str)
+            pathway_index = int(reactome_id_str.split('-')[-1])
+            return {'Q' + str(pathway_index) + str(i): 'GENE' + str((pathway_index + i) % 4) for i in range(3)}
+
+        original_methods = (QueryOMIM.__init__,
+                            QueryMyGene.get_protein_name,
+                            vars(QueryReactome)['query_reactome_pathway_id_to_uniprot_ids_desc'])
+        QueryOMIM.__init__ = stub_query_omim_init
+        QueryMyGene.get_protein_name = stub_get_protein_name
+        QueryReactome.query_reactome_pathway_id_to_uniprot_ids_desc = staticmethod(stub_pathway_id_to_uniprot_ids_desc)
+        try:
+            results = []
+            for max_workers in [1, 4]:
+                stub_web_cache.clear()
+                del stub_web_requests[:]
+                ob = Orangeboard(debug=False)
+                bne = BioNetExpander(ob, max_workers=max_workers)
+                bne.add_node_smart('pathway', 'R-HSA-0', seed_node_bool=True, desc='pathway 0')
+                for pathway_index in range(1, 8):
+                    bne.add_node_smart('pathway', 'R-HSA-' + str(pathway_index), desc='pathway ' + str(pathway_index))
+                start_time = timeit.default_timer()
+                bne.expand_all_nodes()
+                print('max_workers=' + str(max_workers) + ': ' + format(timeit.default_timer() - start_time, '.2f') + ' s')
+                rels = [(rel.reltype, rel.source_node.name, rel.target_node.name)
+                        for reltype in ob.get_all_reltypes() for rel in ob.get_all_rels_for_reltype(reltype)]
+                results.append((sorted((node.name, node.desc) for node in ob.get_list_nodes_for_current_seed_node()),
+                                sorted(rels)))
+                # each pathway is looked up once, not once by a worker thread and again by this thread
+                pathway_requests = [url for url in stub_web_requests if url.startswith('reactome/')]
+                assert sorted(pathway_requests) == ['reactome/R-HSA-' + str(pathway_index) for pathway_index in range(8)]
+            # proteins with the same gene symbol are merged into one node, in the same way for any number of threads
+            assert len(results[0][0]) == 8 + 4
+            assert results[0] == results[1]
+        finally:
+            (QueryOMIM.__init__,
+             QueryMyGene.get_protein_name,
+             QueryReactome.query_reactome_pathway_id_to_uniprot_ids_desc) = original_methods
+
     def test_issue_269():
         ob = Orangeboard(debug=False)
         bne = BioNetExpander(ob)
@@ -756,6 +908,57 @@ class BioNetExpander:
         ob.neo4j_push()
 
 
+class RecordedNode:
+    """Stands in for a node that an ``ExpansionRecorder`` has recorded (it has no ``uuid`` or other
+    attributes, so an expansion that uses them fails, and the node is expanded directly instead)
+    """
+    pass
+
+
+class ExpansionRecorder(BioNetExpander):
+    """Expands one node like a ``BioNetExpander``, but without reading or changing the Orangeboard:
+    the web queries are made (including the ones that ``add_node_smart`` makes), and the calls that
+    add nodes and relationships are recorded in ``operations``, for
+    ``BioNetExpander.add_recorded_expansion`` to replay
+    """
+
+    def __init__(self, expander, node):
+        # shares the query objects of the expander, which hold no per-expansion state; the
+        # add_rel calls of the expand_* methods are recorded by this object's add_rel method
+        self.query_omim_obj = expander.query_omim_obj
+        self.query_mygene_obj = expander.query_mygene_obj
+        self.max_workers = 1
+        self.orangeboard = self
+        self.node = node
+        self.node_desc = node.desc
+        self.operations = []
+
+    def record(self):
+        expand_method = methodcaller('expand_' + self.node.nodetype, node=self.node)
+        expand_method(self)
+        return self
+
+    def add_node_smart(self, simple_node_type, name, seed_node_bool=False, desc=''):
+        node_props = self.get_node_smart_props(simple_node_type, name, desc)
+        if node_props is None:
+            return None
+        if simple_node_type == "protein":
+            node_props["protein_name"] = self.query_mygene_obj.get_protein_name(name)
+        node = RecordedNode()
+        self.operations.append((node, 'add_node_smart', (simple_node_type, name, seed_node_bool),
+                                {'node_props': node_props}))
+        return node
+
+    def add_rel(self, reltype, sourcedb, source_node, target_node, **kwargs):
+        self.operations.append((None, 'add_rel', (reltype, sourcedb, source_node, target_node), kwargs))
+
+    def add_rel_between_distinct_nodes(self, reltype, sourcedb, source_node, target_node, **kwargs):
+        # whether the nodes are distinct is only known once the nodes are added to the Orangeboard
+        if source_node is not None and target_node is not None:
+            self.operations.append((None, 'add_rel_between_distinct_nodes',
+                                    (reltype, sourcedb, source_node, target_node), kwargs))
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Builds the master knowledge graph')
     parser.add_argument('--runfunc', dest='runfunc')
@@ -0,0 +1,267 @@
+'''This module defines the class COHDLocalStore. COHDLocalStore keeps a local copy of (a part of) the Columbia Open
+Health Data (COHD): the mappings from CURIEs to OMOP standard concepts, the concept definitions, and the single and
+paired concept counts of the datasets. It is kept in an indexed sqlite database, so that QueryCOHD can answer
+lookups (and whole batches of them) without calling the COHD API.
+
+The paired concept statistics (frequency, observed/expected ratio, chi-square) are computed from the counts the same
+way that the COHD API computes them, for all the requested pairs at once.
+
+Build a store from the COHD dataset files (tab separated, with a header line):
+
+    python3 COHDLocalStore.py cohd_local.sqlite --dataset-id 3 --patient-count 1731858 \\
+        --concepts concepts.txt --concept-counts concept_counts.txt --pair-counts concept_pair_counts.txt \\
+        --xrefs xref_to_omop.txt
+
+Test Cases in
+    [repo]/code/reasoningtool/kg-construction/tests/COHDLocalStoreTests.py
+
+'''
+
+import argparse
+import csv
+import sqlite3
+import threading
+import numpy as np
+import scipy.stats
+
+
+class COHDLocalStore:
+    BATCH_SIZE = 10000
+
+    def __init__(self, db_file):
+        """
+        :param db_file: path of the sqlite database file (created, empty, if it does not exist)
+        """
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS dataset (dataset_id INTEGER PRIMARY KEY, patient_count INTEGER);
+                CREATE TABLE IF NOT EXISTS concept (concept_id INTEGER PRIMARY KEY, concept_name TEXT, domain_id TEXT,
+                    vocabulary_id TEXT, concept_class_id TEXT, concept_code TEXT);
+                CREATE INDEX IF NOT EXISTS concept_name_index ON concept (concept_name COLLATE NOCASE);
+                CREATE TABLE IF NOT EXISTS concept_count (dataset_id INTEGER, concept_id INTEGER, concept_count INTEGER,
+                    PRIMARY KEY (dataset_id, concept_id)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS paired_concept_count (dataset_id INTEGER, concept_id_1 INTEGER,
+                    concept_id_2 INTEGER, concept_count INTEGER,
+                    PRIMARY KEY (dataset_id, concept_id_1, concept_id_2)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS xref_to_omop (curie TEXT, omop_standard_concept_id INTEGER,
+                    total_distance INTEGER, PRIMARY KEY (curie, omop_standard_concept_id)) WITHOUT ROWID;
+            ''')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # ----------------------------------------------------------------------------------------------------------------
+    # Building the store
+
+    def add_dataset(self, dataset_id, patient_count):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO dataset VALUES (?, ?)", (int(dataset_id), int(patient_count)))
+
+    def add_concepts(self, rows):
+        """
+        :param rows: iterable of (concept_id, concept_name, domain_id, vocabulary_id, concept_class_id, concept_code)
+        """
+        self.__insert_many("INSERT OR REPLACE INTO concept VALUES (?, ?, ?, ?, ?, ?)",
+                           ((int(row[0]),) + tuple(row[1:6]) for row in rows))
+
+    def add_concept_counts(self, dataset_id, rows):
+        """
+        :param rows: iterable of (concept_id, concept_count)
+        """
+        self.__insert_many("INSERT OR REPLACE INTO concept_count VALUES (?, ?, ?)",
+                           ((int(dataset_id), int(concept_id), int(count)) for concept_id, count in rows))
+
+    def add_paired_concept_counts(self, dataset_id, rows):
+        """
+        :param rows: iterable of (concept_id_1, concept_id_2, concept_count); the order of the concepts does not matter
+        """
+        self.__insert_many("INSERT OR REPLACE INTO paired_concept_count VALUES (?, ?, ?, ?)",
+                           ((int(dataset_id),) + self.make_pair_key(concept_id_1, concept_id_2) + (int(count),)
+                            for concept_id_1, concept_id_2, count in rows))
+
+    def add_xrefs_to_omop(self, rows):
+        """
+        :param rows: iterable of (curie, omop_standard_concept_id, total_distance)
+        """
+        self.__insert_many("INSERT OR REPLACE INTO xref_to_omop VALUES (?, ?, ?)",
+                           ((curie, int(concept_id), int(distance)) for curie, concept_id, distance in rows))
+
+    def __insert_many(self, statement, rows):
+        rows = iter(rows)
+        with self.lock, self.connection:
+            while True:
+                batch = [row for _, row in zip(range(COHDLocalStore.BATCH_SIZE), rows)]
+                if not batch:
+                    break
+                self.connection.executemany(statement, batch)
+
+    # ----------------------------------------------------------------------------------------------------------------
+    # Lookups
+
+    @staticmethod
+    def make_pair_key(concept_id_1, concept_id_2):
+        concept_id_1, concept_id_2 = int(concept_id_1), int(concept_id_2)
+        return (concept_id_1, concept_id_2) if concept_id_1 <= concept_id_2 else (concept_id_2, concept_id_1)
+
+    def has_dataset(self, dataset_id):
+        return self.get_patient_count(dataset_id) is not None
+
+    def get_patient_count(self, dataset_id):
+        with self.lock:
+            row = self.connection.execute("SELECT patient_count FROM dataset WHERE dataset_id = ?", (dataset_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_xref_to_OMOP_batch(self, curies, distance=2):
+        """
+        :param curies: iterable of CURIEs
+        :param distance: maximum total mapping distance
+        :return: dictionary of CURIE -> list of {'omop_standard_concept_id', 'omop_concept_name', 'omop_domain_id',
+            'total_distance'} (sorted by distance), for the CURIEs that are in the store
+        """
+        curie_to_xrefs = dict()
+        with self.lock:
+            for curie, concept_id, total_distance, concept_name, domain_id in self.__select_joined(
+                    "SELECT x.curie, x.omop_standard_concept_id, x.total_distance, c.concept_name, c.domain_id "
+                    "FROM lookup_keys k JOIN xref_to_omop x ON x.curie = k.key "
+                    "LEFT JOIN concept c ON c.concept_id = x.omop_standard_concept_id "
+                    "ORDER BY x.curie, x.total_distance, x.omop_standard_concept_id",
+                    [(curie,) for curie in set(curies)], "key TEXT"):
+                xrefs = curie_to_xrefs.setdefault(curie, [])
+                if total_distance <= distance:
+                    xrefs.append({'omop_standard_concept_id': concept_id, 'omop_concept_name': concept_name,
+                                  'omop_domain_id': domain_id, 'total_distance': total_distance})
+        return curie_to_xrefs
+
+    def find_concept_ids(self, node_label, domain="", dataset_id=1, min_count=1):
+        """
+        Search for concepts whose name contains node_label (case insensitive), most frequent first
+        :return: list of concept dictionaries, as in QueryCOHD.find_concept_ids
+        """
+        query = "SELECT c.concept_id, c.concept_name, c.domain_id, c.vocabulary_id, c.concept_class_id, c.concept_code, " \
+                "COALESCE(n.concept_count, 0) FROM concept c " \
+                "LEFT JOIN concept_count n ON n.concept_id = c.concept_id AND n.dataset_id = ? " \
+                "WHERE c.concept_name LIKE ? AND COALESCE(n.concept_count, 0) >= ?"
+        params = [dataset_id, '%' + node_label + '%', min_count]
+        if domain != "":
+            query += " AND c.domain_id = ?"
+            params.append(domain)
+        query += " ORDER BY COALESCE(n.concept_count, 0) DESC, c.concept_id"
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [{'concept_id': row[0], 'concept_name': row[1], 'domain_id': row[2], 'vocabulary_id': row[3],
+                 'concept_class_id': row[4], 'concept_code': row[5], 'concept_count': float(row[6])} for row in rows]
+
+    def get_paired_concept_counts(self, concept_pairs, dataset_id):
+        """
+        The counts of many pairs of concepts, and of each concept of the pairs
+        :param concept_pairs: list of (concept_id_1, concept_id_2) pairs (OMOP ids, as str or int)
+        :param dataset_id: the dataset to look the counts up in
+        :return: tuple of int arrays (paired counts, counts of the first concepts, counts of the second concepts); the
+            counts are 0 for pairs/concepts that are not in the dataset
+        """
+        pair_keys = [self.make_pair_key(concept_id_1, concept_id_2) for concept_id_1, concept_id_2 in concept_pairs]
+        concept_ids = list({concept_id for pair_key in pair_keys for concept_id in pair_key})
+        with self.lock:
+            pair_to_count = {(concept_id_1, concept_id_2): count for concept_id_1, concept_id_2, count in self.__select_joined(
+                "SELECT p.concept_id_1, p.concept_id_2, p.concept_count FROM lookup_keys k JOIN paired_concept_count p "
+                "ON p.dataset_id = ? AND p.concept_id_1 = k.key_1 AND p.concept_id_2 = k.key_2",
+                list(set(pair_keys)), "key_1 INTEGER, key_2 INTEGER", params=(dataset_id,))}
+            concept_to_count = dict(self.__select_joined(
+                "SELECT n.concept_id, n.concept_count FROM lookup_keys k JOIN concept_count n "
+                "ON n.dataset_id = ? AND n.concept_id = k.key",
+                [(concept_id,) for concept_id in concept_ids], "key INTEGER", params=(dataset_id,)))
+        paired_counts = np.array([pair_to_count.get(pair_key, 0) for pair_key in pair_keys], dtype=np.int64)
+        counts_1 = np.array([concept_to_count.get(int(pair[0]), 0) for pair in concept_pairs], dtype=np.int64)
+        counts_2 = np.array([concept_to_count.get(int(pair[1]), 0) for pair in concept_pairs], dtype=np.int64)
+        return paired_counts, counts_1, counts_2
+
+    def __select_joined(self, query, keys, key_columns, params=()):
+        """
+        Run a query that joins the temporary table "lookup_keys" (filled with the given keys) to the store's tables
+        (must be called holding the lock)
+        """
+        self.connection.execute("DROP TABLE IF EXISTS temp.lookup_keys")
+        self.connection.execute(f"CREATE TEMP TABLE lookup_keys ({key_columns})")
+        try:
+            placeholders = ", ".join("?" * len(key_columns.split(",")))
+            self.connection.executemany(f"INSERT INTO temp.lookup_keys VALUES ({placeholders})", keys)
+            return self.connection.execute(query, params).fetchall()
+        finally:
+            self.connection.execute("DROP TABLE temp.lookup_keys")
+            self.connection.commit()
+
+    def get_paired_concept_stats(self, concept_pairs, dataset_id):
+        """
+        Compute the paired concept statistics of many pairs of concepts at once
+        :param concept_pairs: list of (concept_id_1, concept_id_2) pairs (OMOP ids, as str or int)
+        :param dataset_id: the dataset to compute the statistics in
+        :return: dictionary of statistic name ('concept_count', 'concept_frequency', 'expected_count', 'ln_ratio',
+            'chi_square', 'p-value') -> float array with the statistic of each pair (NaN for the pairs that have no paired count, as
+            the COHD API returns no results for them)
+        """
+        patient_count = self.get_patient_count(dataset_id)
+        paired_counts, counts_1, counts_2 = self.get_paired_concept_counts(concept_pairs, dataset_id)
+        return self.compute_paired_concept_stats(paired_counts, counts_1, counts_2, patient_count)
+
+    @staticmethod
+    def compute_paired_concept_stats(paired_counts, counts_1, counts_2, patient_count):
+        """
+        Compute the paired concept statistics from the counts (arrays, one entry per pair of concepts)
+        """
+        has_data = paired_counts > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            observed = paired_counts.astype(float)
+            expected = counts_1.astype(float) * counts_2 / patient_count
+            # 2x2 contingency table of the patients having (or not) each concept, against the table expected if the
+            # concepts were independent
+            table = np.stack([observed, counts_1 - observed, counts_2 - observed,
+                              patient_count - counts_1 - counts_2 + observed])
+            expected_table = np.stack([expected, counts_1 - expected, counts_2 - expected,
+                                       patient_count - counts_1 - counts_2 + expected])
+            chi_square = np.sum((table - expected_table) ** 2 / expected_table, axis=0)
+            stats = {
+                'concept_count': observed,
+                'concept_frequency': observed / patient_count,
+                'expected_count': expected,
+                'ln_ratio': np.log(observed / expected),
+                'chi_square': chi_square,
+                'p-value': scipy.stats.chi2.sf(chi_square, 1),
+            }
+        return {name: np.where(has_data, values, np.nan) for name, values in stats.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds (or adds to) a local COHD store from COHD dataset files")
+    parser.add_argument('db_file', help="the sqlite file of the store")
+    parser.add_argument('--dataset-id', type=int, required=True)
+    parser.add_argument('--patient-count', type=int, required=True)
+    parser.add_argument('--concepts', help="file of concept_id, concept_name, domain_id, vocabulary_id, concept_class_id, concept_code")
+    parser.add_argument('--concept-counts', help="file of concept_id, concept_count")
+    parser.add_argument('--pair-counts', help="file of concept_id_1, concept_id_2, concept_count")
+    parser.add_argument('--xrefs', help="file of curie, omop_standard_concept_id, total_distance")
+    args = parser.parse_args()
+
+    def read_rows(file_name):
+        with open(file_name, 'r') as fid:
+            reader = csv.reader(fid, delimiter='\t')
+            next(reader)  # skip the header
+            yield from reader
+
+    store = COHDLocalStore(args.db_file)
+    store.add_dataset(args.dataset_id, args.patient_count)
+    if args.concepts:
+        store.add_concepts(read_rows(args.concepts))
+    if args.concept_counts:
+        store.add_concept_counts(args.dataset_id, read_rows(args.concept_counts))
+    if args.pair_counts:
+        store.add_paired_concept_counts(args.dataset_id, read_rows(args.pair_counts))
+    if args.xrefs:
+        store.add_xrefs_to_omop(read_rows(args.xrefs))
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,8 @@ import neo4j.v1
 import sys, os
 import timeit
 import argparse
+import csv
+import subprocess
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
 from RTXConfiguration import RTXConfiguration
@@ -134,6 +136,8 @@ class Rel:
 
 class Orangeboard:
     DEBUG_COUNT_REPORT_GRANULARITY = 1000
+    NEO4J_PUSH_BATCH_SIZE = 10000
+    NEO4J_IMPORT_ARRAY_DELIMITER = ';'
 
     def bytesize(self):
         count = 0
@@ -254,6 +258,10 @@ class Orangeboard:
     def get_all_nodes_for_current_seed_node(self):
         return self.get_all_nodes_for_seed_node_uuid(self.seed_node.uuid)
 
+    def get_list_nodes_for_current_seed_node(self):
+        # unlike get_all_nodes_for_current_seed_node, keeps the order in which the nodes were added
+        return list(self.dict_seed_uuid_to_list_nodes[self.seed_node.uuid])
+
     def get_all_reltypes(self):
         return self.dict_reltype_to_dict_relkey_to_rel.keys()
 
@@ -503,39 +511,28 @@ class Orangeboard:
 
         self.neo4j_run_cypher_query(cypher_query)
 
-    def neo4j_push(self, seed_node=None):
-        assert self.dict_reltype_dirs is not None
-
-        self.neo4j_clear()
-
-        nodetypes = self.get_all_nodetypes()
-        for nodetype in nodetypes:
-            if self.debug:
-                print('Pushing nodes to Neo4j for node type: ' + nodetype)
+    @staticmethod
+    def make_batches(items, batch_size):
+        items = list(items)
+        return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    def get_nodes_to_push(self, seed_node=None):
+        """returns a dict of node type to the list of nodes of that type, optionally restricted to one seed node"""
+        ret_dict = dict()
+        for nodetype in self.get_all_nodetypes():
             nodes = self.get_all_nodes_for_nodetype(nodetype)
             if seed_node is not None:
                 nodes &= self.get_all_nodes_for_seed_node_uuid(seed_node.uuid)
-            query_params = {'props': [node.get_props() for node in nodes]}
-            node = next(iter(nodes))
-            cypher_query_str = 'UNWIND $props as map\nCREATE (n' + \
-                               Orangeboard.make_label_string_from_set(node.get_labels()) + \
-                               ')\nSET n = map'
-            if self.debug:
-                print(cypher_query_str)
-            res = self.neo4j_run_cypher_query(cypher_query_str, query_params)
-            if self.debug:
-                print(res.summary().counters)
-
-        try:
-            self.neo4j_run_cypher_query('CREATE INDEX ON :Base(UUID)')
-            self.neo4j_run_cypher_query('CREATE INDEX ON :Base(seed_node_uuid)')
-        except neo4j.exceptions.ClientError as e:
-            print(str(e), file=sys.stderr)
+            if len(nodes) > 0:
+                ret_dict[nodetype] = list(nodes)
+        return ret_dict
 
-        reltypes = self.get_all_reltypes()
-        for reltype in reltypes:
-            if self.debug:
-                print('Pushing relationships to Neo4j for relationship type: ' + reltype)
+    def get_rel_props_to_push(self, seed_node=None):
+        """returns a dict of relationship type to a list of property dicts, one per Neo4j relationship
+        (an undirected relationship type gets one relationship in each direction)"""
+        assert self.dict_reltype_dirs is not None
+        ret_dict = dict()
+        for reltype in self.get_all_reltypes():
             reltype_dir = self.dict_reltype_dirs[reltype]
             rels = self.get_all_rels_for_reltype(reltype)
             if seed_node is not None:
@@ -544,24 +541,186 @@ class Orangeboard:
             if not reltype_dir:
                 reltype_rels_params_list = reltype_rels_params_list + \
                                            [rel.get_props(reverse=True) for rel in rels]
-            query_params = {'rel_data_list': reltype_rels_params_list}
+            if len(reltype_rels_params_list) > 0:
+                ret_dict[reltype] = reltype_rels_params_list
+        return ret_dict
+
+    @staticmethod
+    def make_neo4j_rel_props(rel_data_map, reltype):
+        """the properties of a relationship in Neo4j, given the ``dict`` returned by ``Rel.get_props``"""
+        return {'source_node_uuid': rel_data_map['source_node_uuid'],
+                'target_node_uuid': rel_data_map['target_node_uuid'],
+                'is_defined_by': 'RTX',
+                'provided_by': rel_data_map['sourcedb'],
+                'predicate': reltype,
+                'seed_node_uuid': rel_data_map['seed_node_uuid'],
+                'probability': rel_data_map['prob'],
+                'publications': rel_data_map['publications'],
+                'relation': rel_data_map['extended_reltype']}
+
+    def neo4j_create_indexes(self, nodetypes=()):
+        try:
+            self.neo4j_run_cypher_query('CREATE INDEX ON :Base(UUID)')
+            self.neo4j_run_cypher_query('CREATE INDEX ON :Base(seed_node_uuid)')
+            for nodetype in nodetypes:
+                self.neo4j_run_cypher_query('CREATE INDEX ON :`' + nodetype + '`(rtx_name)')
+        except neo4j.exceptions.ClientError as e:
+            print(str(e), file=sys.stderr)
+
+    def neo4j_push(self, seed_node=None, incremental=False, batch_size=NEO4J_PUSH_BATCH_SIZE):
+        """pushes the graph (or the subgraph for one seed node) to Neo4j, in transactions of at most
+        ``batch_size`` nodes or relationships each
+
+        :param seed_node: if not ``None``, only push the nodes and relationships for this seed node
+        :param incremental: if ``False``, the Neo4j database is cleared and the nodes and relationships
+        are created; if ``True``, the database is not cleared, and each node is merged on its node type
+        and ``rtx_name`` (indexed) and each relationship on its type and end nodes, so that pushing
+        again updates the existing graph in place
+        :param batch_size: the maximum number of nodes or relationships per transaction
+        :returns: nothing
+        """
+        assert self.dict_reltype_dirs is not None
+
+        if not incremental:
+            self.neo4j_clear()
+
+        dict_nodetype_to_nodes = self.get_nodes_to_push(seed_node)
+        if incremental:
+            # the indexes are needed by the MERGE queries, so create them first
+            self.neo4j_create_indexes(dict_nodetype_to_nodes.keys())
+
+        for nodetype, nodes in dict_nodetype_to_nodes.items():
+            if self.debug:
+                print('Pushing nodes to Neo4j for node type: ' + nodetype)
+            label_string = Orangeboard.make_label_string_from_set(nodes[0].get_labels())
+            if not incremental:
+                cypher_query_str = 'UNWIND $props as map\nCREATE (n' + label_string + ')\nSET n = map'
+            else:
+                cypher_query_str = 'UNWIND $props as map\nMERGE (n:`' + nodetype + '` {rtx_name: map.rtx_name})\n' + \
+                                   'SET n += map, n' + label_string
+            if self.debug:
+                print(cypher_query_str)
+            for batch in Orangeboard.make_batches(nodes, batch_size):
+                res = self.neo4j_run_cypher_query(cypher_query_str, {'props': [node.get_props() for node in batch]})
+                if self.debug:
+                    print(res.summary().counters)
+
+        if not incremental:
+            self.neo4j_create_indexes()
+
+        for reltype, reltype_rels_params_list in self.get_rel_props_to_push(seed_node).items():
+            if self.debug:
+                print('Pushing relationships to Neo4j for relationship type: ' + reltype)
             cypher_query_str = 'UNWIND $rel_data_list AS rel_data_map\n' + \
                                'MATCH (n1:Base {UUID: rel_data_map.source_node_uuid}),' + \
                                '(n2:Base {UUID: rel_data_map.target_node_uuid})\n' + \
-                               'CREATE (n1)-[:`' + reltype + \
-                               '` { source_node_uuid: rel_data_map.source_node_uuid,' + \
-                               ' target_node_uuid: rel_data_map.target_node_uuid,' + \
-                               ' is_defined_by: \'RTX\',' + \
-                               ' provided_by: rel_data_map.sourcedb,' + \
-                               ' predicate: \'' + reltype + '\',' + \
-                               ' seed_node_uuid: rel_data_map.seed_node_uuid,' + \
-                               ' probability: rel_data_map.prob,' + \
-                               ' publications: rel_data_map.publications,' + \
-                               ' relation: rel_data_map.extended_reltype' + \
-                               ' }]->(n2)'
-            res = self.neo4j_run_cypher_query(cypher_query_str, query_params)
-            if self.debug:
-                print(res.summary().counters)
+                               ('CREATE' if not incremental else 'MERGE') + \
+                               ' (n1)-[r:`' + reltype + '`]->(n2)\n' + \
+                               'SET r += rel_data_map.neo4j_props'
+            for batch in Orangeboard.make_batches(reltype_rels_params_list, batch_size):
+                rel_data_list = [{'source_node_uuid': rel_data_map['source_node_uuid'],
+                                  'target_node_uuid': rel_data_map['target_node_uuid'],
+                                  'neo4j_props': Orangeboard.make_neo4j_rel_props(rel_data_map, reltype)}
+                                 for rel_data_map in batch]
+                res = self.neo4j_run_cypher_query(cypher_query_str, {'rel_data_list': rel_data_list})
+                if self.debug:
+                    print(res.summary().counters)
+
+    @staticmethod
+    def get_neo4j_import_type(values):
+        """infers the ``neo4j-admin import`` column type for a list of property values"""
+        value_types = set(type(value) for value in values if value is not None)
+        if len(value_types) == 0 or value_types == {str}:
+            return 'string'
+        if value_types == {bool}:
+            return 'boolean'
+        if value_types == {int}:
+            return 'long'
+        if value_types <= {int, float}:
+            return 'double'
+        if value_types == {list}:
+            return 'string[]'
+        return 'string'
+
+    @staticmethod
+    def format_neo4j_import_value(value):
+        if value is None:
+            return ''
+        if type(value) == bool:
+            return 'true' if value else 'false'
+        if type(value) == list:
+            return Orangeboard.NEO4J_IMPORT_ARRAY_DELIMITER.join(str(item) for item in value)
+        return str(value)
+
+    @staticmethod
+    def write_neo4j_import_files(header_file_name, data_file_name, id_columns, rows):
+        """writes a header file and a data file in ``neo4j-admin import`` TSV format
+
+        :param id_columns: a list of (header field, key) pairs for the leading columns (e.g., ``:ID``)
+        :param rows: a list of ``dict`` objects, each with the ``id_columns`` keys and a ``props`` dict
+        """
+        prop_keys = sorted(set(key for row in rows for key in row['props'].keys()))
+        prop_types = {key: Orangeboard.get_neo4j_import_type([row['props'].get(key, None) for row in rows])
+                      for key in prop_keys}
+        with open(header_file_name, 'w', newline='') as header_file:
+            csv.writer(header_file, delimiter='\t').writerow([header for header, _ in id_columns] +
+                                                             [key + ':' + prop_types[key] for key in prop_keys])
+        with open(data_file_name, 'w', newline='') as data_file:
+            writer = csv.writer(data_file, delimiter='\t')
+            for row in rows:
+                writer.writerow([row[key] for _, key in id_columns] +
+                                [Orangeboard.format_neo4j_import_value(row['props'].get(key, None))
+                                 for key in prop_keys])
+
+    def neo4j_export_tsv(self, output_dir, seed_node=None):
+        """exports the graph (or the subgraph for one seed node) as ``neo4j-admin import`` TSV files
+        (``nodes_header.tsv``, ``nodes.tsv``, ``rels_header.tsv``, ``rels.tsv``) in ``output_dir``
+
+        :returns: a ``dict`` with the names of the four files
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        file_names = {file_key: os.path.join(output_dir, file_key + '.tsv') for file_key in
+                      ['nodes_header', 'nodes', 'rels_header', 'rels']}
+        # the "UUID:ID" column also stores the node's UUID property
+        node_rows = [{'id': node.uuid,
+                      'labels': Orangeboard.NEO4J_IMPORT_ARRAY_DELIMITER.join(sorted(node.get_labels())),
+                      'props': {key: value for key, value in node.get_props().items() if key != 'UUID'}}
+                     for nodes in self.get_nodes_to_push(seed_node).values() for node in nodes]
+        Orangeboard.write_neo4j_import_files(file_names['nodes_header'], file_names['nodes'],
+                                             [('UUID:ID', 'id'), (':LABEL', 'labels')], node_rows)
+        rel_rows = [{'start_id': rel_data_map['source_node_uuid'],
+                     'end_id': rel_data_map['target_node_uuid'],
+                     'type': reltype,
+                     'props': Orangeboard.make_neo4j_rel_props(rel_data_map, reltype)}
+                    for reltype, reltype_rels_params_list in self.get_rel_props_to_push(seed_node).items()
+                    for rel_data_map in reltype_rels_params_list]
+        Orangeboard.write_neo4j_import_files(file_names['rels_header'], file_names['rels'],
+                                             [(':START_ID', 'start_id'), (':END_ID', 'end_id'), (':TYPE', 'type')],
+                                             rel_rows)
+        return file_names
+
+    def neo4j_bulk_import(self, output_dir, database='graph.db', neo4j_admin='neo4j-admin', seed_node=None):
+        """exports the graph to TSV files in ``output_dir`` and loads them into a new Neo4j database
+        with ``neo4j-admin import``, which is much faster than ``neo4j_push`` for a large graph
+
+        The Neo4j server must be stopped and ``database`` must not already exist (this is how
+        KG2 is loaded; see ``code/kg2/tsv-to-neo4j.sh``).  After the server is restarted, call
+        ``neo4j_create_indexes()``.
+
+        :returns: nothing
+        """
+        file_names = self.neo4j_export_tsv(output_dir, seed_node)
+        command = [neo4j_admin, 'import',
+                   '--database=' + database,
+                   '--nodes', file_names['nodes_header'] + ',' + file_names['nodes'],
+                   '--relationships', file_names['rels_header'] + ',' + file_names['rels'],
+                   '--delimiter', 'TAB',
+                   '--array-delimiter', Orangeboard.NEO4J_IMPORT_ARRAY_DELIMITER,
+                   '--multiline-fields=true',
+                   '--report-file=' + os.path.join(output_dir, 'import.report')]
+        if self.debug:
+            print(' '.join(command))
+        subprocess.run(command, check=True)
 
     def test_issue_66():
         ob = Orangeboard(debug=True)
@@ -623,6 +782,62 @@ class Orangeboard:
         ob.neo4j_push()
         print(ob)        
 
+    def make_test_orangeboard():
+        ob = Orangeboard(debug=True)
+        ob.set_dict_reltype_dirs({'targets': True, 'interacts_with': False})
+        node1 = ob.add_node('drug', 'x', seed_node_bool=True, desc='drug x')
+        node2 = ob.add_node('uniprot_protein', 'w', seed_node_bool=False, desc='protein w')
+        node3 = ob.add_node('uniprot_protein', 'v', seed_node_bool=False, desc='protein v\twith a tab')
+        ob.add_rel('targets', 'ChEMBL', node1, node2, prob=0.5, publications='PMID:1')
+        ob.add_rel('interacts_with', 'PC2', node2, node3, extended_reltype='physically interacts with')
+        return ob
+
+    def test_incremental_push():
+        ob = Orangeboard.make_test_orangeboard()
+        rtxConfig = RTXConfiguration()
+        ob.neo4j_set_url(rtxConfig.neo4j_bolt)
+        ob.neo4j_set_auth(rtxConfig.neo4j_username, rtxConfig.neo4j_password)
+        ob.neo4j_push(batch_size=1)
+        ob.neo4j_push(incremental=True, batch_size=1)
+        node_count = ob.neo4j_run_cypher_query('MATCH (n:Base) RETURN count(n)').single()[0]
+        rel_count = ob.neo4j_run_cypher_query('MATCH ()-[r]->() RETURN count(r)').single()[0]
+        assert node_count == 3
+        assert rel_count == 3
+        print(ob)
+
+    def test_export_tsv():
+        ob = Orangeboard.make_test_orangeboard()
+        file_names = ob.neo4j_export_tsv('orangeboard-import-test')
+        tables = dict()
+        for file_key, file_name in file_names.items():
+            with open(file_name, 'r', newline='') as file:
+                print(file_name + ':\n' + file.read())
+                file.seek(0)
+                tables[file_key] = list(csv.reader(file, delimiter='\t'))
+        assert tables['nodes_header'] == [['UUID:ID', ':LABEL', 'category:string', 'expanded:boolean', 'name:string',
+                                           'rtx_name:string', 'seed_node_uuid:string']]
+        nodes_by_name = {row[5]: row for row in tables['nodes']}
+        assert len(tables['nodes']) == 3 and set(nodes_by_name.keys()) == {'x', 'w', 'v'}
+        uuids = {name: row[0] for name, row in nodes_by_name.items()}
+        assert nodes_by_name['x'] == [uuids['x'], 'Base;drug', 'drug', 'false', 'drug x', 'x', uuids['x']]
+        assert nodes_by_name['w'] == [uuids['w'], 'Base;uniprot_protein', 'uniprot_protein', 'false', 'protein w', 'w', uuids['x']]
+        # a tab in a value is quoted, and reads back unchanged
+        assert nodes_by_name['v'][4] == 'protein v\twith a tab'
+        assert tables['rels_header'] == [[':START_ID', ':END_ID', ':TYPE', 'is_defined_by:string', 'predicate:string',
+                                          'probability:double', 'provided_by:string', 'publications:string',
+                                          'relation:string', 'seed_node_uuid:string', 'source_node_uuid:string',
+                                          'target_node_uuid:string']]
+        assert len(tables['rels']) == 3
+        assert [uuids['x'], uuids['w'], 'targets', 'RTX', 'targets', '0.5', 'ChEMBL', 'PMID:1', 'targets',
+                uuids['x'], uuids['x'], uuids['w']] in tables['rels']
+        # the undirected relationship is exported in both directions
+        interacts_with_rows = [row for row in tables['rels'] if row[2] == 'interacts_with']
+        assert sorted((row[0], row[1]) for row in interacts_with_rows) == \
+            sorted([(uuids['w'], uuids['v']), (uuids['v'], uuids['w'])])
+        for row in interacts_with_rows:
+            assert row[5] == '' and row[6] == 'PC2' and row[8] == '`physically interacts with`'
+            assert row[10:12] == row[0:2]
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Builds the master knowledge graph')
     parser.add_argument('--runfunc', dest='runfunc')
@@ -18,10 +18,13 @@ __status__ = 'Prototype'
 
 # import requests
 # import requests_cache
+import os
 import sys
 import urllib.parse
+import numpy as np
 
 from cache_control_helper import CacheControlHelper
+from COHDLocalStore import COHDLocalStore
 
 # configure requests package to use the "QueryCOHD.sqlite" cache
 # requests_cache.install_cache('QueryCOHD')
@@ -54,6 +57,49 @@ class QueryCOHD:
         'get_concept_ancestors':                '/omop/conceptAncestors',
         'get_concept_descendants':              '/omop/conceptDescendants'
     }
+    # local copy of the COHD data (see COHDLocalStore.py); lookups that it can answer do not call the API
+    LOCAL_STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cohd_local.sqlite')
+    _local_store = None
+    _local_store_checked = False
+
+    @staticmethod
+    def get_local_store():
+        """The local COHD store (opened the first time it is needed), or None if there is no local store file"""
+        if not QueryCOHD._local_store_checked:
+            QueryCOHD._local_store_checked = True
+            if os.path.isfile(QueryCOHD.LOCAL_STORE_FILE):
+                QueryCOHD._local_store = COHDLocalStore(QueryCOHD.LOCAL_STORE_FILE)
+        return QueryCOHD._local_store
+
+    @staticmethod
+    def set_local_store(local_store):
+        """Use the given COHDLocalStore (or None, to always call the API)"""
+        QueryCOHD._local_store = local_store
+        QueryCOHD._local_store_checked = True
+
+    @staticmethod
+    def __get_local_store_for(dataset_id):
+        local_store = QueryCOHD.get_local_store()
+        if local_store is not None and local_store.has_dataset(dataset_id):
+            return local_store
+        return None
+
+    @staticmethod
+    def __get_local_paired_result(concept_id_1, concept_id_2, dataset_id, stat_names):
+        """
+        The statistics of a pair of concepts from the local store, as a result dictionary of the COHD API
+        :return: result dictionary, {} if the pair has no data, or None if the local store does not have the dataset
+        """
+        local_store = QueryCOHD.__get_local_store_for(dataset_id)
+        if local_store is None:
+            return None
+        stats = local_store.get_paired_concept_stats([(concept_id_1, concept_id_2)], dataset_id)
+        if np.isnan(stats['concept_count'][0]):
+            return {}
+        result = {'concept_id_1': int(concept_id_1), 'concept_id_2': int(concept_id_2), 'dataset_id': dataset_id}
+        for stat_name, result_name in stat_names.items():
+            result[result_name] = int(stats[stat_name][0]) if stat_name == 'concept_count' else float(stats[stat_name][0])
+        return result
 
     @staticmethod
     def __access_api(handler, url_suffix):
@@ -127,6 +173,9 @@ class QueryCOHD:
         """
         if not isinstance(node_label, str) or not isinstance(dataset_id, int) or not isinstance(domain, str):
             return []
+        local_store = QueryCOHD.__get_local_store_for(dataset_id)
+        if local_store is not None:
+            return local_store.find_concept_ids(node_label, domain=domain, dataset_id=dataset_id, min_count=min_count)
         handler = QueryCOHD.HANDLER_MAP['find_concept_id']
         url_suffix = "q=" + node_label + "&dataset_id=" + str(dataset_id) + "&min_count=" + str(min_count)
         if domain != "":
@@ -165,6 +214,12 @@ class QueryCOHD:
         """
         if not isinstance(concept_id1, str) or not isinstance(concept_id2, str) or not isinstance(dataset_id, int):
             return {}
+        if concept_id1.isdigit() and concept_id2.isdigit() and concept_id1 != concept_id2:
+            local_result = QueryCOHD.__get_local_paired_result(concept_id1, concept_id2, dataset_id,
+                                                                {'concept_count': 'concept_count',
+                                                                 'concept_frequency': 'concept_frequency'})
+            if local_result is not None:
+                return local_result
         handler = QueryCOHD.HANDLER_MAP['get_paired_concept_freq']
         url_suffix = "q=" + urllib.parse.quote_plus(concept_id1 + ',' + concept_id2) + "&dataset_id=" + str(dataset_id)
         res_json = QueryCOHD.__access_api(handler, url_suffix)
@@ -379,6 +434,11 @@ class QueryCOHD:
         """
         if not isinstance(curie, str) or not isinstance(distance, int):
             return []
+        local_store = QueryCOHD.get_local_store()
+        if local_store is not None:
+            curie_to_xrefs = local_store.get_xref_to_OMOP_batch([curie], distance)
+            if curie in curie_to_xrefs:
+                return curie_to_xrefs[curie]
         handler = QueryCOHD.HANDLER_MAP['get_xref_to_OMOP']
         url_suffix = 'curie=' + curie + "&distance=" + str(distance)
         res_json = QueryCOHD.__access_api(handler, url_suffix)
@@ -703,6 +763,11 @@ class QueryCOHD:
         """
         if not isinstance(concept_id_1, str) or not isinstance(concept_id_2, str) or not isinstance(domain, str) or not isinstance(dataset_id, int):
             return []
+        if concept_id_2 != "" and domain == "" and concept_id_1.isdigit() and concept_id_2.isdigit():
+            local_result = QueryCOHD.__get_local_paired_result(concept_id_1, concept_id_2, dataset_id,
+                                                                {'chi_square': 'chi_square', 'p-value': 'p-value'})
+            if local_result is not None:
+                return [local_result] if local_result else []
         handler = QueryCOHD.HANDLER_MAP['get_chi_square']
         url_suffix = 'concept_id_1=' + concept_id_1 + '&dataset_id=' + str(dataset_id)
         if domain != "":
@@ -761,6 +826,12 @@ class QueryCOHD:
         """
         if not isinstance(concept_id_1, str) or not isinstance(concept_id_2, str) or not isinstance(domain, str) or not isinstance(dataset_id, int):
             return []
+        if concept_id_2 != "" and domain == "" and concept_id_1.isdigit() and concept_id_2.isdigit():
+            local_result = QueryCOHD.__get_local_paired_result(concept_id_1, concept_id_2, dataset_id,
+                                                                {'expected_count': 'expected_count', 'ln_ratio': 'ln_ratio',
+                                                                 'concept_count': 'observed_count'})
+            if local_result is not None:
+                return [local_result] if local_result else []
         handler = QueryCOHD.HANDLER_MAP['get_obs_exp_ratio']
         url_suffix = 'concept_id_1=' + concept_id_1 + '&dataset_id=' + str(dataset_id)
         if domain != "":
@@ -921,6 +992,9 @@ class QueryCOHD:
         """
         if not isinstance(dataset_id, int) or dataset_id <= 0:
             return {}
+        local_store = QueryCOHD.__get_local_store_for(dataset_id)
+        if local_store is not None:
+            return {'count': local_store.get_patient_count(dataset_id), 'dataset_id': dataset_id}
         handler = QueryCOHD.HANDLER_MAP['get_patient_count']
         url_suffix = 'dataset_id=' + str(dataset_id)
         res_json = QueryCOHD.__access_api(handler, url_suffix)
@@ -1065,6 +1139,67 @@ class QueryCOHD:
                 results_list = results
         return results_list
 
+    @staticmethod
+    def get_xref_to_OMOP_batch(curies, distance=2):
+        """Cross-reference many CURIEs to OMOP standard concepts (see get_xref_to_OMOP). The CURIEs are looked up in the
+        local store all at once; the API is only called for the CURIEs that the local store does not have.
+
+        Args:
+            curies (list): CURIEs of the concepts to map, e.g., ["DOID:8398", "DOID:9352"]
+
+            distance (int): Mapping distance (see get_xref_to_OMOP). Default: 2.
+
+        Returns:
+            dictionary: CURIE -> array of cross-reference dictionaries (empty if no data obtained)
+        """
+        curies = [curie for curie in set(curies) if isinstance(curie, str)]
+        if not isinstance(distance, int):
+            return {curie: [] for curie in curies}
+        curie_to_xrefs = dict()
+        local_store = QueryCOHD.get_local_store()
+        if local_store is not None:
+            curie_to_xrefs = local_store.get_xref_to_OMOP_batch(curies, distance)
+        for curie in curies:
+            if curie not in curie_to_xrefs:
+                curie_to_xrefs[curie] = QueryCOHD.get_xref_to_OMOP(curie, distance)
+        return curie_to_xrefs
+
+    @staticmethod
+    def get_paired_concept_stats_batch(concept_pairs, stat_name, dataset_id=1):
+        """Retrieves a statistic of many pairs of concepts. If the local store has the dataset, the statistic of all the
+        pairs is computed at once from its counts; otherwise the API is called for each pair.
+
+        Args:
+            concept_pairs (list): list of pairs of OMOP ids, e.g., [("192855", "2008271")]
+
+            stat_name (str): 'concept_frequency' (as in get_paired_concept_freq), 'ln_ratio' (as in get_obs_exp_ratio)
+                or 'p-value' (as in get_chi_square)
+
+            dataset_id (int): The dataset_id of the dataset to query. Default dataset is the 5-year dataset (1).
+
+        Returns:
+            numpy array: the statistic of each pair of concepts, NaN for the pairs with no data
+        """
+        if stat_name not in ('concept_frequency', 'ln_ratio', 'p-value'):
+            raise ValueError(f"unknown paired concept statistic: {stat_name}")
+        concept_pairs = list(concept_pairs)
+        local_store = QueryCOHD.__get_local_store_for(dataset_id)
+        if local_store is not None:
+            return local_store.get_paired_concept_stats(concept_pairs, dataset_id)[stat_name]
+        values = np.full(len(concept_pairs), np.nan)
+        for index, (concept_id_1, concept_id_2) in enumerate(concept_pairs):
+            if stat_name == 'concept_frequency':
+                result = QueryCOHD.get_paired_concept_freq(concept_id_1, concept_id_2, dataset_id)
+            elif stat_name == 'ln_ratio':
+                results = QueryCOHD.get_obs_exp_ratio(concept_id_1, concept_id_2=concept_id_2, dataset_id=dataset_id)
+                result = results[0] if results else None
+            else:
+                results = QueryCOHD.get_chi_square(concept_id_1, concept_id_2=concept_id_2, dataset_id=dataset_id)
+                result = results[0] if results else None
+            if result and stat_name in result:
+                values[index] = result[stat_name]
+        return values
+
 
 # if __name__ == '__main__':
     # print(QueryCOHD.find_concept_ids("cancer", "Condition", 1))
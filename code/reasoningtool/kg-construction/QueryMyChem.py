@@ -26,6 +26,7 @@ from QueryPubChem import QueryPubChem
 
 class QueryMyChem:
     TIMEOUT_SEC = 120
+    BATCH_SIZE = 1000   # maximum number of IDs in one POST to the batch annotation endpoint
     API_BASE_URL = 'http://mychem.info/v1'
     HANDLER_MAP = {
         'get_chemical_substance': 'chem/{id}',
@@ -67,6 +68,34 @@ class QueryMyChem:
             result_str = json.dumps(json_dict)
         return result_str
 
+    @staticmethod
+    def __access_api_batch(handler, data):
+        requests = CacheControlHelper()
+        url = QueryMyChem.API_BASE_URL + '/' + handler
+        try:
+            res = requests.post(url, data=data, timeout=QueryMyChem.TIMEOUT_SEC)
+        except requests.exceptions.Timeout:
+            print('Timeout in QueryMyChem for URL: ' + url, file=sys.stderr)
+            return None
+        except BaseException as e:
+            print('%s received in QueryMyChem for URL: %s' % (e, url), file=sys.stderr)
+            return None
+        status_code = res.status_code
+        if status_code != 200:
+            print('Status code ' + str(status_code) + ' for url: ' + url, file=sys.stderr)
+            return None
+        return res.json()
+
+    @staticmethod
+    def __get_chebi_definition(json_dict):
+        result_str = 'None'
+        if "chebi" in json_dict.keys():
+            if type(json_dict['chebi']) is dict and "definition" in json_dict['chebi'].keys():
+                result_str = json_dict['chebi']['definition']
+            if type(json_dict['chebi']) is list and "definition" in json_dict['chebi'][0].keys():
+                result_str = json_dict['chebi'][0]['definition']
+        return result_str
+
     @staticmethod
     def __get_description(entity_type, entity_id):
         handler = QueryMyChem.HANDLER_MAP[entity_type].format(id=entity_id)
@@ -75,11 +104,7 @@ class QueryMyChem:
         if results is not None:
             #   remove all \n characters using json api and convert the string to one line
             json_dict = json.loads(results)
-            if "chebi" in json_dict.keys():
-                if type(json_dict['chebi']) is dict and "definition" in json_dict['chebi'].keys():
-                    result_str = json_dict['chebi']['definition']
-                if type(json_dict['chebi']) is list and "definition" in json_dict['chebi'][0].keys():
-                    result_str = json_dict['chebi'][0]['definition']
+            result_str = QueryMyChem.__get_chebi_definition(json_dict)
         return result_str
 
     @staticmethod
@@ -94,6 +119,34 @@ class QueryMyChem:
             chemical_substance_id = "CHEMBL" + chemical_substance_id[7:]
         return QueryMyChem.__get_description("get_chemical_substance", chemical_substance_id)
 
+    @staticmethod
+    def get_chemical_substance_descriptions(chemical_substance_ids):
+        """
+        Batch version of get_chemical_substance_description
+        :param chemical_substance_ids: a list of ChEMBL IDs
+        :return: a list of the descriptions of the chemical substances, in the same order
+        """
+        descs = dict()
+        for start in range(0, len(chemical_substance_ids), QueryMyChem.BATCH_SIZE):
+            batch_ids = chemical_substance_ids[start:start + QueryMyChem.BATCH_SIZE]
+            query_to_id = dict()
+            for chemical_substance_id in batch_ids:
+                if chemical_substance_id[:7].upper() == "CHEMBL:":
+                    query_to_id["CHEMBL" + chemical_substance_id[7:]] = chemical_substance_id
+                else:
+                    query_to_id[chemical_substance_id] = chemical_substance_id
+            results = QueryMyChem.__access_api_batch('chem', {'ids': ','.join(query_to_id.keys()),
+                                                              'fields': 'chebi.definition'})
+            if results is None:
+                for chemical_substance_id in batch_ids:
+                    descs[chemical_substance_id] = QueryMyChem.get_chemical_substance_description(chemical_substance_id)
+                continue
+            for json_dict in results:
+                chemical_substance_id = query_to_id.get(json_dict.get('query', None), None)
+                if chemical_substance_id is not None and chemical_substance_id not in descs:
+                    descs[chemical_substance_id] = QueryMyChem.__get_chebi_definition(json_dict)
+        return [descs.get(chemical_substance_id, 'None') for chemical_substance_id in chemical_substance_ids]
+
     @staticmethod
     def get_mesh_id(chemical_substance_id):
         if chemical_substance_id[:7].upper() == "CHEMBL:":
@@ -32,6 +32,7 @@ class QueryMyGene:
 
     TIMEOUT_SEC = 120
     API_BASE_URL = 'http://mygene.info/v3'
+    BATCH_SIZE = 1000   # maximum number of query terms in one POST to the batch query endpoint
     HANDLER_MAP = {
         'query': 'query',
         'gene': 'gene'
@@ -68,6 +69,61 @@ class QueryMyGene:
         else:
             return res.json()
 
+    @staticmethod
+    def __access_api_batch(handler, data):
+        requests = CacheControlHelper()
+        url = QueryMyGene.API_BASE_URL + '/' + handler
+        try:
+            res = requests.post(url, data=data, timeout=QueryMyGene.TIMEOUT_SEC)
+        except requests.exceptions.Timeout:
+            print('Timeout in QueryMyGene for URL: ' + url, file=sys.stderr)
+            return None
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except BaseException as e:
+            print('%s received in QueryMyGene for URL: %s' % (e, url), file=sys.stderr)
+            return None
+        status_code = res.status_code
+        if status_code != 200:
+            print('Status code ' + str(status_code) + ' for url: ' + url, file=sys.stderr)
+            return None
+        return res.json()
+
+    @staticmethod
+    def __get_summaries(node_ids, scope):
+        """
+        Queries the batch endpoint for the summaries of up to BATCH_SIZE genes
+        :param node_ids: a list of CURIE IDs, e.g., ["UniProtKB:O60884", ...]
+        :param scope: the MyGene field that the local IDs are matched in, e.g., "uniprot"
+        :return: a dict mapping each node ID to its summary ("None" if there is no summary), or
+                 None if the request failed
+        """
+        local_id_to_node_id = {node_id.split(':')[-1].strip(): node_id for node_id in node_ids}
+        data = {'q': ','.join(local_id_to_node_id.keys()), 'scopes': scope, 'fields': 'summary'}
+        results = QueryMyGene.__access_api_batch(QueryMyGene.HANDLER_MAP['query'], data)
+        if results is None:
+            return None
+        summaries = dict.fromkeys(node_ids, "None")
+        found_node_ids = set()
+        # the hits for each query term are in order of score, so the first one is the top hit
+        for hit in results:
+            node_id = local_id_to_node_id.get(hit.get('query', None), None)
+            if node_id is not None and node_id not in found_node_ids:
+                found_node_ids.add(node_id)
+                summaries[node_id] = hit.get('summary', "None")
+        return summaries
+
+    def __get_descs(self, node_ids, scope, get_desc):
+        str_node_ids = [node_id for node_id in node_ids if isinstance(node_id, str)]
+        descs = dict()
+        for start in range(0, len(str_node_ids), QueryMyGene.BATCH_SIZE):
+            batch_node_ids = str_node_ids[start:start + QueryMyGene.BATCH_SIZE]
+            batch_descs = QueryMyGene.__get_summaries(batch_node_ids, scope)
+            if batch_descs is None:
+                batch_descs = {node_id: get_desc(node_id) for node_id in batch_node_ids}
+            descs.update(batch_descs)
+        return [descs.get(node_id, "None") for node_id in node_ids]
+
     @staticmethod
     def unnest(lst, skip_type):
         """
@@ -468,6 +524,21 @@ class QueryMyGene:
                         desc = result_dict["hits"][0]["summary"]
         return desc
 
+    def get_protein_descs(self, protein_ids):
+        """
+        Batch version of get_protein_desc
+        :param protein_ids: a list of UniProtKB CURIE IDs
+        :return: a list of the descriptions of the proteins, in the same order
+        """
+        return self.__get_descs(protein_ids, 'uniprot', self.get_protein_desc)
+
+    def get_microRNA_descs(self, microrna_ids):
+        """
+        Batch version of get_microRNA_desc
+        :param microrna_ids: a list of NCBIGene CURIE IDs
+        :return: a list of the descriptions of the microRNAs, in the same order
+        """
+        return self.__get_descs(microrna_ids, 'entrezgene', self.get_microRNA_desc)
 
     def get_protein_name(self, protein_id):
         if not isinstance(protein_id, str):
@@ -35,6 +35,11 @@ If you want to update the descriptions of all types of nodes, please use the def
 If you want to update the descriptions of the specified nodes, please use the runfunc argument to specify the method:
         $ cd [git repo]/code/reasoningtool/kg-construction
         $ python3 UpdateNodesInfo.py -u xxx -p xxx --runfunc=update_disease_nodes_desc 1>stdout_desc.log 2>stderr_desc.log
+
+The descriptions of protein, microRNA and chemical_substance nodes are fetched with the batch endpoints of MyGene
+and MyChem; the other descriptions are fetched concurrently (see the numThreads argument), with a limit on the
+request rate for each source. The progress of an update is saved in a checkpoint file in the directory given by
+the checkpointDir argument, and rerunning an interrupted update resumes from there.
 """
 
 __author__ = 'Deqing Qu'
@@ -49,6 +54,7 @@ __status__ = 'Prototype'
 import argparse
 import sys
 import os
+import concurrent.futures
 
 from Neo4jConnection import Neo4jConnection
 from QueryEBIOLS import QueryEBIOLS
@@ -58,6 +64,7 @@ from QueryMyChem import QueryMyChem
 from QueryReactome import QueryReactome
 from QueryKEGG import QueryKEGG
 from QueryHMDB import QueryHMDB
+import cache_control_helper
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
 from RTXConfiguration import RTXConfiguration
@@ -75,10 +82,30 @@ class UpdateNodesInfo:
         'bio_process': 'QueryBioLink'
     }
 
-    def __init__(self, user, password, url ='bolt://localhost:7687'):
+    # number of nodes whose descriptions are written to Neo4j in one transaction
+    UPDATE_CHUNK_SIZE = 10000
+
+    # number of threads that fetch descriptions from sources that have no batch endpoint
+    DEFAULT_MAX_WORKERS = 8
+
+    # network requests per second, for each host that the descriptions are fetched from
+    SOURCE_MAX_REQUESTS_PER_SEC = {'www.ebi.ac.uk': 10,
+                                   'mygene.info': 10,
+                                   'mychem.info': 10,
+                                   'reactome.org': 10,
+                                   'api.omim.org': 4,
+                                   'rest.kegg.jp': 3,
+                                   'www.hmdb.ca': 5}
+
+    def __init__(self, user, password, url ='bolt://localhost:7687', max_workers=DEFAULT_MAX_WORKERS,
+                 checkpoint_dir='.'):
         self.neo4j_user = user
         self.neo4j_password = password
         self.neo4j_url = url
+        self.max_workers = max_workers
+        self.checkpoint_dir = checkpoint_dir
+        for host, max_requests_per_sec in UpdateNodesInfo.SOURCE_MAX_REQUESTS_PER_SEC.items():
+            cache_control_helper.set_rate_limit(host, max_requests_per_sec)
 
     def __update_nodes(self, node_type):
         conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
@@ -145,342 +172,134 @@ class UpdateNodesInfo:
     def update_bio_process_nodes(self):
         self.__update_nodes('bio_process')
 
-    def update_anatomy_nodes_desc(self):
+    def __fetch_concurrently(self, get_desc, node_ids):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(get_desc, node_ids))
+
+    def __get_checkpoint_file_name(self, node_type):
+        return os.path.join(self.checkpoint_dir, 'UpdateNodesInfo-' + node_type + '.checkpoint')
+
+    @staticmethod
+    def __write_nodes_desc(update_nodes_mtd, nodes_array, checkpoint_file):
+        update_nodes_mtd(nodes_array)
+        for node in nodes_array:
+            checkpoint_file.write(node['node_id'] + '\n')
+        checkpoint_file.flush()
+
+    def __update_nodes_desc(self, node_type, fetch_descs, update_nodes_mtd_name=None):
+        """
+        Fetches the descriptions of all nodes of a type and writes them to Neo4j
+        :param node_type: the node type, as used in the names of the Neo4jConnection methods
+        :param fetch_descs: a function that takes a list of node IDs and returns the list of their descriptions
+        :param update_nodes_mtd_name: the Neo4jConnection method that writes the descriptions, if it is not
+                                      named "update_<node_type>_nodes_desc"
+        The descriptions are written in chunks of UPDATE_CHUNK_SIZE nodes, each in a background thread while
+        the next chunk is being fetched. The IDs of the written nodes are appended to a checkpoint file, so
+        that an interrupted update resumes with the nodes that have not been written yet.
+        """
         conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_anatomy_nodes()
-        print("the number of anatomy nodes: %d" % len(nodes))
+        nodes = getattr(conn, "get_" + node_type + "_nodes")()
+        print("the number of %s nodes: %d" % (node_type, len(nodes)))
+        if update_nodes_mtd_name is None:
+            update_nodes_mtd_name = "update_" + node_type + "_nodes_desc"
+        update_nodes_mtd = getattr(conn, update_nodes_mtd_name)
 
         from time import time
         t = time()
 
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryEBIOLS.get_anatomy_description(node_id)
-            nodes_array.append(node)
+        checkpoint_file_name = self.__get_checkpoint_file_name(node_type)
+        if os.path.exists(checkpoint_file_name):
+            with open(checkpoint_file_name, 'r') as checkpoint_file:
+                written_node_ids = set(line.rstrip('\n') for line in checkpoint_file)
+            nodes = [node_id for node_id in nodes if node_id not in written_node_ids]
+            print("resuming from checkpoint; %d %s nodes left to update" % (len(nodes), node_type))
 
-        print("anatomy api pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_anatomy_nodes_desc(nodes_array[start:end])
-
-        print("anatomy total time: %f" % (time() - t))
+        success_count = 0
+        with open(checkpoint_file_name, 'a') as checkpoint_file, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as writer:
+            pending_write = None
+            for start in range(0, len(nodes), UpdateNodesInfo.UPDATE_CHUNK_SIZE):
+                node_ids = nodes[start:start + UpdateNodesInfo.UPDATE_CHUNK_SIZE]
+                descs = fetch_descs(node_ids)
+                nodes_array = [{'node_id': node_id, 'desc': desc} for node_id, desc in zip(node_ids, descs)]
+                success_count += sum(desc is not None and desc != "None" for desc in descs)
+                if pending_write is not None:
+                    pending_write.result()
+                pending_write = writer.submit(UpdateNodesInfo.__write_nodes_desc, update_nodes_mtd,
+                                              nodes_array, checkpoint_file)
+            if pending_write is not None:
+                pending_write.result()
+        os.remove(checkpoint_file_name)
+
+        print("%s success_count = %d" % (node_type, success_count))
+        print("%s total time: %f" % (node_type, time() - t))
 
         conn.close()
 
-    def update_phenotype_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_phenotype_nodes()
-        print("the number of phenotype nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryEBIOLS.get_phenotype_description(node_id)
-            nodes_array.append(node)
-
-        print("phenotype api pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_phenotype_nodes_desc(nodes_array[start:end])
-
-        print("phenotype total time: %f" % (time() - t))
+    def update_anatomy_nodes_desc(self):
+        self.__update_nodes_desc('anatomy',
+                                 lambda node_ids: self.__fetch_concurrently(QueryEBIOLS.get_anatomy_description,
+                                                                            node_ids))
 
-        conn.close()
+    def update_phenotype_nodes_desc(self):
+        self.__update_nodes_desc('phenotype',
+                                 lambda node_ids: self.__fetch_concurrently(QueryEBIOLS.get_phenotype_description,
+                                                                            node_ids))
 
     def update_microRNA_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_microRNA_nodes()
-        print("the number of microRNA nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
         mg = QueryMyGene()
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = mg.get_microRNA_desc(node_id)
-            nodes_array.append(node)
-
-        print("microRNA api pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_microRNA_nodes_desc(nodes_array[start:end])
-
-        print("microRNA total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('microRNA', mg.get_microRNA_descs)
 
     def update_pathway_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_pathway_nodes()
-        print("the number of pathway: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryReactome.get_pathway_desc(node_id)
-            nodes_array.append(node)
-
-        print("pathway api pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_pathway_nodes_desc(nodes_array[start:end])
-
-        print("pathway total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('pathway',
+                                 lambda node_ids: self.__fetch_concurrently(QueryReactome.get_pathway_desc,
+                                                                            node_ids))
 
     def update_protein_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_protein_nodes()
-        print("the number of protein nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
         mg = QueryMyGene()
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = mg.get_protein_desc(node_id)
-            nodes_array.append(node)
-
-        print("protein api pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_protein_nodes_desc(nodes_array[start:end])
-
-        print("protein total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('protein', mg.get_protein_descs)
 
     def update_disease_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_disease_nodes()
-        print("the number of disease nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
         qo = QueryOMIM()
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
+
+        def get_disease_desc(node_id):
             if node_id[:4] == "OMIM":
-                node['desc'] = qo.disease_mim_to_description(node_id)
+                return qo.disease_mim_to_description(node_id)
             elif node_id[:4] == "DOID":
-                node['desc'] = QueryEBIOLS.get_disease_description(node_id)
-            nodes_array.append(node)
-
-        print("disease api pulling time: %f" % (time() - t))
+                return QueryEBIOLS.get_disease_description(node_id)
+            return None
 
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_disease_nodes_desc(nodes_array[start:end])
-
-        print("disease total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('disease',
+                                 lambda node_ids: self.__fetch_concurrently(get_disease_desc, node_ids))
 
     def update_chemical_substance_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_chemical_substance_nodes()
-        print("the number of chemical_substance nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryMyChem.get_chemical_substance_description(node_id)
-            nodes_array.append(node)
-
-        print("chemical_substance pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_chemical_substance_nodes_desc(nodes_array[start:end])
-
-        print("chemical substance total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('chemical_substance', QueryMyChem.get_chemical_substance_descriptions)
 
     def update_bio_process_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_bio_process_nodes()
-        print("the number of bio_process nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryEBIOLS.get_bio_process_description(node_id)
-            nodes_array.append(node)
-
-        print("bio_process pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_bio_process_nodes_desc(nodes_array[start:end])
-
-        print("bio_process total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('bio_process',
+                                 lambda node_ids: self.__fetch_concurrently(QueryEBIOLS.get_bio_process_description,
+                                                                            node_ids))
 
     def update_cellular_component_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_cellular_component_nodes()
-        print("the number of cellular_component nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            # print("no %d" % i)
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryEBIOLS.get_cellular_component_description(node_id)
-            nodes_array.append(node)
-
-        print("cellular_component pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_cellular_component_nodes_desc(nodes_array[start:end])
-
-        print("cellular_component total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('cellular_component',
+                                 lambda node_ids: self.__fetch_concurrently(
+                                     QueryEBIOLS.get_cellular_component_description, node_ids))
 
     def update_molecular_function_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_molecular_function_nodes()
-        print("the number of molecular_function nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            # print("no %d" % i)
-            node = dict()
-            node['node_id'] = node_id
-            node['desc'] = QueryEBIOLS.get_molecular_function_description(node_id)
-            nodes_array.append(node)
-
-        print("molecular_function pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_molecular_function_nodes_desc(nodes_array[start:end])
-
-        print("molecular_function total time: %f" % (time() - t))
-
-        conn.close()
+        self.__update_nodes_desc('molecular_function',
+                                 lambda node_ids: self.__fetch_concurrently(
+                                     QueryEBIOLS.get_molecular_function_description, node_ids))
 
     def update_metabolite_nodes_desc(self):
-        conn = Neo4jConnection(self.neo4j_url, self.neo4j_user, self.neo4j_password)
-        nodes = conn.get_metabolite_nodes()
-        print("the number of metabolite nodes: %d" % len(nodes))
-
-        from time import time
-        t = time()
-
-        success_count = 0
-        nodes_array = []
-        for i, node_id in enumerate(nodes):
-            # if i % 100 == 0:
-            #     print("no %d" % i)
-            node = dict()
-            node['node_id'] = node_id
+        def get_metabolite_desc(node_id):
             hmdb_id = QueryKEGG.map_kegg_compound_to_hmdb_id(node_id)
             if hmdb_id:
                 hmdb_url = 'http://www.hmdb.ca/metabolites/' + hmdb_id
-                node['desc'] = QueryHMDB.get_compound_desc(hmdb_url)
-                if node['desc'] != "None":
-                    success_count += 1
-            else:
-                node['desc'] = 'None'
-            nodes_array.append(node)
-        print("success_count = " + str(success_count))
-        print("metabolite pulling time: %f" % (time() - t))
-
-        nodes_nums = len(nodes_array)
-        chunk_size = 10000
-        group_nums = nodes_nums // chunk_size + 1
-        for i in range(group_nums):
-            start = i * chunk_size
-            end = (i + 1) * chunk_size if (i + 1) * chunk_size < nodes_nums else nodes_nums
-            conn.update_metabolite_nodes_desc(nodes_array[start:end])
-
-        print("metabolite total time: %f" % (time() - t))
+                return QueryHMDB.get_compound_desc(hmdb_url)
+            return 'None'
 
-        conn.close()
+        self.__update_nodes_desc('metabolite',
+                                 lambda node_ids: self.__fetch_concurrently(get_metabolite_desc, node_ids))
 
     def update_all(self):
         # UpdateNodesInfo.update_anatomy_nodes()
@@ -518,6 +337,12 @@ if __name__ == '__main__':
                              "staging. (default: Production)", default='Production')
 
     parser.add_argument('--runfunc', dest='runfunc')
+    parser.add_argument('--numThreads', type=int, default=UpdateNodesInfo.DEFAULT_MAX_WORKERS,
+                        help="The number of threads that fetch descriptions from sources without a batch endpoint. "
+                             "(default: %d)" % UpdateNodesInfo.DEFAULT_MAX_WORKERS)
+    parser.add_argument('--checkpointDir', default='.',
+                        help="The directory of the checkpoint files from which an interrupted update resumes. "
+                             "(default: .)")
     args = parser.parse_args()
 
     # create the RTXConfiguration object
@@ -525,7 +350,8 @@ if __name__ == '__main__':
     rtxConfig.live = args.live
 
     #   create UpdateNodesInfo object
-    ui = UpdateNodesInfo(rtxConfig.neo4j_username, rtxConfig.neo4j_password, rtxConfig.neo4j_bolt)
+    ui = UpdateNodesInfo(rtxConfig.neo4j_username, rtxConfig.neo4j_password, rtxConfig.neo4j_bolt,
+                         max_workers=args.numThreads, checkpoint_dir=args.checkpointDir)
 
     args_dict = vars(args)
     if args_dict.get('runfunc', None) is not None:
@@ -1,8 +1,13 @@
 import calendar
+import threading
+import time
+from urllib.parse import urlparse
+from cachecontrol.adapter import CacheControlAdapter
 from cachecontrol.heuristics import BaseHeuristic
 from datetime import datetime, timedelta
 from email.utils import parsedate, formatdate
 import requests
+from requests.adapters import HTTPAdapter
 from cachecontrol import CacheControl
 from cachecontrol.caches.file_cache import FileCache
 
@@ -26,10 +31,61 @@ class CustomHeuristic(BaseHeuristic):
         return '110 - "%s"' % msg
 
 
+class RateLimiter(object):
+    """Spaces out requests to each host so that no more than a set number of requests
+    per second are sent to it, across all threads of the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.min_interval_sec = dict()
+        self.next_request_time = dict()
+
+    def set_rate_limit(self, host, max_requests_per_sec):
+        with self.lock:
+            if max_requests_per_sec is None:
+                self.min_interval_sec.pop(host, None)
+            else:
+                self.min_interval_sec[host] = 1.0 / max_requests_per_sec
+
+    def wait(self, host):
+        with self.lock:
+            min_interval_sec = self.min_interval_sec.get(host, None)
+            if min_interval_sec is None:
+                return
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time.get(host, now))
+            self.next_request_time[host] = request_time + min_interval_sec
+        # sleep outside the lock so that requests to other hosts are not held up
+        if request_time > now:
+            time.sleep(request_time - now)
+
+
+rate_limiter = RateLimiter()
+
+
+def set_rate_limit(host, max_requests_per_sec):
+    """Limit the requests sent over the network to `host` (e.g., 'www.uniprot.org');
+    responses served from the web cache are not counted. `None` removes the limit."""
+    rate_limiter.set_rate_limit(host, max_requests_per_sec)
+
+
+class RateLimitedHTTPAdapter(HTTPAdapter):
+
+    def send(self, request, **kwargs):
+        rate_limiter.wait(urlparse(request.url).hostname)
+        return super(RateLimitedHTTPAdapter, self).send(request, **kwargs)
+
+
+class RateLimitedCacheControlAdapter(CacheControlAdapter, RateLimitedHTTPAdapter):
+    # CacheControlAdapter only calls down to RateLimitedHTTPAdapter.send on a cache miss
+    pass
+
+
 class CacheControlHelper(object):
 
     def __init__(self):
-        self.sess = CacheControl(requests.session(), heuristic=CustomHeuristic(days=30), cache=FileCache('.web_cache'))
+        self.sess = CacheControl(requests.session(), heuristic=CustomHeuristic(days=30), cache=FileCache('.web_cache'),
+                                 adapter_class=RateLimitedCacheControlAdapter)
         self.exceptions = requests.exceptions
 
     def get(self, url, params=None, timeout=120, cookies=None, headers={'Accept': 'application/json'}):
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import os, sys
+import math
+import shutil
+import tempfile
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parentdir)
+
+from COHDLocalStore import COHDLocalStore
+
+# a small synthetic COHD dataset
+PATIENT_COUNT = 1000
+CONCEPTS = [(192855, 'Cancer in situ of urinary bladder', 'Condition', 'SNOMED', 'Clinical Finding', '92546004'),
+            (80180, 'Osteoarthritis', 'Condition', 'SNOMED', 'Clinical Finding', '396275006'),
+            (1177480, 'ibuprofen', 'Drug', 'RxNorm', 'Ingredient', '5640'),
+            (19019073, 'Ibuprofen 600 MG Oral Tablet', 'Drug', 'RxNorm', 'Clinical Drug', '197806')]
+CONCEPT_COUNTS = [(192855, 50), (80180, 200), (1177480, 100), (19019073, 10)]
+PAIRED_COUNTS = [(80180, 1177480, 40), (192855, 1177480, 5)]
+XREFS = [('DOID:8398', 80180, 2), ('DOID:8398', 192855, 3)]
+
+
+class COHDLocalStoreTestCases(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = COHDLocalStore(os.path.join(self.tmp_dir, 'cohd_local.sqlite'))
+        self.store.add_dataset(3, PATIENT_COUNT)
+        self.store.add_concepts(CONCEPTS)
+        self.store.add_concept_counts(3, CONCEPT_COUNTS)
+        self.store.add_paired_concept_counts(3, PAIRED_COUNTS)
+        self.store.add_xrefs_to_omop(XREFS)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_has_dataset(self):
+        self.assertTrue(self.store.has_dataset(3))
+        self.assertFalse(self.store.has_dataset(1))
+        self.assertEqual(self.store.get_patient_count(3), PATIENT_COUNT)
+
+    def test_get_xref_to_OMOP_batch(self):
+        result = self.store.get_xref_to_OMOP_batch(['DOID:8398', 'DOID:9352'], distance=2)
+        self.assertEqual(list(result), ['DOID:8398'])
+        self.assertEqual(result['DOID:8398'], [{'omop_standard_concept_id': 80180, 'omop_concept_name': 'Osteoarthritis',
+                                                'omop_domain_id': 'Condition', 'total_distance': 2}])
+        result = self.store.get_xref_to_OMOP_batch(['DOID:8398'], distance=3)
+        self.assertEqual([x['omop_standard_concept_id'] for x in result['DOID:8398']], [80180, 192855])
+
+    def test_find_concept_ids(self):
+        result = self.store.find_concept_ids('ibuprofen', domain='Drug', dataset_id=3)
+        self.assertEqual([x['concept_id'] for x in result], [1177480, 19019073])
+        self.assertEqual(result[0]['concept_count'], 100.0)
+        self.assertEqual(self.store.find_concept_ids('ibuprofen', domain='Condition', dataset_id=3), [])
+
+    def test_get_paired_concept_stats(self):
+        # the order of the concepts of a pair does not matter, and pairs with no counts have no statistics
+        stats = self.store.get_paired_concept_stats([('1177480', '80180'), ('80180', '1177480'), ('192855', '80180')], 3)
+        self.assertEqual(list(stats['concept_count'][:2]), [40, 40])
+        self.assertTrue(all(math.isnan(values[2]) for values in stats.values()))
+        self.assertAlmostEqual(stats['concept_frequency'][0], 40 / PATIENT_COUNT)
+        expected = 200 * 100 / PATIENT_COUNT
+        self.assertAlmostEqual(stats['expected_count'][0], expected)
+        self.assertAlmostEqual(stats['ln_ratio'][0], math.log(40 / expected))
+        # chi-square of the 2x2 table of patients with/without each concept
+        table = [40, 200 - 40, 100 - 40, PATIENT_COUNT - 200 - 100 + 40]
+        expected_table = [expected, 200 - expected, 100 - expected, PATIENT_COUNT - 200 - 100 + expected]
+        chi_square = sum((x - e) ** 2 / e for x, e in zip(table, expected_table))
+        self.assertAlmostEqual(stats['chi_square'][0], chi_square)
+        self.assertAlmostEqual(stats['p-value'][0], math.erfc(math.sqrt(chi_square / 2)))
+
+    def test_query_cohd_local_lookups(self):
+        from QueryCOHD import QueryCOHD
+        QueryCOHD.set_local_store(self.store)
+        try:
+            result = QueryCOHD.get_paired_concept_freq('80180', '1177480', 3)
+            self.assertEqual(result['concept_count'], 40)
+            self.assertAlmostEqual(result['concept_frequency'], 40 / PATIENT_COUNT)
+            self.assertEqual(QueryCOHD.get_paired_concept_freq('80180', '19019073', 3), {})
+            result = QueryCOHD.get_obs_exp_ratio('192855', concept_id_2='1177480', dataset_id=3)
+            self.assertAlmostEqual(result[0]['ln_ratio'], math.log(5 / (50 * 100 / PATIENT_COUNT)))
+            self.assertEqual(result[0]['observed_count'], 5)
+            self.assertEqual(QueryCOHD.get_xref_to_OMOP_batch(['DOID:8398'], 1), {'DOID:8398': []})
+            values = QueryCOHD.get_paired_concept_stats_batch([('80180', '1177480'), ('80180', '19019073')],
+                                                              'concept_frequency', dataset_id=3)
+            self.assertAlmostEqual(values[0], 40 / PATIENT_COUNT)
+            self.assertTrue(math.isnan(values[1]))
+        finally:
+            QueryCOHD.set_local_store(None)